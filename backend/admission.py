@@ -0,0 +1,335 @@
+"""
+backend/admission.py
+
+Admission control and load shedding for the analysis, separation and
+YouTube endpoints.
+
+The scheduler (scheduler.py) queues without limit: under a burst every
+upload became a temp file plus a queued job, and the container ran out of
+memory long before the queue drained. Now each request that would start
+new work is admitted first:
+
+  1. Its audio header is read cheaply (`probe_audio`: soundfile, then
+     ffprobe) for duration, channels and sample rate.
+  2. Cost per mode comes from scheduler.estimate_cost, and the queueing
+     delay from the scheduler's own SJF order (`JobScheduler.expected_wait`).
+     Peak memory is estimated from the decoded size of the audio.
+  3. The request is accepted; downgraded from precise to balanced when the
+     precise job would not be admitted but the balanced one would (the
+     same fallback main.py applies when the precise engine is missing); or
+     rejected with 503 and a Retry-After of the expected excess wait.
+
+Cache hits and requests that join an in-flight computation (single_flight.py)
+add no work and are never subject to admission. `precheck` applies the
+hard queue-depth cap before the upload is even spooled.
+
+Decisions are counted per endpoint, action and reason; `stats()` is
+reported on /api/health. ADMISSION_ENABLED=false admits everything.
+"""
+from __future__ import annotations
+
+import json
+import math
+import os
+import shutil
+import subprocess
+import threading
+from collections import Counter
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+
+try:
+    from backend.scheduler import (
+        DEFAULT_DURATION_SEC,
+        SEPARATION_COST_FACTOR,
+        JobScheduler,
+        audio_duration,
+        estimate_cost,
+        get_scheduler,
+        is_heavy,
+    )
+except (ImportError, ModuleNotFoundError):
+    from scheduler import (
+        DEFAULT_DURATION_SEC,
+        SEPARATION_COST_FACTOR,
+        JobScheduler,
+        audio_duration,
+        estimate_cost,
+        get_scheduler,
+        is_heavy,
+    )
+
+ADMISSION_ENABLED = os.environ.get("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_DOWNGRADE = os.environ.get("ADMISSION_DOWNGRADE", "true").lower() == "true"
+# Longest expected queueing delay a new job may face, per pool
+ADMISSION_MAX_WAIT_HEAVY = float(os.environ.get("ADMISSION_MAX_WAIT_HEAVY", "600.0"))
+ADMISSION_MAX_WAIT_LIGHT = float(os.environ.get("ADMISSION_MAX_WAIT_LIGHT", "120.0"))
+# Hard cap on queued jobs per pool, checked before an upload is spooled
+ADMISSION_MAX_QUEUED = int(os.environ.get("ADMISSION_MAX_QUEUED", "32"))
+# Memory that must stay free after a new job's estimated peak
+ADMISSION_MIN_FREE_MB = float(os.environ.get("ADMISSION_MIN_FREE_MB", "512.0"))
+# Retry-After when the limit is memory or queue depth rather than expected wait
+ADMISSION_RETRY_AFTER = int(os.environ.get("ADMISSION_RETRY_AFTER", "30"))
+
+SEPARATION = "separate"  # pseudo-mode for /api/separate
+
+# Peak resident bytes per byte of decoded float32 audio at the file's own
+# rate and channels (resampling, spectrograms, model activations)
+MODE_MEMORY_FACTORS = {
+    "fast": 4.0,
+    "balanced": 6.0,
+    "precise": 16.0,
+}
+SEPARATION_MEMORY_FACTOR = 12.0  # Demucs: stems x channels, plus overlap buffers
+_DEFAULT_SAMPLE_RATE = 44100
+_DEFAULT_CHANNELS = 2
+_FFPROBE_TIMEOUT = 10
+
+
+# ── Header probing ──────────────────────────────────────────────────────────
+
+@dataclass(frozen=True)
+class AudioInfo:
+    duration: float
+    channels: int = _DEFAULT_CHANNELS
+    sample_rate: int = _DEFAULT_SAMPLE_RATE
+
+
+def _ffprobe(path: Path) -> AudioInfo | None:
+    ffprobe = shutil.which("ffprobe")
+    if ffprobe is None:
+        return None
+    try:
+        out = subprocess.run(
+            [ffprobe, "-v", "error", "-select_streams", "a:0",
+             "-show_entries", "stream=channels,sample_rate:format=duration",
+             "-of", "json", str(path)],
+            capture_output=True, text=True, timeout=_FFPROBE_TIMEOUT, check=True,
+        ).stdout
+        data = json.loads(out)
+        stream = (data.get("streams") or [{}])[0]
+        return AudioInfo(
+            duration=float(data["format"]["duration"]),
+            channels=int(stream.get("channels") or _DEFAULT_CHANNELS),
+            sample_rate=int(stream.get("sample_rate") or _DEFAULT_SAMPLE_RATE),
+        )
+    except Exception:
+        return None
+
+
+def probe_audio(path: str | Path) -> AudioInfo:
+    """Duration, channels and sample rate from the file header, without decoding."""
+    try:
+        import soundfile as sf
+        info = sf.info(str(path))
+        return AudioInfo(float(info.duration), int(info.channels), int(info.samplerate))
+    except Exception:
+        pass
+    info = _ffprobe(Path(path))
+    if info is not None:
+        return info
+    return AudioInfo(audio_duration(path))
+
+
+def estimate_memory(info: AudioInfo | None, mode: str, separate_vocals: bool = False) -> float:
+    """Estimated peak bytes for one job on this audio."""
+    if info is None:
+        info = AudioInfo(DEFAULT_DURATION_SEC)
+    decoded = max(info.duration, 0.0) * info.sample_rate * info.channels * 4
+    if mode == SEPARATION:
+        return decoded * SEPARATION_MEMORY_FACTOR
+    factor = MODE_MEMORY_FACTORS.get(mode, MODE_MEMORY_FACTORS["balanced"])
+    if separate_vocals:
+        factor += SEPARATION_MEMORY_FACTOR
+    return decoded * factor
+
+
+def _read_int(path: str) -> int | None:
+    try:
+        value = Path(path).read_text().strip()
+    except OSError:
+        return None
+    return int(value) if value.isdigit() else None
+
+
+def available_memory() -> int | None:
+    """
+    Bytes this process can still allocate: the smaller of the cgroup
+    (container) headroom and the host's MemAvailable. None if unknown.
+    """
+    candidates = []
+    for limit_file, usage_file in (
+        ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current"),
+        ("/sys/fs/cgroup/memory/memory.limit_in_bytes", "/sys/fs/cgroup/memory/memory.usage_in_bytes"),
+    ):
+        limit, usage = _read_int(limit_file), _read_int(usage_file)
+        # "max" / a near-2^63 v1 value mean no limit
+        if limit is not None and usage is not None and limit < 1 << 60:
+            candidates.append(max(limit - usage, 0))
+            break
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    candidates.append(int(line.split()[1]) * 1024)
+                    break
+    except (OSError, ValueError):
+        pass
+    return min(candidates) if candidates else None
+
+
+# ── Decisions ───────────────────────────────────────────────────────────────
+
+@dataclass(frozen=True)
+class Admission:
+    """Outcome of admitting one request."""
+
+    action: str                      # "accept" | "downgrade" | "reject"
+    mode: str                        # the mode to run (after any downgrade)
+    reason: str | None = None        # "queue" | "memory" | "depth" when not plainly accepted
+    retry_after: int | None = None   # seconds, for rejections
+    expected_wait: float = 0.0
+
+    @property
+    def admitted(self) -> bool:
+        return self.action != "reject"
+
+
+class AdmissionController:
+    """Accept / downgrade / reject new work from queue depth and memory headroom."""
+
+    def __init__(
+        self,
+        scheduler: JobScheduler | None = None,
+        enabled: bool = ADMISSION_ENABLED,
+        downgrade: bool = ADMISSION_DOWNGRADE,
+        max_wait_heavy: float = ADMISSION_MAX_WAIT_HEAVY,
+        max_wait_light: float = ADMISSION_MAX_WAIT_LIGHT,
+        max_queued: int = ADMISSION_MAX_QUEUED,
+        min_free_bytes: float = ADMISSION_MIN_FREE_MB * 1024 * 1024,
+        memory_fn: Callable[[], int | None] = available_memory,
+    ):
+        self.scheduler = scheduler if scheduler is not None else get_scheduler()
+        self.enabled = enabled
+        self.downgrade = downgrade
+        self.max_wait = {True: max_wait_heavy, False: max_wait_light}
+        self.max_queued = max_queued
+        self.min_free_bytes = min_free_bytes
+        self.memory_fn = memory_fn
+        self._lock = threading.Lock()
+        self._decisions: Counter = Counter()  # (endpoint, action) → count
+        self._reasons: Counter = Counter()    # reason → count
+
+    def _candidates(self, mode: str) -> list[str]:
+        if self.downgrade and mode == "precise":
+            return ["precise", "balanced"]
+        return [mode]
+
+    @staticmethod
+    def _heavy(mode: str, separate_vocals: bool) -> bool:
+        return mode == SEPARATION or is_heavy(mode, separate_vocals)
+
+    def precheck(self, endpoint: str, mode: str, separate_vocals: bool = False) -> Admission:
+        """Queue-depth cap only — cheap enough to run before reading the upload."""
+        if not self.enabled:
+            return Admission("accept", mode)
+        for candidate in self._candidates(mode):
+            if self.scheduler.queued(self._heavy(candidate, separate_vocals)) < self.max_queued:
+                return Admission("accept", mode)
+        return self._record(endpoint, Admission("reject", mode, "depth", ADMISSION_RETRY_AFTER))
+
+    def admit(
+        self,
+        endpoint: str,
+        info: AudioInfo | None,
+        mode: str,
+        separate_vocals: bool = False,
+    ) -> Admission:
+        """
+        Decide on a request that would start a new job of `mode` ("fast",
+        "balanced", "precise" or SEPARATION) on `info`'s audio (None when
+        the audio is not available yet, e.g. before a YouTube download).
+        """
+        if not self.enabled:
+            return Admission("accept", mode)
+        duration = info.duration if info is not None else None
+        available = self.memory_fn()
+        rejections = []
+        for candidate in self._candidates(mode):
+            heavy = self._heavy(candidate, separate_vocals)
+            if candidate == SEPARATION:
+                cost = (duration or DEFAULT_DURATION_SEC) * SEPARATION_COST_FACTOR
+            else:
+                cost = estimate_cost(duration, candidate, separate_vocals)
+            wait = self.scheduler.expected_wait(cost, heavy)
+
+            if self.scheduler.queued(heavy) >= self.max_queued:
+                rejections.append(Admission("reject", mode, "depth", ADMISSION_RETRY_AFTER, wait))
+            elif wait > self.max_wait[heavy]:
+                retry = max(math.ceil(wait - self.max_wait[heavy]), 1)
+                rejections.append(Admission("reject", mode, "queue", retry, wait))
+            elif (
+                available is not None
+                and available - estimate_memory(info, candidate, separate_vocals) < self.min_free_bytes
+            ):
+                rejections.append(Admission("reject", mode, "memory", ADMISSION_RETRY_AFTER, wait))
+            elif candidate == mode:
+                return self._record(endpoint, Admission("accept", mode, expected_wait=wait))
+            else:
+                reason = rejections[0].reason
+                return self._record(endpoint, Admission("downgrade", candidate, reason, expected_wait=wait))
+
+        # Retry when the soonest of the alternatives would be admitted
+        return self._record(endpoint, min(rejections, key=lambda a: a.retry_after))
+
+    def _record(self, endpoint: str, decision: Admission) -> Admission:
+        with self._lock:
+            self._decisions[(endpoint, decision.action)] += 1
+            if decision.action != "accept":
+                self._reasons[decision.reason] += 1
+        if decision.action == "reject":
+            print(
+                f"[Admission] Rejected {endpoint} ({decision.mode}, {decision.reason}, "
+                f"~{decision.expected_wait:.0f}s wait) — retry after {decision.retry_after}s"
+            )
+        elif decision.action == "downgrade":
+            print(f"[Admission] Downgraded {endpoint} to {decision.mode} ({decision.reason})")
+        return decision
+
+    def decisions(self) -> dict[tuple[str, str], int]:
+        """Decision counts by (endpoint, action), for metrics export."""
+        with self._lock:
+            return dict(self._decisions)
+
+    def stats(self) -> dict:
+        with self._lock:
+            totals: Counter = Counter()
+            endpoints: dict[str, dict[str, int]] = {}
+            for (endpoint, action), n in self._decisions.items():
+                totals[action] += n
+                endpoints.setdefault(endpoint, {})[action] = n
+            reasons = dict(self._reasons)
+        available = self.memory_fn()
+        return {
+            "enabled": self.enabled,
+            "accepted": totals["accept"],
+            "downgraded": totals["downgrade"],
+            "rejected": totals["reject"],
+            "reasons": reasons,
+            "endpoints": endpoints,
+            "memoryAvailableMB": round(available / (1024 * 1024)) if available is not None else None,
+        }
+
+
+_ADMISSION: AdmissionController | None = None
+_ADMISSION_LOCK = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """The process-wide controller, over the process-wide scheduler."""
+    global _ADMISSION
+    with _ADMISSION_LOCK:
+        if _ADMISSION is None:
+            _ADMISSION = AdmissionController()
+        return _ADMISSION
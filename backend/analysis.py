@@ -7,6 +7,7 @@ Provides:
   - analyze_file(): Full librosa-based chord/key/tempo analysis (balanced mode)
   - separate_audio_full(): Demucs 4-stem separation (vocals, drums, bass, other)
   - separate_audio_stems(): Demucs 6-stem separation (+ guitar, piano)
+  - load_or_separate_stems(): stem-cache-aware Demucs entry point shared with precise mode
   - _get_diatonic_quality(): Helper for key-aware chord simplification
 
 All dependencies are commercially safe:
@@ -16,23 +17,36 @@ from __future__ import annotations
 
 import gc
 import hashlib
-import multiprocessing
+import math
 import subprocess
 import tempfile
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
 from pathlib import Path
+from typing import TYPE_CHECKING
 
 import librosa
 import numpy as np
 import soundfile as sf
 import torch
 
-# Configure torch for CPU efficiency
-num_cores = min(multiprocessing.cpu_count(), 4)
-torch.set_num_threads(num_cores)
+from ml.instrumentation import analysis_mode, stage
+from ml.tracing import STATUS_ERROR, current_span, span
 
-# Global model cache to avoid reloading from disk on every request
-_DEMUCS_WRAPPER = None
-_DEMUCS_6STEM_WRAPPER = None
+try:
+    from backend.job_control import CancellationToken, ProgressCallback, check_cancelled, scale_progress
+    from backend.model_manager import get_model_manager
+    from backend.stem_cache import content_hash, get_stem_cache
+except (ImportError, ModuleNotFoundError):
+    from job_control import CancellationToken, ProgressCallback, check_cancelled, scale_progress
+    from model_manager import get_model_manager
+    from stem_cache import content_hash, get_stem_cache
+
+if TYPE_CHECKING:
+    from ml.analysis_context import AnalysisContext
+
+# torch's thread count is set per job by the thread budget (thread_budget.py)
 
 # Stem types for 6-stem separation (htdemucs_6s model)
 STEM_TYPES = ["vocals", "drums", "bass", "guitar", "piano", "other"]
@@ -98,12 +112,27 @@ class DemucsSeparator:
         self.model.eval()
         self.samplerate = self.model.samplerate
 
-    def separate_audio_file(self, path: str | Path) -> dict[str, torch.Tensor]:
-        """Separate audio into stems. Returns dict of stem_name → tensor."""
+    @stage("demucs")
+    def separate_audio_file(
+        self,
+        path: str | Path,
+        overlap: float = 0.1,
+        progress_cb: ProgressCallback | None = None,
+        cancel_token: CancellationToken | None = None,
+    ) -> dict[str, torch.Tensor]:
+        """
+        Separate audio into stems. Returns dict of stem_name → tensor.
+
+        `progress_cb(1, message, percent)` is called after every Demucs chunk;
+        a cancelled `cancel_token` aborts between chunks (JobCancelled).
+        """
         from demucs.apply import apply_model
 
+        check_cancelled(cancel_token)
+
         print(f"[Demucs] Loading audio {Path(path).name}...")
-        y, sr = librosa.load(str(path), sr=self.samplerate, mono=False, duration=300)
+        with stage("decode"):
+            y, sr = librosa.load(str(path), sr=self.samplerate, mono=False, duration=300)
 
         if len(y.shape) == 1:
             wav = torch.from_numpy(y).unsqueeze(0)
@@ -120,50 +149,154 @@ class DemucsSeparator:
         wav = (wav - ref.mean()) / (ref.std() + 1e-8)
 
         print(f"[Demucs] Running inference on {wav.shape[1] / sr:.1f}s of audio (CPU)...")
-        with torch.no_grad():
-            sources = apply_model(self.model, wav[None], shifts=0, overlap=0.1, progress=True)[0]
+        with torch.no_grad(), self._chunk_hooks(wav.shape[1], overlap, progress_cb, cancel_token):
+            sources = apply_model(self.model, wav[None], shifts=0, overlap=overlap, progress=True)[0]
+        # Undo the normalization so stems keep the mix's original loudness
+        sources = sources * ref.std() + ref.mean()
 
         return {
             name: sources[i]
             for i, name in enumerate(self.model.sources)
         }
 
+    @contextmanager
+    def _chunk_hooks(
+        self,
+        n_samples: int,
+        overlap: float,
+        progress_cb: ProgressCallback | None,
+        cancel_token: CancellationToken | None,
+    ) -> Iterator[None]:
+        """
+        Progress per finished chunk and cancellation at every chunk edge,
+        through torch forward hooks on the (sub-)models: apply_model calls
+        the model once per chunk. (demucs 4.0.1, the pinned version, has no
+        apply_model `callback`.) The models are shared between scheduler
+        threads, so the hooks only act for the calling thread.
+        """
+        if progress_cb is None and cancel_token is None:
+            yield
+            return
+
+        # apply_model splits each (sub-)model's pass into segment-long chunks
+        models = getattr(self.model, "models", [self.model])
+        segment = float(getattr(models[0], "segment", 0) or 0)
+        stride = int((1 - overlap) * int(self.samplerate * segment))
+        total = len(models) * (math.ceil(n_samples / stride) if stride > 0 else 1)
+        done = 0
+        thread = threading.get_ident()
+
+        def before_chunk(module, inputs) -> None:
+            # Raising here makes apply_model drop its remaining chunks
+            if threading.get_ident() == thread:
+                check_cancelled(cancel_token)
+
+        def after_chunk(module, inputs, output) -> None:
+            nonlocal done
+            if threading.get_ident() != thread:
+                return
+            check_cancelled(cancel_token)
+            if progress_cb is not None:
+                done += 1
+                progress_cb(1, f"Separating stems via Demucs ({min(done, total)}/{total} chunks)...",
+                            min(100, 100 * done // total))
+
+        handles = []
+        for model in models:
+            handles.append(model.register_forward_pre_hook(before_chunk))
+            handles.append(model.register_forward_hook(after_chunk))
+        try:
+            yield
+        finally:
+            for handle in handles:
+                handle.remove()
+
 
 def _get_separator() -> DemucsSeparator:
-    """Get or create the 4-stem Demucs separator."""
-    global _DEMUCS_WRAPPER
-    if _DEMUCS_WRAPPER is None:
-        _DEMUCS_WRAPPER = DemucsSeparator("htdemucs")
-    return _DEMUCS_WRAPPER
+    """Get or create the shared 4-stem Demucs separator."""
+    return get_model_manager().get("htdemucs", lambda: DemucsSeparator("htdemucs"))
 
 
 def _get_separator_6stem() -> DemucsSeparator:
-    """Get or create the 6-stem Demucs separator."""
-    global _DEMUCS_6STEM_WRAPPER
-    if _DEMUCS_6STEM_WRAPPER is None:
-        _DEMUCS_6STEM_WRAPPER = DemucsSeparator("htdemucs_6s")
-    return _DEMUCS_6STEM_WRAPPER
+    """Get or create the shared 6-stem Demucs separator (also used by precise mode)."""
+    return get_model_manager().get("htdemucs_6s", lambda: DemucsSeparator("htdemucs_6s"))
+
+
+def _to_mono(tensor: torch.Tensor) -> np.ndarray:
+    audio_np = tensor.cpu().numpy()
+    if audio_np.ndim > 1:
+        audio_np = audio_np.mean(axis=0)
+    return audio_np.astype(np.float32)
+
+
+def load_or_separate_stems(
+    file_path: Path,
+    model_name: str,
+    accept_models: tuple[str, ...] = (),
+    overlap: float = 0.1,
+    progress_cb: ProgressCallback | None = None,
+    cancel_token: CancellationToken | None = None,
+) -> tuple[dict[str, np.ndarray], int, str]:
+    """
+    Mono stems for `file_path`, served from the stem cache when possible.
 
+    Looks up `model_name` first, then any model in `accept_models` whose
+    stems are interchangeable for the caller (e.g. a 6-stem run can answer a
+    vocals/instrumental request), in both cases only from a run with at
+    least `overlap` (stem_cache.py). On a miss, runs `model_name` and stores the
+    result for every later consumer of the same audio. `overlap` is passed to
+    Demucs' apply_model (chunk overlap; lower is faster); `progress_cb` and
+    `cancel_token` go to DemucsSeparator.separate_audio_file.
 
-def separate_audio_full(file_path: Path) -> dict | None:
+    Returns (stems, samplerate, model_used).
+    """
+    with span("demucs.load_or_separate", model=model_name, overlap=overlap) as sp:
+        cache = get_stem_cache()
+        audio_hash = content_hash(file_path) if cache is not None else None
+
+        if cache is not None:
+            for candidate in (model_name, *accept_models):
+                hit = cache.load(audio_hash, candidate, min_overlap=overlap)
+                if hit is not None:
+                    print(f"[Demucs] Stem cache hit ({candidate}, {audio_hash[:12]})")
+                    sp.set_attribute("stem_cache_hit", candidate)
+                    stems, sr = hit
+                    return stems, sr, candidate
+
+        separator = _get_separator_6stem() if model_name == "htdemucs_6s" else _get_separator()
+        control = {"progress_cb": progress_cb, "cancel_token": cancel_token}
+        separated = separator.separate_audio_file(
+            file_path, overlap=overlap, **{k: v for k, v in control.items() if v is not None},
+        )
+        stems = {name: _to_mono(tensor) for name, tensor in separated.items()}
+        sr = separator.samplerate
+
+        if cache is not None:
+            cache.put(audio_hash, model_name, stems, sr, overlap=overlap)
+        return stems, sr, model_name
+
+
+@span("demucs.separate_full")
+def separate_audio_full(
+    file_path: Path,
+    progress_cb: ProgressCallback | None = None,
+    cancel_token: CancellationToken | None = None,
+) -> dict | None:
     """
     Separate audio into vocals + instrumental (everything except vocals).
     Returns dict with 'vocals' and 'instrumental' temp file paths.
     """
     try:
-        separator = _get_separator()
-        stems = separator.separate_audio_file(file_path)
+        stems, sr, _ = load_or_separate_stems(
+            file_path, "htdemucs", accept_models=("htdemucs_6s",),
+            progress_cb=progress_cb, cancel_token=cancel_token,
+        )
 
         result = {}
-        sr = separator.samplerate
 
         # Sum all non-vocal stems for instrumental
         instrumental = None
-        for name, tensor in stems.items():
-            audio_np = tensor.cpu().numpy()
-            if audio_np.ndim > 1:
-                audio_np = audio_np.mean(axis=0)
-
+        for name, audio_np in stems.items():
             if name == "vocals":
                 tmp = tempfile.NamedTemporaryFile(delete=False, suffix="_vocals.wav")
                 sf.write(tmp.name, audio_np, sr)
@@ -183,25 +316,27 @@ def separate_audio_full(file_path: Path) -> dict | None:
         return result
     except Exception as e:
         print(f"[Demucs] Separation failed: {e}")
+        current_span().set_status(STATUS_ERROR, str(e))
         return None
 
 
-def separate_audio_stems(file_path: Path) -> dict | None:
+@span("demucs.separate_stems")
+def separate_audio_stems(
+    file_path: Path,
+    progress_cb: ProgressCallback | None = None,
+    cancel_token: CancellationToken | None = None,
+) -> dict | None:
     """
     6-stem separation: vocals, drums, bass, guitar, piano, other.
     Returns dict of stem_name → temp file path.
     """
     try:
-        separator = _get_separator_6stem()
-        stems = separator.separate_audio_file(file_path)
+        stems, sr, _ = load_or_separate_stems(
+            file_path, "htdemucs_6s", progress_cb=progress_cb, cancel_token=cancel_token,
+        )
 
         result = {}
-        sr = separator.samplerate
-
-        for name, tensor in stems.items():
-            audio_np = tensor.cpu().numpy()
-            if audio_np.ndim > 1:
-                audio_np = audio_np.mean(axis=0)
+        for name, audio_np in stems.items():
             tmp = tempfile.NamedTemporaryFile(delete=False, suffix=f"_{name}.wav")
             sf.write(tmp.name, audio_np, sr)
             result[name] = tmp.name
@@ -210,14 +345,18 @@ def separate_audio_stems(file_path: Path) -> dict | None:
         return result
     except Exception as e:
         print(f"[Demucs] 6-stem separation failed: {e}")
+        current_span().set_status(STATUS_ERROR, str(e))
         return None
 
 
 # ── Balanced mode analysis ─────────────────────────────────────────────────
 
+@analysis_mode("balanced")
 def analyze_file(
-    file_path: Path,
+    file_path: Path | AnalysisContext,
     separate_vocals: bool = False,
+    progress_cb: ProgressCallback | None = None,
+    cancel_token: CancellationToken | None = None,
 ) -> dict:
     """
     High-precision DSP chord analysis (balanced mode).
@@ -229,34 +368,58 @@ def analyze_file(
       - Ergodic HMM Viterbi smoothing for musical timing
       - Zero ONNX dependency
 
+    `file_path` may also be a channel-preserving AnalysisContext (decoded
+    audio shared with a pool worker); vocal separation still reads the file
+    behind it. `progress_cb(stage, message, percent)` and `cancel_token`
+    work as in the precise engine (see job_control.py).
+
     Returns dict with: tempo, meter, key, scale, chords, simpleChords,
     and optionally instrumentalPath.
     """
+    from ml.analysis_context import AnalysisContext
     from ml.chord_templates import detect_chords_template
     from ml.dsp_tempo_key import detect_key_dsp, detect_tempo_dsp
 
+    ctx = file_path if isinstance(file_path, AnalysisContext) else None
+    if ctx is not None:
+        file_path = ctx.file_path
     analysis_path = file_path
     instrumental_path = None
 
     # Optional heavy Demucs vocal separation (if explicitly toggled)
     if separate_vocals:
-        separated = separate_audio_full(file_path)
+        separated = separate_audio_full(
+            file_path, progress_cb=scale_progress(progress_cb, 0, 60), cancel_token=cancel_token,
+        )
         if separated and separated.get("instrumental"):
             analysis_path = Path(separated["instrumental"])
             instrumental_path = separated["instrumental"]
+            ctx = None
+
+    check_cancelled(cancel_token)
+    if progress_cb:
+        progress_cb(2, "Detecting key & tempo...", 60 if separate_vocals else 10)
+
+    # One channel-preserving decode shared by key, tempo and chord detection
+    if ctx is None:
+        ctx = AnalysisContext(analysis_path, keep_channels=True)
 
     # 1. Detect Key & Scale using Krumhansl-Schmuckler profiles
-    key_str = detect_key_dsp(str(analysis_path))
+    key_str = detect_key_dsp(ctx)
     parts = key_str.split()
     key = parts[0] if parts else "C"
     scale = parts[1] if len(parts) > 1 else "major"
 
     # 2. Detect Tempo using autocorrelation
-    tempo = float(detect_tempo_dsp(str(analysis_path)))
+    tempo = float(detect_tempo_dsp(ctx))
+
+    check_cancelled(cancel_token)
+    if progress_cb:
+        progress_cb(3, "Matching chords with key-aware templates...", 75 if separate_vocals else 40)
 
     # 3. Detect chords using high-precision DSP engine with vocal attenuation and diatonic key prior
     raw_segments = detect_chords_template(
-        analysis_path,
+        ctx,
         use_vocal_suppression=True,
         detected_key=f"{key} {scale}",
         min_duration_ms=400.0,
@@ -264,6 +427,21 @@ def analyze_file(
         tempo_bpm=tempo,
     )
 
+    result = format_balanced_result(raw_segments, key, scale, tempo)
+
+    if instrumental_path:
+        result["instrumentalPath"] = instrumental_path
+
+    return result
+
+
+def format_balanced_result(
+    raw_segments: list[tuple[float, float, str, float]],
+    key: str,
+    scale: str,
+    tempo: float,
+) -> dict:
+    """Build the balanced-mode AnalysisResult dict from raw (start, end, label, confidence) segments."""
     chords: list[dict] = []
     simple_chords: list[dict] = []
 
@@ -297,7 +475,7 @@ def analyze_file(
             "confidence": round(conf, 3),
         })
 
-    result = {
+    return {
         "tempo": round(tempo, 1),
         "meter": 4,
         "key": key,
@@ -306,11 +484,6 @@ def analyze_file(
         "simpleChords": simple_chords,
     }
 
-    if instrumental_path:
-        result["instrumentalPath"] = instrumental_path
-
-    return result
-
 
 def _simplify_chord(chord: str, key: str, scale: str) -> str:
     """Simplify a chord label to root + basic triad quality."""
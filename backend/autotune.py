@@ -0,0 +1,296 @@
+"""
+backend/autotune.py
+
+Host-specific tuning of thread counts and ONNX Runtime session options.
+
+Thread counts and session options used to be hard-coded, and no single value
+suits every instance type we deploy on. This module runs a short synthetic
+workload through the real code paths and records what was fastest here:
+
+  - ONNX CRNN (`chord_custom._detect_chords_onnx`): intra-op threads, graph
+    optimization level, execution mode (and inter-op threads when parallel).
+  - Demucs (`demucs.apply.apply_model`): torch intra-op threads.
+  - Template engines (balanced `detect_chords_template` and the accurate
+    chord_custom path): BLAS threads via threadpoolctl.
+
+Each search is a staged coordinate descent (threads first, then the other
+knobs at the best thread count), so a run takes seconds to a few minutes
+instead of the full cross product. Stages whose dependency is unavailable
+(no ONNX model, no Demucs weights, no threadpoolctl) are skipped.
+
+The profile is saved as JSON (AUTOTUNE_PROFILE_PATH) and loaded by the
+thread budget at startup: tuned values act as per-job maxima on top of the
+budget's fair share. A profile recorded on a different host shape (core
+count / architecture) is ignored.
+
+Usage:
+    python autotune.py [--quick] [--output PATH]
+or set AUTOTUNE_ON_STARTUP=true to tune on the first start without a profile.
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+import numpy as np
+
+AUTOTUNE_PROFILE_PATH = Path(
+    os.environ.get("AUTOTUNE_PROFILE_PATH", Path(tempfile.gettempdir()) / "guitariz_autotune.json")
+)
+AUTOTUNE_ON_STARTUP = os.environ.get("AUTOTUNE_ON_STARTUP", "false").lower() == "true"
+
+PROFILE_VERSION = 1
+
+
+# ── Host / profile I/O ──────────────────────────────────────────────────────
+
+def host_fingerprint() -> dict:
+    """What a profile is valid for."""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        cores = os.cpu_count() or 1
+    return {"cores": cores, "machine": platform.machine(), "processor": platform.processor()}
+
+
+def save_profile(profile: dict, path: str | Path = AUTOTUNE_PROFILE_PATH) -> None:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(profile, indent=2))
+    os.replace(tmp, path)
+
+
+def load_profile(path: str | Path = AUTOTUNE_PROFILE_PATH) -> dict | None:
+    """The saved profile, or None if missing, unreadable or from another host shape."""
+    try:
+        profile = json.loads(Path(path).read_text())
+    except (OSError, ValueError):
+        return None
+    if profile.get("version") != PROFILE_VERSION or profile.get("host") != host_fingerprint():
+        return None
+    return profile
+
+
+# ── Measurement helpers ─────────────────────────────────────────────────────
+
+def thread_candidates(max_threads: int) -> list[int]:
+    """1, 2, 4, ... up to and including `max_threads`."""
+    out, n = [], 1
+    while n < max_threads:
+        out.append(n)
+        n *= 2
+    out.append(max(max_threads, 1))
+    return sorted(set(out))
+
+
+def _best_time(fn: Callable[[], object], repeats: int) -> float:
+    """Minimum wall time over `repeats` runs, after one warm-up run."""
+    fn()
+    best = float("inf")
+    for _ in range(max(repeats, 1)):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def synthetic_audio(seconds: float, sr: int, channels: int = 1, seed: int = 0) -> np.ndarray:
+    """A deterministic chord progression (C–Am–F–G, 2 s each) with light noise."""
+    rng = np.random.default_rng(seed)
+    chords = [(261.63, 329.63, 392.00), (220.00, 261.63, 329.63), (174.61, 220.00, 261.63), (196.00, 246.94, 293.66)]
+    n = int(seconds * sr)
+    t = np.arange(n) / sr
+    y = np.zeros(n, dtype=np.float64)
+    seg = 2 * sr
+    for i in range(0, n, seg):
+        freqs = chords[(i // seg) % len(chords)]
+        tt = t[i:i + seg]
+        y[i:i + seg] = sum(np.sin(2 * np.pi * f * tt) for f in freqs)
+    y = 0.2 * y / 3 + 0.01 * rng.standard_normal(n)
+    if channels > 1:
+        y = np.stack([y] * channels)
+    return y.astype(np.float32)
+
+
+def _argmin(timings: dict) -> tuple:
+    key = min(timings, key=timings.get)
+    return key, timings[key]
+
+
+# ── Stages ──────────────────────────────────────────────────────────────────
+
+def tune_onnx(seconds: float, repeats: int, max_threads: int) -> dict | None:
+    """Search ONNX session options on `_detect_chords_onnx` over synthetic audio."""
+    try:
+        import onnxruntime as ort
+
+        import chord_custom
+        from ml.analysis_context import AnalysisContext
+        from ml.features import SR
+    except ImportError as e:
+        print(f"[Autotune] Skipping ONNX: {e}")
+        return None
+
+    model_path = chord_custom._resolve_model_path()
+    if model_path is None:
+        print("[Autotune] Skipping ONNX: no chord model")
+        return None
+
+    ctx = AnalysisContext.from_waveform(synthetic_audio(seconds, SR), sr=SR)
+    _ = ctx.cnn_input  # features are not part of what we tune
+
+    levels = {
+        "ORT_ENABLE_BASIC": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        "ORT_ENABLE_EXTENDED": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        "ORT_ENABLE_ALL": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+    }
+    modes = {
+        "ORT_SEQUENTIAL": ort.ExecutionMode.ORT_SEQUENTIAL,
+        "ORT_PARALLEL": ort.ExecutionMode.ORT_PARALLEL,
+    }
+
+    def measure(intra: int, level: str, mode: str, inter: int) -> float:
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = intra
+        opts.inter_op_num_threads = inter
+        opts.graph_optimization_level = levels[level]
+        opts.execution_mode = modes[mode]
+        opts.add_session_config_entry("session.intra_op.allow_spinning", "0")
+        sess = ort.InferenceSession(str(model_path), sess_options=opts, providers=["CPUExecutionProvider"])
+        with _session_installed(chord_custom, sess):
+            return _best_time(lambda: chord_custom._detect_chords_onnx(ctx), repeats)
+
+    threads, _ = _argmin({n: measure(n, "ORT_ENABLE_ALL", "ORT_SEQUENTIAL", 1) for n in thread_candidates(max_threads)})
+    level, _ = _argmin({lv: measure(threads, lv, "ORT_SEQUENTIAL", 1) for lv in levels})
+    mode_timings = {("ORT_SEQUENTIAL", 1): measure(threads, level, "ORT_SEQUENTIAL", 1)}
+    for inter in thread_candidates(min(max_threads, 2)):
+        mode_timings[("ORT_PARALLEL", inter)] = measure(threads, level, "ORT_PARALLEL", inter)
+    (mode, inter), best = _argmin(mode_timings)
+
+    return {
+        "model": model_path.name,
+        "intra_op_num_threads": threads,
+        "inter_op_num_threads": inter,
+        "graph_optimization_level": level,
+        "execution_mode": mode,
+        "seconds": round(best, 4),
+    }
+
+
+@contextlib.contextmanager
+def _session_installed(chord_custom_module, sess):
+    """Temporarily make `sess` the session `_detect_chords_onnx` uses."""
+    saved = (chord_custom_module._onnx_session, chord_custom_module._onnx_load_attempted)
+    chord_custom_module._onnx_session, chord_custom_module._onnx_load_attempted = sess, True
+    try:
+        yield
+    finally:
+        chord_custom_module._onnx_session, chord_custom_module._onnx_load_attempted = saved
+
+
+def tune_demucs(seconds: float, repeats: int, max_threads: int) -> dict | None:
+    """Search torch intra-op threads on Demucs `apply_model`."""
+    try:
+        import torch
+        from demucs.apply import apply_model
+
+        from analysis import _get_separator
+        separator = _get_separator()
+    except Exception as e:
+        print(f"[Autotune] Skipping Demucs: {e}")
+        return None
+
+    model = separator.model
+    wav = torch.from_numpy(synthetic_audio(seconds, separator.samplerate, channels=model.audio_channels))
+
+    def run():
+        with torch.no_grad():
+            apply_model(model, wav[None], shifts=0, overlap=0.1, progress=False)
+
+    original = torch.get_num_threads()
+    timings = {}
+    try:
+        for n in thread_candidates(max_threads):
+            torch.set_num_threads(n)
+            timings[n] = _best_time(run, repeats)
+    finally:
+        torch.set_num_threads(original)
+    threads, best = _argmin(timings)
+    return {"threads": threads, "seconds": round(best, 4)}
+
+
+def tune_templates(seconds: float, repeats: int, max_threads: int) -> dict | None:
+    """Search BLAS threads on the template engines (balanced + accurate)."""
+    try:
+        from threadpoolctl import threadpool_limits
+
+        from chord_custom import detect_chords_custom
+        from ml.analysis_context import AnalysisContext
+        from ml.chord_templates import detect_chords_template
+        from ml.features import SR
+    except ImportError as e:
+        print(f"[Autotune] Skipping template engines: {e}")
+        return None
+
+    y = synthetic_audio(seconds, SR, channels=2)
+
+    def run():
+        # Fresh contexts: the engines' feature extraction is part of the workload
+        detect_chords_template(AnalysisContext.from_waveform(y, sr=SR), use_vocal_suppression=True)
+        detect_chords_custom(AnalysisContext.from_waveform(y[0], sr=SR), mode="accurate")
+
+    timings = {}
+    for n in thread_candidates(max_threads):
+        with threadpool_limits(limits=n, user_api="blas"):
+            timings[n] = _best_time(run, repeats)
+    threads, best = _argmin(timings)
+    return {"threads": threads, "seconds": round(best, 4)}
+
+
+# ── Entry points ────────────────────────────────────────────────────────────
+
+def run_autotune(
+    quick: bool = False,
+    path: str | Path | None = AUTOTUNE_PROFILE_PATH,
+    stages: tuple[str, ...] = ("onnx", "demucs", "templates"),
+) -> dict:
+    """Benchmark this host, save the profile to `path` (unless None) and return it."""
+    host = host_fingerprint()
+    seconds, repeats = (8.0, 1) if quick else (30.0, 3)
+    max_threads = host["cores"]
+    t0 = time.time()
+    print(f"[Autotune] Tuning for {host['cores']} cores ({'quick' if quick else 'full'})...")
+
+    tuners = {"onnx": tune_onnx, "demucs": tune_demucs, "templates": tune_templates}
+    profile = {
+        "version": PROFILE_VERSION,
+        "host": host,
+        "createdAt": time.time(),
+        **{name: tuners[name](seconds, repeats, max_threads) for name in stages},
+    }
+    profile["tuneSeconds"] = round(time.time() - t0, 1)
+
+    if path is not None:
+        save_profile(profile, path)
+    print(f"[Autotune] Done in {profile['tuneSeconds']}s: " + json.dumps({k: profile.get(k) for k in stages}))
+    return profile
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark thread counts and ONNX Runtime settings for this host")
+    parser.add_argument("--quick", action="store_true", help="short workload, single repeat")
+    parser.add_argument("--output", type=str, default=str(AUTOTUNE_PROFILE_PATH))
+    args = parser.parse_args()
+    run_autotune(quick=args.quick, path=args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,9 @@ Exposes exactly three functions that main.py calls:
     detect_key_custom(file_path)          → str
     detect_tempo_custom(file_path)        → float
 
+Each accepts either a path or a shared `ml.analysis_context.AnalysisContext`;
+passing one context to all three decodes the file and computes the CQT once.
+
 Modes:
   - "fast":     Batched ONNX CRNN inference + HMM Viterbi smoothing (~3-5s)
   - "accurate": HPSS + CQT chroma template matching + HMM Viterbi (~5-8s)
@@ -20,10 +23,22 @@ from pathlib import Path
 
 import numpy as np
 
-from ml.chord_vocab import LABEL_TO_IDX, NUM_CLASSES, build_templates
+from ml.analysis_context import AnalysisContext, as_context
+from ml.chord_templates import score_chroma_frames
+from ml.chord_vocab import LABEL_TO_IDX, build_templates
 from ml.dsp_tempo_key import detect_key_dsp, detect_tempo_dsp
-from ml.features import HOP_LENGTH, extract_cnn_input, extract_cqt_chroma, load_audio
+from ml.features import HOP_LENGTH
+from ml.instrumentation import stage
+from ml.segments import SegmentArrays, coalesce_runs
 from ml.viterbi import smooth_chord_sequence
+from ml.windowing import windowed_logits
+
+try:
+    from backend.inference_batcher import ONNX_BATCH_WINDOW_MS, InferenceBatcher
+    from backend.onnx_sessions import OnnxSessionPool
+except (ImportError, ModuleNotFoundError):
+    from inference_batcher import ONNX_BATCH_WINDOW_MS, InferenceBatcher
+    from onnx_sessions import OnnxSessionPool
 
 # ── ONNX model paths ───────────────────────────────────────────────────────
 CHORD_MODEL_PATH = Path(
@@ -36,9 +51,19 @@ QUANT_MODEL_PATH = Path(
 # A/B test flag — prefer quantized model (smaller, faster) if it exists
 USE_QUANTIZED_MODEL = os.environ.get("USE_QUANTIZED_MODEL", "true").lower() == "true"
 
-# Lazy-loaded ONNX session (cached per-process)
+# CRNN inference layout. "auto": whole track in one call up to
+# ONNX_MAX_FULL_TRACK_SEC, overlapped windows beyond; "full" / "windowed" force one.
+ONNX_INFERENCE_MODE = os.environ.get("ONNX_INFERENCE_MODE", "auto").lower()
+ONNX_MAX_FULL_TRACK_SEC = float(os.environ.get("ONNX_MAX_FULL_TRACK_SEC", "600.0"))
+ONNX_WINDOW_FRAMES = int(os.environ.get("ONNX_WINDOW_FRAMES", "512"))              # ~47 s
+ONNX_WINDOW_OVERLAP_FRAMES = int(os.environ.get("ONNX_WINDOW_OVERLAP_FRAMES", "64"))  # ~6 s
+ONNX_WINDOW_BATCH = int(os.environ.get("ONNX_WINDOW_BATCH", "4"))                   # windows per call
+
+# Lazy-loaded ONNX session pool (cached per-process, see onnx_sessions.py)
 _onnx_session = None
 _onnx_load_attempted = False
+# Cross-request batching over that pool (inference_batcher.py); None if disabled
+_onnx_batcher = None
 
 
 # ── Low-confidence filtering ───────────────────────────────────────────────
@@ -48,34 +73,51 @@ def _filter_low_confidence_segments(
     threshold: float = 0.65,
 ) -> list[tuple[float, float, str, float]]:
     """Map low-confidence chord segments to 'N.C.' and merge consecutive duplicates."""
+    segs = SegmentArrays.from_tuples(segments)
+    if not len(segs):
+        return []
+
     # Step 1: Remap below threshold to N.C.
-    cleaned = []
-    for start, end, chord, conf in segments:
-        if chord != "N.C." and conf < threshold:
-            cleaned.append((start, end, "N.C.", conf))
-        else:
-            cleaned.append((start, end, chord, conf))
+    labels = list(segs.labels)
+    if "N.C." not in labels:
+        labels.append("N.C.")
+    nc = labels.index("N.C.")
+    segs.label = np.where(segs.conf < threshold, nc, segs.label)
+    segs.labels = labels
 
     # Step 2: Merge consecutive identical labels
-    merged: list[tuple[float, float, str, float]] = []
-    for start, end, chord, conf in cleaned:
-        if merged and merged[-1][2] == chord:
-            prev_start, prev_end, _, prev_conf = merged[-1]
-            prev_dur = prev_end - prev_start
-            curr_dur = end - start
-            new_conf = (prev_conf * prev_dur + conf * curr_dur) / (prev_dur + curr_dur)
-            merged[-1] = (prev_start, end, chord, float(new_conf))
-        else:
-            merged.append((start, end, chord, conf))
-
-    return merged
+    return coalesce_runs(segs).to_tuples()
 
 
 # ── ONNX session management ───────────────────────────────────────────────
 
+def _resolve_model_path() -> Path | None:
+    """The ONNX file `_get_onnx_session` would load, or None if none exists."""
+    if USE_QUANTIZED_MODEL and QUANT_MODEL_PATH.exists():
+        return QUANT_MODEL_PATH
+    if CHORD_MODEL_PATH.exists():
+        return CHORD_MODEL_PATH
+    return None
+
+
+def model_fingerprint() -> str:
+    """
+    Identity of the chord model currently in use (file name, size, mtime).
+    Used to version server-side result caches so a model swap invalidates them.
+    """
+    path = _resolve_model_path()
+    if path is None:
+        return "dsp"
+    st = path.stat()
+    return f"{path.name}:{st.st_size}:{int(st.st_mtime)}"
+
+
 def _get_onnx_session():
-    """Lazily load the ONNX model once per process. Cached after first call."""
-    global _onnx_session, _onnx_load_attempted
+    """
+    Lazily load the ONNX model once per process. Cached after first call.
+    Returns an `OnnxSessionPool` (same `run` signature as a session) or None.
+    """
+    global _onnx_session, _onnx_load_attempted, _onnx_batcher
     if _onnx_load_attempted:
         return _onnx_session
     _onnx_load_attempted = True
@@ -93,8 +135,9 @@ def _get_onnx_session():
             return None
 
     try:
-        import onnxruntime as ort
-        _onnx_session = ort.InferenceSession(str(model_to_load), providers=["CPUExecutionProvider"])
+        _onnx_session = OnnxSessionPool(model_to_load).start()
+        if ONNX_BATCH_WINDOW_MS > 0:
+            _onnx_batcher = InferenceBatcher(_onnx_session, concurrency=_onnx_session.size)
         print(f"[chord_custom] Loaded trained chord model from {model_to_load}")
     except Exception as e:
         print(f"[chord_custom] Failed to load ONNX model ({e}); falling back to DSP.")
@@ -103,38 +146,56 @@ def _get_onnx_session():
     return _onnx_session
 
 
+def onnx_session_stats() -> dict | None:
+    """Session-pool and batching stats for /api/health, or None before the model is loaded."""
+    pool = _onnx_session
+    if not isinstance(pool, OnnxSessionPool):
+        return None
+    return {**pool.stats(), "batching": _onnx_batcher.stats() if _onnx_batcher is not None else None}
+
+
 # ── ONNX-based chord detection ─────────────────────────────────────────────
 
-def _detect_chords_onnx(file_path: Path) -> list[tuple[float, float, str, float]]:
+def _detect_chords_onnx(ctx: AnalysisContext) -> list[tuple[float, float, str, float]]:
     """Run batched ONNX CRNN inference with Viterbi smoothing."""
     sess = _get_onnx_session()
-    y, sr = load_audio(str(file_path))
-    log_cqt = extract_cnn_input(y, sr)  # (n_bins, n_frames)
+    sr = ctx.sr
+    log_cqt = ctx.cnn_input  # (n_bins, n_frames)
     _, n_frames = log_cqt.shape
     frame_rate = sr / HOP_LENGTH
 
-    # For very long files (>10 minutes), use chunked inference to avoid OOM
+    # Long tracks (or ONNX_INFERENCE_MODE=windowed): overlapped windows,
+    # several per call, so memory stays bounded (see ml/windowing.py)
     duration = n_frames * HOP_LENGTH / sr
-    max_duration_sec = 600.0
-
-    if duration > max_duration_sec:
-        # Chunked fallback
-        chunk_frames = 200
-        all_logits = np.zeros((n_frames, NUM_CLASSES), dtype=np.float32)
-        for start in range(0, n_frames, chunk_frames):
-            end = min(start + chunk_frames, n_frames)
-            chunk = log_cqt[:, start:end][None, None, :, :]
-            out = sess.run(None, {"log_cqt": chunk.astype(np.float32)})[0]
-            all_logits[start:end] = out[0]
-    else:
-        # Batch full-track CQT into a single ONNX inference call
-        chunk = log_cqt[None, None, :, :]  # (1, 1, n_bins, n_frames)
-        out = sess.run(None, {"log_cqt": chunk.astype(np.float32)})[0]  # (1, n_frames, 109)
-        all_logits = out[0]
+    windowed = ONNX_INFERENCE_MODE == "windowed" or (
+        ONNX_INFERENCE_MODE == "auto" and duration > ONNX_MAX_FULL_TRACK_SEC
+    )
+
+    with stage("crnn"):
+        if windowed:
+            if ONNX_INFERENCE_MODE == "auto":
+                print(
+                    f"[chord_custom] {duration:.0f}s track exceeds ONNX_MAX_FULL_TRACK_SEC="
+                    f"{ONNX_MAX_FULL_TRACK_SEC:.0f}; using windowed inference"
+                )
+            all_logits = windowed_logits(
+                lambda batch: sess.run(None, {"log_cqt": batch})[0],
+                log_cqt,
+                window=ONNX_WINDOW_FRAMES,
+                overlap=ONNX_WINDOW_OVERLAP_FRAMES,
+                batch_size=ONNX_WINDOW_BATCH,
+            )
+        elif _onnx_batcher is not None and sess is _onnx_batcher.session:
+            # Full track, batched with other requests arriving at the same time
+            all_logits = _onnx_batcher.infer(log_cqt)
+        else:
+            # Batch full-track CQT into a single ONNX inference call
+            chunk = log_cqt[None, None, :, :]  # (1, 1, n_bins, n_frames)
+            out = sess.run(None, {"log_cqt": chunk.astype(np.float32)})[0]  # (1, n_frames, 109)
+            all_logits = out[0]
 
     # Convert logits to probabilities via softmax
-    e = np.exp(all_logits - all_logits.max(axis=-1, keepdims=True))
-    probs = e / e.sum(axis=-1, keepdims=True)
+    probs = logits_to_probs(all_logits)
 
     # Apply HMM Viterbi smoothing
     smoothed_segments = smooth_chord_sequence(
@@ -153,10 +214,32 @@ def _detect_chords_onnx(file_path: Path) -> list[tuple[float, float, str, float]
     return _filter_low_confidence_segments(results, threshold=0.35)
 
 
+def accurate_frame_scores(chroma: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Accurate-mode frame scoring: (sims, chroma norms, softmax probs)."""
+    templates = build_templates()  # (109, 12)
+    nc_idx = LABEL_TO_IDX["N.C."]
+
+    # Cosine similarity for all frames in one batched matmul
+    sims, norms = score_chroma_frames(chroma, templates, nc_idx, min_norm=0.15)
+
+    # Softmax with temperature scaling
+    tau = 0.20
+    e = np.exp(sims / tau)
+    probs = e / e.sum(axis=-1, keepdims=True)
+    return sims, norms, probs
+
+
+def logits_to_probs(logits: np.ndarray) -> np.ndarray:
+    """Row-wise softmax of CRNN logits."""
+    e = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+
 # ── Public API ──────────────────────────────────────────────────────────────
 
+@stage("chords")
 def detect_chords_custom(
-    file_path: Path,
+    file_path: Path | AnalysisContext,
     mode: str = "fast",
 ) -> list[tuple[float, float, str, float]]:
     """
@@ -168,44 +251,26 @@ def detect_chords_custom(
       - "fast": Batched ONNX CRNN with HMM Viterbi smoothing.
       - "accurate": HPSS + CQT chroma template matching + HMM Viterbi.
     """
+    ctx = as_context(file_path)
+
     if mode == "fast":
         sess = _get_onnx_session()
         if sess is not None:
             try:
-                return _detect_chords_onnx(file_path)
+                return _detect_chords_onnx(ctx)
             except Exception as e:
                 print(f"[chord_custom] ONNX inference failed ({e}); falling back to DSP.")
         # Fallback to DSP if ONNX unavailable or failed
         mode = "accurate"
 
     # ACCURATE MODE: classical template matching with HPSS + CQT + Viterbi
-    import librosa
-
-    y, sr = load_audio(str(file_path))
-    y_harmonic = librosa.effects.harmonic(y)  # HPSS harmonic isolation
-    chroma = extract_cqt_chroma(y_harmonic, sr)  # (n_frames, 12)
+    sr = ctx.sr
+    chroma = ctx.harmonic_chroma  # HPSS harmonic isolation → (n_frames, 12)
     n_frames = len(chroma)
     frame_rate = sr / HOP_LENGTH
 
-    templates = build_templates()  # (109, 12)
     nc_idx = LABEL_TO_IDX["N.C."]
-
-    # Cosine similarity per frame
-    sims = np.zeros((n_frames, NUM_CLASSES), dtype=np.float32)
-    for t in range(n_frames):
-        vec = chroma[t]
-        norm = np.linalg.norm(vec)
-        if norm < 0.15:
-            sims[t, nc_idx] = 1.0
-        else:
-            v = vec / (norm + 1e-8)
-            sims[t] = templates @ v
-            sims[t, nc_idx] = -1.0
-
-    # Softmax with temperature scaling
-    tau = 0.20
-    e = np.exp(sims / tau)
-    probs = e / e.sum(axis=-1, keepdims=True)
+    sims, norms, probs = accurate_frame_scores(chroma)
 
     # Viterbi smoothing
     smoothed_segments = smooth_chord_sequence(
@@ -228,8 +293,8 @@ def detect_chords_custom(
         t_end_idx = max(t_start_idx + 1, min(t_end_idx, n_frames))
 
         if seg.chord == "N.C.":
-            confs = [1.0 - np.linalg.norm(chroma[t]) for t in range(t_start_idx, t_end_idx)]
-            mean_conf = float(np.mean(confs)) if confs else 0.0
+            confs = 1.0 - norms[t_start_idx:t_end_idx]
+            mean_conf = float(np.mean(confs)) if len(confs) else 0.0
         else:
             confs = (sims[t_start_idx:t_end_idx, seg_idx] + 1.0) / 2.0
             mean_conf = float(np.mean(confs))
@@ -239,11 +304,11 @@ def detect_chords_custom(
     return _filter_low_confidence_segments(results, threshold=0.35)
 
 
-def detect_key_custom(file_path: Path) -> str:
+def detect_key_custom(file_path: Path | AnalysisContext) -> str:
     """Returns e.g. 'C major' or 'A minor'."""
-    return detect_key_dsp(str(file_path))
+    return detect_key_dsp(file_path)
 
 
-def detect_tempo_custom(file_path: Path) -> float:
+def detect_tempo_custom(file_path: Path | AnalysisContext) -> float:
     """Returns BPM as a float, e.g. 120.0."""
-    return detect_tempo_dsp(str(file_path))
+    return detect_tempo_dsp(file_path)
@@ -15,6 +15,9 @@ from __future__ import annotations
 import os
 from pathlib import Path
 
+from ml.analysis_context import AnalysisContext, as_context
+from ml.instrumentation import analysis_mode
+
 # Standard drop-in variables for main.py
 CHORD_MODEL_PATH = Path(
     os.environ.get("CHORD_MODEL_PATH", Path(__file__).parent / "chord_model.onnx")
@@ -37,8 +40,10 @@ except (ImportError, ModuleNotFoundError):
 
 try:
     from backend.analysis import _get_diatonic_quality
+    from backend.job_control import CancellationToken, ProgressCallback, check_cancelled
 except (ImportError, ModuleNotFoundError):
     from analysis import _get_diatonic_quality
+    from job_control import CancellationToken, ProgressCallback, check_cancelled
 
 
 def _clean_label(label: str) -> str:
@@ -106,19 +111,12 @@ def _simplify_label(label: str, key: str = "C", scale: str = "major") -> str:
         return root
 
 
-def analyze_file_fast(file_path: Path, mode: str = "fast") -> dict:
+def format_fast_result(chords: list[tuple[float, float, str, float]], key_str: str, tempo: float) -> dict:
     """
-    Production-ready chord analysis endpoint.
-    Returns a dict matching the frontend's AnalysisResult type.
+    Build the frontend AnalysisResult dict from raw (start, end, label,
+    confidence) segments, a key string ("C major" / "Am") and a tempo.
     """
-    print(f"[Custom Audio API] Running fast hybrid analysis for {file_path.name} | Mode: {mode}...")
-
-    # 1. Run the custom ML/ONNX + DSP pipeline
-    chords = detect_chords_custom(file_path, mode=mode)
-    key_str = detect_key_custom(file_path)
-    tempo = detect_tempo_custom(file_path)
-
-    # 2. Parse key string (e.g., "C major" or "Am")
+    # 1. Parse key string (e.g., "C major" or "Am")
     if " " in key_str:
         key, scale = key_str.split(" ", 1)
     elif key_str.endswith("m"):
@@ -128,7 +126,7 @@ def analyze_file_fast(file_path: Path, mode: str = "fast") -> dict:
         key = key_str
         scale = "major"
 
-    # 3. Format chords for the React frontend
+    # 2. Format chords for the React frontend
     formatted_chords = []
     simple_chords = []
 
@@ -149,7 +147,7 @@ def analyze_file_fast(file_path: Path, mode: str = "fast") -> dict:
             "confidence": float(confidence),
         })
 
-    # 4. Merge consecutive identical simple chords
+    # 3. Merge consecutive identical simple chords
     merged_simple: list[dict] = []
     for sc in simple_chords:
         if merged_simple and merged_simple[-1]["chord"] == sc["chord"]:
@@ -158,7 +156,7 @@ def analyze_file_fast(file_path: Path, mode: str = "fast") -> dict:
         else:
             merged_simple.append(sc.copy())
 
-    # 5. Filter short simple-chord segments (<1.0s) by merging into neighbors
+    # 4. Filter short simple-chord segments (<1.0s) by merging into neighbors
     final_simple: list[dict] = []
     for i, sc in enumerate(merged_simple):
         dur = sc["end"] - sc["start"]
@@ -172,7 +170,7 @@ def analyze_file_fast(file_path: Path, mode: str = "fast") -> dict:
         else:
             final_simple.append(sc)
 
-    result = {
+    return {
         "tempo": float(tempo),
         "meter": 4,
         "key": key,
@@ -181,5 +179,41 @@ def analyze_file_fast(file_path: Path, mode: str = "fast") -> dict:
         "simpleChords": final_simple,
     }
 
-    print(f"[Custom Audio API] Analysis complete | Key: {key} {scale} | Tempo: {tempo} BPM | Chords: {len(formatted_chords)}")
+
+@analysis_mode("fast")
+def analyze_file_fast(
+    file_path: Path | str | AnalysisContext,
+    mode: str = "fast",
+    progress_cb: ProgressCallback | None = None,
+    cancel_token: CancellationToken | None = None,
+) -> dict:
+    """
+    Production-ready chord analysis endpoint.
+    Returns a dict matching the frontend's AnalysisResult type.
+
+    `file_path` may also be an AnalysisContext, e.g. decoded audio shared
+    with a pool worker (see process_pool.py). `progress_cb` and
+    `cancel_token` work as in the other engines (see job_control.py).
+    """
+    check_cancelled(cancel_token)
+    if progress_cb:
+        progress_cb(2, "Running the chord model...", 10)
+    ctx = as_context(file_path)
+    name = ctx.file_path.name if ctx.file_path is not None else "<in-memory audio>"
+    print(f"[Custom Audio API] Running fast hybrid analysis for {name} | Mode: {mode}...")
+
+    # 1. Run the custom ML/ONNX + DSP pipeline over one shared context, so the
+    #    file is decoded and its CQT computed once for all three detectors
+    chords = detect_chords_custom(ctx, mode=mode)
+    check_cancelled(cancel_token)
+    if progress_cb:
+        progress_cb(3, "Detecting key & tempo...", 70)
+    key_str = detect_key_custom(ctx)
+    tempo = detect_tempo_custom(ctx)
+
+    result = format_fast_result(chords, key_str, tempo)
+    print(
+        f"[Custom Audio API] Analysis complete | Key: {result['key']} {result['scale']} | "
+        f"Tempo: {tempo} BPM | Chords: {len(result['chords'])}"
+    )
     return result
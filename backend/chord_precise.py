@@ -26,7 +26,16 @@ import librosa
 import numpy as np
 import scipy.ndimage
 import scipy.stats
-import torch
+
+from ml.instrumentation import analysis_mode, stage
+from ml.segments import SegmentArrays, coalesce_runs, merge_short_segments
+
+try:
+    from backend.analysis import load_or_separate_stems
+    from backend.job_control import CancellationToken, check_cancelled, scale_progress
+except (ImportError, ModuleNotFoundError):
+    from analysis import load_or_separate_stems
+    from job_control import CancellationToken, check_cancelled, scale_progress
 
 # ---------------------------------------------------------------------------
 # Chord vocabulary for precise mode (extended: 170 chords vs 108 in balanced)
@@ -93,6 +102,16 @@ def _build_precise_templates() -> tuple[list[str], np.ndarray]:
 CHORD_NAMES, CHORD_TEMPLATES = _build_precise_templates()
 N_CHORDS = len(CHORD_NAMES)  # 1 + 12*16 = 193 (including N.C.)
 
+# Precomputed once for the batched ensemble scorer (Stage 4)
+_TEMPLATES_CENTERED = CHORD_TEMPLATES - CHORD_TEMPLATES.mean(axis=1, keepdims=True)
+_TEMPLATE_STD = _TEMPLATES_CENTERED.std(axis=1)            # 0 for N.C.
+_TEMPLATE_SQ_NORM = np.einsum("ij,ij->i", CHORD_TEMPLATES, CHORD_TEMPLATES)
+# Root pitch class per chord (-1 for N.C.), used by the bass-root boost
+CHORD_ROOT_PC = np.array(
+    [PITCH_CLASS_NAMES.index(n.split(":")[0]) if ":" in n else -1 for n in CHORD_NAMES],
+    dtype=np.int64,
+)
+
 # ---------------------------------------------------------------------------
 # Diatonic / secondary-dominant bias tables
 # ---------------------------------------------------------------------------
@@ -154,64 +173,43 @@ def _get_bias_indices(key: str, scale: str) -> dict[str, list[int]]:
 # Stage 1 — Deep Stem Separation
 # ---------------------------------------------------------------------------
 
-def _precise_separate_stems(audio_path: Path, progress_cb: Callable | None = None) -> np.ndarray:
+_PRECISE_STEM_MODEL = "htdemucs_6s"
+_HARMONIC_STEMS = ["guitar", "piano", "other"]
+
+
+@stage("resample")
+def _harmonic_mix_22k(stems: dict[str, np.ndarray], sr: int) -> np.ndarray:
+    """Sum the mono harmonic stems (drums, bass, vocals excluded) and resample to 22050 Hz."""
+    harmonic_mono = sum(stems[s] for s in _HARMONIC_STEMS if s in stems)
+    return librosa.resample(np.asarray(harmonic_mono, dtype=np.float32), orig_sr=sr, target_sr=22050)
+
+
+def _precise_separate_stems(
+    audio_path: Path,
+    progress_cb: Callable | None = None,
+    cancel_token: CancellationToken | None = None,
+) -> np.ndarray:
     """
     Use Demucs htdemucs_6s to separate guitar, piano, and other stems,
     then sum them into a single clean harmonic signal (drums, bass, vocals removed).
 
-    Returns mono numpy array at 44100 Hz.
+    Uses the process-wide htdemucs_6s separator (loaded once, see
+    model_manager.py) and the stem cache, so audio already separated by
+    /api/separate (6-stem) or an earlier precise run skips Demucs entirely.
+
+    Returns mono numpy array at 22050 Hz.
     Falls back to the raw mix if separation fails.
     """
     if progress_cb:
         progress_cb(1, "Separating guitar & piano stems via Demucs...", 10)
 
     try:
-        from demucs.apply import apply_model
-        from demucs.pretrained import get_model
-
-        model = get_model("htdemucs_6s")
-        model.cpu()
-        model.eval()
-        sr = model.samplerate
-
-        print("[Precise] Loading audio for stem separation...")
-        y, _ = librosa.load(str(audio_path), sr=sr, mono=False, duration=300)
-
-        if y.ndim == 1:
-            wav = torch.from_numpy(y).unsqueeze(0)
-        else:
-            wav = torch.from_numpy(y)
-
-        if wav.shape[0] > model.audio_channels:
-            wav = wav[: model.audio_channels]
-        elif wav.shape[0] < model.audio_channels:
-            wav = wav.repeat(model.audio_channels, 1)
-
-        ref = wav.mean(0)
-        wav_norm = (wav - ref.mean()) / (ref.std() + 1e-8)
-
-        print(f"[Precise] Running Demucs htdemucs_6s on {wav.shape[1]/sr:.1f}s (CPU)...")
-        with torch.no_grad():
-            sources = apply_model(model, wav_norm[None], shifts=0, overlap=0.0, progress=True)[0]
-        sources = sources * ref.std() + ref.mean()
-
-        source_dict = dict(zip(model.sources, sources))
-
-        # Sum harmonic stems: guitar + piano + other (exclude drums, bass, vocals)
-        harmonic_stems = ["guitar", "piano", "other"]
-        harmonic = sum(
-            source_dict[s].cpu().numpy()
-            for s in harmonic_stems
-            if s in source_dict
+        # Shared warm htdemucs_6s model + stem cache (see analysis.load_or_separate_stems)
+        stems, sr, _ = load_or_separate_stems(
+            audio_path, _PRECISE_STEM_MODEL, overlap=0.0,
+            progress_cb=scale_progress(progress_cb, 10, 35), cancel_token=cancel_token,
         )
-
-        # Convert stereo → mono and resample to 22050 for librosa pipeline
-        if harmonic.ndim > 1:
-            harmonic_mono = harmonic.mean(axis=0)
-        else:
-            harmonic_mono = harmonic
-
-        harmonic_22k = librosa.resample(harmonic_mono, orig_sr=sr, target_sr=22050)
+        harmonic_22k = _harmonic_mix_22k(stems, sr)
 
         gc.collect()
         print("[Precise] Stem separation complete. Harmonic signal isolated.")
@@ -219,7 +217,8 @@ def _precise_separate_stems(audio_path: Path, progress_cb: Callable | None = Non
 
     except Exception as e:
         print(f"[Precise] Stem separation failed ({e}); using raw mix as fallback.")
-        y, _ = librosa.load(str(audio_path), sr=22050, mono=True, duration=300)
+        with stage("decode"):
+            y, _ = librosa.load(str(audio_path), sr=22050, mono=True, duration=300)
         gc.collect()
         return y
 
@@ -245,6 +244,7 @@ def _apply_chroma_noise_floor(chroma: np.ndarray, floor_ratio: float = 0.15) ->
     return chroma * mask
 
 
+@stage("cqt")
 def _extract_triple_chroma(y: np.ndarray, sr: int, hop_length: int, progress_cb: Callable | None = None) -> tuple[np.ndarray, np.ndarray]:
     """
     Compute a weighted ensemble of three chroma representations:
@@ -334,6 +334,7 @@ def _extract_triple_chroma(y: np.ndarray, sr: int, hop_length: int, progress_cb:
 # Stage 3 — Beat-Synced + Structure-Aware Segmentation
 # ---------------------------------------------------------------------------
 
+@stage("boundaries")
 def _compute_boundaries(y: np.ndarray, sr: int, hop_length: int, progress_cb: Callable | None = None) -> np.ndarray:
     """
     Compute a merged set of boundary frames from:
@@ -412,124 +413,144 @@ def _compute_boundaries(y: np.ndarray, sr: int, hop_length: int, progress_cb: Ca
 # Stage 4 — Ensemble Template Matching
 # ---------------------------------------------------------------------------
 
-def _ensemble_score(chroma_vec: np.ndarray) -> np.ndarray:
+def _ensemble_scores(vecs: np.ndarray) -> np.ndarray:
     """
-    Compute per-chord scores using a weighted ensemble of 3 metrics:
+    Compute per-chord scores for a batch of chroma vectors using a weighted
+    ensemble of 3 metrics:
       0.50 × cosine similarity
       0.35 × Pearson correlation
       0.15 × Euclidean proximity
 
-    Returns shape (N_CHORDS,) score array.
+    `vecs` is (n_segments, 12) with non-zero rows. Returns (n_segments, N_CHORDS).
     """
+    vecs = np.asarray(vecs, dtype=np.float32)
+
     # Cosine
-    norm = np.linalg.norm(chroma_vec)
-    if norm < 1e-9:
-        return np.zeros(N_CHORDS, dtype=np.float32)
-    v_norm = chroma_vec / norm
-    cosine = CHORD_TEMPLATES @ v_norm  # (N,)
-
-    # Pearson correlation
-    v_centered = chroma_vec - chroma_vec.mean()
-    v_std = v_centered.std()
-    pearson = np.zeros(N_CHORDS, dtype=np.float32)
-    if v_std > 1e-9:
-        for i, tpl in enumerate(CHORD_TEMPLATES):
-            t_centered = tpl - tpl.mean()
-            t_std = t_centered.std()
-            if t_std < 1e-9:
-                pearson[i] = 0.0
-            else:
-                pearson[i] = float(np.dot(v_centered, t_centered) / (v_std * t_std + 1e-9))
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    v_norm = vecs / norms
+    cosine = v_norm @ CHORD_TEMPLATES.T
+
+    # Pearson correlation (centered dot over the product of std devs; the
+    # templates are centered once at import)
+    v_centered = vecs - vecs.mean(axis=1, keepdims=True)
+    v_std = v_centered.std(axis=1)
+    pearson = (v_centered @ _TEMPLATES_CENTERED.T) / (v_std[:, None] * _TEMPLATE_STD[None, :] + 1e-9)
+    pearson[v_std <= 1e-9] = 0.0
+    pearson[:, _TEMPLATE_STD < 1e-9] = 0.0
     pearson = np.clip(pearson, -1.0, 1.0)
 
-    # Euclidean proximity: 1 / (1 + ||v - tpl||)
-    diffs = np.linalg.norm(CHORD_TEMPLATES - v_norm[None, :], axis=1)
-    euclidean = 1.0 / (1.0 + diffs)
+    # Euclidean proximity: 1 / (1 + ||v - tpl||), with ||v|| = 1
+    sq_dist = _TEMPLATE_SQ_NORM[None, :] + 1.0 - 2.0 * cosine
+    euclidean = 1.0 / (1.0 + np.sqrt(np.maximum(sq_dist, 0.0)))
 
     return (0.50 * cosine + 0.35 * pearson + 0.15 * euclidean).astype(np.float32)
 
 
-def _detect_segment_chord(
+def _bias_multipliers(bias_indices: dict[str, list[int]]) -> np.ndarray:
+    """Per-chord key-aware bias factors (repeated indices compound, as before)."""
+    mult = np.ones(N_CHORDS, dtype=np.float32)
+    for name, factor in (("diatonic", 1.45), ("secondary", 1.20), ("borrowed", 1.10)):
+        idx = np.asarray([i for i in bias_indices[name] if i < N_CHORDS], dtype=np.int64)
+        np.multiply.at(mult, idx, factor)
+    return mult
+
+
+def _segment_medians(chroma: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """
+    Median chroma of every [start, end) frame range → (n_segments, n_bins).
+
+    Segments are grouped by length so each group is one gather + median
+    instead of one call per segment. Ranges past the last frame are
+    truncated; empty ranges yield a zero row.
+    """
+    out = np.zeros((len(starts), chroma.shape[0]), dtype=np.float32)
+    lengths = np.minimum(ends, chroma.shape[1]) - starts
+    for length in np.unique(lengths[lengths > 0]):
+        rows = np.flatnonzero(lengths == length)
+        frames = starts[rows, None] + np.arange(length)[None, :]   # (k, length)
+        out[rows] = np.median(chroma[:, frames], axis=2).T
+    return out
+
+
+@stage("chords")
+def _detect_segment_chords(
     chroma: np.ndarray,
     chroma_bass: np.ndarray,
-    s_frame: int,
-    e_frame: int,
+    starts: np.ndarray,
+    ends: np.ndarray,
     sr: int,
     hop_length: int,
     bias_indices: dict[str, list[int]],
-) -> dict:
-    """Detect the best chord for one segment using ensemble scoring + key-aware bias."""
-
-    cseg = chroma[:, s_frame:e_frame]
-    vec = np.median(cseg, axis=1)
-    norm = np.linalg.norm(vec)
-
-    t_start = float(librosa.frames_to_time(s_frame, sr=sr, hop_length=hop_length))
-    t_end   = float(librosa.frames_to_time(e_frame, sr=sr, hop_length=hop_length))
-
-    if norm < 0.12:
-        return {"start": t_start, "end": t_end, "chord": "N.C.", "confidence": 0.0, "bass": None}
-
-    scores = _ensemble_score(vec)
-
-    # Key-aware bias
-    for idx in bias_indices["diatonic"]:
-        if idx < N_CHORDS:
-            scores[idx] *= 1.45
-    for idx in bias_indices["secondary"]:
-        if idx < N_CHORDS:
-            scores[idx] *= 1.20
-    for idx in bias_indices["borrowed"]:
-        if idx < N_CHORDS:
-            scores[idx] *= 1.10
-
-    # Bass root bias: boost chords whose root matches the dominant bass note
-    bass_seg = chroma_bass[:, s_frame:e_frame]
-    bass_vec = np.median(bass_seg, axis=1)
-    bass_norm = np.linalg.norm(bass_vec)
-    if bass_norm > 1e-9:
-        bass_vec_n = bass_vec / bass_norm
-    else:
-        bass_vec_n = np.zeros(12)
-
-    dominant_bass_pc = int(np.argmax(bass_vec_n))
-    bass_confidence  = float(bass_vec_n[dominant_bass_pc])
-
-    # Boost all templates whose root matches the dominant bass pitch class
-    for i, name in enumerate(CHORD_NAMES):
-        if ":" in name:
-            root_part = name.split(":")[0]
-            if root_part in PITCH_CLASS_NAMES:
-                root_pc = PITCH_CLASS_NAMES.index(root_part)
-                if root_pc == dominant_bass_pc:
-                    scores[i] *= (1.0 + 0.12 * bass_confidence)
-
-    best_idx = int(np.argmax(scores))
-    chord_name = CHORD_NAMES[best_idx]
-
-    # Confidence: raw cosine of best template (unbiased)
-    conf = float(np.dot(vec / (norm + 1e-9), CHORD_TEMPLATES[best_idx]))
-
-    if conf < 0.35:
-        return {"start": t_start, "end": t_end, "chord": "N.C.", "confidence": float(conf), "bass": None}
-
-    # Slash chord detection: if bass note ≠ root and bass is confident, annotate
-    slash_chord = None
-    if bass_confidence > 0.65 and ":" in chord_name:
-        root_part = chord_name.split(":")[0]
-        if root_part in PITCH_CLASS_NAMES:
-            root_pc = PITCH_CLASS_NAMES.index(root_part)
-            if dominant_bass_pc != root_pc:
-                bass_name = PITCH_CLASS_NAMES[dominant_bass_pc]
-                slash_chord = f"{_format_chord(chord_name)}/{bass_name}"
+) -> list[dict]:
+    """Detect the best chord for every segment using ensemble scoring + key-aware bias."""
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    n_seg = len(starts)
+    if n_seg == 0:
+        return []
 
-    return {
-        "start": t_start,
-        "end": t_end,
-        "chord": slash_chord if slash_chord else _format_chord(chord_name),
-        "confidence": float(np.clip(conf, 0.0, 1.0)),
-        "bass": PITCH_CLASS_NAMES[dominant_bass_pc] if bass_confidence > 0.5 else None,
-    }
+    vecs = _segment_medians(chroma, starts, ends)
+    norms = np.linalg.norm(vecs, axis=1)
+    t_starts = librosa.frames_to_time(starts, sr=sr, hop_length=hop_length)
+    t_ends = librosa.frames_to_time(ends, sr=sr, hop_length=hop_length)
+
+    active = norms >= 0.12
+    best_idx = np.zeros(n_seg, dtype=np.int64)
+    conf = np.zeros(n_seg, dtype=np.float32)
+    dominant_bass_pc = np.zeros(n_seg, dtype=np.int64)
+    bass_confidence = np.zeros(n_seg, dtype=np.float32)
+
+    if active.any():
+        scores = _ensemble_scores(vecs[active])
+
+        # Key-aware bias
+        scores *= _bias_multipliers(bias_indices)[None, :]
+
+        # Bass root bias: boost chords whose root matches the dominant bass note
+        bass_vecs = _segment_medians(chroma_bass, starts[active], ends[active])
+        bass_norms = np.linalg.norm(bass_vecs, axis=1, keepdims=True)
+        bass_vecs_n = np.where(bass_norms > 1e-9, bass_vecs / np.maximum(bass_norms, 1e-9), 0.0)
+        bass_pc = np.argmax(bass_vecs_n, axis=1)
+        bass_conf = bass_vecs_n[np.arange(len(bass_pc)), bass_pc]
+
+        root_match = CHORD_ROOT_PC[None, :] == bass_pc[:, None]
+        scores *= np.where(root_match, 1.0 + 0.12 * bass_conf[:, None], 1.0).astype(np.float32)
+
+        best = np.argmax(scores, axis=1)
+
+        # Confidence: raw cosine of best template (unbiased)
+        v_unit = vecs[active] / (norms[active, None] + 1e-9)
+        conf[active] = np.einsum("ij,ij->i", v_unit, CHORD_TEMPLATES[best])
+        best_idx[active] = best
+        dominant_bass_pc[active] = bass_pc
+        bass_confidence[active] = bass_conf
+
+    segments: list[dict] = []
+    for i in range(n_seg):
+        t_start, t_end = float(t_starts[i]), float(t_ends[i])
+        if not active[i]:
+            segments.append({"start": t_start, "end": t_end, "chord": "N.C.", "confidence": 0.0, "bass": None})
+            continue
+        if conf[i] < 0.35:
+            segments.append({"start": t_start, "end": t_end, "chord": "N.C.", "confidence": float(conf[i]), "bass": None})
+            continue
+
+        chord_name = CHORD_NAMES[best_idx[i]]
+        bass_pc_i = int(dominant_bass_pc[i])
+
+        # Slash chord detection: if bass note ≠ root and bass is confident, annotate
+        slash_chord = None
+        if bass_confidence[i] > 0.65 and CHORD_ROOT_PC[best_idx[i]] >= 0 and bass_pc_i != CHORD_ROOT_PC[best_idx[i]]:
+            slash_chord = f"{_format_chord(chord_name)}/{PITCH_CLASS_NAMES[bass_pc_i]}"
+
+        segments.append({
+            "start": t_start,
+            "end": t_end,
+            "chord": slash_chord if slash_chord else _format_chord(chord_name),
+            "confidence": float(np.clip(conf[i], 0.0, 1.0)),
+            "bass": PITCH_CLASS_NAMES[bass_pc_i] if bass_confidence[i] > 0.5 else None,
+        })
+    return segments
 
 
 def _format_chord(colon_label: str) -> str:
@@ -605,43 +626,46 @@ def _smooth_precise(
     """
     if not segments:
         return []
-    merged: list[dict] = []
-    cur = segments[0].copy()
-    for seg in segments[1:]:
-        if seg["chord"] == cur["chord"]:
-            cur["end"] = seg["end"]
-            cur["confidence"] = max(cur["confidence"], seg["confidence"])
-        else:
-            merged.append(cur)
-            cur = seg.copy()
-    merged.append(cur)
-    # Absorb short/low-confidence segments
-    hard_min_dur = min(hard_min_dur, min_dur)
-    final: list[dict] = []
-    for i, seg in enumerate(merged):
-        dur = seg["end"] - seg["start"]
-        must_merge = dur < hard_min_dur
-        may_merge = (not must_merge) and dur < min_dur and seg.get("confidence", 0.0) < confidence_threshold
-        if must_merge or may_merge:
-            if final:
-                final[-1]["end"] = seg["end"]
-            elif i + 1 < len(merged):
-                merged[i + 1]["start"] = seg["start"]
-            else:
-                final.append(seg)
-        else:
-            final.append(seg)
-    return final
+    segs = SegmentArrays.from_records(
+        [s["start"] for s in segments],
+        [s["end"] for s in segments],
+        [s["chord"] for s in segments],
+        [s.get("confidence", 0.0) for s in segments],
+    )
+    segs = coalesce_runs(segs, conf_mode="max")
+    # Absorb short/low-confidence segments into the left neighbor (right one at
+    # the start of the track); absorbing keeps the neighbor's confidence
+    segs = merge_short_segments(
+        segs,
+        min_dur=min_dur,
+        hard_min_dur=hard_min_dur,
+        conf_threshold=confidence_threshold,
+        prefer="left",
+        absorb_conf="keep",
+        coalesce_conf="max",
+    )
+    return [
+        {
+            **segments[src],
+            "start": float(segs.start[i]),
+            "end": float(segs.end[i]),
+            "chord": segs.chord(i),
+            "confidence": float(segs.conf[i]),
+        }
+        for i, src in enumerate(segs.src.tolist())
+    ]
 
 
 # ---------------------------------------------------------------------------
 # Public entry point
 # ---------------------------------------------------------------------------
 
+@analysis_mode("precise")
 def analyze_file_precise(
     file_path: Path,
     separate_vocals: bool = False,
     progress_cb: Callable[[int, str, int], None] | None = None,
+    cancel_token: CancellationToken | None = None,
 ) -> dict:
     """
     Maximum-accuracy chord analysis.
@@ -651,6 +675,8 @@ def analyze_file_precise(
         separate_vocals: If True, stem separation is always run regardless.
                          In precise mode, stems are ALWAYS separated (this param is ignored).
         progress_cb:     Optional callback(stage, message, percent) for streaming progress.
+        cancel_token:    Optional CancellationToken; checked between stages and
+                         on every Demucs chunk (raises JobCancelled).
 
     Returns:
         dict with keys: tempo, meter, key, scale, chords, simpleChords
@@ -659,7 +685,8 @@ def analyze_file_precise(
     hop_length = 512
 
     # ── Stage 1: Stem separation ─────────────────────────────────────────
-    y = _precise_separate_stems(file_path, progress_cb=progress_cb)
+    y = _precise_separate_stems(file_path, progress_cb=progress_cb, cancel_token=cancel_token)
+    check_cancelled(cancel_token)
 
     if y.size == 0:
         return {"tempo": 0, "meter": 4, "key": "C", "scale": "major", "chords": [], "simpleChords": []}
@@ -669,35 +696,39 @@ def analyze_file_precise(
     # ── Stage 2: Triple chroma extraction ────────────────────────────────
     chroma, chroma_bass = _extract_triple_chroma(y, sr, hop_length, progress_cb=progress_cb)
     n_frames = chroma.shape[1]
+    check_cancelled(cancel_token)
 
     # ── Key estimation (Krumhansl-Schmuckler on ensemble chroma) ─────────
     MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
     MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
-    chroma_mean = chroma.mean(axis=1)
-    best_score, best_key, best_scale = -1e9, "C", "major"
-    for tonic in range(12):
-        for profile, scale_name in [(MAJOR_PROFILE, "major"), (MINOR_PROFILE, "minor")]:
-            score = float(np.dot(chroma_mean, np.roll(profile, tonic)))
-            if score > best_score:
-                best_score, best_key, best_scale = score, PITCH_CLASS_NAMES[tonic], scale_name
+    with stage("key"):
+        chroma_mean = chroma.mean(axis=1)
+        best_score, best_key, best_scale = -1e9, "C", "major"
+        for tonic in range(12):
+            for profile, scale_name in [(MAJOR_PROFILE, "major"), (MINOR_PROFILE, "minor")]:
+                score = float(np.dot(chroma_mean, np.roll(profile, tonic)))
+                if score > best_score:
+                    best_score, best_key, best_scale = score, PITCH_CLASS_NAMES[tonic], scale_name
     key, scale = best_key, best_scale
     print(f"[Precise] Detected key: {key} {scale}")
 
     # ── Meter estimation ─────────────────────────────────────────────────
-    try:
-        tempo_ref, _ = librosa.beat.beat_track(y=y, sr=sr, hop_length=hop_length)
-        onset_env    = librosa.onset.onset_strength(y=y, sr=sr)
-        beat_gap     = (60.0 / float(tempo_ref)) * sr / hop_length
-        ac           = librosa.autocorrelate(onset_env, max_size=int(beat_gap * 5) + 2)
-        lags         = [int(beat_gap * 3), int(beat_gap * 4)]
-        s3 = ac[lags[0]] if lags[0] < len(ac) else 0
-        s4 = ac[lags[1]] if lags[1] < len(ac) else 0
-        meter = 3 if s3 > s4 * 1.1 else 4
-    except Exception:
-        tempo_ref = 120.0
-        meter = 4
+    with stage("tempo"):
+        try:
+            tempo_ref, _ = librosa.beat.beat_track(y=y, sr=sr, hop_length=hop_length)
+            onset_env    = librosa.onset.onset_strength(y=y, sr=sr)
+            beat_gap     = (60.0 / float(tempo_ref)) * sr / hop_length
+            ac           = librosa.autocorrelate(onset_env, max_size=int(beat_gap * 5) + 2)
+            lags         = [int(beat_gap * 3), int(beat_gap * 4)]
+            s3 = ac[lags[0]] if lags[0] < len(ac) else 0
+            s4 = ac[lags[1]] if lags[1] < len(ac) else 0
+            meter = 3 if s3 > s4 * 1.1 else 4
+        except Exception:
+            tempo_ref = 120.0
+            meter = 4
 
     # ── Stage 3: Boundaries ───────────────────────────────────────────────
+    check_cancelled(cancel_token)
     boundaries, tempo = _compute_boundaries(y, sr, hop_length, progress_cb=progress_cb)
 
     # Use detected tempo from beat_track
@@ -707,28 +738,28 @@ def analyze_file_precise(
         tempo = 120.0
 
     # ── Stage 4: Ensemble template matching ───────────────────────────────
+    check_cancelled(cancel_token)
     if progress_cb:
         progress_cb(4, "Running ensemble chord matching (170-chord vocabulary)...", 70)
 
     bias_indices = _get_bias_indices(key, scale)
-    segments: list[dict] = []
-
-    for i in range(len(boundaries) - 1):
-        s_f = int(boundaries[i])
-        e_f = int(boundaries[i + 1])
-        if e_f <= s_f:
-            continue
-        seg = _detect_segment_chord(chroma, chroma_bass, s_f, e_f, sr, hop_length, bias_indices)
-        segments.append(seg)
 
+    seg_starts = [int(b) for b in boundaries[:-1]]
+    seg_ends = [int(b) for b in boundaries[1:]]
     # Trailing segment
-    if len(boundaries) > 0:
-        last_f = int(boundaries[-1])
-        if last_f < n_frames - 2:
-            seg = _detect_segment_chord(chroma, chroma_bass, last_f, n_frames, sr, hop_length, bias_indices)
-            segments.append(seg)
+    if len(boundaries) > 0 and int(boundaries[-1]) < n_frames - 2:
+        seg_starts.append(int(boundaries[-1]))
+        seg_ends.append(n_frames)
+
+    seg_starts_arr = np.asarray(seg_starts, dtype=np.int64)
+    seg_ends_arr = np.asarray(seg_ends, dtype=np.int64)
+    keep = seg_ends_arr > seg_starts_arr
+    segments = _detect_segment_chords(
+        chroma, chroma_bass, seg_starts_arr[keep], seg_ends_arr[keep], sr, hop_length, bias_indices
+    )
 
     # ── Stage 5: Viterbi-style smoothing ──────────────────────────────────
+    check_cancelled(cancel_token)
     if progress_cb:
         progress_cb(5, "Refining with Viterbi smoothing & inversion detection...", 88)
 
@@ -736,15 +767,16 @@ def analyze_file_precise(
     precise_min = float(np.clip(0.4 * beat_dur, 0.15, 0.50))  # tighter than balanced
     simple_min  = float(np.clip(0.5 * beat_dur, 0.20, 0.60))
 
-    smoothed = _smooth_precise(segments, min_dur=precise_min)
+    with stage("viterbi"):
+        smoothed = _smooth_precise(segments, min_dur=precise_min)
 
-    simple_chords = []
-    for seg in smoothed:
-        simple_chords.append({
-            **seg,
-            "chord": _simplify_chord_precise(seg["chord"], key, scale),
-        })
-    simple_smoothed = _smooth_precise(simple_chords, min_dur=simple_min)
+        simple_chords = []
+        for seg in smoothed:
+            simple_chords.append({
+                **seg,
+                "chord": _simplify_chord_precise(seg["chord"], key, scale),
+            })
+        simple_smoothed = _smooth_precise(simple_chords, min_dur=simple_min)
 
     # Strip internal 'bass' key (frontend doesn't use it directly)
     def _strip_bass(segs: list[dict]) -> list[dict]:
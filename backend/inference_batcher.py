@@ -0,0 +1,181 @@
+"""
+backend/inference_batcher.py
+
+Cross-request dynamic batching for the ONNX chord CRNN.
+
+The exported model has a dynamic batch axis, but `_detect_chords_onnx` ran
+one `sess.run` per track with batch=1. Under load, several fast-mode
+requests reach inference within milliseconds of each other; running them as
+one batch amortizes per-call overhead and uses the GEMM kernels with larger
+operands, so the host finishes more songs per CPU-second.
+
+How a request is served:
+
+  1. `infer(log_cqt)` queues the (n_bins, n_frames) input and blocks.
+  2. The dispatcher thread waits up to ONNX_BATCH_WINDOW_MS after the first
+     pending request (or until ONNX_BATCH_MAX_SIZE are pending), then sorts
+     the pending inputs by length and cuts them into buckets. A bucket grows
+     while its padding waste — padded frames / total frames in the batch —
+     stays at or under ONNX_BATCH_MAX_PADDING_WASTE.
+  3. Each bucket is padded to its longest input with PAD_VALUE (silence in
+     the CRNN's input scale) and run once; callers get their own logits,
+     cropped back to their length.
+
+Buckets run on up to `concurrency` threads so a session pool (onnx_sessions)
+keeps serving several batches at once. Padding only ever follows an input,
+so it affects the backward LSTM at the very end of a track; keeping the
+waste bound small keeps that tail short. Batching is per process — with
+analysis worker processes each worker batches its own requests.
+
+A window of 0 disables batching (chord_custom then calls the session
+directly).
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any
+
+import numpy as np
+
+ONNX_BATCH_WINDOW_MS = float(os.environ.get("ONNX_BATCH_WINDOW_MS", "10.0"))
+ONNX_BATCH_MAX_SIZE = int(os.environ.get("ONNX_BATCH_MAX_SIZE", "8"))
+ONNX_BATCH_MAX_PADDING_WASTE = float(os.environ.get("ONNX_BATCH_MAX_PADDING_WASTE", "0.2"))
+
+PAD_VALUE = -1.0  # cnn_input_from_cqt maps the -80 dB floor to -1
+
+
+@dataclass
+class _Request:
+    log_cqt: np.ndarray
+    future: Future = field(default_factory=Future)
+
+    @property
+    def n_frames(self) -> int:
+        return self.log_cqt.shape[1]
+
+
+def plan_batches(lengths: list[int], max_size: int, max_padding_waste: float) -> list[list[int]]:
+    """
+    Group request indices into batches: sorted by length, each batch grows
+    while len(batch) <= max_size and its padding waste <= max_padding_waste.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    batches: list[list[int]] = []
+    current: list[int] = []
+    total = 0
+    for i in order:
+        n = lengths[i]
+        if current:
+            # Sorted ascending: the candidate is the longest, so it sets the padded length
+            padded = n * (len(current) + 1)
+            waste = 1.0 - (total + n) / padded if padded else 0.0
+            if len(current) < max_size and waste <= max_padding_waste:
+                current.append(i)
+                total += n
+                continue
+            batches.append(current)
+        current, total = [i], n
+    if current:
+        batches.append(current)
+    return batches
+
+
+class InferenceBatcher:
+    """Collects concurrent CRNN inputs into padded batches for one session."""
+
+    def __init__(
+        self,
+        session: Any,
+        window_ms: float = ONNX_BATCH_WINDOW_MS,
+        max_size: int = ONNX_BATCH_MAX_SIZE,
+        max_padding_waste: float = ONNX_BATCH_MAX_PADDING_WASTE,
+        concurrency: int = 1,
+        input_name: str = "log_cqt",
+    ):
+        self.session = session
+        self.window = max(window_ms, 0.0) / 1000
+        self.max_size = max(int(max_size), 1)
+        self.max_padding_waste = max(float(max_padding_waste), 0.0)
+        self.input_name = input_name
+
+        self._cond = threading.Condition()
+        self._pending: list[_Request] = []
+        self._executor = ThreadPoolExecutor(max_workers=max(int(concurrency), 1), thread_name_prefix="onnx-batch")
+        self._thread = threading.Thread(target=self._dispatch_loop, name="onnx-batcher", daemon=True)
+        self._thread.start()
+
+        self.requests = 0
+        self.batches = 0
+        self.largest_batch = 0
+        self.frames = 0
+        self.padded_frames = 0
+
+    def infer(self, log_cqt: np.ndarray) -> np.ndarray:
+        """Logits (n_frames, n_classes) for one (n_bins, n_frames) input."""
+        request = _Request(np.asarray(log_cqt, dtype=np.float32))
+        with self._cond:
+            self._pending.append(request)
+            self._cond.notify()
+        return request.future.result()
+
+    # ── Dispatch ────────────────────────────────────────────────────────────
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # Hold the window open from the first arrival unless the batch fills up
+                deadline = time.monotonic() + self.window
+                while len(self._pending) < self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                pending, self._pending = self._pending, []
+
+            plan = plan_batches([r.n_frames for r in pending], self.max_size, self.max_padding_waste)
+            for indices in plan:
+                self._executor.submit(self._run_batch, [pending[i] for i in indices])
+
+    def _run_batch(self, batch: list[_Request]) -> None:
+        longest = max(r.n_frames for r in batch)
+        n_bins = batch[0].log_cqt.shape[0]
+        x = np.full((len(batch), 1, n_bins, longest), PAD_VALUE, dtype=np.float32)
+        for i, r in enumerate(batch):
+            x[i, 0, :, :r.n_frames] = r.log_cqt
+        try:
+            logits = self.session.run(None, {self.input_name: x})[0]  # (B, longest, n_classes)
+        except BaseException as e:
+            for r in batch:
+                r.future.set_exception(e)
+            return
+
+        with self._cond:
+            self.requests += len(batch)
+            self.batches += 1
+            self.largest_batch = max(self.largest_batch, len(batch))
+            self.frames += sum(r.n_frames for r in batch)
+            self.padded_frames += longest * len(batch)
+        for i, r in enumerate(batch):
+            r.future.set_result(logits[i, :r.n_frames])
+
+    # ── Reporting ───────────────────────────────────────────────────────────
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "windowMs": round(self.window * 1000, 1),
+                "maxBatch": self.max_size,
+                "maxPaddingWaste": self.max_padding_waste,
+                "requests": self.requests,
+                "batches": self.batches,
+                "avgBatchSize": round(self.requests / self.batches, 2) if self.batches else 0.0,
+                "largestBatch": self.largest_batch,
+                "paddingWaste": round(1.0 - self.frames / self.padded_frames, 4) if self.padded_frames else 0.0,
+                "pending": len(self._pending),
+            }
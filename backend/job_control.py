@@ -0,0 +1,107 @@
+"""
+backend/job_control.py
+
+Cancellation and progress reporting shared by every analysis engine.
+
+Each request gets a CancellationToken that is passed down through the
+scheduler, the optional worker processes and the engines (balanced, fast,
+precise, progressive, Demucs separation). Engines call
+`token.raise_if_cancelled()` at their stage boundaries — and Demucs on every
+chunk of `apply_model` — so a job whose client went away stops within one
+stage or chunk and frees its scheduler slot.
+
+JobCancelled derives from BaseException, like asyncio.CancelledError: the
+engines' `except Exception` fallbacks (raw-mix fallback when separation
+fails, DSP fallback when ONNX fails, ...) must not swallow a cancellation
+and carry on with the expensive part.
+
+Progress keeps the `progress_cb(stage, message, percent)` signature the
+precise engine and the job store already use. `scale_progress` maps a
+nested step's 0–100 % into its slice of the caller's range, e.g. Demucs
+chunk progress into 10–35 % of a precise run.
+"""
+from __future__ import annotations
+
+import threading
+from collections.abc import Callable
+
+ProgressCallback = Callable[[int, str, int], None]
+
+
+class JobCancelled(BaseException):
+    """Raised inside a job whose CancellationToken was cancelled."""
+
+
+class CancellationToken:
+    """Thread-safe, one-way cancellation flag for one job."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: list[Callable[[], None]] = []
+        self.reason: str | None = None
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        """Cancel the job; callbacks registered with `on_cancel` run once, here."""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn()
+            except Exception as e:
+                print(f"[Jobs] Cancel callback failed: {e}")
+
+    def on_cancel(self, fn: Callable[[], None]) -> None:
+        """Call `fn` when the token is cancelled (immediately if it already is)."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(fn)
+                return
+        fn()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise JobCancelled(self.reason or "cancelled")
+
+
+def check_cancelled(token: CancellationToken | None) -> None:
+    """`token.raise_if_cancelled()`, for the optional tokens engines receive."""
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+def scale_progress(
+    progress_cb: ProgressCallback | None,
+    lo: int,
+    hi: int,
+    stage: int | None = None,
+) -> ProgressCallback | None:
+    """
+    A callback that maps 0–100 % onto [lo, hi] of `progress_cb` (and
+    optionally replaces the stage number). Repeated events are dropped.
+    """
+    if progress_cb is None:
+        return None
+    last = None
+
+    def scaled(inner_stage: int, message: str, percent: int) -> None:
+        nonlocal last
+        event = (
+            inner_stage if stage is None else stage,
+            message,
+            lo + (hi - lo) * min(max(int(percent), 0), 100) // 100,
+        )
+        if event == last:
+            return
+        last = event
+        progress_cb(*event)
+
+    return scaled
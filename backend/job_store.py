@@ -0,0 +1,228 @@
+"""
+backend/job_store.py
+
+SQLite-backed state for the asynchronous job API (/api/jobs).
+
+Long analyses (precise mode: ~90–130s) no longer have to live inside one HTTP
+request. A job row records status, the latest progress stage and the final
+result; every `progress_cb` event is appended to an event log, so a client
+that reconnects can resume `/api/jobs/{id}/events` from the last sequence
+number it saw.
+
+Statuses: queued → running → done | failed. Jobs still queued or running
+when the process stops cannot be resumed (their upload and scheduler slot
+are gone) and are marked failed on the next start.
+
+Finished jobs are kept for JOB_TTL_SECONDS (default 24h).
+"""
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+JOB_DB_PATH = Path(os.environ.get("JOB_DB_PATH", Path(tempfile.gettempdir()) / "guitariz_jobs.sqlite3"))
+JOB_TTL_SECONDS = int(os.environ.get("JOB_TTL_SECONDS", str(24 * 3600)))
+
+TERMINAL_STATUSES = ("done", "failed")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id            TEXT PRIMARY KEY,
+    status        TEXT NOT NULL,
+    mode          TEXT NOT NULL,
+    separate_vocals INTEGER NOT NULL,
+    filename      TEXT,
+    cost          REAL,
+    stage         INTEGER,
+    message       TEXT,
+    percent       REAL,
+    error         TEXT,
+    result        TEXT,
+    created_at    REAL NOT NULL,
+    started_at    REAL,
+    finished_at   REAL
+);
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id  TEXT NOT NULL,
+    seq     INTEGER NOT NULL,
+    event   TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+
+class JobStore:
+    """Thread-safe job table + per-job event log in one SQLite file."""
+
+    def __init__(self, path: str | Path = JOB_DB_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+
+    # ── Writes ──────────────────────────────────────────────────────────────
+
+    def create(self, mode: str, separate_vocals: bool, filename: str | None = None, cost: float | None = None) -> str:
+        """Insert a queued job; returns its id."""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, mode, separate_vocals, filename, cost, created_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, mode, int(bool(separate_vocals)), filename, cost, time.time()),
+            )
+        return job_id
+
+    def mark_running(self, job_id: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?",
+                (time.time(), job_id),
+            )
+
+    def add_event(self, job_id: str, event: dict) -> int:
+        """Append a progress event (and mirror its stage on the job row); returns its seq."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) + 1 FROM job_events WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            seq = int(row[0])
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "INSERT INTO job_events (job_id, seq, event) VALUES (?, ?, ?)",
+                (job_id, seq, json.dumps(event)),
+            )
+            if event.get("type") == "progress":
+                self._conn.execute(
+                    "UPDATE jobs SET stage = ?, message = ?, percent = ? WHERE id = ?",
+                    (event.get("stage"), event.get("message"), event.get("percent"), job_id),
+                )
+            self._conn.execute("COMMIT")
+        return seq
+
+    def finish(self, job_id: str, result: dict) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'done', percent = 100, result = ?, finished_at = ? WHERE id = ?",
+                (json.dumps(result), time.time(), job_id),
+            )
+
+    def fail(self, job_id: str, error: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                (error, time.time(), job_id),
+            )
+
+    def recover_interrupted(self) -> int:
+        """Fail jobs left queued/running by a previous process; returns how many."""
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Interrupted by a server restart', "
+                "finished_at = ? WHERE status IN ('queued', 'running')",
+                (time.time(),),
+            )
+            return cur.rowcount
+
+    def expire(self, ttl_seconds: float = JOB_TTL_SECONDS) -> int:
+        """Delete finished jobs older than `ttl_seconds`; returns how many."""
+        cutoff = time.time() - ttl_seconds
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "DELETE FROM job_events WHERE job_id IN "
+                "(SELECT id FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?)",
+                (cutoff,),
+            )
+            cur = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (cutoff,)
+            )
+            self._conn.execute("COMMIT")
+            return cur.rowcount
+
+    # ── Reads ───────────────────────────────────────────────────────────────
+
+    def get(self, job_id: str) -> dict | None:
+        """Client-facing status view (without the result payload)."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "status": row["status"],
+            "mode": row["mode"],
+            "separateVocals": bool(row["separate_vocals"]),
+            "stage": row["stage"],
+            "message": row["message"],
+            "percent": row["percent"] or 0,
+            "etaSeconds": _eta_seconds(row),
+            "error": row["error"],
+            "createdAt": row["created_at"],
+            "startedAt": row["started_at"],
+            "finishedAt": row["finished_at"],
+        }
+
+    def events(self, job_id: str, after: int = 0) -> list[tuple[int, dict]]:
+        """Events with seq > `after`, in order."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, event FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after),
+            ).fetchall()
+        return [(int(r["seq"]), json.loads(r["event"])) for r in rows]
+
+    def result(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute("SELECT result FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or row["result"] is None:
+            return None
+        return json.loads(row["result"])
+
+    def stats(self) -> dict:
+        """Job counts by status, for /api/health."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+
+def _eta_seconds(row: sqlite3.Row) -> float | None:
+    """Remaining seconds: from progress once the job reports it, else its cost estimate."""
+    if row["status"] in TERMINAL_STATUSES:
+        return 0.0
+    cost = row["cost"]
+    if row["status"] == "queued" or row["started_at"] is None:
+        return round(cost, 1) if cost is not None else None
+    elapsed = time.time() - row["started_at"]
+    percent = row["percent"] or 0
+    if percent > 0:
+        return round(elapsed * (100 - percent) / percent, 1)
+    return round(max(cost - elapsed, 0.0), 1) if cost is not None else None
+
+
+_JOB_STORE: JobStore | None = None
+_JOB_STORE_LOCK = threading.Lock()
+
+
+def get_job_store() -> JobStore:
+    """The process-wide job store. Jobs interrupted by a restart are failed on first use."""
+    global _JOB_STORE
+    with _JOB_STORE_LOCK:
+        if _JOB_STORE is None:
+            _JOB_STORE = JobStore()
+            interrupted = _JOB_STORE.recover_interrupted()
+            print(
+                f"[Jobs] Store ready at {_JOB_STORE.path}"
+                + (f" ({interrupted} interrupted jobs marked failed)" if interrupted else "")
+            )
+        return _JOB_STORE
@@ -6,13 +6,23 @@ FastAPI server for the Guitariz Chord AI backend.
 Endpoints:
   POST /api/analyze         — Full file upload → JSON response
   POST /api/analyze-stream  — Streaming NDJSON response (progressive chords)
+  POST /api/jobs            — Submit an analysis job, returns its id immediately
+  GET  /api/jobs/{id}       — Job status, stage and ETA
+  GET  /api/jobs/{id}/events — NDJSON progress events, then the result
+  GET  /api/jobs/{id}/result — Final result JSON
   GET  /api/health          — Health check
+  GET  /api/metrics         — Prometheus metrics (stage latencies, queues, caches)
   GET  /api/analyze/download/{id}/{filename} — Serve separated audio files
+  GET  /api/admin/profiles  — Request profiles (admin token; see profiling.py)
+  GET  /api/admin/profiles/{filename} — Download a profile (pstats / collapsed stacks)
   WS   /ws/chords           — Real-time microphone chord detection
 
 Deployed on HuggingFace Spaces (Docker, port 7860).
 """
+import asyncio
+import json
 import logging
+import math
 import os
 import shutil
 import socket
@@ -22,15 +32,24 @@ import threading
 import time
 import uuid
 from contextlib import asynccontextmanager
+from functools import partial
 from pathlib import Path
 
 import dns.resolver
 import httpx
 import uvicorn
 from analysis import STEM_TYPES, analyze_file, separate_audio_full, separate_audio_stems
-from fastapi import FastAPI, File, Form, HTTPException, UploadFile, WebSocket
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from job_store import TERMINAL_STATUSES, get_job_store
+from ml import tracing
+from ml.instrumentation import REGISTRY, MetricFamily, analysis_mode
+from result_cache import copy_and_hash, get_result_cache, make_key
+from process_pool import get_analysis_pool
+from progressive import PROGRESSIVE_STREAMING, ProgressiveAnalyzer
+from single_flight import Flight, get_single_flight
+from starlette.concurrency import run_in_threadpool
 from websocket_chords import websocket_chord_endpoint
 from youtube import (
     check_rate_limit,
@@ -40,6 +59,46 @@ from youtube import (
     get_video_info,
 )
 
+# The same job_control module the engines and scheduler import, so
+# `except JobCancelled` here matches what they raise
+try:
+    from backend.job_control import CancellationToken, JobCancelled, scale_progress
+except (ImportError, ModuleNotFoundError):
+    from job_control import CancellationToken, JobCancelled, scale_progress
+
+# Likewise the scheduler: admission control must watch the queue this
+# module fills, not a second scheduler of its own
+try:
+    from backend.admission import SEPARATION, Admission, get_admission_controller, probe_audio
+    from backend.scheduler import SEPARATION_COST_FACTOR, audio_duration, estimate_cost, get_scheduler, is_heavy
+except (ImportError, ModuleNotFoundError):
+    from admission import SEPARATION, Admission, get_admission_controller, probe_audio
+    from scheduler import SEPARATION_COST_FACTOR, audio_duration, estimate_cost, get_scheduler, is_heavy
+
+# Likewise the model manager and stem cache: health and metrics report the
+# models and stems the engines (analysis.py) actually use
+try:
+    from backend.model_manager import get_model_manager
+    from backend.stem_cache import get_stem_cache
+except (ImportError, ModuleNotFoundError):
+    from model_manager import get_model_manager
+    from stem_cache import get_stem_cache
+
+# Likewise the thread budget: a profile tuned at startup must reach the
+# budget the scheduler leases from and ONNX sessions are sized by
+try:
+    from backend.autotune import AUTOTUNE_ON_STARTUP, load_profile, run_autotune
+    from backend.thread_budget import get_thread_budget
+except (ImportError, ModuleNotFoundError):
+    from autotune import AUTOTUNE_ON_STARTUP, load_profile, run_autotune
+    from thread_budget import get_thread_budget
+
+# Likewise profiling: the scheduler reads the session this module starts
+try:
+    from backend.profiling import current_session, get_profiler
+except (ImportError, ModuleNotFoundError):
+    from profiling import current_session, get_profiler
+
 # Try to import custom fast ONNX engine, but don't fail if it's not available
 try:
     from chord_fast import FAST_ENGINE_AVAILABLE, FAST_ENGINE_ERROR, analyze_file_fast
@@ -151,11 +210,38 @@ print("[DIAG] Diagnostics complete.\n")
 # Store separated audio files temporarily (in production, use S3/cloud storage)
 separated_files: dict[str, dict] = {}
 
-# Concurrency Control
-MAX_CONCURRENT_SEPARATION = 1
-separation_semaphore = threading.Semaphore(MAX_CONCURRENT_SEPARATION)
-MAX_CONCURRENT_CHORDS = 3
-chord_semaphore = threading.Semaphore(MAX_CONCURRENT_CHORDS)
+# Concurrency control: engine work runs on the scheduler's heavy / light
+# worker pools (see scheduler.py); requests await their job without holding
+# a threadpool thread while queued.
+scheduler = get_scheduler()
+
+# Optional multi-process workers (ANALYSIS_WORKER_PROCESSES > 0), forked in
+# lifespan once the models are loaded so they share the weights copy-on-write
+analysis_pool = get_analysis_pool()
+
+# Asynchronous jobs (/api/jobs): status, progress events and results in SQLite
+job_store = get_job_store()
+JOB_EVENTS_POLL_SECONDS = 0.5
+
+# Concurrent identical requests share one computation (single_flight.py)
+inflight = get_single_flight()
+_inflight_jobs: dict[str, str] = {}  # /api/jobs: cache key → its queued / running job id
+
+# Requests that would start new work are accepted, downgraded or shed with
+# 503 + Retry-After from queue depth and memory headroom (admission.py)
+admission = get_admission_controller()
+
+# Opt-in per-request profiles, downloadable under /api/admin/profiles (profiling.py)
+profiler = get_profiler()
+
+# How often a request waiting on its job checks whether the client left; when
+# a computation's last client leaves, its job is cancelled (job_control.py)
+DISCONNECT_POLL_SECONDS = float(os.environ.get("DISCONNECT_POLL_SECONDS", "1.0"))
+
+# Server-side result cache (content hash + mode + engine version → result)
+APP_VERSION = "1.3.4"
+result_cache = get_result_cache()
+stem_cache = get_stem_cache()
 
 
 def cleanup_loop():
@@ -175,6 +261,9 @@ def cleanup_loop():
                             print(f"[Cleanup] Deleted expired file: {path}")
                     except Exception as e:
                         print(f"[Cleanup] Error deleting {p}: {e}")
+            expired_jobs = job_store.expire()
+            if expired_jobs:
+                print(f"[Cleanup] Expired {expired_jobs} finished jobs")
         except Exception as e:
             print(f"[Cleanup] Error in loop: {e}")
         time.sleep(600)
@@ -184,6 +273,12 @@ def cleanup_loop():
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    if AUTOTUNE_ON_STARTUP and load_profile() is None:
+        try:
+            get_thread_budget().set_profile(run_autotune(quick=True))
+        except Exception as e:
+            print(f"[Startup] ⚠️ Autotune failed: {e}")
+
     print("[Startup] Preloading models...")
     try:
         from analysis import _get_separator, _get_separator_6stem
@@ -193,13 +288,26 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         print(f"[Startup] ⚠️ Model preload failed: {e}")
 
+    if analysis_pool is not None:
+        analysis_pool.start()
+    elif FAST_ENGINE_AVAILABLE:
+        # Build the ONNX session pool now rather than inside the first fast
+        # request (pool workers build their own: ORT threads do not survive fork)
+        try:
+            _chord_custom()._get_onnx_session()
+        except Exception as e:
+            print(f"[Startup] ⚠️ ONNX session preload failed: {e}")
+
     thread = threading.Thread(target=cleanup_loop, daemon=True)
     thread.start()
     print("[Startup] ✓ Cleanup thread started")
     yield
 
+    if analysis_pool is not None:
+        analysis_pool.shutdown()
 
-app = FastAPI(title="Chord AI Backend", version="1.3.4", lifespan=lifespan)
+
+app = FastAPI(title="Chord AI Backend", version=APP_VERSION, lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -207,9 +315,100 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Analysis-Mode", "X-Trace-Id", "traceparent", "X-Profile-Id"],
 )
 
 
+# ── Tracing ─────────────────────────────────────────────────────────────────
+
+# Polled endpoints, not worth a trace each
+_UNTRACED_PATHS = {"/api/health", "/api/metrics"}
+
+
+class TracingMiddleware:
+    """
+    Root span per /api request (ml/tracing.py). An incoming W3C `traceparent`
+    makes it a child of the caller's trace; the trace id goes back in the
+    `X-Trace-Id` and `traceparent` response headers. The span stays open
+    until a streamed body has been sent, and the engines, scheduler jobs,
+    Demucs and YouTube spans of the request nest under it.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if (scope["type"] != "http" or not tracing.enabled()
+                or not path.startswith("/api/") or path in _UNTRACED_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        parent = tracing.parse_traceparent(headers.get(b"traceparent", b"").decode("latin-1"))
+        method = scope.get("method", "GET")
+        with tracing.span(
+            f"{method} {path}", parent=parent, kind=tracing.KIND_SERVER, **{"http.method": method, "http.target": path},
+        ) as sp:
+            async def send_with_trace(message):
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    sp.set_attribute("http.status_code", status)
+                    if status >= 500:
+                        sp.set_status(tracing.STATUS_ERROR, f"HTTP {status}")
+                    message["headers"] = [
+                        *message.get("headers", []),
+                        (b"x-trace-id", sp.trace_id.encode()),
+                        (b"traceparent", sp.traceparent.encode()),
+                    ]
+                await send(message)
+
+            await self.app(scope, receive, send_with_trace)
+
+
+# ── Profiling ───────────────────────────────────────────────────────────────
+
+class ProfilingMiddleware:
+    """
+    Runs an analysis request (POST /api/...) under a profile session when
+    the profiler picks it — `X-Profile` + `X-Admin-Token` headers, or
+    PROFILE_SAMPLE_RATE — and returns the profile's id in `X-Profile-Id`.
+    The session covers the request's scheduler jobs (profiling.py).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if (not profiler.enabled or scope["type"] != "http" or scope.get("method") != "POST"
+                or not path.startswith("/api/") or path.startswith("/api/admin/")):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        mode = profiler.choose_mode(
+            headers.get(b"x-profile", b"").decode("latin-1") or None,
+            headers.get(b"x-admin-token", b"").decode("latin-1") or None,
+        )
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+
+        with profiler.session(f"POST {path}", mode) as session:
+            async def send_with_profile_id(message):
+                if message["type"] == "http.response.start":
+                    message["headers"] = [*message.get("headers", []), (b"x-profile-id", session.id.encode())]
+                await send(message)
+
+            await self.app(scope, receive, send_with_profile_id)
+
+
+# Tracing wraps profiling, so a profile records its request's trace id
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(TracingMiddleware)
+
+
 # ── Health check ────────────────────────────────────────────────────────────
 
 @app.get("/api/health")
@@ -219,238 +418,789 @@ def health():
         "status": "ok",
         "fast_engine": FAST_ENGINE_AVAILABLE,
         "precise_engine": analyze_file_precise is not None,
-        "version": "1.3.4",
+        "version": APP_VERSION,
+        "result_cache": result_cache.stats() if result_cache is not None else None,
+        "stem_cache": stem_cache.stats() if stem_cache is not None else None,
+        "models": get_model_manager().stats(),
+        "scheduler": scheduler.stats(),
+        "jobs": job_store.stats(),
+        "workerPool": analysis_pool.stats() if analysis_pool is not None else None,
+        "threads": get_thread_budget().stats(),
+        "onnx": _onnx_session_stats(),
+        "singleFlight": inflight.stats(),
+        "admission": admission.stats(),
+        "profiling": profiler.stats(),
     }
 
 
+@app.get("/api/metrics")
+def metrics():
+    """Prometheus text exposition: per-stage latency histograms (ml/instrumentation.py)
+    plus the subsystem counters /api/health reports."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def _separated_files_bytes() -> tuple[int, int]:
+    """(files, bytes on disk) held for download in `separated_files`."""
+    files = size = 0
+    for info in list(separated_files.values()):
+        for p in info.get("paths", []):
+            try:
+                size += os.path.getsize(p)
+                files += 1
+            except OSError:
+                pass
+    return files, size
+
+
+def _collect_metrics() -> list[MetricFamily]:
+    """Scrape-time export of the counters each subsystem keeps for /api/health."""
+    queue = MetricFamily("guitariz_scheduler_jobs", "gauge", "Scheduler jobs queued or running, by pool.")
+    workers = MetricFamily("guitariz_scheduler_workers", "gauge", "Scheduler worker threads, by pool.")
+    finished = MetricFamily("guitariz_scheduler_jobs_total", "counter", "Finished scheduler jobs, by pool and outcome.")
+    for pool, s in scheduler.stats().items():
+        queue.add(s["queued"], pool=pool, state="queued").add(s["running"], pool=pool, state="running")
+        workers.add(s["workers"], pool=pool)
+        for outcome in ("completed", "failed", "cancelled"):
+            finished.add(s[outcome], pool=pool, outcome=outcome)
+
+    hits = MetricFamily("guitariz_cache_hits_total", "counter", "Cache hits, by cache.")
+    misses = MetricFamily("guitariz_cache_misses_total", "counter", "Cache misses, by cache.")
+    cache_bytes = MetricFamily("guitariz_cache_bytes", "gauge", "Bytes stored on disk, by cache.")
+    for name, cache in (("result", result_cache), ("stem", stem_cache)):
+        if cache is not None:
+            s = cache.stats()
+            hits.add(s["hits"], cache=name)
+            misses.add(s["misses"], cache=name)
+            cache_bytes.add(s["bytes"], cache=name)
+
+    load = MetricFamily("guitariz_model_load_seconds", "gauge", "Time taken to load each model.")
+    model_hits = MetricFamily("guitariz_model_hits_total", "counter", "Requests served by an already-loaded model.")
+    for name, s in get_model_manager().stats()["loaded"].items():
+        load.add(s["loadSeconds"], model=name)
+        model_hits.add(s["hits"], model=name)
+    onnx = _onnx_session_stats()
+    sessions = MetricFamily("guitariz_onnx_sessions", "gauge", "ONNX inference sessions, by state.")
+    if onnx is not None:
+        load.add(onnx["loadSeconds"], model="onnx")
+        sessions.add(onnx["sessions"] - onnx["idle"], state="busy").add(onnx["idle"], state="idle")
+
+    files, size = _separated_files_bytes()
+    downloads = [
+        MetricFamily("guitariz_separated_files", "gauge", "Separated audio files held for download.").add(files),
+        MetricFamily("guitariz_separated_files_bytes", "gauge", "Bytes of separated audio held for download.").add(size),
+    ]
+
+    decisions = MetricFamily("guitariz_admission_decisions_total", "counter", "Admission decisions, by endpoint and action.")
+    for (endpoint, action), n in sorted(admission.decisions().items()):
+        decisions.add(n, endpoint=endpoint, action=action)
+
+    flights = inflight.stats()
+    coalescing = [
+        MetricFamily("guitariz_inflight_computations", "gauge", "Computations shared by concurrent identical requests.")
+        .add(flights["inFlight"]),
+        MetricFamily("guitariz_inflight_requests_total", "counter", "Requests that started or joined a computation.")
+        .add(flights["started"], role="leader").add(flights["joined"], role="joined"),
+    ]
+
+    jobs = MetricFamily("guitariz_jobs", "gauge", "Jobs in the /api/jobs store, by status.")
+    for status, n in job_store.stats().items():
+        jobs.add(n, status=status)
+
+    return [queue, workers, finished, hits, misses, cache_bytes, load, model_hits, sessions,
+            *downloads, decisions, *coalescing, jobs]
+
+
+REGISTRY.add_collector(_collect_metrics)
+
+
+def _chord_custom():
+    """chord_custom as the engines import it (backend-first), so its ONNX pool is theirs."""
+    try:
+        from backend import chord_custom
+    except (ImportError, ModuleNotFoundError):
+        import chord_custom
+    return chord_custom
+
+
+def _onnx_session_stats() -> dict | None:
+    try:
+        return _chord_custom().onnx_session_stats()
+    except Exception:
+        return None
+
+
+# ── Analysis helpers ───────────────────────────────────────────────────────
+
+def _resolve_mode(mode: str, use_madmom: bool) -> str:
+    """Map the client's mode/use_madmom pair onto an engine name."""
+    if not use_madmom and mode == "fast" or mode == "accurate":
+        return "balanced"
+    return mode
+
+
+def _effective_mode(resolved_mode: str) -> str:
+    """The engine that will actually run for `resolved_mode` once fallbacks apply."""
+    if resolved_mode == "precise" and analyze_file_precise is None:
+        return "balanced"
+    if resolved_mode not in ("precise", "balanced") and not FAST_ENGINE_AVAILABLE:
+        return "balanced"
+    return resolved_mode
+
+
+def _engine_version(mode: str) -> str:
+    """Version string for result-cache keys: app version plus model identity."""
+    version = f"{APP_VERSION}/{mode}"
+    if mode == "fast":
+        try:
+            version += f"/{_chord_custom().model_fingerprint()}"
+        except Exception:
+            pass
+    return version
+
+
+def _run_analysis(
+    tmp_path: Path,
+    resolved_mode: str,
+    separate_vocals: bool,
+    progress_cb=None,
+    cancel_token: CancellationToken | None = None,
+) -> dict:
+    """Run one analysis, in a pool worker process when the pool is enabled
+    (in this process when the request is being profiled)."""
+    if analysis_pool is not None and current_session() is None:
+        return analysis_pool.run(
+            _run_engine, tmp_path, _effective_mode(resolved_mode), separate_vocals,
+            shared_audio=not separate_vocals, progress_cb=progress_cb, cancel_token=cancel_token,
+        )
+    return _run_engine(tmp_path, resolved_mode, separate_vocals, progress_cb=progress_cb, cancel_token=cancel_token)
+
+
+def _run_engine(
+    tmp_path,
+    resolved_mode: str,
+    separate_vocals: bool,
+    progress_cb=None,
+    cancel_token: CancellationToken | None = None,
+) -> dict:
+    """Dispatch one analysis to the engine for `resolved_mode`, with fallbacks.
+    `tmp_path` is a Path, or an AnalysisContext inside a pool worker."""
+    control = {"progress_cb": progress_cb, "cancel_token": cancel_token}
+    if resolved_mode == "precise":
+        if analyze_file_precise is not None:
+            print("[API] Running PRECISE mode (Deep 5-stage pipeline)")
+            return analyze_file_precise(tmp_path, separate_vocals=separate_vocals, **control)
+        print("[API] Precise engine not available, falling back to BALANCED mode")
+        return analyze_file(tmp_path, separate_vocals=separate_vocals, **control)
+
+    if resolved_mode == "balanced":
+        print(f"[API] Running BALANCED mode (Librosa DSP pipeline) | Vocal Filter: {separate_vocals}")
+        return _analyze_balanced(tmp_path, separate_vocals, control)
+
+    # Fast mode (Custom ONNX)
+    if not FAST_ENGINE_AVAILABLE:
+        print("[API] Fast engine not available, falling back to BALANCED mode")
+        return _analyze_balanced(tmp_path, separate_vocals, control)
+
+    if separate_vocals:
+        print("[API] Running FAST mode with vocal separation...")
+        with analysis_mode("fast"):
+            separated = separate_audio_full(
+                tmp_path, progress_cb=scale_progress(progress_cb, 0, 60), cancel_token=cancel_token,
+            )
+        if separated and separated.get("instrumental"):
+            instr_path = separated["instrumental"]
+            result = analyze_file_fast(
+                instr_path, mode="fast",
+                progress_cb=scale_progress(progress_cb, 60, 100), cancel_token=cancel_token,
+            )
+            result["instrumentalPath"] = instr_path
+            return result
+        print("[API] Vocal separation failed, using original audio")
+        result = analyze_file_fast(tmp_path, mode="fast", **control)
+        result["separationFallback"] = True
+        return result
+    print("[API] Running FAST mode (Custom ONNX) | Vocal Filter: OFF")
+    return analyze_file_fast(tmp_path, mode="fast", **control)
+
+
+def _analyze_balanced(tmp_path, separate_vocals: bool, control: dict) -> dict:
+    result = analyze_file(tmp_path, separate_vocals=separate_vocals, **control)
+    if separate_vocals and "instrumentalPath" not in result:
+        # analyze_file fell back to the original mix
+        result["separationFallback"] = True
+    return result
+
+
+def _save_upload(file: UploadFile) -> tuple[Path, str]:
+    """Spool an upload to a temp file; returns (path, sha256 of its bytes)."""
+    suffix = Path(file.filename).suffix or ".tmp"
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        content_hash = copy_and_hash(file.file, tmp)
+    return Path(tmp.name), content_hash
+
+
+def _cache_key(content_hash: str, resolved_mode: str, separate_vocals: bool, progressive: bool = False) -> str:
+    mode = _effective_mode(resolved_mode)
+    version = _engine_version(mode) + ("/progressive" if progressive else "")
+    return make_key(content_hash, mode, separate_vocals, version)
+
+
+def _cached_result(cache_key: str) -> dict | None:
+    """Result-cache lookup. A cached instrumental is copied out so the
+    download cleanup loop can never delete the cache's own copy."""
+    if result_cache is None:
+        return None
+    hit = result_cache.get(cache_key)
+    if hit is None:
+        return None
+    result, instrumental = hit
+    if instrumental is not None:
+        with tempfile.NamedTemporaryFile(delete=False, suffix="_instrumental.wav") as tmp:
+            pass
+        try:
+            shutil.copyfile(instrumental, tmp.name)
+        except OSError as e:
+            # Evicted between get() and the copy: treat it as a miss
+            print(f"[ResultCache] Cached instrumental unavailable: {e}")
+            Path(tmp.name).unlink(missing_ok=True)
+            return None
+        result["instrumentalPath"] = tmp.name
+    return result
+
+
+def _store_result(cache_key: str, result: dict) -> None:
+    """Cache a finished result, unless its vocal separation failed and it fell
+    back to the original mix: that is not what `separate_vocals` asked for,
+    and a transient Demucs failure must not be served until evicted."""
+    if result.pop("separationFallback", False):
+        return
+    if result_cache is not None:
+        result_cache.put(cache_key, result, result.get("instrumentalPath"))
+
+
+def _register_instrumental(result: dict) -> str | None:
+    """Move `instrumentalPath` into the download registry; returns its URL."""
+    if "instrumentalPath" not in result:
+        return None
+    file_id = str(uuid.uuid4())
+    path = result.pop("instrumentalPath")
+    separated_files[file_id] = {
+        "paths": [path],
+        "timestamp": time.time(),
+        "type": "analysis",
+    }
+    print(f"Stored instrumental file with ID: {file_id}")
+    return f"/api/analyze/download/{file_id}/instrumental.wav"
+
+
+def _analysis_job_cost(tmp_path: Path, resolved_mode: str, separate_vocals: bool) -> tuple[float, bool]:
+    """(estimated seconds, needs heavy pool) for one analysis job."""
+    mode = _effective_mode(resolved_mode)
+    cost = estimate_cost(audio_duration(tmp_path), mode, separate_vocals)
+    return cost, is_heavy(mode, separate_vocals)
+
+
+def _schedule_analysis(
+    tmp_path: Path,
+    resolved_mode: str,
+    separate_vocals: bool,
+    cost: float,
+    heavy: bool,
+    progress_cb=None,
+    cancel_token: CancellationToken | None = None,
+) -> asyncio.Future:
+    """Queue `_run_analysis` on the scheduler; returns an awaitable future."""
+    return asyncio.wrap_future(scheduler.submit(
+        _run_analysis, tmp_path, resolved_mode, separate_vocals,
+        progress_cb=progress_cb, cancel_token=cancel_token, cost=cost, heavy=heavy,
+    ))
+
+
+def _is_progressive(resolved_mode: str, separate_vocals: bool) -> bool:
+    """Whether /api/analyze-stream analyzes this request block by block (progressive.py)."""
+    return (
+        PROGRESSIVE_STREAMING
+        and not separate_vocals
+        and _effective_mode(resolved_mode) in ("fast", "balanced")
+    )
+
+
+def _run_progressive(tmp_path: Path, resolved_mode: str, emit, cancel_token: CancellationToken | None = None) -> dict:
+    return ProgressiveAnalyzer(tmp_path, _effective_mode(resolved_mode), cancel_token=cancel_token).run(emit)
+
+
+def _schedule_progressive(
+    tmp_path: Path,
+    resolved_mode: str,
+    cost: float,
+    emit,
+    cancel_token: CancellationToken | None = None,
+) -> asyncio.Future:
+    """Queue a progressive analysis; `emit` receives its NDJSON events as they are ready.
+    Runs in this process even with worker processes, so events stream directly."""
+    return asyncio.wrap_future(scheduler.submit(
+        _run_progressive, tmp_path, resolved_mode, emit, cancel_token, cost=cost, heavy=False,
+    ))
+
+
+def _overloaded(decision: Admission) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=f"Server busy ({decision.reason}), retry in {decision.retry_after}s",
+        headers={"Retry-After": str(decision.retry_after)},
+    )
+
+
+def _precheck(endpoint: str, mode: str, separate_vocals: bool = False) -> None:
+    """Shed load on the queue-depth cap before an upload is spooled (503)."""
+    decision = admission.precheck(endpoint, mode, separate_vocals)
+    if not decision.admitted:
+        raise _overloaded(decision)
+
+
+async def _admit(endpoint: str, tmp_path: Path | None, mode: str, separate_vocals: bool = False) -> Admission:
+    """Admission for a request that would start a new job; 503 when rejected."""
+    info = await run_in_threadpool(probe_audio, tmp_path) if tmp_path is not None else None
+    decision = admission.admit(endpoint, info, mode, separate_vocals)
+    if not decision.admitted:
+        raise _overloaded(decision)
+    return decision
+
+
+async def _admit_analysis(endpoint: str, tmp_path: Path, resolved_mode: str, separate_vocals: bool) -> str | None:
+    """Admission for a new analysis job: the mode it was downgraded to, if
+    any (callers then redo their cache / in-flight lookups for that mode)."""
+    decision = await _admit(endpoint, tmp_path, _effective_mode(resolved_mode), separate_vocals)
+    return decision.mode if decision.action == "downgrade" else None
+
+
+async def _wait_for_disconnect(request: Request) -> None:
+    """Return once the client behind `request` has gone away."""
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+    print(f"[API] Client disconnected from {request.url.path}")
+
+
+async def _await_flight(flight: Flight, request: Request):
+    """This client's copy of the flight's result; JobCancelled if the client
+    disconnects first (the flight goes on while other clients wait for it)."""
+    disconnect = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        await asyncio.wait({flight.task, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnect.cancel()
+    if not flight.task.done():
+        raise JobCancelled("client disconnected")
+    return flight.result()
+
+
+async def _flight_lines(flight: Flight, request: Request):
+    """NDJSON lines for the flight's events — replayed from its start, then
+    live — until it finishes; JobCancelled if the client disconnects first."""
+    events = flight.listen()
+    # Long stretches without a line to send would not notice a disconnect
+    disconnect = asyncio.ensure_future(_wait_for_disconnect(request))
+    getter = None
+    try:
+        while not flight.task.done():
+            getter = asyncio.ensure_future(events.get())
+            await asyncio.wait({flight.task, getter, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield json.dumps(getter.result()) + "\n"
+            else:
+                getter.cancel()
+            if disconnect.done():
+                raise JobCancelled("client disconnected")
+        while not events.empty():
+            yield json.dumps(events.get_nowait()) + "\n"
+    finally:
+        if getter is not None:
+            getter.cancel()
+        disconnect.cancel()
+        flight.unlisten(events)
+
+
+async def _analysis_flight(
+    flight: Flight,
+    tmp_path: Path,
+    resolved_mode: str,
+    separate_vocals: bool,
+    cache_key: str,
+    progressive: bool = False,
+) -> dict:
+    """The shared work behind identical analysis requests: schedule the job,
+    publish its events on the flight, cache the result. Owns `tmp_path`."""
+    job = None
+    try:
+        cost, heavy = await run_in_threadpool(_analysis_job_cost, tmp_path, resolved_mode, separate_vocals)
+        if progressive:
+            job = _schedule_progressive(tmp_path, resolved_mode, cost, flight.emit, flight.cancel_token)
+        else:
+            job = _schedule_analysis(
+                tmp_path, resolved_mode, separate_vocals, cost, heavy, flight.progress_cb, flight.cancel_token,
+            )
+        result = await job
+        await run_in_threadpool(_store_result, cache_key, result)
+        return result
+    finally:
+        _discard_upload(tmp_path, job, flight.cancel_token)
+
+
+def _discard_upload(
+    tmp_path: Path,
+    job: asyncio.Future | None = None,
+    cancel_token: CancellationToken | None = None,
+) -> None:
+    """Delete an upload once no job can still read it. A job that was still
+    queued is dropped; a running one is cancelled through `cancel_token`
+    and deletes the file when it stops."""
+    def unlink(_=None):
+        try:
+            tmp_path.unlink(missing_ok=True)
+        except Exception:
+            pass
+
+    if job is not None and not job.done():
+        job.cancel()
+        if cancel_token is not None:
+            cancel_token.cancel("request ended")
+        job.add_done_callback(unlink)
+    else:
+        unlink()
+
+
+def _ndjson_result_lines(result: dict, instrumental_url: str | None = None):
+    """Serialize a finished result as the metadata + 30-second chord chunks protocol."""
+    metadata = {
+        "type": "metadata",
+        "tempo": result.get("tempo", 120),
+        "meter": result.get("meter", 4),
+        "key": result.get("key", "C"),
+        "scale": result.get("scale", "major"),
+    }
+    if instrumental_url:
+        metadata["instrumentalUrl"] = instrumental_url
+    yield json.dumps(metadata) + "\n"
+
+    # Yield chords in 30-second chunks
+    chords = result.get("chords", [])
+    simple_chords = result.get("simpleChords", chords)
+    duration = max((c["end"] for c in chords), default=0)
+
+    chunk_size_sec = 30.0
+    if duration <= 0:
+        yield json.dumps({
+            "type": "chords", "start": 0, "end": 0,
+            "chords": chords, "simpleChords": simple_chords,
+        }) + "\n"
+        return
+
+    num_chunks = int(math.ceil(duration / chunk_size_sec))
+    for i in range(num_chunks):
+        c_start = i * chunk_size_sec
+        c_end = (i + 1) * chunk_size_sec
+        chunk_chords = [c for c in chords if c["end"] > c_start and c["start"] < c_end]
+        chunk_simple = [c for c in simple_chords if c["end"] > c_start and c["start"] < c_end]
+        yield json.dumps({
+            "type": "chords", "start": c_start, "end": c_end,
+            "chords": chunk_chords, "simpleChords": chunk_simple,
+        }) + "\n"
+
+
 # ── Chord analysis endpoints ───────────────────────────────────────────────
 
 @app.post("/api/analyze")
-def analyze(
+async def analyze(
+    request: Request,
     file: UploadFile = File(...),
     separate_vocals: bool = Form(False),
     use_madmom: bool = Form(True),
     mode: str = Form("fast"),
 ):
     """Analyze audio file for chords, key, tempo, and meter."""
-    resolved_mode = mode
-    if not use_madmom and mode == "fast" or mode == "accurate":
-        resolved_mode = "balanced"
+    resolved_mode = _resolve_mode(mode, use_madmom)
 
     print(f"Received analysis request for file: {file.filename} (separate_vocals={separate_vocals}, mode={resolved_mode})")
 
-    is_heavy = separate_vocals or resolved_mode == "precise"
-    active_semaphore = separation_semaphore if is_heavy else chord_semaphore
-
-    with active_semaphore:
-        try:
-            if not file.filename:
-                raise HTTPException(status_code=400, detail="File required")
-
-            suffix = Path(file.filename).suffix or ".tmp"
-            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-                shutil.copyfileobj(file.file, tmp)
-                tmp_path = Path(tmp.name)
+    if not file.filename:
+        raise HTTPException(status_code=400, detail="File required")
 
-            try:
-                if resolved_mode == "precise":
-                    if analyze_file_precise is not None:
-                        print("[API] Running PRECISE mode (Deep 5-stage pipeline)")
-                        result = analyze_file_precise(tmp_path, separate_vocals=separate_vocals)
-                    else:
-                        print("[API] Precise engine not available, falling back to BALANCED mode")
-                        result = analyze_file(tmp_path, separate_vocals=separate_vocals)
-                elif resolved_mode == "balanced":
-                    print(f"[API] Running BALANCED mode (Librosa DSP pipeline) | Vocal Filter: {separate_vocals}")
-                    result = analyze_file(tmp_path, separate_vocals=separate_vocals)
-                else:
-                    # Fast mode (Custom ONNX)
-                    if FAST_ENGINE_AVAILABLE:
-                        if separate_vocals:
-                            print("[API] Running FAST mode with vocal separation...")
-                            separated = separate_audio_full(tmp_path)
-                            if separated and separated.get("instrumental"):
-                                instr_path = separated["instrumental"]
-                                result = analyze_file_fast(instr_path, mode="fast")
-                                result["instrumentalPath"] = instr_path
-                            else:
-                                print("[API] Vocal separation failed, using original audio")
-                                result = analyze_file_fast(tmp_path, mode="fast")
-                        else:
-                            print("[API] Running FAST mode (Custom ONNX) | Vocal Filter: OFF")
-                            result = analyze_file_fast(tmp_path, mode="fast")
-                    else:
-                        print("[API] Fast engine not available, falling back to BALANCED mode")
-                        result = analyze_file(tmp_path, separate_vocals=separate_vocals)
-
-                # Store instrumental file if vocal separation was used
-                if "instrumentalPath" in result:
-                    file_id = str(uuid.uuid4())
-                    path = result["instrumentalPath"]
-                    separated_files[file_id] = {
-                        "paths": [path],
-                        "timestamp": time.time(),
-                        "type": "analysis",
-                    }
-                    result["instrumentalUrl"] = f"/api/analyze/download/{file_id}/instrumental.wav"
-                    print(f"Stored instrumental file with ID: {file_id}")
-                    del result["instrumentalPath"]
-
-                print(f"Returning result with keys: {result.keys()}")
-                return JSONResponse(result)
-            except Exception as e:
-                print(f"[API] Analysis failed: {e}")
-                import traceback
-                traceback.print_exc()
-                raise HTTPException(status_code=500, detail=f"Analysis failed: {e}")
-        finally:
-            try:
-                if 'tmp_path' in locals():
-                    tmp_path.unlink(missing_ok=True)
-            except Exception:
-                pass
+    _precheck("analyze", _effective_mode(resolved_mode), separate_vocals)
+    tmp_path, content_hash = await run_in_threadpool(_save_upload, file)
+    handed_off = False  # the upload belongs to the flight that analyzes it
+    headers = {}
+    try:
+        cache_key = _cache_key(content_hash, resolved_mode, separate_vocals)
+        result = await run_in_threadpool(_cached_result, cache_key)
+        if result is None and not inflight.running(cache_key):
+            downgraded = await _admit_analysis("analyze", tmp_path, resolved_mode, separate_vocals)
+            if downgraded:
+                resolved_mode, headers = downgraded, {"X-Analysis-Mode": downgraded}
+                cache_key = _cache_key(content_hash, resolved_mode, separate_vocals)
+                result = await run_in_threadpool(_cached_result, cache_key)
+        if result is not None:
+            # Cache hits never enter the scheduler queues
+            print(f"[API] Result cache hit ({content_hash[:12]}, mode={resolved_mode})")
+        else:
+            start = partial(
+                _analysis_flight, tmp_path=tmp_path, resolved_mode=resolved_mode,
+                separate_vocals=separate_vocals, cache_key=cache_key,
+            )
+            async with inflight.attach(cache_key, start) as (flight, handed_off):
+                try:
+                    result = await _await_flight(flight, request)
+                except JobCancelled:
+                    raise HTTPException(status_code=499, detail="Client closed request")
+                except Exception as e:
+                    print(f"[API] Analysis failed: {e}")
+                    import traceback
+                    traceback.print_exc()
+                    raise HTTPException(status_code=500, detail=f"Analysis failed: {e}")
+
+        # Store instrumental file if vocal separation was used
+        instrumental_url = _register_instrumental(result)
+        if instrumental_url:
+            result["instrumentalUrl"] = instrumental_url
+
+        print(f"Returning result with keys: {result.keys()}")
+        return JSONResponse(result, headers=headers)
+    finally:
+        if not handed_off:
+            _discard_upload(tmp_path)
 
 
 @app.post("/api/analyze-stream")
-def analyze_stream(
+async def analyze_stream(
+    request: Request,
     file: UploadFile = File(...),
     separate_vocals: bool = Form(False),
     use_madmom: bool = Form(True),
     mode: str = Form("fast"),
 ):
     """Analyze audio and stream chords back in NDJSON chunks."""
-    import json
-    import math
-
-    resolved_mode = mode
-    if not use_madmom and mode == "fast" or mode == "accurate":
-        resolved_mode = "balanced"
+    resolved_mode = _resolve_mode(mode, use_madmom)
 
     print(f"Received streaming request for file: {file.filename} (mode={resolved_mode})")
 
-    is_heavy = separate_vocals or resolved_mode == "precise"
-    active_semaphore = separation_semaphore if is_heavy else chord_semaphore
-
     try:
         if not file.filename:
             raise HTTPException(status_code=400, detail="File required")
 
-        suffix = Path(file.filename).suffix or ".tmp"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            shutil.copyfileobj(file.file, tmp)
-            tmp_path = Path(tmp.name)
+        _precheck("analyze-stream", _effective_mode(resolved_mode), separate_vocals)
+        tmp_path, content_hash = await run_in_threadpool(_save_upload, file)
+        headers = {}
+        try:
+            progressive = _is_progressive(resolved_mode, separate_vocals)
+            cache_key = _cache_key(content_hash, resolved_mode, separate_vocals, progressive)
+            cached = await run_in_threadpool(_cached_result, cache_key)
+            if cached is None and not inflight.running(cache_key):
+                downgraded = await _admit_analysis("analyze-stream", tmp_path, resolved_mode, separate_vocals)
+                if downgraded:
+                    resolved_mode, headers = downgraded, {"X-Analysis-Mode": downgraded}
+                    progressive = _is_progressive(resolved_mode, separate_vocals)
+                    cache_key = _cache_key(content_hash, resolved_mode, separate_vocals, progressive)
+                    cached = await run_in_threadpool(_cached_result, cache_key)
+        except BaseException:
+            _discard_upload(tmp_path)
+            raise
+
+        async def ndjson_generator():
+            handed_off = False
+            try:
+                result = cached
+                if result is None:
+                    start = partial(
+                        _analysis_flight, tmp_path=tmp_path, resolved_mode=resolved_mode,
+                        separate_vocals=separate_vocals, cache_key=cache_key, progressive=progressive,
+                    )
+                    async with inflight.attach(cache_key, start) as (flight, handed_off):
+                        # Progress lines and progressive chord / metadata lines
+                        # from the worker thread, as they arrive
+                        async for line in _flight_lines(flight, request):
+                            yield line
+                        result = flight.result()
+                else:
+                    print(f"[API] Result cache hit ({content_hash[:12]}, mode={resolved_mode})")
 
-        def ndjson_generator():
-            with active_semaphore:
-                try:
-                    if resolved_mode == "precise" and analyze_file_precise is not None:
-                        import queue
-                        q = queue.Queue()
-
-                        def run_precise():
-                            try:
-                                res = analyze_file_precise(
-                                    tmp_path,
-                                    separate_vocals=separate_vocals,
-                                    progress_cb=lambda stage, msg, pct: q.put({
-                                        "type": "progress", "stage": stage,
-                                        "message": msg, "percent": pct,
-                                    }),
-                                )
-                                q.put({"type": "result", "result": res})
-                            except Exception as inner_err:
-                                q.put({"type": "error", "detail": str(inner_err)})
-
-                        t_thread = threading.Thread(target=run_precise)
-                        t_thread.start()
-
-                        result = None
-                        while True:
-                            item = q.get()
-                            if item["type"] == "progress":
-                                yield json.dumps(item) + "\n"
-                            elif item["type"] == "result":
-                                result = item["result"]
-                                break
-                            elif item["type"] == "error":
-                                raise Exception(item["detail"])
-                    else:
-                        # Fast or Balanced mode
-                        if resolved_mode == "balanced":
-                            result = analyze_file(tmp_path, separate_vocals=separate_vocals)
-                        else:
-                            if FAST_ENGINE_AVAILABLE:
-                                if separate_vocals:
-                                    separated = separate_audio_full(tmp_path)
-                                    if separated and separated.get("instrumental"):
-                                        result = analyze_file_fast(separated["instrumental"], mode="fast")
-                                        result["instrumentalPath"] = separated["instrumental"]
-                                    else:
-                                        result = analyze_file_fast(tmp_path, mode="fast")
-                                else:
-                                    result = analyze_file_fast(tmp_path, mode="fast")
-                            else:
-                                result = analyze_file(tmp_path, separate_vocals=separate_vocals)
-
-                    # Handle instrumental file
-                    instrumental_url = None
-                    if "instrumentalPath" in result:
-                        file_id = str(uuid.uuid4())
-                        path = result["instrumentalPath"]
-                        separated_files[file_id] = {
-                            "paths": [path], "timestamp": time.time(), "type": "analysis",
-                        }
-                        instrumental_url = f"/api/analyze/download/{file_id}/instrumental.wav"
-
-                    # Yield metadata
-                    metadata = {
-                        "type": "metadata",
-                        "tempo": result.get("tempo", 120),
-                        "meter": result.get("meter", 4),
-                        "key": result.get("key", "C"),
-                        "scale": result.get("scale", "major"),
-                    }
-                    if instrumental_url:
-                        metadata["instrumentalUrl"] = instrumental_url
-                    yield json.dumps(metadata) + "\n"
-
-                    # Yield chords in 30-second chunks
-                    chords = result.get("chords", [])
-                    simple_chords = result.get("simpleChords", chords)
-                    duration = max((c["end"] for c in chords), default=0)
-
-                    chunk_size_sec = 30.0
-                    if duration <= 0:
-                        yield json.dumps({
-                            "type": "chords", "start": 0, "end": 0,
-                            "chords": chords, "simpleChords": simple_chords,
-                        }) + "\n"
-                        return
-
-                    num_chunks = int(math.ceil(duration / chunk_size_sec))
-                    for i in range(num_chunks):
-                        c_start = i * chunk_size_sec
-                        c_end = (i + 1) * chunk_size_sec
-                        chunk_chords = [c for c in chords if c["end"] > c_start and c["start"] < c_end]
-                        chunk_simple = [c for c in simple_chords if c["end"] > c_start and c["start"] < c_end]
-                        yield json.dumps({
-                            "type": "chords", "start": c_start, "end": c_end,
-                            "chords": chunk_chords, "simpleChords": chunk_simple,
-                        }) + "\n"
+                # Final (or cached) result; after a progressive run these lines
+                # replace the provisional chords with the refined key's labels
+                instrumental_url = _register_instrumental(result)
+                for line in _ndjson_result_lines(result, instrumental_url):
+                    yield line
 
-                except Exception as e:
-                    yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
-                finally:
-                    try:
-                        tmp_path.unlink(missing_ok=True)
-                    except Exception:
-                        pass
+            except JobCancelled as e:
+                print(f"[API] Streaming analysis abandoned ({e})")
+            except Exception as e:
+                yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
+            finally:
+                if not handed_off:
+                    _discard_upload(tmp_path)
 
-        return StreamingResponse(ndjson_generator(), media_type="application/x-ndjson")
+        return StreamingResponse(ndjson_generator(), media_type="application/x-ndjson", headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ── Job API ─────────────────────────────────────────────────────────────────
+
+def _run_job(job_id: str, tmp_path: Path, resolved_mode: str, separate_vocals: bool, cache_key: str) -> None:
+    """Scheduler job behind POST /api/jobs: runs the analysis and records
+    progress, result or failure in the job store."""
+    job_store.mark_running(job_id)
+    try:
+        result = _run_analysis(
+            tmp_path, resolved_mode, separate_vocals,
+            progress_cb=lambda stage, msg, pct: job_store.add_event(job_id, {
+                "type": "progress", "stage": stage, "message": msg, "percent": pct,
+            }),
+        )
+        _store_result(cache_key, result)
+        instrumental_url = _register_instrumental(result)
+        if instrumental_url:
+            result["instrumentalUrl"] = instrumental_url
+        job_store.finish(job_id, result)
+        print(f"[Jobs] {job_id} done")
+    except Exception as e:
+        print(f"[Jobs] {job_id} failed: {e}")
+        job_store.fail(job_id, str(e))
+    finally:
+        if _inflight_jobs.get(cache_key) == job_id:
+            _inflight_jobs.pop(cache_key, None)
+        try:
+            tmp_path.unlink(missing_ok=True)
+        except Exception:
+            pass
+
+
+def _get_job_or_404(job_id: str) -> dict:
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+
+@app.post("/api/jobs", status_code=202)
+async def submit_job(
+    file: UploadFile = File(...),
+    separate_vocals: bool = Form(False),
+    use_madmom: bool = Form(True),
+    mode: str = Form("fast"),
+):
+    """Queue an analysis and return its job id without waiting for it."""
+    resolved_mode = _resolve_mode(mode, use_madmom)
+
+    if not file.filename:
+        raise HTTPException(status_code=400, detail="File required")
+
+    _precheck("jobs", _effective_mode(resolved_mode), separate_vocals)
+    tmp_path, content_hash = await run_in_threadpool(_save_upload, file)
+    cache_key = _cache_key(content_hash, resolved_mode, separate_vocals)
+    result = await run_in_threadpool(_cached_result, cache_key)
+    job_id = _inflight_job(cache_key) if result is None else None
+    if result is None and job_id is None:
+        try:
+            downgraded = await _admit_analysis("jobs", tmp_path, resolved_mode, separate_vocals)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        if downgraded:
+            # The job records the mode it actually runs
+            resolved_mode = downgraded
+            cache_key = _cache_key(content_hash, resolved_mode, separate_vocals)
+            result = await run_in_threadpool(_cached_result, cache_key)
+            job_id = _inflight_job(cache_key) if result is None else None
+
+    if result is not None:
+        # Cache hits complete immediately
+        print(f"[API] Result cache hit ({content_hash[:12]}, mode={resolved_mode})")
+        tmp_path.unlink(missing_ok=True)
+        instrumental_url = _register_instrumental(result)
+        if instrumental_url:
+            result["instrumentalUrl"] = instrumental_url
+        job_id = job_store.create(resolved_mode, separate_vocals, file.filename, cost=0.0)
+        job_store.finish(job_id, result)
+    elif job_id is not None:
+        # The same analysis is already queued or running: share its job
+        print(f"[Jobs] {file.filename} joins in-flight job {job_id}")
+        tmp_path.unlink(missing_ok=True)
+    else:
+        cost, heavy = await run_in_threadpool(_analysis_job_cost, tmp_path, resolved_mode, separate_vocals)
+        job_id = job_store.create(resolved_mode, separate_vocals, file.filename, cost=cost)
+        if inflight.enabled:
+            _inflight_jobs[cache_key] = job_id
+        scheduler.submit(
+            _run_job, job_id, tmp_path, resolved_mode, separate_vocals, cache_key,
+            cost=cost, heavy=heavy,
+        )
+        print(f"[Jobs] Queued {job_id} ({file.filename}, mode={resolved_mode}, ~{cost:.0f}s)")
+
+    return JSONResponse(_get_job_or_404(job_id), status_code=202)
+
+
+def _inflight_job(cache_key: str) -> str | None:
+    """Id of a queued or running /api/jobs job for `cache_key`, if any."""
+    job_id = _inflight_jobs.get(cache_key)
+    if job_id is None:
+        return None
+    job = job_store.get(job_id)
+    if job is None or job["status"] in TERMINAL_STATUSES:
+        _inflight_jobs.pop(cache_key, None)
+        return None
+    return job_id
+
+
+@app.get("/api/jobs/{job_id}")
+def job_status(job_id: str):
+    """Status, current stage and ETA of a job."""
+    return _get_job_or_404(job_id)
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str, after: int = 0):
+    """
+    Stream a job's progress events as NDJSON, then its result in the
+    /api/analyze-stream format (metadata + chord chunks) or an error line.
+    Each progress event carries `seq`; reconnect with `?after=<seq>` to resume.
+    """
+    _get_job_or_404(job_id)
+
+    async def event_generator():
+        last = after
+        while True:
+            job = job_store.get(job_id)
+            if job is None:
+                yield json.dumps({"type": "error", "detail": "Job not found or expired"}) + "\n"
+                return
+            for seq, event in job_store.events(job_id, after=last):
+                last = seq
+                yield json.dumps({**event, "seq": seq}) + "\n"
+            if job["status"] == "done":
+                result = job_store.result(job_id) or {}
+                for line in _ndjson_result_lines(result, result.get("instrumentalUrl")):
+                    yield line
+                return
+            if job["status"] == "failed":
+                yield json.dumps({"type": "error", "detail": job["error"]}) + "\n"
+                return
+            await asyncio.sleep(JOB_EVENTS_POLL_SECONDS)
+
+    return StreamingResponse(event_generator(), media_type="application/x-ndjson")
+
+
+@app.get("/api/jobs/{job_id}/result")
+def job_result(job_id: str):
+    """Final result JSON; 202 with the job status while it is still pending."""
+    job = _get_job_or_404(job_id)
+    if job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {job['error']}")
+    if job["status"] not in TERMINAL_STATUSES:
+        return JSONResponse(job, status_code=202)
+    return JSONResponse(job_store.result(job_id))
+
+
 # ── File download ───────────────────────────────────────────────────────────
 
 @app.get("/api/analyze/download/{file_id}/{filename}")
@@ -473,54 +1223,147 @@ def download_file(file_id: str, filename: str):
     raise HTTPException(status_code=404, detail="File no longer available")
 
 
+# ── Admin: profiles ─────────────────────────────────────────────────────────
+
+def _require_admin(request: Request) -> None:
+    if not profiler.admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not profiler.authorized(request.headers.get("x-admin-token")):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@app.get("/api/admin/profiles")
+def list_profiles(request: Request):
+    """Stored request profiles, newest first (metadata from profiling.py)."""
+    _require_admin(request)
+    return {"profiles": profiler.list()}
+
+
+@app.get("/api/admin/profiles/{filename}")
+def download_profile(filename: str, request: Request):
+    """Download `<id>.collapsed` (folded stacks), `<id>.pstats` or `<id>.json`."""
+    _require_admin(request)
+    path = profiler.path(filename)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found or still running")
+    media_type = "application/json" if path.suffix == ".json" else "application/octet-stream"
+    return FileResponse(path=path, media_type=media_type, filename=filename)
+
+
 # ── Stem separation endpoints ──────────────────────────────────────────────
 
+def _separate_file(tmp_path: Path, stems: str, cancel_token: CancellationToken | None = None) -> dict | None:
+    """Run Demucs on an upload (scheduler job)."""
+    with analysis_mode("separate"):
+        if stems == "6":
+            return separate_audio_stems(tmp_path, cancel_token=cancel_token)
+        return separate_audio_full(tmp_path, cancel_token=cancel_token)
+
+
+async def _separation_flight(flight: Flight, tmp_path: Path, stems: str) -> dict | None:
+    """The shared Demucs run behind identical /api/separate requests. Owns `tmp_path`."""
+    job = None
+    try:
+        duration = await run_in_threadpool(audio_duration, tmp_path)
+        job = asyncio.wrap_future(scheduler.submit(
+            _separate_file, tmp_path, stems, flight.cancel_token,
+            cost=duration * SEPARATION_COST_FACTOR, heavy=True,
+        ))
+        return await job
+    finally:
+        _discard_upload(tmp_path, job, flight.cancel_token)
+
+
 @app.post("/api/separate")
-def separate(
+async def separate(
+    request: Request,
     file: UploadFile = File(...),
     stems: str = Form("4"),
 ):
     """Separate audio into stems (4-stem or 6-stem)."""
-    with separation_semaphore:
-        try:
-            suffix = Path(file.filename).suffix or ".tmp"
-            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-                shutil.copyfileobj(file.file, tmp)
-                tmp_path = Path(tmp.name)
+    _precheck("separate", SEPARATION)
+    tmp_path, content_hash = await run_in_threadpool(_save_upload, file)
+    handed_off = False
+    try:
+        key = f"separate/{content_hash}/{stems}"
+        if not inflight.running(key):
+            await _admit("separate", tmp_path, SEPARATION)
+        start = partial(_separation_flight, tmp_path=tmp_path, stems=stems)
+        async with inflight.attach(key, start) as (flight, handed_off):
+            try:
+                result = await _await_flight(flight, request)
+            except JobCancelled:
+                raise HTTPException(status_code=499, detail="Client closed request")
+
+        if not result:
+            raise HTTPException(status_code=500, detail="Separation failed")
+
+        file_id = str(uuid.uuid4())
+        all_paths = list(result.values())
+        separated_files[file_id] = {
+            "paths": all_paths,
+            "timestamp": time.time(),
+            "type": "separation",
+        }
+
+        urls = {}
+        for stem_name, stem_path in result.items():
+            urls[stem_name] = f"/api/analyze/download/{file_id}/{stem_name}.wav"
+
+        return JSONResponse({"id": file_id, "stems": urls})
+    finally:
+        if not handed_off:
+            _discard_upload(tmp_path)
 
-            if stems == "6":
-                result = separate_audio_stems(tmp_path)
-            else:
-                result = separate_audio_full(tmp_path)
 
-            if not result:
-                raise HTTPException(status_code=500, detail="Separation failed")
+# ── YouTube endpoints ───────────────────────────────────────────────────────
 
-            file_id = str(uuid.uuid4())
-            all_paths = list(result.values())
-            separated_files[file_id] = {
-                "paths": all_paths,
-                "timestamp": time.time(),
-                "type": "separation",
-            }
+def _analyze_youtube_audio(
+    tmp_path: Path,
+    separate_vocals: bool,
+    mode: str,
+    cancel_token: CancellationToken | None = None,
+) -> dict:
+    """Analysis step of /api/youtube/analyze (scheduler job)."""
+    if FAST_ENGINE_AVAILABLE and mode == "fast":
+        return analyze_file_fast(tmp_path, mode="fast", cancel_token=cancel_token)
+    return analyze_file(tmp_path, separate_vocals=separate_vocals, cancel_token=cancel_token)
+
+
+async def _youtube_flight(flight: Flight, url: str, separate_vocals: bool, mode: str) -> dict:
+    """The shared download + analysis behind identical /api/youtube/analyze requests."""
+    tmp_path = job = None
+    try:
+        audio_path = await run_in_threadpool(extract_audio, url)
+        if not audio_path:
+            raise HTTPException(status_code=500, detail="Failed to extract audio from YouTube")
 
-            urls = {}
-            for stem_name, stem_path in result.items():
-                urls[stem_name] = f"/api/analyze/download/{file_id}/{stem_name}.wav"
+        tmp_path = Path(audio_path)
 
-            return JSONResponse({"id": file_id, "stems": urls})
-        finally:
-            try:
-                if 'tmp_path' in locals():
-                    tmp_path.unlink(missing_ok=True)
-            except Exception:
-                pass
+        engine = "fast" if FAST_ENGINE_AVAILABLE and mode == "fast" else "balanced"
+        vocal_filter = separate_vocals and engine == "balanced"
+        duration = await run_in_threadpool(audio_duration, tmp_path)
+        job = asyncio.wrap_future(scheduler.submit(
+            _analyze_youtube_audio, tmp_path, separate_vocals, mode, flight.cancel_token,
+            cost=estimate_cost(duration, engine, vocal_filter),
+            heavy=is_heavy(engine, vocal_filter),
+        ))
+        result = await job
 
+        # Add video info
+        info = await run_in_threadpool(get_video_info, url)
+        if info:
+            result["videoTitle"] = info.get("title", "")
+            result["videoDuration"] = info.get("duration", 0)
+        return result
+    finally:
+        if tmp_path is not None:
+            _discard_upload(tmp_path, job, flight.cancel_token)
 
-# ── YouTube endpoints ───────────────────────────────────────────────────────
 
 @app.post("/api/youtube/analyze")
-def youtube_analyze(
+async def youtube_analyze(
+    request: Request,
     url: str = Form(...),
     separate_vocals: bool = Form(False),
     mode: str = Form("fast"),
@@ -534,35 +1377,22 @@ def youtube_analyze(
         remaining = get_remaining_requests()
         raise HTTPException(status_code=429, detail=f"Rate limit exceeded. {remaining} requests remaining.")
 
+    engine = "fast" if FAST_ENGINE_AVAILABLE and mode == "fast" else "balanced"
+    vocal_filter = separate_vocals and engine == "balanced"
+    key = f"youtube/{video_id}/{engine}/{vocal_filter}"
+    if not inflight.running(key):
+        # The duration is unknown until the download: admit at the default estimate
+        await _admit("youtube", None, engine, vocal_filter)
+    start = partial(_youtube_flight, url=url, separate_vocals=separate_vocals, mode=mode)
     try:
-        audio_path = extract_audio(url)
-        if not audio_path:
-            raise HTTPException(status_code=500, detail="Failed to extract audio from YouTube")
-
-        tmp_path = Path(audio_path)
-
-        if FAST_ENGINE_AVAILABLE and mode == "fast":
-            result = analyze_file_fast(tmp_path, mode="fast")
-        else:
-            result = analyze_file(tmp_path, separate_vocals=separate_vocals)
-
-        # Add video info
-        info = get_video_info(url)
-        if info:
-            result["videoTitle"] = info.get("title", "")
-            result["videoDuration"] = info.get("duration", 0)
-
-        return JSONResponse(result)
+        async with inflight.attach(key, start) as (flight, _):
+            return JSONResponse(await _await_flight(flight, request))
+    except JobCancelled:
+        raise HTTPException(status_code=499, detail="Client closed request")
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"YouTube analysis failed: {e}")
-    finally:
-        try:
-            if 'tmp_path' in locals():
-                tmp_path.unlink(missing_ok=True)
-        except Exception:
-            pass
 
 
 @app.get("/api/youtube/info")
@@ -0,0 +1,131 @@
+"""
+backend/model_manager.py
+
+Process-wide registry of warm ML models (Demucs separators today).
+
+Models are loaded once, on first use or at startup, and handed out to every
+caller afterwards — analysis.py's vocal filter, /api/separate and precise
+mode all share the same htdemucs / htdemucs_6s weights instead of each
+deserializing their own copy.
+
+Thread safety: each model name has its own load lock, so two requests that
+need the same cold model wait for a single load, while a request for a
+different model is not blocked behind it. Returned instances are shared;
+callers must treat them as read-only (eval mode, no_grad inference).
+
+For every model the manager records load time, the resident-memory growth
+observed across the load, and the size of its parameters; /api/health
+reports these under "models".
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections.abc import Callable
+from typing import Any
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = 4096
+
+
+def resident_bytes() -> int | None:
+    """Current resident set size of this process, or None if unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _param_bytes(model: Any) -> int | None:
+    """Bytes held by a torch module's parameters (or a wrapper's `.model`)."""
+    module = getattr(model, "model", model)
+    params = getattr(module, "parameters", None)
+    if not callable(params):
+        return None
+    try:
+        return int(sum(p.numel() * p.element_size() for p in params()))
+    except (TypeError, AttributeError):
+        return None
+
+
+class ModelManager:
+    """Thread-safe load-once cache of named models."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._load_locks: dict[str, threading.Lock] = {}
+        self._models: dict[str, Any] = {}
+        self._stats: dict[str, dict] = {}
+
+    def get(self, name: str, loader: Callable[[], Any]) -> Any:
+        """
+        Return the warm instance registered under `name`, calling `loader()`
+        to build it the first time. Concurrent first calls load only once.
+        A loader that raises leaves nothing cached, so the next call retries.
+        """
+        model = self._models.get(name)
+        if model is not None:
+            self._count_hit(name)
+            return model
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        with load_lock:
+            model = self._models.get(name)
+            if model is not None:
+                self._count_hit(name)
+                return model
+
+            rss_before = resident_bytes()
+            t0 = time.perf_counter()
+            model = loader()
+            load_seconds = time.perf_counter() - t0
+            rss_after = resident_bytes()
+
+            rss_delta = (
+                max(rss_after - rss_before, 0)
+                if rss_before is not None and rss_after is not None else None
+            )
+            with self._lock:
+                self._models[name] = model
+                self._stats[name] = {
+                    "loadSeconds": round(load_seconds, 3),
+                    "residentBytes": rss_delta,
+                    "paramBytes": _param_bytes(model),
+                    "loadedAt": time.time(),
+                    "hits": 0,
+                }
+            print(
+                f"[Models] Loaded {name} in {load_seconds:.2f}s"
+                + (f" (+{rss_delta / 1e6:.0f} MB resident)" if rss_delta is not None else "")
+            )
+            return model
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def stats(self) -> dict:
+        """Per-model load time / memory / hit counters, for /api/health."""
+        with self._lock:
+            return {
+                "loaded": {name: dict(s) for name, s in self._stats.items()},
+                "residentBytes": resident_bytes(),
+            }
+
+    def _count_hit(self, name: str) -> None:
+        with self._lock:
+            if name in self._stats:
+                self._stats[name]["hits"] += 1
+
+
+_MODEL_MANAGER = ModelManager()
+
+
+def get_model_manager() -> ModelManager:
+    """The process-wide model manager."""
+    return _MODEL_MANAGER
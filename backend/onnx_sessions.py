@@ -0,0 +1,234 @@
+"""
+backend/onnx_sessions.py
+
+Pool of warm ONNX Runtime sessions over a cached, pre-optimized model.
+
+chord_custom used to build one `ort.InferenceSession` on the first fast-mode
+request: graph optimization and weight prepacking ran inside that request,
+and every later request shared the single session. The pool instead:
+
+  - Optimizes the model once and saves the result under ONNX_MODEL_CACHE_DIR
+    (`optimized_model_filepath`), by default in ORT format. The file name is
+    keyed by the source model, ORT version, host shape and optimization
+    level, so later processes and restarts load it without re-optimizing.
+  - Creates ONNX_SESSION_POOL_SIZE sessions (default: one per concurrent
+    light job) so concurrent fast-mode requests do not queue on one session.
+    Every session's intra-op threads come from the thread budget.
+  - Shares the weights between the sessions: the ORT-format bytes are read
+    once and every session uses them in place for its initializers
+    (`session.use_ort_model_bytes_for_initializers`) instead of keeping its
+    own copy. onnxruntime's Python API does not expose a prepacked-weights
+    container, so prepacked buffers are still built per session.
+  - Runs one warm-up inference per session at start-up and records it apart
+    from the steady-state latency of real requests.
+
+`OnnxSessionPool.run` has the signature of `InferenceSession.run`, so callers
+can use a pool wherever they used a session. `stats()` feeds /api/health.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import queue
+import tempfile
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+try:
+    from backend.autotune import host_fingerprint
+    from backend.thread_budget import THREAD_BUDGET_LIGHT_CONCURRENCY, onnx_session_options
+except (ImportError, ModuleNotFoundError):
+    from autotune import host_fingerprint
+    from thread_budget import THREAD_BUDGET_LIGHT_CONCURRENCY, onnx_session_options
+
+ONNX_SESSION_POOL_SIZE = int(os.environ.get("ONNX_SESSION_POOL_SIZE", "0")) or THREAD_BUDGET_LIGHT_CONCURRENCY
+ONNX_MODEL_CACHE_DIR = Path(
+    os.environ.get("ONNX_MODEL_CACHE_DIR", Path(tempfile.gettempdir()) / "guitariz_onnx")
+)
+ONNX_OPTIMIZED_FORMAT = os.environ.get("ONNX_OPTIMIZED_FORMAT", "ort").lower()  # "ort" or "onnx"
+
+WARMUP_DIM = 8          # size used for symbolic (batch / time) dims in the warm-up input
+LATENCY_WINDOW = 256    # recent runs kept for the steady-state percentiles
+
+
+class OnnxSessionPool:
+    """A fixed set of sessions over one optimized model, handed out per run."""
+
+    def __init__(
+        self,
+        model_path: str | Path,
+        size: int = ONNX_SESSION_POOL_SIZE,
+        cache_dir: str | Path = ONNX_MODEL_CACHE_DIR,
+        model_format: str = ONNX_OPTIMIZED_FORMAT,
+        options_factory: Callable[[], Any] = onnx_session_options,
+    ):
+        self.model_path = Path(model_path)
+        self.size = max(int(size), 1)
+        self.cache_dir = Path(cache_dir)
+        self.model_format = "ort" if model_format == "ort" else "onnx"
+        self._options_factory = options_factory
+
+        self._lock = threading.Lock()
+        self._idle: queue.Queue = queue.Queue()
+        self._sessions: list = []
+        self._model_bytes: bytes | None = None  # must outlive the sessions using it in place
+        self.optimized_path: Path | None = None
+
+        self.cache_hit = False
+        self.optimize_seconds = 0.0
+        self.load_seconds = 0.0
+        self.first_inference_ms: float | None = None
+        self.warmup_ms: list[float] = []
+        self._latency_ms: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.runs = 0
+        self.waits = 0
+
+    # ── Build ───────────────────────────────────────────────────────────────
+
+    def _cache_key(self, level: str) -> str:
+        import onnxruntime as ort
+
+        st = self.model_path.stat()
+        ident = f"{self.model_path.name}:{st.st_size}:{int(st.st_mtime)}:{ort.__version__}:{level}:{host_fingerprint()}"
+        return hashlib.sha1(ident.encode()).hexdigest()[:12]
+
+    def _optimize(self) -> Path:
+        """The cached optimized model, written first if missing."""
+        import onnxruntime as ort
+
+        opts = self._options_factory()
+        level = str(opts.graph_optimization_level).rsplit(".", 1)[-1]
+        path = self.cache_dir / f"{self.model_path.stem}.{self._cache_key(level)}.{self.model_format}"
+        if path.exists():
+            self.cache_hit = True
+            return path
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        opts.optimized_model_filepath = str(tmp)
+        if self.model_format == "ort":
+            opts.add_session_config_entry("session.save_model_format", "ORT")
+        t0 = time.perf_counter()
+        try:
+            ort.InferenceSession(str(self.model_path), sess_options=opts, providers=["CPUExecutionProvider"])
+            os.replace(tmp, path)
+        finally:
+            tmp.unlink(missing_ok=True)
+        self.optimize_seconds = time.perf_counter() - t0
+        print(f"[ONNX] Optimized {self.model_path.name} → {path} in {self.optimize_seconds:.1f}s")
+        return path
+
+    def _new_session(self):
+        import onnxruntime as ort
+
+        opts = self._options_factory()
+        # The cached graph is already optimized for this host
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        if self.model_format == "ort":
+            opts.add_session_config_entry("session.load_model_format", "ORT")
+            opts.add_session_config_entry("session.use_ort_model_bytes_directly", "1")
+            opts.add_session_config_entry("session.use_ort_model_bytes_for_initializers", "1")
+            source = self._model_bytes
+        else:
+            source = str(self.optimized_path)
+        return ort.InferenceSession(source, sess_options=opts, providers=["CPUExecutionProvider"])
+
+    def start(self) -> OnnxSessionPool:
+        """Optimize (or load the cached model), create and warm every session. Idempotent."""
+        with self._lock:
+            if self._sessions:
+                return self
+            try:
+                self.optimized_path = self._optimize()
+            except Exception as e:
+                if self.model_format != "ort":
+                    raise
+                print(f"[ONNX] ORT-format save failed ({e}); caching an optimized ONNX model instead")
+                self.model_format = "onnx"
+                self.optimized_path = self._optimize()
+            if self.model_format == "ort":
+                self._model_bytes = self.optimized_path.read_bytes()
+
+            t0 = time.perf_counter()
+            for _ in range(self.size):
+                sess = self._new_session()
+                self.warmup_ms.append(self._warm_up(sess))
+                self._sessions.append(sess)
+                self._idle.put(sess)
+            self.load_seconds = time.perf_counter() - t0
+            self.first_inference_ms = self.warmup_ms[0] if self.warmup_ms else None
+            print(
+                f"[ONNX] {self.size} session(s) ready in {self.load_seconds:.2f}s "
+                f"({'cached' if self.cache_hit else 'fresh'} {self.model_format} model, "
+                f"first inference {self.first_inference_ms or 0:.1f} ms)"
+            )
+        return self
+
+    @staticmethod
+    def _warm_up(sess) -> float:
+        """One inference on a small zero input; returns its latency in ms."""
+        feeds = {}
+        for inp in sess.get_inputs():
+            shape = [d if isinstance(d, int) and d > 0 else WARMUP_DIM for d in inp.shape]
+            dtype = np.float32 if "float" in inp.type else np.int64
+            feeds[inp.name] = np.zeros(shape, dtype=dtype)
+        t0 = time.perf_counter()
+        try:
+            sess.run(None, feeds)
+        except Exception as e:
+            print(f"[ONNX] Warm-up inference failed: {e}")
+        return (time.perf_counter() - t0) * 1000
+
+    # ── Inference ───────────────────────────────────────────────────────────
+
+    def run(self, output_names, input_feed: dict, run_options=None) -> list:
+        """`InferenceSession.run` on an idle session (waits if all are busy)."""
+        if not self._sessions:
+            self.start()
+        try:
+            sess = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                self.waits += 1
+            sess = self._idle.get()
+        t0 = time.perf_counter()
+        try:
+            return sess.run(output_names, input_feed, run_options)
+        finally:
+            elapsed = (time.perf_counter() - t0) * 1000
+            self._idle.put(sess)
+            with self._lock:
+                self.runs += 1
+                self._latency_ms.append(elapsed)
+
+    def get_inputs(self):
+        return self.start()._sessions[0].get_inputs()
+
+    def get_outputs(self):
+        return self.start()._sessions[0].get_outputs()
+
+    # ── Reporting ───────────────────────────────────────────────────────────
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = np.asarray(self._latency_ms, dtype=np.float64)
+            return {
+                "model": self.model_path.name,
+                "format": self.model_format,
+                "cached": self.cache_hit,
+                "sessions": len(self._sessions),
+                "idle": self._idle.qsize(),
+                "optimizeSeconds": round(self.optimize_seconds, 3),
+                "loadSeconds": round(self.load_seconds, 3),
+                "firstInferenceMs": round(self.first_inference_ms, 2) if self.first_inference_ms is not None else None,
+                "steadyStateMs": round(float(np.median(latencies)), 2) if latencies.size else None,
+                "p95Ms": round(float(np.percentile(latencies, 95)), 2) if latencies.size else None,
+                "runs": self.runs,
+                "waits": self.waits,
+            }
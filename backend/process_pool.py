@@ -0,0 +1,307 @@
+"""
+backend/process_pool.py
+
+Optional multi-process analysis workers (ANALYSIS_WORKER_PROCESSES > 0).
+
+In the default threaded mode every analysis shares one interpreter, so the
+GIL-bound parts (Viterbi and segment loops, librosa glue, result formatting)
+serialize across concurrent requests. In worker-pool mode:
+
+  - Models are loaded in the parent first (Demucs via the model manager at
+    startup), then the workers are forked, so the weights are shared
+    copy-on-write instead of being loaded once per worker.
+  - Decoded audio reaches a worker through `multiprocessing.shared_memory`:
+    the parent decodes once into a shared block and the worker wraps it
+    with `AnalysisContext.from_waveform` — no pickling of sample arrays.
+    Jobs that need the file itself (Demucs separation, precise mode) pass
+    the path instead.
+  - `progress_cb` events travel back on a queue shared by all workers and
+    are dispatched to the submitting request's callback.
+  - A job's CancellationToken reaches its worker as a one-byte shared
+    memory flag: cancelling the token in the parent sets the byte, and the
+    worker-side token reads it at every cancellation check.
+  - Stage metrics and tracing spans recorded in the worker are shipped
+    back with the result and replayed / exported by the parent, the spans
+    under the trace of the request that submitted the job.
+
+The scheduler keeps deciding what runs when; a scheduler worker thread just
+blocks on the pool while its job runs in a process. Each worker's thread
+budget (torch, BLAS, ONNX) is ANALYSIS_WORKER_TORCH_THREADS (default:
+cores / processes) so the pool does not oversubscribe the machine.
+
+The ONNX session is created lazily in each worker (chord_custom loads it
+once per process); onnxruntime sessions are not safe to use across fork.
+"""
+from __future__ import annotations
+
+import itertools
+import multiprocessing
+import os
+import threading
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from ml import tracing
+from ml.instrumentation import REGISTRY, capture
+
+try:
+    from backend.job_control import CancellationToken
+    from backend.thread_budget import configure_thread_budget
+except (ImportError, ModuleNotFoundError):
+    from job_control import CancellationToken
+    from thread_budget import configure_thread_budget
+
+ANALYSIS_WORKER_PROCESSES = int(os.environ.get("ANALYSIS_WORKER_PROCESSES", "0"))
+ANALYSIS_WORKER_TORCH_THREADS = int(os.environ.get("ANALYSIS_WORKER_TORCH_THREADS", "0"))
+
+# Modes whose engines accept a decoded AnalysisContext (without Demucs)
+_SHARED_AUDIO_MODES = ("fast", "balanced")
+
+# Set in each worker by the pool initializer
+_progress_queue = None
+
+
+# ── Worker side ─────────────────────────────────────────────────────────────
+
+def _init_worker(progress_queue, torch_threads: int) -> None:
+    global _progress_queue
+    _progress_queue = progress_queue
+    # This worker runs one job at a time on its slice of the machine
+    configure_thread_budget(torch_threads, light_concurrency=1).apply()
+
+
+def _attach_audio(name: str, shape: tuple, dtype: str) -> tuple[shared_memory.SharedMemory, np.ndarray]:
+    # Forked workers share the parent's resource tracker, so attaching only
+    # re-registers a name the parent already tracks (and later unlinks)
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+class _SharedFlagToken(CancellationToken):
+    """Worker-side CancellationToken that also reads the parent's shared flag."""
+
+    def __init__(self, flag: shared_memory.SharedMemory):
+        super().__init__()
+        self._flag = flag
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set() and self._flag.buf[0]:
+            self.cancel("cancelled by the parent process")
+        return self._event.is_set()
+
+
+def _worker_run(
+    target: Callable[..., dict],
+    token: int | None,
+    source: tuple,
+    args: tuple,
+    cancel_flag: str | None = None,
+    traceparent: str | None = None,
+) -> tuple[dict, list, list]:
+    """Rebuild the analysis source in the worker and call
+    `target(source, *args, progress_cb=...)`, plus `cancel_token=...` when
+    the job has one. Returns (result, stage metrics recorded meanwhile,
+    spans recorded under `traceparent`)."""
+    from ml.analysis_context import AnalysisContext
+
+    progress_cb = None
+    if token is not None and _progress_queue is not None:
+        def progress_cb(stage, msg, pct):
+            _progress_queue.put((token, stage, msg, pct))
+
+    flag = cancel_token = None
+    if cancel_flag is not None:
+        flag = shared_memory.SharedMemory(name=cancel_flag)
+        cancel_token = _SharedFlagToken(flag)
+
+    shm = None
+    if source[0] == "shm":
+        _, name, shape, dtype, sr, file_path = source
+        shm, audio = _attach_audio(name, shape, dtype)
+        ctx = AnalysisContext.from_waveform(audio, sr=sr)
+        ctx.file_path = Path(file_path)
+        analysis_source: Path | AnalysisContext = ctx
+    else:
+        analysis_source = Path(source[1])
+
+    try:
+        control = {"cancel_token": cancel_token} if cancel_token is not None else {}
+        with capture() as observations, tracing.collect(traceparent) as spans:
+            result = target(analysis_source, *args, progress_cb=progress_cb, **control)
+        return result, observations, spans
+    finally:
+        if progress_cb is not None:
+            _progress_queue.put((token, None, None, None))  # end of this job's events
+        if flag is not None:
+            del cancel_token
+            flag.close()
+        if shm is not None:
+            del analysis_source, ctx, audio
+            try:
+                shm.close()
+            except BufferError:
+                pass  # a feature array still views the block; freed with the process mapping
+
+
+# ── Parent side ─────────────────────────────────────────────────────────────
+
+def _set_flag(flag: shared_memory.SharedMemory) -> None:
+    try:
+        flag.buf[0] = 1
+    except (TypeError, ValueError):
+        pass  # the job already finished and released the flag
+
+
+def _decode_shared(file_path: Path, mode: str) -> tuple[shared_memory.SharedMemory, tuple]:
+    """Decode `file_path` the way `mode`'s engine would, into a new shared block."""
+    from ml.analysis_context import AnalysisContext
+
+    ctx = AnalysisContext(file_path, keep_channels=(mode == "balanced"))
+    audio = np.ascontiguousarray(ctx.audio, dtype=np.float32)
+    shm = shared_memory.SharedMemory(create=True, size=max(audio.nbytes, 1))
+    np.ndarray(audio.shape, dtype=audio.dtype, buffer=shm.buf)[...] = audio
+    return shm, ("shm", shm.name, audio.shape, audio.dtype.str, ctx.sr, str(file_path))
+
+
+class AnalysisProcessPool:
+    """Fork-based process pool for analysis jobs, started after model preload."""
+
+    def __init__(self, processes: int = ANALYSIS_WORKER_PROCESSES, torch_threads: int = ANALYSIS_WORKER_TORCH_THREADS):
+        self.processes = max(int(processes), 1)
+        self.torch_threads = torch_threads or max(multiprocessing.cpu_count() // self.processes, 1)
+        self._ctx = multiprocessing.get_context("fork")
+        self._progress_queue = self._ctx.Queue()
+        self._executor: ProcessPoolExecutor | None = None
+        self._callbacks: dict[int, tuple[Callable, threading.Event]] = {}
+        self._tokens = itertools.count(1)
+        self._lock = threading.Lock()
+        self.jobs = 0
+        self.shared_bytes_total = 0
+
+    def start(self) -> None:
+        """Fork the workers now, so they inherit the models loaded so far."""
+        with self._lock:
+            if self._executor is not None:
+                return
+            self._start_locked()
+
+    def _start_locked(self) -> None:
+        # Workers must inherit the parent's tracker (see _attach_audio)
+        resource_tracker.ensure_running()
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=self._ctx,
+            initializer=_init_worker,
+            initargs=(self._progress_queue, self.torch_threads),
+        )
+        # With the fork start method all workers are created on first submit
+        self._executor.submit(int).result()
+        threading.Thread(target=self._dispatch_progress, name="pool-progress", daemon=True).start()
+        print(f"[Pool] Forked {self.processes} analysis workers ({self.torch_threads} torch threads each)")
+
+    def _dispatch_progress(self) -> None:
+        while True:
+            try:
+                token, stage, msg, pct = self._progress_queue.get()
+            except (EOFError, OSError):
+                return
+            entry = self._callbacks.get(token)
+            if entry is None:
+                continue
+            cb, finished = entry
+            if stage is None:
+                finished.set()
+            else:
+                try:
+                    cb(stage, msg, pct)
+                except Exception as e:
+                    print(f"[Pool] Progress callback failed: {e}")
+
+    def run(
+        self,
+        target: Callable[..., dict],
+        file_path: Path,
+        mode: str,
+        *args: Any,
+        shared_audio: bool = True,
+        progress_cb: Callable | None = None,
+        cancel_token: CancellationToken | None = None,
+    ) -> dict:
+        """
+        Run `target(source, mode, *args, progress_cb=..., cancel_token=...)`
+        in a worker and block until it returns. `source` is an
+        AnalysisContext over shared decoded audio for fast/balanced jobs
+        (when `shared_audio`), else the file path.
+        """
+        self.start()
+        token = finished = None
+        if progress_cb is not None:
+            token, finished = next(self._tokens), threading.Event()
+            self._callbacks[token] = (progress_cb, finished)
+
+        shm = flag = None
+        completed = False
+        try:
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+                flag = shared_memory.SharedMemory(create=True, size=1)
+                flag.buf[0] = 0
+                cancel_token.on_cancel(lambda: _set_flag(flag))
+            if shared_audio and mode in _SHARED_AUDIO_MODES:
+                shm, source = _decode_shared(file_path, mode)
+                with self._lock:
+                    self.shared_bytes_total += shm.size
+            else:
+                source = ("path", str(file_path))
+            with self._lock:
+                self.jobs += 1
+            result, observations, spans = self._executor.submit(
+                _worker_run, target, token, source, (mode, *args), flag.name if flag is not None else None,
+                tracing.current_traceparent(),
+            ).result()
+            completed = True
+            # The worker's stage timings, into this process's /api/metrics
+            REGISTRY.replay(observations)
+            tracing.export(spans)
+            return result
+        finally:
+            if token is not None:
+                # Progress travels on its own queue; let it catch up with the
+                # result. A job that raised (e.g. its worker died) may never
+                # send the end marker, so it gets no wait.
+                if completed:
+                    finished.wait(timeout=5.0)
+                self._callbacks.pop(token, None)
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            if flag is not None:
+                flag.close()
+                flag.unlink()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "processes": self.processes,
+                "torchThreads": self.torch_threads,
+                "jobs": self.jobs,
+                "sharedAudioBytesTotal": self.shared_bytes_total,
+            }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def get_analysis_pool() -> AnalysisProcessPool | None:
+    """A new pool when ANALYSIS_WORKER_PROCESSES > 0 (started later via `start()`), else None."""
+    if ANALYSIS_WORKER_PROCESSES <= 0:
+        return None
+    return AnalysisProcessPool()
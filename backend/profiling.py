@@ -0,0 +1,322 @@
+"""
+backend/profiling.py
+
+On-demand profiling of individual analysis requests.
+
+Hot spots such as the per-frame loops in chord_templates.py or the precise
+engine's `_ensemble_score` only show up on production audio. Instead of
+copying that audio to a laptop, a request can be profiled where it runs:
+
+  - Per request: an admin sends  `X-Profile: sample | cprofile`  together
+    with  `X-Admin-Token: $PROFILE_ADMIN_TOKEN`.
+  - By sampling: PROFILE_SAMPLE_RATE (0–1) profiles that fraction of all
+    analysis requests in PROFILE_MODE.
+
+A profiled request gets an `X-Profile-Id` response header. Its scheduler
+jobs (scheduler.py) run under the profiler — they inherit the request's
+context, so /api/jobs work queued after the response is still covered —
+and once the last job has finished the profile is written to PROFILE_DIR:
+
+  - "sample":   a stack sampler thread reads the job thread's frames every
+                PROFILE_SAMPLE_INTERVAL seconds → `<id>.collapsed`, folded
+                stacks for flamegraph.pl / speedscope. Low overhead.
+  - "cprofile": deterministic cProfile → `<id>.pstats` (pstats / snakeviz).
+                Exact call counts, but slows Python-heavy loops down.
+
+plus `<id>.json` with the request, mode, trace id and timings. Admins list
+and download them under /api/admin/profiles (same token). Profiled analyses
+run in the serving process even when worker processes are enabled, so the
+profiler sees the engine. A request that joins another request's flight
+(single_flight.py) or is served from the result cache has nothing to
+profile and writes no file.
+
+Zero overhead when disabled: without PROFILE_ADMIN_TOKEN or a sample rate
+the middleware passes every request straight through, no profiler or
+sampler thread runs, and a job only checks one context variable.
+"""
+from __future__ import annotations
+
+import contextvars
+import cProfile
+import json
+import os
+import pstats
+import random
+import re
+import secrets
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+from ml import tracing
+
+PROFILE_ADMIN_TOKEN = os.environ.get("PROFILE_ADMIN_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0.0"))
+PROFILE_MODE = os.environ.get("PROFILE_MODE", "sample")
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", "0.005"))
+PROFILE_DIR = Path(os.environ.get("PROFILE_DIR", Path(tempfile.gettempdir()) / "guitariz_profiles"))
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", "50"))
+
+MODES = ("sample", "cprofile")
+SUFFIXES = {"sample": ".collapsed", "cprofile": ".pstats"}
+
+_PROFILE_FILE = re.compile(r"^[0-9a-f]{12}\.(collapsed|pstats|json)$")
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+class _StackSampler:
+    """Counts the folded Python stacks of registered threads at a fixed interval."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self._threads: set[int] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def add(self, thread_id: int) -> None:
+        with self._lock:
+            self._threads.add(thread_id)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._stop,), name="profile-sampler", daemon=True,
+                )
+                self._thread.start()
+
+    def remove(self, thread_id: int) -> None:
+        with self._lock:
+            self._threads.discard(thread_id)
+
+    def stop(self) -> None:
+        """Stop sampling; a later `add` starts again, adding to the same counts."""
+        with self._lock:
+            thread, stop = self._thread, self._stop
+            self._thread, self._stop = None, threading.Event()
+        stop.set()
+        if thread is not None:
+            thread.join(timeout=1.0)
+
+    def _run(self, stop: threading.Event) -> None:
+        while not stop.wait(self.interval):
+            with self._lock:
+                threads = set(self._threads)
+            frames = sys._current_frames()
+            for thread_id in threads:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if stack:
+                    with self._lock:
+                        self.stacks[";".join(reversed(stack))] += 1
+                        self.samples += 1
+            del frames
+
+
+class ProfileSession:
+    """The profile of one request: every job it runs, written when the last ends."""
+
+    def __init__(self, profiler: Profiler, label: str, mode: str):
+        self.profiler = profiler
+        self.id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.mode = mode
+        self.trace_id = tracing.current_span().trace_id
+        self.started = time.time()
+        self.cpu_seconds = 0.0
+        self.captures = 0
+        self._refs = 1  # the request itself
+        self._lock = threading.Lock()
+        self._profiles: list[cProfile.Profile] = []
+        self._sampler = _StackSampler(profiler.interval) if mode == "sample" else None
+
+    @contextmanager
+    def capture(self) -> Iterator[None]:
+        """Profile the current thread for the duration of the block."""
+        with self._lock:
+            self._refs += 1
+            self.captures += 1
+        cpu0 = time.thread_time()
+        profile = None
+        if self._sampler is not None:
+            self._sampler.add(threading.get_ident())
+        else:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError as e:
+                # Python 3.12+ allows one active cProfile per interpreter
+                print(f"[Profile] cProfile unavailable for this job: {e}")
+                profile = None
+        try:
+            yield
+        finally:
+            if self._sampler is not None:
+                self._sampler.remove(threading.get_ident())
+            elif profile is not None:
+                profile.disable()
+            with self._lock:
+                self.cpu_seconds += time.thread_time() - cpu0
+                if profile is not None:
+                    self._profiles.append(profile)
+            self.release()
+
+    def release(self) -> None:
+        with self._lock:
+            self._refs -= 1
+            done = self._refs == 0
+        if done:
+            self._write()
+
+    def _write(self) -> None:
+        # No job has run yet (e.g. an /api/jobs request returning 202 before
+        # its job starts): the job's capture writes the profile when it ends
+        if not self.captures:
+            return
+        if self._sampler is not None:
+            self._sampler.stop()
+        directory = self.profiler.directory
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            data_path = directory / f"{self.id}{SUFFIXES[self.mode]}"
+            if self._sampler is not None:
+                lines = [f"{stack} {n}" for stack, n in self._sampler.stacks.most_common()]
+                data_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+            elif self._profiles:
+                stats = pstats.Stats(self._profiles[0])
+                for profile in self._profiles[1:]:
+                    stats.add(profile)
+                stats.dump_stats(str(data_path))
+            meta = {
+                "id": self.id,
+                "label": self.label,
+                "mode": self.mode,
+                "traceId": self.trace_id,
+                "started": self.started,
+                "wallSeconds": round(time.time() - self.started, 3),
+                "cpuSeconds": round(self.cpu_seconds, 3),
+                "jobs": self.captures,
+                "samples": self._sampler.samples if self._sampler is not None else None,
+                "file": data_path.name,
+            }
+            (directory / f"{self.id}.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+            print(f"[Profile] Wrote {data_path.name} ({self.label}, {meta['wallSeconds']}s)")
+        except Exception as e:
+            print(f"[Profile] Could not write profile {self.id}: {e}")
+        self.profiler.prune()
+
+
+_session: contextvars.ContextVar[ProfileSession | None] = contextvars.ContextVar("guitariz_profile", default=None)
+
+
+def current_session() -> ProfileSession | None:
+    """The profile session of the request this code runs for, if it opted in."""
+    return _session.get()
+
+
+class Profiler:
+    """Decides which requests to profile and keeps their profiles on disk."""
+
+    def __init__(
+        self,
+        admin_token: str = PROFILE_ADMIN_TOKEN,
+        sample_rate: float = PROFILE_SAMPLE_RATE,
+        default_mode: str = PROFILE_MODE,
+        interval: float = PROFILE_SAMPLE_INTERVAL,
+        directory: Path = PROFILE_DIR,
+        max_files: int = PROFILE_MAX_FILES,
+    ):
+        self.admin_token = admin_token
+        self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+        self.default_mode = default_mode if default_mode in MODES else "sample"
+        self.interval = interval
+        self.directory = Path(directory)
+        self.max_files = max_files
+        self.sessions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.admin_token) or self.sample_rate > 0
+
+    def authorized(self, token: str | None) -> bool:
+        return bool(self.admin_token) and token is not None and secrets.compare_digest(token, self.admin_token)
+
+    def choose_mode(self, requested: str | None, token: str | None) -> str | None:
+        """Profiling mode for a request (X-Profile / X-Admin-Token headers), or None."""
+        if requested and self.authorized(token):
+            return requested if requested in MODES else self.default_mode
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return self.default_mode
+        return None
+
+    @contextmanager
+    def session(self, label: str, mode: str) -> Iterator[ProfileSession]:
+        """Profile the jobs started inside the block (and those they queue)."""
+        session = ProfileSession(self, label, mode)
+        self.sessions += 1
+        token = _session.set(session)
+        try:
+            yield session
+        finally:
+            _session.reset(token)
+            session.release()
+
+    def list(self) -> list[dict]:
+        profiles = []
+        for meta_path in sorted(self.directory.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True):
+            try:
+                profiles.append(json.loads(meta_path.read_text(encoding="utf-8")))
+            except (OSError, ValueError):
+                continue
+        return profiles
+
+    def path(self, filename: str) -> Path | None:
+        """The stored file `filename`, if it names one (no path traversal)."""
+        if not _PROFILE_FILE.match(filename):
+            return None
+        path = self.directory / filename
+        return path if path.is_file() else None
+
+    def prune(self) -> None:
+        """Keep the newest `max_files` profiles."""
+        try:
+            metas = sorted(self.directory.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+        except OSError:
+            return
+        for meta_path in metas[self.max_files:]:
+            for suffix in (".json", *SUFFIXES.values()):
+                meta_path.with_suffix(suffix).unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "sampleRate": self.sample_rate,
+            "mode": self.default_mode,
+            "sessions": self.sessions,
+        }
+
+
+_PROFILER: Profiler | None = None
+_PROFILER_LOCK = threading.Lock()
+
+
+def get_profiler() -> Profiler:
+    """The process-wide profiler (idle unless PROFILE_ADMIN_TOKEN or PROFILE_SAMPLE_RATE is set)."""
+    global _PROFILER
+    with _PROFILER_LOCK:
+        if _PROFILER is None:
+            _PROFILER = Profiler()
+        return _PROFILER
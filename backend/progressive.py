@@ -0,0 +1,505 @@
+"""
+backend/progressive.py
+
+Progressive (streaming) chord analysis for /api/analyze-stream.
+
+The stream endpoint used to run the whole analysis and only then slice the
+result into 30-second NDJSON chunks, so the first chord arrived when the
+last one was known. For fast and balanced modes this module analyzes the
+track block by block instead:
+
+  1. Decode PROGRESSIVE_BLOCK_SEC of audio at a time (soundfile blocks,
+     streaming soxr resampling; formats libsndfile cannot read are decoded
+     whole and then sliced).
+  2. Compute the mode's frame features for every frame whose support is now
+     complete — each block is analyzed with CONTEXT_FRAMES of audio on both
+     sides so block edges match a whole-track analysis:
+       - fast:     log-CQT → ONNX CRNN (BiLSTM given MODEL_CONTEXT_FRAMES of
+                   look-ahead), or accurate-mode chroma templates without a
+                   model.
+       - balanced: vocal attenuation + HPSS → template chroma → gated,
+                   key-biased template scores.
+  3. Decode with a fixed-lag Viterbi (ml.viterbi.OnlineViterbi, lag
+     PROGRESSIVE_VITERBI_LAG frames) and a streaming minimum-duration merge;
+     segments are emitted as NDJSON "chords" lines as soon as they can no
+     longer change.
+  4. Key and tempo are sent as provisional "metadata" once
+     PROGRESSIVE_PROVISIONAL_SEC of audio has been analyzed, and refined over
+     the whole track at the end, when the complete result (same shape as
+     /api/analyze) is returned for the final chunk lines and the cache.
+
+Global normalizations become running ones (CRNN dB reference, silence
+threshold) and the Viterbi is static rather than adaptive, so results can
+differ slightly from the one-shot engines; the cache keeps them apart.
+"""
+from __future__ import annotations
+
+import os
+from collections import deque
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from pathlib import Path
+
+import librosa
+import numpy as np
+
+from ml.analysis_context import AnalysisContext
+from ml.chord_templates import (
+    _suppress_center_vocals_and_isolate_harmonics,
+    get_diatonic_chords,
+    template_chroma,
+    template_frame_probs,
+)
+from ml.chord_vocab import IDX_TO_LABEL, LABEL_TO_IDX, NUM_CLASSES
+from ml.dsp_tempo_key import key_from_chroma, tempo_from_onset_envelope
+from ml.features import HOP_LENGTH, SR, chroma_from_cqt, cqt_magnitude
+from ml.instrumentation import analysis_mode, stage
+from ml.viterbi import OnlineViterbi
+
+try:
+    from backend.analysis import format_balanced_result
+    from backend.chord_custom import _get_onnx_session, accurate_frame_scores, logits_to_probs
+    from backend.chord_fast import format_fast_result
+    from backend.job_control import CancellationToken, check_cancelled
+except (ImportError, ModuleNotFoundError):
+    from analysis import format_balanced_result
+    from chord_custom import _get_onnx_session, accurate_frame_scores, logits_to_probs
+    from chord_fast import format_fast_result
+    from job_control import CancellationToken, check_cancelled
+
+PROGRESSIVE_STREAMING = os.environ.get("PROGRESSIVE_STREAMING", "true").lower() == "true"
+PROGRESSIVE_BLOCK_SEC = float(os.environ.get("PROGRESSIVE_BLOCK_SEC", "8.0"))
+PROGRESSIVE_VITERBI_LAG = int(os.environ.get("PROGRESSIVE_VITERBI_LAG", "16"))        # frames, ~1.5 s
+PROGRESSIVE_PROVISIONAL_SEC = float(os.environ.get("PROGRESSIVE_PROVISIONAL_SEC", "15.0"))
+
+CONTEXT_FRAMES = 24         # audio context per block side (~2.2 s, > longest CQT filter)
+MODEL_CONTEXT_FRAMES = 32   # CRNN look-back / look-ahead around the frames it finalizes
+BALANCED_MAX_SEC = 360.0    # balanced mode's chord analysis window, as in chord_templates
+
+_NC = LABEL_TO_IDX["N.C."]
+
+
+# ── Block decoding ──────────────────────────────────────────────────────────
+
+def iter_audio_blocks(path: str | Path, block_sec: float, keep_channels: bool) -> Iterator[np.ndarray]:
+    """
+    Decoded audio at SR, `block_sec` at a time: (n,) mono or (channels, n)
+    with `keep_channels`. Concatenated, the blocks equal a whole-file decode.
+    """
+    import soundfile as sf
+
+    try:
+        info = sf.info(str(path))
+    except Exception:
+        # Not readable by libsndfile (e.g. AAC): decode once, then slice
+        y, _ = librosa.load(str(path), sr=SR, mono=not keep_channels)
+        step = max(int(block_sec * SR), 1)
+        for i in range(0, y.shape[-1], step):
+            yield y[..., i:i + step]
+        return
+
+    resampler = None
+    if info.samplerate != SR:
+        import soxr
+        resampler = soxr.ResampleStream(info.samplerate, SR, info.channels, dtype="float32")
+
+    def shaped(block: np.ndarray) -> np.ndarray:  # (n, channels) → output layout
+        if not keep_channels or block.shape[1] == 1:
+            return block.mean(axis=1) if block.shape[1] > 1 else block[:, 0]
+        return np.ascontiguousarray(block.T)
+
+    blocksize = max(int(block_sec * info.samplerate), 1)
+    for block in sf.blocks(str(path), blocksize=blocksize, dtype="float32", always_2d=True):
+        if resampler is not None:
+            block = resampler.resample_chunk(block, last=False)
+        if len(block):
+            yield shaped(block)
+    if resampler is not None:
+        block = resampler.resample_chunk(np.zeros((0, info.channels), dtype=np.float32), last=True)
+        if len(block):
+            yield shaped(block)
+
+
+class _GrowingBuffer:
+    """Append-only sample buffer, (n,) or (channels, n), with amortized growth."""
+
+    def __init__(self):
+        self._data: np.ndarray | None = None
+        self.size = 0
+
+    def append(self, block: np.ndarray) -> None:
+        n = block.shape[-1]
+        if self._data is None:
+            self._data = np.empty(block.shape[:-1] + (max(n * 8, 1),), dtype=np.float32)
+        elif self.size + n > self._data.shape[-1]:
+            grown = np.empty(self._data.shape[:-1] + (max(2 * self._data.shape[-1], self.size + n),), dtype=np.float32)
+            grown[..., :self.size] = self._data[..., :self.size]
+            self._data = grown
+        self._data[..., self.size:self.size + n] = block
+        self.size += n
+
+    def view(self, start: int = 0, end: int | None = None) -> np.ndarray:
+        end = self.size if end is None else min(end, self.size)
+        return self._data[..., start:end]
+
+
+# ── Frame scorers ───────────────────────────────────────────────────────────
+
+@dataclass
+class FrameScores:
+    probs: np.ndarray        # (n, NUM_CLASSES) observation probabilities
+    conf: np.ndarray         # (n, NUM_CLASSES) per-label confidence contribution
+    nc_conf: np.ndarray      # (n,) confidence when the decided label is N.C.
+
+
+class _CrnnScorer:
+    """Fast mode: log-CQT → CRNN logits, with a running dB reference."""
+
+    min_duration_ms = 300.0
+    self_transition_prob = 0.95
+    low_conf_threshold = 0.35
+
+    def __init__(self, session):
+        self.session = session
+        self._features = _GrowingBuffer()   # (216, frames) CRNN input
+        self._ref = 1e-5
+        self._scored = 0
+        self.key_chroma: list[np.ndarray] = []
+
+    def add(self, y_seg: np.ndarray, keep: slice, final: bool) -> FrameScores | None:
+        cqt = cqt_magnitude(y_seg, SR)[:, keep]
+        self.key_chroma.append(chroma_from_cqt(cqt, SR))
+        # cnn_input_from_cqt with ref = loudest bin so far instead of the track max
+        self._ref = max(self._ref, float(cqt.max(initial=0.0)))
+        db = 20.0 * np.log10(np.maximum(cqt, 1e-5) / self._ref)
+        self._features.append(((np.maximum(db, -80.0) + 40.0) / 40.0).astype(np.float32))
+
+        n = self._features.size
+        end = n if final else n - MODEL_CONTEXT_FRAMES
+        if end <= self._scored:
+            return None
+        lo = max(0, self._scored - MODEL_CONTEXT_FRAMES)
+        x = self._features.view(lo, n)[None, None]
+        logits = self.session.run(None, {"log_cqt": x})[0][0]
+        probs = logits_to_probs(logits[self._scored - lo:end - lo])
+        self._scored = end
+        return FrameScores(probs=probs, conf=probs, nc_conf=probs[:, _NC])
+
+
+class _ChromaScorer:
+    """Fast mode without a model: accurate-mode harmonic chroma templates."""
+
+    min_duration_ms = 300.0
+    self_transition_prob = 0.95
+    low_conf_threshold = 0.35
+
+    def __init__(self):
+        self.key_chroma: list[np.ndarray] = []
+
+    def add(self, y_seg: np.ndarray, keep: slice, final: bool) -> FrameScores:
+        self.key_chroma.append(chroma_from_cqt(cqt_magnitude(y_seg, SR)[:, keep], SR))
+        harmonic = librosa.effects.harmonic(y_seg)
+        chroma = chroma_from_cqt(cqt_magnitude(harmonic, SR), SR)[keep]
+        sims, norms, probs = accurate_frame_scores(chroma)
+        return FrameScores(probs=probs, conf=(sims + 1.0) / 2.0, nc_conf=1.0 - norms)
+
+
+class _TemplateScorer:
+    """Balanced mode: vocal attenuation, HPSS, template chroma and gating."""
+
+    min_duration_ms = 400.0
+    self_transition_prob = 0.96
+    low_conf_threshold = 0.38
+
+    def __init__(self):
+        self.tuning: float | None = None
+        self.diatonic_indices: list[int] = []
+        self._max_rms = 0.0
+        self.key_chroma = None  # key comes from the mono waveform at the end
+
+    def set_key(self, key_str: str) -> None:
+        self.diatonic_indices = [LABEL_TO_IDX[c] for c in get_diatonic_chords(key_str) if c in LABEL_TO_IDX]
+
+    def add(self, y_seg: np.ndarray, keep: slice, final: bool) -> FrameScores:
+        y_harm, rms, sr = _suppress_center_vocals_and_isolate_harmonics(
+            AnalysisContext.from_waveform(y_seg, sr=SR), max_duration=y_seg.shape[-1] / SR + 1.0,
+        )
+        if self.tuning is None:
+            try:
+                self.tuning = float(librosa.estimate_tuning(y=y_harm, sr=sr))
+            except Exception:
+                self.tuning = 0.0
+        chroma = template_chroma(y_harm, sr, self.tuning)[keep]
+        rms = rms[keep]
+        if len(rms) < len(chroma):
+            rms = np.pad(rms, (0, len(chroma) - len(rms)), mode="edge")
+        self._max_rms = max(self._max_rms, float(rms.max(initial=0.0)))
+        silence_threshold = max(0.008, self._max_rms * 0.025)
+        sims, probs = template_frame_probs(chroma, rms[:len(chroma)] < silence_threshold, self.diatonic_indices)
+        return FrameScores(probs=probs, conf=(sims + 1.0) / 2.0, nc_conf=np.full(len(probs), 0.95))
+
+
+# ── Streaming segmentation ──────────────────────────────────────────────────
+
+@dataclass
+class _Segment:
+    label: int
+    start: int
+    end: int
+    conf_sum: float
+    conf_frames: int
+
+    @property
+    def confidence(self) -> float:
+        return self.conf_sum / self.conf_frames if self.conf_frames else 0.0
+
+
+class SegmentStream:
+    """
+    Run-length segmentation of decided frames with a streaming minimum
+    duration: a run shorter than `min_frames` is absorbed by the segment
+    before it. The last long segment is held back until the next long one
+    closes, since short runs may still be merged into it.
+    """
+
+    def __init__(self, min_frames: int):
+        self.min_frames = max(int(min_frames), 1)
+        self._run: _Segment | None = None
+        self._held: list[_Segment] = []
+
+    def push(self, frame: int, label: int, conf: float) -> list[_Segment]:
+        run = self._run
+        if run is not None and run.label == label:
+            run.end = frame + 1
+            run.conf_sum += conf
+            run.conf_frames += 1
+            return []
+        self._run = _Segment(label, frame, frame + 1, conf, 1)
+        return self._close(run) if run is not None else []
+
+    def flush(self) -> list[_Segment]:
+        out = self._close(self._run) if self._run is not None else []
+        self._run = None
+        out, self._held = out + self._held, []
+        return out
+
+    def _close(self, seg: _Segment) -> list[_Segment]:
+        held = self._held
+        if held and (seg.end - seg.start < self.min_frames or held[-1].label == seg.label):
+            prev = held[-1]
+            prev.end = seg.end
+            if prev.label == seg.label:
+                prev.conf_sum += seg.conf_sum
+                prev.conf_frames += seg.conf_frames
+            return []
+        if seg.end - seg.start < self.min_frames:
+            held.append(seg)  # leading short run: nothing before it to absorb it
+            return []
+        out, self._held = held, [seg]
+        return out
+
+
+# ── Analyzer ────────────────────────────────────────────────────────────────
+
+class ProgressiveAnalyzer:
+    """
+    Block-by-block fast / balanced analysis. `run(emit)` calls `emit(event)`
+    with NDJSON-ready dicts ("progress", provisional "metadata", "chords")
+    as they become available and returns the final result dict. A cancelled
+    `cancel_token` stops the run at the next block (JobCancelled).
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        mode: str,
+        block_sec: float = PROGRESSIVE_BLOCK_SEC,
+        lag: int = PROGRESSIVE_VITERBI_LAG,
+        provisional_sec: float = PROGRESSIVE_PROVISIONAL_SEC,
+        cancel_token: CancellationToken | None = None,
+    ):
+        self.path = Path(path)
+        self.cancel_token = cancel_token
+        self.mode = "balanced" if mode == "balanced" else "fast"
+        self.block_sec = block_sec
+        self.provisional_frames = int(provisional_sec * SR / HOP_LENGTH)
+        self.frame_rate = SR / HOP_LENGTH
+
+        if self.mode == "balanced":
+            self.scorer = _TemplateScorer()
+        else:
+            session = _get_onnx_session()
+            self.scorer = _CrnnScorer(session) if session is not None else _ChromaScorer()
+        self.viterbi = OnlineViterbi(NUM_CLASSES, self.scorer.self_transition_prob, lag=lag)
+        self.segments = SegmentStream(round(self.scorer.min_duration_ms / 1000 * self.frame_rate))
+
+        self._mono = _GrowingBuffer()
+        self._audio = _GrowingBuffer() if self.mode == "balanced" else self._mono
+        self._featured = 0      # frames with features
+        self._decided = 0       # frames with a Viterbi decision
+        self._pending: deque[tuple[np.ndarray, float]] = deque()  # (conf row, nc conf) awaiting decision
+        self._emitted: list[tuple[float, float, str, float]] = []
+        self._key_str: str | None = None
+        self._tempo: float | None = None
+
+    # ── Driver ──────────────────────────────────────────────────────────────
+
+    def run(self, emit: Callable[[dict], None]) -> dict:
+        with analysis_mode(f"{self.mode}-progressive"):
+            return self._run(emit)
+
+    def _run(self, emit: Callable[[dict], None]) -> dict:
+        total_sec = _duration_hint(self.path)
+        max_frames = int(BALANCED_MAX_SEC * self.frame_rate) if self.mode == "balanced" else None
+        blocks = iter_audio_blocks(self.path, self.block_sec, keep_channels=self.mode == "balanced")
+
+        with stage("decode"):
+            block = next(blocks, None)
+        while block is not None:
+            check_cancelled(self.cancel_token)
+            with stage("decode"):
+                nxt = next(blocks, None)
+            final = nxt is None
+            self._audio.append(block)
+            if self._audio is not self._mono:
+                self._mono.append(block.mean(axis=0) if block.ndim == 2 else block)
+
+            limit_reached = max_frames is not None and self._featured >= max_frames
+            if not limit_reached:
+                self._advance(final, max_frames, emit)
+            if total_sec and not self._emitted:  # chord lines carry the progress after that
+                emit({
+                    "type": "progress", "stage": 1, "message": "Analyzing",
+                    "percent": min(99, int(100 * self._mono.size / SR / total_sec)),
+                })
+            block = nxt
+
+        self._finish(emit)
+        return self._result()
+
+    def _advance(self, final: bool, max_frames: int | None, emit: Callable[[dict], None]) -> None:
+        n_samples = self._audio.size
+        total_frames = 1 + n_samples // HOP_LENGTH
+        f1 = total_frames if final else n_samples // HOP_LENGTH - CONTEXT_FRAMES
+        if max_frames is not None:
+            f1 = min(f1, max_frames)
+            final = final or f1 == max_frames
+        f0 = self._featured
+        if f1 <= f0:
+            return
+
+        s = max(0, f0 - CONTEXT_FRAMES) * HOP_LENGTH
+        e = min(n_samples, (f1 + CONTEXT_FRAMES) * HOP_LENGTH)
+        offset = s // HOP_LENGTH
+        scores = self.scorer.add(self._audio.view(s, e), slice(f0 - offset, f1 - offset), final)
+        self._featured = f1
+        if scores is not None:
+            self._decide(scores, emit)
+        if final:
+            self._drain_viterbi(emit)
+
+        if self._key_str is None and self._featured >= self.provisional_frames:
+            self._estimate_key_tempo()
+            emit(self._metadata(provisional=True))
+
+    # ── Decoding ────────────────────────────────────────────────────────────
+
+    def _decide(self, scores: FrameScores, emit: Callable[[dict], None]) -> None:
+        lag = self.viterbi.lag
+        segments: list[_Segment] = []
+        for probs, conf, nc_conf in zip(scores.probs, scores.conf, scores.nc_conf):
+            self._pending.append((conf, float(nc_conf)))
+            state = self.viterbi.push(probs)
+            if self.viterbi.frames - 1 >= lag:  # decision for the frame `lag` back
+                segments += self._commit(state)
+        self._emit_segments(segments, emit)
+
+    def _drain_viterbi(self, emit: Callable[[dict], None]) -> None:
+        tail = self.viterbi.tail()
+        first = self.viterbi.frames - len(tail)
+        segments: list[_Segment] = []
+        for state in tail[self._decided - first:]:
+            segments += self._commit(int(state))
+        self._emit_segments(segments + self.segments.flush(), emit)
+
+    def _commit(self, state: int) -> list[_Segment]:
+        conf, nc_conf = self._pending.popleft()
+        frame = self._decided
+        self._decided += 1
+        return self.segments.push(frame, state, nc_conf if state == _NC else float(conf[state]))
+
+    def _emit_segments(self, segments: list[_Segment], emit: Callable[[dict], None]) -> None:
+        if not segments:
+            return
+        new: list[tuple[float, float, str, float]] = []
+        for seg in segments:
+            label, conf = IDX_TO_LABEL[seg.label], seg.confidence
+            if label != "N.C." and conf < self.scorer.low_conf_threshold:
+                label = "N.C."
+            seg_t = (seg.start / self.frame_rate, seg.end / self.frame_rate, label, float(np.clip(conf, 0.0, 1.0)))
+            if new and new[-1][2] == label:
+                new[-1] = (new[-1][0], seg_t[1], label, new[-1][3])
+            else:
+                new.append(seg_t)
+        # A first segment continuing the last emitted chord replaces it, extended
+        if self._emitted and self._emitted[-1][2] == new[0][2]:
+            last = self._emitted.pop()
+            new[0] = (last[0], new[0][1], last[2], last[3])
+        self._emitted += new
+
+        formatted = self._format(new)
+        emit({
+            "type": "chords",
+            "start": new[0][0],
+            "end": new[-1][1],
+            "chords": formatted["chords"],
+            "simpleChords": formatted["simpleChords"],
+            "provisional": True,
+        })
+
+    # ── Key / tempo / result ────────────────────────────────────────────────
+
+    def _estimate_key_tempo(self) -> None:
+        y = self._mono.view()
+        chroma = (
+            np.concatenate(self.scorer.key_chroma) if self.scorer.key_chroma
+            else AnalysisContext.from_waveform(y, sr=SR).chroma
+        )
+        self._key_str = key_from_chroma(chroma)
+        onset_env = librosa.onset.onset_strength(y=y, sr=SR, hop_length=HOP_LENGTH, aggregate=np.median, fmax=8000)
+        self._tempo = float(tempo_from_onset_envelope(onset_env, SR))
+        if isinstance(self.scorer, _TemplateScorer):
+            self.scorer.set_key(self._key_str)
+
+    def _finish(self, emit: Callable[[dict], None]) -> None:
+        self._estimate_key_tempo()
+        emit(self._metadata(provisional=False))
+
+    def _format(self, segments: list[tuple[float, float, str, float]]) -> dict:
+        key_str = self._key_str or "C major"
+        if self.mode == "balanced":
+            key, _, scale = key_str.partition(" ")
+            return format_balanced_result(segments, key, scale or "major", self._tempo or 120.0)
+        return format_fast_result(segments, key_str, self._tempo or 120.0)
+
+    def _metadata(self, provisional: bool) -> dict:
+        formatted = self._format([])
+        return {
+            "type": "metadata",
+            "tempo": formatted["tempo"],
+            "meter": 4,
+            "key": formatted["key"],
+            "scale": formatted["scale"],
+            "provisional": provisional,
+        }
+
+    def _result(self) -> dict:
+        return self._format(self._emitted)
+
+
+def _duration_hint(path: Path) -> float | None:
+    try:
+        import soundfile as sf
+        return float(sf.info(str(path)).duration)
+    except Exception:
+        return None
@@ -0,0 +1,286 @@
+"""
+backend/result_cache.py
+
+Content-addressed server-side cache for /api/analyze and /api/analyze-stream.
+
+The browser cache (src/lib/analysisCache.ts) only helps the user who already
+analyzed a song. This cache sits in front of the analysis engines so that the
+same audio uploaded by different users is analyzed once per replica.
+
+Keys are a SHA-256 of:
+    uploaded bytes (content hash) + mode + separate_vocals + engine version
+so a model swap or version bump never serves stale results.
+
+Storage:
+  - Disk: one directory per key holding result.json (plus instrumental.wav
+    when vocal separation produced one). Bounded by RESULT_CACHE_MAX_BYTES;
+    least-recently-used entries are evicted first.
+  - Memory: a small LRU of decoded results in front of the disk layer.
+
+All operations are best-effort: an I/O error degrades to a cache miss and is
+never surfaced to the client.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import BinaryIO
+
+RESULT_CACHE_ENABLED = os.environ.get("RESULT_CACHE_ENABLED", "true").lower() == "true"
+RESULT_CACHE_DIR = Path(
+    os.environ.get("RESULT_CACHE_DIR", Path(tempfile.gettempdir()) / "guitariz_result_cache")
+)
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+RESULT_CACHE_MEMORY_ENTRIES = int(os.environ.get("RESULT_CACHE_MEMORY_ENTRIES", "256"))
+
+_HASH_CHUNK = 1024 * 1024
+
+
+# ── Content hashing ─────────────────────────────────────────────────────────
+
+def hash_file(path: str | Path) -> str:
+    """SHA-256 hex digest of a file's bytes."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def copy_and_hash(src: BinaryIO, dst: BinaryIO) -> str:
+    """Copy an upload stream to `dst` and return the SHA-256 of the copied bytes."""
+    h = hashlib.sha256()
+    for chunk in iter(lambda: src.read(_HASH_CHUNK), b""):
+        h.update(chunk)
+        dst.write(chunk)
+    return h.hexdigest()
+
+
+def make_key(content_hash: str, mode: str, separate_vocals: bool, engine_version: str) -> str:
+    """Cache key for one (audio, parameters, engine) combination."""
+    raw = f"{content_hash}|{mode}|{int(bool(separate_vocals))}|{engine_version}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# ── Disk LRU ────────────────────────────────────────────────────────────────
+
+class DiskLRU:
+    """
+    Byte-bounded LRU of entry directories under one root.
+
+    Each key maps to `root/<key>/`. Entries are written into a staging
+    directory and committed with an atomic rename, so readers never observe a
+    half-written entry. Shared by the result cache and the Demucs stem cache.
+    """
+
+    def __init__(self, directory: str | Path, max_bytes: int, marker_file: str):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.marker_file = marker_file  # an entry is valid once this file exists
+
+        self._lock = threading.Lock()
+        self._index: OrderedDict[str, int] = OrderedDict()  # key → bytes on disk, LRU order
+        self.total_bytes = 0
+        self.evictions = 0
+        self._load_index()
+
+    def _load_index(self) -> None:
+        """Rebuild the LRU index from disk, oldest access first."""
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            entries = []
+            for entry in self.directory.iterdir():
+                if not entry.is_dir():
+                    continue
+                if ".tmp-" in entry.name or not (entry / self.marker_file).exists():
+                    shutil.rmtree(entry, ignore_errors=True)
+                    continue
+                size = sum(p.stat().st_size for p in entry.iterdir() if p.is_file())
+                entries.append((entry.stat().st_mtime, entry.name, size))
+            for _, key, size in sorted(entries):
+                self._index[key] = size
+                self.total_bytes += size
+        except OSError as e:
+            print(f"[Cache] Failed to scan {self.directory}: {e}")
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def path(self, key: str) -> Path:
+        return self.directory / key
+
+    def touch(self, key: str) -> bool:
+        """Mark `key` as most recently used. Returns False if it is not cached."""
+        with self._lock:
+            if key not in self._index:
+                return False
+            self._index.move_to_end(key)
+        try:
+            os.utime(self.path(key))
+        except OSError:
+            pass
+        return True
+
+    def staging_dir(self, key: str) -> Path:
+        """A fresh directory to write an entry into before `commit`."""
+        tmp_dir = self.directory / f"{key}.tmp-{uuid.uuid4().hex}"
+        tmp_dir.mkdir(parents=True)
+        return tmp_dir
+
+    def commit(self, key: str, staging: Path) -> list[str]:
+        """Atomically publish a staged entry; returns the keys evicted to make room."""
+        size = sum(p.stat().st_size for p in staging.iterdir() if p.is_file())
+        evicted: list[str] = []
+        with self._lock:
+            if key in self._index:
+                self._remove(key)
+            os.replace(staging, self.path(key))
+            self._index[key] = size
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes and len(self._index) > 1:
+                oldest = next(iter(self._index))
+                self._remove(oldest)
+                self.evictions += 1
+                evicted.append(oldest)
+        return evicted
+
+    def drop(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        self.total_bytes -= self._index.pop(key, 0)
+        shutil.rmtree(self.path(key), ignore_errors=True)
+
+
+# ── Result cache ────────────────────────────────────────────────────────────
+
+class ResultCache:
+    """Disk-backed analysis result cache with an in-memory LRU front."""
+
+    RESULT_FILE = "result.json"
+    INSTRUMENTAL_FILE = "instrumental.wav"
+
+    def __init__(
+        self,
+        directory: str | Path = RESULT_CACHE_DIR,
+        max_bytes: int = RESULT_CACHE_MAX_BYTES,
+        memory_entries: int = RESULT_CACHE_MEMORY_ENTRIES,
+    ):
+        self.disk = DiskLRU(directory, max_bytes, self.RESULT_FILE)
+        self.directory = self.disk.directory
+        self.memory_entries = memory_entries
+
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[str, dict] = OrderedDict()
+
+        self.hits = 0
+        self.memory_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> tuple[dict, Path | None] | None:
+        """
+        Look up a cached result.
+
+        Returns (result, instrumental_path) on a hit — `result` is a private
+        copy the caller may mutate, `instrumental_path` points inside the cache
+        and must be copied before handing it out — or None on a miss.
+        """
+        entry_dir = self.disk.path(key)
+        if not self.disk.touch(key):
+            with self._lock:
+                self._memory.pop(key, None)
+                self.misses += 1
+            return None
+
+        with self._lock:
+            result = self._memory.get(key)
+            if result is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+            else:
+                try:
+                    result = json.loads((entry_dir / self.RESULT_FILE).read_text())
+                except (OSError, ValueError):
+                    self.disk.drop(key)
+                    self.misses += 1
+                    return None
+                self._remember(key, result)
+            self.hits += 1
+
+        instrumental = entry_dir / self.INSTRUMENTAL_FILE
+        return json.loads(json.dumps(result)), (instrumental if instrumental.exists() else None)
+
+    def put(self, key: str, result: dict, instrumental_path: str | Path | None = None) -> None:
+        """Store a result (and optionally its instrumental track) under `key`."""
+        payload = {k: v for k, v in result.items() if k not in ("instrumentalPath", "instrumentalUrl")}
+        staging = None
+        try:
+            staging = self.disk.staging_dir(key)
+            (staging / self.RESULT_FILE).write_text(json.dumps(payload))
+            if instrumental_path:
+                shutil.copyfile(instrumental_path, staging / self.INSTRUMENTAL_FILE)
+            evicted = self.disk.commit(key, staging)
+        except OSError as e:
+            print(f"[ResultCache] Failed to store entry: {e}")
+            if staging is not None:
+                shutil.rmtree(staging, ignore_errors=True)
+            return
+
+        with self._lock:
+            for old in evicted:
+                self._memory.pop(old, None)
+            self._remember(key, payload)
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size, for /api/health."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "memoryHits": self.memory_hits,
+                "misses": self.misses,
+                "hitRate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "entries": len(self.disk),
+                "bytes": self.disk.total_bytes,
+                "maxBytes": self.disk.max_bytes,
+                "evictions": self.disk.evictions,
+            }
+
+    def _remember(self, key: str, result: dict) -> None:
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+
+_RESULT_CACHE: ResultCache | None = None
+_RESULT_CACHE_LOCK = threading.Lock()
+
+
+def get_result_cache() -> ResultCache | None:
+    """Process-wide cache instance, or None when disabled via RESULT_CACHE_ENABLED."""
+    global _RESULT_CACHE
+    if not RESULT_CACHE_ENABLED:
+        return None
+    with _RESULT_CACHE_LOCK:
+        if _RESULT_CACHE is None:
+            t0 = time.time()
+            _RESULT_CACHE = ResultCache()
+            print(
+                f"[ResultCache] Ready at {_RESULT_CACHE.directory} "
+                f"({_RESULT_CACHE.stats()['entries']} entries, {time.time() - t0:.2f}s)"
+            )
+        return _RESULT_CACHE
@@ -0,0 +1,342 @@
+"""
+backend/scheduler.py
+
+Cost-aware job scheduler for the analysis and separation endpoints.
+
+Replaces the two threading semaphores main.py used to hold while a request
+waited for an engine slot. Those blocked a FastAPI threadpool thread per
+queued request, so a burst of precise jobs could exhaust the pool and leave
+/api/health unanswered. Now:
+
+  - Endpoints submit a job and `await` it; a queued request holds no thread.
+  - Jobs run on two fixed worker pools: "heavy" (Demucs separation, precise
+    mode — SCHEDULER_HEAVY_WORKERS, default 1) and "light" (fast / balanced
+    chord analysis — SCHEDULER_LIGHT_WORKERS, default 3).
+  - Each pool serves its queue shortest-expected-job-first with linear aging:
+    a job's priority is  cost - aging_rate * seconds_waited,  so short jobs
+    overtake long ones but nothing starves. Because aging is linear in time,
+    this ordering equals sorting by  cost + aging_rate * submitted_at,  which
+    is fixed at submit time and lets the queue be a plain heap.
+
+Costs are estimated seconds of work, from the audio duration and the
+per-mode throughput factors below (see estimate_cost).
+
+Jobs run in a copy of the submitter's context (contextvars), so a job's
+tracing spans (ml/tracing.py) land under the request that queued it, in a
+"scheduler.job" span that records the queue wait — and under the request's
+profiler when it opted into profiling (profiling.py).
+
+Every job runs under a thread-budget lease for its pool (thread_budget.py),
+which resizes the torch / BLAS thread pools to the current load.
+
+A queued job is dropped by cancelling its future; a running one stops when
+its CancellationToken is cancelled (job_control.py) and counts as cancelled,
+not failed.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from ml.instrumentation import REGISTRY
+from ml.tracing import span
+
+try:
+    from backend.job_control import JobCancelled
+    from backend.profiling import current_session
+    from backend.thread_budget import ThreadBudget, get_thread_budget
+except (ImportError, ModuleNotFoundError):
+    from job_control import JobCancelled
+    from profiling import current_session
+    from thread_budget import ThreadBudget, get_thread_budget
+
+SCHEDULER_HEAVY_WORKERS = int(os.environ.get("SCHEDULER_HEAVY_WORKERS", "1"))
+SCHEDULER_LIGHT_WORKERS = int(os.environ.get("SCHEDULER_LIGHT_WORKERS", "3"))
+SCHEDULER_AGING_RATE = float(os.environ.get("SCHEDULER_AGING_RATE", "1.0"))
+
+# Seconds of CPU per second of audio, measured on the reference 2-vCPU box
+MODE_COST_FACTORS = {
+    "fast": 0.05,
+    "balanced": 0.15,
+    "precise": 0.6,
+}
+SEPARATION_COST_FACTOR = 1.2    # Demucs, per separation pass
+DEFAULT_DURATION_SEC = 180.0    # assumed when the duration cannot be read
+_BYTES_PER_SECOND_GUESS = 16_000  # ~128 kbit/s compressed audio
+
+QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "guitariz_queue_wait_seconds",
+    "Time a job spent queued before a scheduler worker picked it up.",
+    ("pool",),
+)
+
+
+# ── Cost estimation ─────────────────────────────────────────────────────────
+
+def audio_duration(path: str | Path) -> float:
+    """Duration in seconds from the file header; falls back to a size-based guess."""
+    try:
+        import soundfile as sf
+        return float(sf.info(str(path)).duration)
+    except Exception:
+        pass
+    try:
+        import librosa
+        return float(librosa.get_duration(path=str(path)))
+    except Exception:
+        pass
+    try:
+        return Path(path).stat().st_size / _BYTES_PER_SECOND_GUESS
+    except OSError:
+        return DEFAULT_DURATION_SEC
+
+
+def estimate_cost(duration_sec: float | None, mode: str, separate_vocals: bool = False) -> float:
+    """Expected seconds of work for one analysis of `duration_sec` of audio."""
+    duration = duration_sec if duration_sec and duration_sec > 0 else DEFAULT_DURATION_SEC
+    factor = MODE_COST_FACTORS.get(mode, MODE_COST_FACTORS["balanced"])
+    if separate_vocals:
+        factor += SEPARATION_COST_FACTOR
+    return duration * factor
+
+
+def is_heavy(mode: str, separate_vocals: bool) -> bool:
+    """Whether an analysis needs the heavy (Demucs) pool."""
+    return separate_vocals or mode == "precise"
+
+
+# ── Scheduler ───────────────────────────────────────────────────────────────
+
+@dataclass(order=True)
+class _Job:
+    priority: float
+    seq: int
+    fn: Callable[..., Any] = field(compare=False)
+    args: tuple = field(compare=False)
+    kwargs: dict = field(compare=False)
+    cost: float = field(compare=False)
+    submitted_at: float = field(compare=False)
+    future: Future = field(compare=False)
+    context: contextvars.Context = field(compare=False, default_factory=contextvars.copy_context)
+
+
+class _Pool:
+    """One queue + its worker threads."""
+
+    def __init__(self, name: str, workers: int, aging_rate: float, budget: ThreadBudget):
+        self.name = name
+        self.budget = budget
+        self.workers = max(int(workers), 1)
+        self.aging_rate = aging_rate
+        self._heap: list[_Job] = []
+        self._cond = threading.Condition()
+        self._threads: list[threading.Thread] = []
+        self._closed = False
+        self._in_progress: dict[int, tuple[float, float]] = {}  # seq → (cost, started_at)
+
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.started = 0
+        self.total_wait = 0.0
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"sched-{self.name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def push(self, job: _Job) -> None:
+        with self._cond:
+            heapq.heappush(self._heap, job)
+            self._cond.notify()
+
+    def _drop_cancelled(self) -> None:
+        """Remove queued jobs whose future was cancelled (their request left);
+        the caller holds `_cond`. Otherwise they would count as queued work
+        until a worker popped them."""
+        live = [j for j in self._heap if not j.future.cancelled()]
+        if len(live) != len(self._heap):
+            self.cancelled += len(self._heap) - len(live)
+            heapq.heapify(live)
+            self._heap = live
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._heap:
+                    return
+                job = heapq.heappop(self._heap)
+                if not job.future.set_running_or_notify_cancel():
+                    self.cancelled += 1
+                    continue
+                self.running += 1
+                self.started += 1
+                started_at = time.monotonic()
+                self.total_wait += started_at - job.submitted_at
+                QUEUE_WAIT_SECONDS.observe(started_at - job.submitted_at, pool=self.name)
+                self._in_progress[job.seq] = (job.cost, started_at)
+
+            try:
+                result = job.context.run(self._run, job, started_at - job.submitted_at)
+            except JobCancelled as e:
+                job.future.set_exception(e)
+                outcome = "cancelled"
+            except BaseException as e:
+                job.future.set_exception(e)
+                outcome = "failed"
+            else:
+                job.future.set_result(result)
+                outcome = "completed"
+
+            with self._cond:
+                self.running -= 1
+                self._in_progress.pop(job.seq, None)
+                if outcome == "completed":
+                    self.completed += 1
+                elif outcome == "cancelled":
+                    self.cancelled += 1
+                else:
+                    self.failed += 1
+
+    def _run(self, job: _Job, queue_wait: float) -> Any:
+        profile = current_session()
+        with span(
+            "scheduler.job", pool=self.name, cost=round(job.cost, 3), queue_wait_seconds=round(queue_wait, 3),
+        ), self.budget.lease(self.name), profile.capture() if profile is not None else nullcontext():
+            return job.fn(*job.args, **job.kwargs)
+
+    def expected_wait(self, cost: float) -> float:
+        """
+        Seconds a job of `cost` submitted now would wait for a worker: the
+        queued work that would run before it (by the heap's priority order),
+        plus what is left of the running jobs, spread over the workers.
+        """
+        now = time.monotonic()
+        priority = cost + self.aging_rate * now
+        with self._cond:
+            self._drop_cancelled()
+            ahead = sum(j.cost for j in self._heap if j.priority <= priority)
+            remaining = sum(max(c - (now - t), 0.0) for c, t in self._in_progress.values())
+            idle = self.workers - len(self._in_progress)
+        if ahead == 0 and idle > 0:
+            return 0.0
+        return (ahead + remaining) / self.workers
+
+    def queued(self) -> int:
+        with self._cond:
+            self._drop_cancelled()
+            return len(self._heap)
+
+    def stats(self) -> dict:
+        with self._cond:
+            self._drop_cancelled()
+            return {
+                "workers": self.workers,
+                "queued": len(self._heap),
+                "queuedCost": round(sum(j.cost for j in self._heap), 1),
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "avgWaitSeconds": round(self.total_wait / self.started, 3) if self.started else 0.0,
+            }
+
+
+class JobScheduler:
+    """Shortest-expected-job-first scheduler with aging over heavy/light pools."""
+
+    def __init__(
+        self,
+        heavy_workers: int = SCHEDULER_HEAVY_WORKERS,
+        light_workers: int = SCHEDULER_LIGHT_WORKERS,
+        aging_rate: float = SCHEDULER_AGING_RATE,
+        budget: ThreadBudget | None = None,
+    ):
+        budget = budget if budget is not None else get_thread_budget()
+        self._seq = itertools.count()
+        self._pools = {
+            "heavy": _Pool("heavy", heavy_workers, aging_rate, budget),
+            "light": _Pool("light", light_workers, aging_rate, budget),
+        }
+        for pool in self._pools.values():
+            pool.start()
+
+    def submit(self, fn: Callable[..., Any], *args, cost: float, heavy: bool, **kwargs) -> Future:
+        """
+        Queue `fn(*args, **kwargs)` on the heavy or light pool with an
+        estimated `cost` in seconds. Returns a concurrent Future; cancelling
+        it before a worker picks the job up removes the job.
+        """
+        pool = self._pools["heavy" if heavy else "light"]
+        now = time.monotonic()
+        future: Future = Future()
+        pool.push(_Job(
+            priority=cost + pool.aging_rate * now,
+            seq=next(self._seq),
+            fn=fn,
+            args=args,
+            kwargs=kwargs,
+            cost=cost,
+            submitted_at=now,
+            future=future,
+        ))
+        return future
+
+    async def run(self, fn: Callable[..., Any], *args, cost: float, heavy: bool, **kwargs) -> Any:
+        """Submit a job and await its result without holding a thread while queued.
+        If the awaiting request is cancelled, a still-queued job is dropped."""
+        return await asyncio.wrap_future(self.submit(fn, *args, cost=cost, heavy=heavy, **kwargs))
+
+    def expected_wait(self, cost: float, heavy: bool) -> float:
+        """Estimated queueing delay in seconds for a job submitted now (admission.py)."""
+        return self._pools["heavy" if heavy else "light"].expected_wait(cost)
+
+    def queued(self, heavy: bool) -> int:
+        """Number of jobs waiting in the heavy or light queue."""
+        return self._pools["heavy" if heavy else "light"].queued()
+
+    def stats(self) -> dict:
+        """Queue depth / throughput per pool, for /api/health."""
+        return {name: pool.stats() for name, pool in self._pools.items()}
+
+    def shutdown(self) -> None:
+        """Stop the workers once their queues drain."""
+        for pool in self._pools.values():
+            pool.close()
+
+
+_SCHEDULER: JobScheduler | None = None
+_SCHEDULER_LOCK = threading.Lock()
+
+
+def get_scheduler() -> JobScheduler:
+    """The process-wide scheduler (workers start on first use)."""
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = JobScheduler()
+            print(
+                f"[Scheduler] Ready ({SCHEDULER_HEAVY_WORKERS} heavy / "
+                f"{SCHEDULER_LIGHT_WORKERS} light workers, aging {SCHEDULER_AGING_RATE})"
+            )
+        return _SCHEDULER
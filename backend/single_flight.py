@@ -0,0 +1,170 @@
+"""
+backend/single_flight.py
+
+Single-flight coalescing of concurrent identical requests.
+
+When a link goes viral the same upload (or YouTube video) arrives many
+times within seconds. The result cache only helps once the first analysis
+has finished; until then every copy queued its own Demucs / CRNN run. Now
+the endpoints run their work as a *flight* keyed by what determines the
+result — the result-cache key (content hash, mode, vocal filter, engine
+version) or the video ID plus parameters:
+
+  - The first request starts the flight; identical requests arriving while
+    it runs attach to it instead of scheduling their own job.
+  - Every attached client gets the flight's events — replayed from the
+    start, then live — so late joiners of /api/analyze-stream still see
+    the whole progress / progressive-chord stream — and its own copy of
+    the result.
+  - The flight's CancellationToken (job_control.py) is cancelled only when
+    its last client leaves; one client disconnecting does not abort the
+    work the others are waiting for.
+
+Flights live on the event loop: `attach` / `leave` run on the loop, and
+worker threads hand events in through `Flight.emit`, which is thread-safe.
+With SINGLE_FLIGHT_ENABLED=false every request gets a private flight.
+"""
+from __future__ import annotations
+
+import asyncio
+import copy
+import os
+import threading
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from typing import Any
+
+try:
+    from backend.job_control import CancellationToken
+except (ImportError, ModuleNotFoundError):
+    from job_control import CancellationToken
+
+SINGLE_FLIGHT_ENABLED = os.environ.get("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+
+
+class Flight:
+    """One running computation and the clients attached to it."""
+
+    def __init__(self, key: str, loop: asyncio.AbstractEventLoop):
+        self.key = key
+        self.loop = loop
+        self.cancel_token = CancellationToken()
+        self.task: asyncio.Future | None = None
+        self.events: list[dict] = []
+        self.clients = 0
+        self._listeners: set[asyncio.Queue] = set()
+
+    # ── Producer side (any thread) ──────────────────────────────────────────
+
+    def emit(self, event: dict) -> None:
+        """Publish an NDJSON event to every attached client (thread-safe)."""
+        self.loop.call_soon_threadsafe(self._publish, event)
+
+    def progress_cb(self, stage: int, message: str, percent: int) -> None:
+        """`progress_cb` for the engines: emits a "progress" event."""
+        self.emit({"type": "progress", "stage": stage, "message": message, "percent": percent})
+
+    def _publish(self, event: dict) -> None:
+        self.events.append(event)
+        for queue in self._listeners:
+            queue.put_nowait(event)
+
+    # ── Consumer side (event loop) ──────────────────────────────────────────
+
+    def listen(self) -> asyncio.Queue:
+        """A queue holding every event so far, then each new one."""
+        queue: asyncio.Queue = asyncio.Queue()
+        for event in self.events:
+            queue.put_nowait(event)
+        self._listeners.add(queue)
+        return queue
+
+    def unlisten(self, queue: asyncio.Queue) -> None:
+        self._listeners.discard(queue)
+
+    def result(self) -> Any:
+        """This client's copy of the finished flight's result (raises its error)."""
+        return copy.deepcopy(self.task.result())
+
+
+class SingleFlight:
+    """Registry of in-flight computations by key."""
+
+    def __init__(self, enabled: bool = SINGLE_FLIGHT_ENABLED):
+        self.enabled = enabled
+        self._flights: dict[str, Flight] = {}
+        self.started = 0
+        self.joined = 0
+        self.abandoned = 0
+
+    def join(self, key: str, start: Callable[[Flight], Awaitable[Any]]) -> tuple[Flight, bool]:
+        """
+        Attach to the flight for `key`, starting `start(flight)` as a new one
+        if none is running. Returns (flight, started_here).
+        """
+        flight = self._flights.get(key) if self.enabled else None
+        leader = flight is None
+        if leader:
+            flight = Flight(key, asyncio.get_running_loop())
+            flight.task = asyncio.ensure_future(start(flight))
+            flight.task.add_done_callback(lambda _: self._forget(flight))
+            if self.enabled:
+                self._flights[key] = flight
+            self.started += 1
+        else:
+            self.joined += 1
+            print(f"[SingleFlight] Joined in-flight {key[:48]} ({flight.clients + 1} clients)")
+        flight.clients += 1
+        return flight, leader
+
+    def running(self, key: str) -> bool:
+        """Whether a request for `key` would join a flight rather than start one."""
+        return self.enabled and key in self._flights
+
+    def leave(self, flight: Flight) -> None:
+        """Detach one client; the last one to leave an unfinished flight cancels it."""
+        flight.clients -= 1
+        if flight.clients > 0 or flight.task.done():
+            return
+        self.abandoned += 1
+        self._forget(flight)  # a new request for the key starts afresh
+        flight.cancel_token.cancel("no clients left")
+        flight.task.cancel()
+
+    @asynccontextmanager
+    async def attach(
+        self, key: str, start: Callable[[Flight], Awaitable[Any]],
+    ) -> AsyncIterator[tuple[Flight, bool]]:
+        """`join` for the duration of a request, `leave` when it ends."""
+        flight, leader = self.join(key, start)
+        try:
+            yield flight, leader
+        finally:
+            self.leave(flight)
+
+    def _forget(self, flight: Flight) -> None:
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "inFlight": len(self._flights),
+            "clients": sum(f.clients for f in self._flights.values()),
+            "started": self.started,
+            "joined": self.joined,
+            "abandoned": self.abandoned,
+        }
+
+
+_SINGLE_FLIGHT: SingleFlight | None = None
+_SINGLE_FLIGHT_LOCK = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    """The process-wide registry (coalescing disabled via SINGLE_FLIGHT_ENABLED)."""
+    global _SINGLE_FLIGHT
+    with _SINGLE_FLIGHT_LOCK:
+        if _SINGLE_FLIGHT is None:
+            _SINGLE_FLIGHT = SingleFlight()
+        return _SINGLE_FLIGHT
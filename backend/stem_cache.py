@@ -0,0 +1,164 @@
+"""
+backend/stem_cache.py
+
+Persistent cache of Demucs stems, keyed by audio content hash + model name.
+
+Demucs costs 60–120s of CPU per song and runs on a single heavy
+worker, yet the same audio is often separated more than once: a user runs
+/api/separate, then precise mode, then balanced mode with the vocal filter.
+Every consumer now goes through this store first:
+
+  - separate_audio_full()    → htdemucs (falls back to a cached htdemucs_6s run,
+                               whose vocals/non-vocals split is equivalent)
+  - separate_audio_stems()   → htdemucs_6s
+  - precise mode             → htdemucs_6s (guitar + piano + other)
+
+Entries record the Demucs chunk overlap they were separated with, and a
+lookup is only served by a run with at least the requested overlap: precise
+mode's fast overlap-0 stems (audible seams at chunk edges) never reach a
+/api/separate download, while its lookups can reuse /api/separate's
+overlap-0.1 stems. A better run replaces a worse entry under the same key.
+
+Stems are stored as mono float32 WAV at the model's sample rate, one entry
+directory per (model, hash), bounded by STEM_CACHE_MAX_BYTES with LRU eviction.
+"""
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+try:
+    from backend.result_cache import DiskLRU, hash_file
+except (ImportError, ModuleNotFoundError):
+    from result_cache import DiskLRU, hash_file
+
+STEM_CACHE_ENABLED = os.environ.get("STEM_CACHE_ENABLED", "true").lower() == "true"
+STEM_CACHE_DIR = Path(
+    os.environ.get("STEM_CACHE_DIR", Path(tempfile.gettempdir()) / "guitariz_stem_cache")
+)
+STEM_CACHE_MAX_BYTES = int(os.environ.get("STEM_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+
+class StemCache:
+    """Byte-bounded LRU store of separated stems."""
+
+    MANIFEST_FILE = "stems.json"
+
+    def __init__(
+        self,
+        directory: str | Path = STEM_CACHE_DIR,
+        max_bytes: int = STEM_CACHE_MAX_BYTES,
+    ):
+        self.disk = DiskLRU(directory, max_bytes, self.MANIFEST_FILE)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(content_hash: str, model_name: str) -> str:
+        return f"{model_name}-{content_hash}"
+
+    def has(self, content_hash: str, model_name: str) -> bool:
+        return self._key(content_hash, model_name) in self.disk
+
+    def load(
+        self, content_hash: str, model_name: str, min_overlap: float = 0.0,
+    ) -> tuple[dict[str, np.ndarray], int] | None:
+        """Return ({stem_name: mono float32 audio}, samplerate) or None on a miss.
+        Entries separated with less chunk overlap than `min_overlap` are misses."""
+        key = self._key(content_hash, model_name)
+        if not self.disk.touch(key):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        entry = self.disk.path(key)
+        try:
+            manifest = json.loads((entry / self.MANIFEST_FILE).read_text())
+            # Entries from before overlap was recorded: assume the lowest
+            if float(manifest.get("overlap", 0.0)) < min_overlap:
+                with self._lock:
+                    self.misses += 1
+                return None
+            stems = {
+                name: sf.read(entry / f"{name}.wav", dtype="float32")[0]
+                for name in manifest["stems"]
+            }
+        except (OSError, ValueError, KeyError, RuntimeError) as e:
+            print(f"[StemCache] Dropping unreadable entry {key}: {e}")
+            self.disk.drop(key)
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return stems, int(manifest["samplerate"])
+
+    def put(
+        self,
+        content_hash: str,
+        model_name: str,
+        stems: dict[str, np.ndarray],
+        samplerate: int,
+        overlap: float = 0.0,
+    ) -> None:
+        """Store mono stems for (content_hash, model_name), separated with chunk `overlap`."""
+        key = self._key(content_hash, model_name)
+        staging = None
+        try:
+            staging = self.disk.staging_dir(key)
+            for name, audio in stems.items():
+                sf.write(staging / f"{name}.wav", np.asarray(audio, dtype=np.float32), samplerate, subtype="FLOAT")
+            (staging / self.MANIFEST_FILE).write_text(json.dumps({
+                "model": model_name,
+                "samplerate": samplerate,
+                "overlap": overlap,
+                "stems": list(stems),
+            }))
+            self.disk.commit(key, staging)
+        except (OSError, RuntimeError) as e:
+            print(f"[StemCache] Failed to store {key}: {e}")
+            if staging is not None:
+                shutil.rmtree(staging, ignore_errors=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "entries": len(self.disk),
+                "bytes": self.disk.total_bytes,
+                "maxBytes": self.disk.max_bytes,
+                "evictions": self.disk.evictions,
+            }
+
+
+def content_hash(path: str | Path) -> str:
+    """Content key for stem lookups (SHA-256 of the audio file's bytes)."""
+    return hash_file(path)
+
+
+_STEM_CACHE: StemCache | None = None
+_STEM_CACHE_LOCK = threading.Lock()
+
+
+def get_stem_cache() -> StemCache | None:
+    """Process-wide stem store, or None when disabled via STEM_CACHE_ENABLED."""
+    global _STEM_CACHE
+    if not STEM_CACHE_ENABLED:
+        return None
+    with _STEM_CACHE_LOCK:
+        if _STEM_CACHE is None:
+            _STEM_CACHE = StemCache()
+            print(f"[StemCache] Ready at {STEM_CACHE_DIR} ({len(_STEM_CACHE.disk)} entries)")
+        return _STEM_CACHE
@@ -0,0 +1,175 @@
+"""
+backend/test_admission.py
+
+Unit tests for admission control and load shedding.
+"""
+from __future__ import annotations
+
+import threading
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from admission import SEPARATION, AdmissionController, AudioInfo, estimate_memory, probe_audio
+from scheduler import JobScheduler
+
+GB = 1024 ** 3
+SONG = AudioInfo(duration=200.0, channels=2, sample_rate=44100)
+
+
+@pytest.fixture
+def sched():
+    sched = JobScheduler(heavy_workers=1, light_workers=1)
+    gate = threading.Event()
+    sched.gate = gate
+    yield sched
+    gate.set()
+    sched.shutdown()
+
+
+def _occupy(sched: JobScheduler, heavy: bool, cost: float, queued: int = 0) -> None:
+    """Keep the pool's worker busy on a job of `cost`, with `queued` more behind it."""
+    started = threading.Event()
+    sched.submit(lambda: (started.set(), sched.gate.wait()), cost=cost, heavy=heavy)
+    started.wait(timeout=5)
+    for _ in range(queued):
+        sched.submit(sched.gate.wait, cost=cost, heavy=heavy)
+
+
+def _controller(sched, **kwargs) -> AdmissionController:
+    kwargs.setdefault("memory_fn", lambda: 8 * GB)
+    return AdmissionController(
+        sched, enabled=True, max_wait_heavy=300.0, max_wait_light=60.0,
+        min_free_bytes=0.5 * GB, **kwargs,
+    )
+
+
+def test_idle_server_accepts(sched):
+    decision = _controller(sched).admit("analyze", SONG, "precise")
+    assert decision.action == "accept"
+    assert decision.mode == "precise"
+    assert decision.expected_wait == 0.0
+
+
+def test_cancelled_queued_jobs_do_not_count(sched):
+    _occupy(sched, heavy=True, cost=10.0)
+    abandoned = [sched.submit(sched.gate.wait, cost=100.0, heavy=True) for _ in range(5)]
+    controller = _controller(sched, max_queued=4)
+    assert controller.admit("separate", SONG, SEPARATION).reason == "depth"
+
+    for future in abandoned:
+        assert future.cancel()  # their clients left (main._discard_upload)
+    assert sched.queued(True) == 0
+    assert sched.stats()["heavy"]["queuedCost"] == 0
+    assert sched.stats()["heavy"]["cancelled"] == 5
+    decision = controller.admit("separate", SONG, SEPARATION)
+    assert decision.action == "accept"
+    assert decision.expected_wait <= 10.0
+
+
+def test_long_queue_rejects_with_retry_after(sched):
+    _occupy(sched, heavy=True, cost=1000.0)
+    decision = _controller(sched).admit("separate", SONG, SEPARATION)
+    assert decision.action == "reject"
+    assert decision.reason == "queue"
+    # ~1000 s of running work against a 300 s limit
+    assert 690 <= decision.retry_after <= 700
+
+
+def test_precise_is_downgraded_when_only_the_heavy_pool_is_full(sched):
+    _occupy(sched, heavy=True, cost=1000.0)
+    ctl = _controller(sched)
+    decision = ctl.admit("analyze", SONG, "precise")
+    assert decision.action == "downgrade"
+    assert decision.mode == "balanced"
+    assert decision.reason == "queue"
+
+    # Vocal separation needs the heavy pool either way: nothing to downgrade to
+    assert ctl.admit("analyze", SONG, "precise", separate_vocals=True).action == "reject"
+
+    stats = ctl.stats()
+    assert stats["downgraded"] == 1 and stats["rejected"] == 1
+    assert stats["endpoints"]["analyze"] == {"downgrade": 1, "reject": 1}
+    assert stats["reasons"] == {"queue": 2}
+
+
+def test_downgrade_can_be_disabled(sched):
+    _occupy(sched, heavy=True, cost=1000.0)
+    assert _controller(sched, downgrade=False).admit("analyze", SONG, "precise").action == "reject"
+
+
+def test_short_jobs_are_admitted_ahead_of_a_long_backlog(sched):
+    # SJF: a short job waits only for the running job, not the long queued ones
+    _occupy(sched, heavy=False, cost=30.0, queued=3)
+    ctl = _controller(sched)
+    assert ctl.admit("analyze", AudioInfo(20.0), "balanced").action == "accept"
+    assert ctl.admit("analyze", AudioInfo(600.0), "balanced").action == "reject"
+
+
+def test_memory_headroom_rejects(sched):
+    needed = estimate_memory(SONG, "precise")
+    ctl = _controller(sched, memory_fn=lambda: int(needed))
+    decision = ctl.admit("analyze", SONG, "balanced")
+    assert decision.action == "accept"
+
+    ctl = _controller(sched, memory_fn=lambda: int(0.6 * GB))
+    decision = ctl.admit("analyze", SONG, "fast")
+    assert decision.action == "reject"
+    assert decision.reason == "memory"
+    assert decision.retry_after > 0
+
+
+def test_unknown_memory_is_not_a_limit(sched):
+    assert _controller(sched, memory_fn=lambda: None).admit("analyze", SONG, "precise").admitted
+
+
+def test_precheck_caps_queue_depth(sched):
+    _occupy(sched, heavy=True, cost=10.0, queued=2)
+    ctl = _controller(sched, max_queued=2)
+    assert ctl.precheck("separate", SEPARATION).action == "reject"
+    # Precise can still fall back to the light pool
+    assert ctl.precheck("analyze", "precise").admitted
+    assert ctl.stats()["reasons"] == {"depth": 1}
+
+
+def test_disabled_controller_admits_everything(sched):
+    _occupy(sched, heavy=True, cost=10_000.0, queued=5)
+    ctl = AdmissionController(sched, enabled=False, max_queued=1, memory_fn=lambda: 0)
+    assert ctl.precheck("separate", SEPARATION).admitted
+    assert ctl.admit("separate", SONG, SEPARATION).action == "accept"
+
+
+def test_probe_audio_reads_the_header(tmp_path):
+    path = tmp_path / "clip.wav"
+    sf.write(path, np.zeros((22050 * 3, 2), dtype=np.float32), 22050)
+    info = probe_audio(path)
+    assert info.duration == pytest.approx(3.0)
+    assert info.channels == 2
+    assert info.sample_rate == 22050
+
+
+def test_memory_estimate_scales_with_channels_and_separation():
+    mono = AudioInfo(100.0, channels=1)
+    stereo = AudioInfo(100.0, channels=2)
+    assert estimate_memory(stereo, "balanced") == pytest.approx(2 * estimate_memory(mono, "balanced"))
+    assert estimate_memory(stereo, "balanced", separate_vocals=True) > estimate_memory(stereo, "precise")
+
+
+def test_main_admission_watches_the_queue_main_fills(monkeypatch):
+    import main
+
+    assert main.admission.scheduler is main.scheduler
+    monkeypatch.setattr(main.admission, "enabled", True)
+    monkeypatch.setattr(main.admission, "max_queued", 2)
+    monkeypatch.setattr(main.admission, "memory_fn", lambda: 8 * GB)
+    gate = threading.Event()
+    futures = [main.scheduler.submit(gate.wait, cost=100.0, heavy=True) for _ in range(4)]
+    try:
+        assert main.admission.precheck("separate", SEPARATION).action == "reject"
+        decision = main.admission.admit("separate", SONG, SEPARATION)
+        assert decision.action == "reject" and decision.expected_wait > 0
+    finally:
+        gate.set()
+        for future in futures:
+            future.result(timeout=5)
@@ -0,0 +1,67 @@
+"""
+backend/test_analysis_context.py
+
+Unit tests for the per-request decode-once AnalysisContext.
+"""
+from __future__ import annotations
+
+import librosa
+import numpy as np
+import soundfile as sf
+
+from ml.analysis_context import AnalysisContext, as_context
+from ml.dsp_tempo_key import detect_key_dsp, detect_tempo_dsp
+from ml.features import SR, extract_cnn_input, extract_cqt_chroma
+
+
+def _triad(duration: float = 4.0, sr: int = SR) -> np.ndarray:
+    """A-minor triad with a 2 Hz amplitude pulse (gives the tempo tracker onsets)."""
+    t = np.arange(int(duration * sr)) / sr
+    env = 0.6 + 0.4 * (np.sin(2 * np.pi * 2.0 * t) > 0)
+    y = sum(np.sin(2 * np.pi * f * t) for f in (220.0, 261.63, 329.63))
+    return (0.2 * env * y).astype(np.float32)
+
+
+def test_features_are_memoized():
+    ctx = AnalysisContext.from_waveform(_triad())
+    assert ctx.cqt is ctx.cqt
+    assert ctx.chroma is ctx.chroma
+    assert ctx.chroma.shape == (ctx.cqt.shape[1], 12)
+    assert ctx.cnn_input.shape == ctx.cqt.shape
+
+
+def test_shared_cqt_matches_standalone_extractors():
+    y = _triad()
+    ctx = AnalysisContext.from_waveform(y)
+    np.testing.assert_allclose(ctx.chroma, extract_cqt_chroma(y, SR), atol=1e-6)
+    np.testing.assert_allclose(ctx.cnn_input, extract_cnn_input(y, SR), atol=1e-6)
+
+
+def test_file_is_decoded_once_across_detectors(tmp_path, monkeypatch):
+    path = tmp_path / "triad.wav"
+    stereo = np.stack([_triad(), _triad()])
+    sf.write(path, stereo.T, SR)
+
+    calls = []
+    real_load = librosa.load
+
+    def counting_load(*args, **kwargs):
+        calls.append(args)
+        return real_load(*args, **kwargs)
+
+    monkeypatch.setattr(librosa, "load", counting_load)
+
+    ctx = AnalysisContext(path, keep_channels=True)
+    assert ctx.audio.ndim == 2
+    key = detect_key_dsp(ctx)
+    tempo = detect_tempo_dsp(ctx)
+
+    assert len(calls) == 1
+    assert key.split()[0] in ("A", "C")
+    assert tempo > 0
+
+
+def test_as_context_passes_contexts_through(tmp_path):
+    ctx = AnalysisContext.from_waveform(_triad(1.0))
+    assert as_context(ctx) is ctx
+    assert as_context(tmp_path / "x.wav").file_path == tmp_path / "x.wav"
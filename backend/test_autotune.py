@@ -0,0 +1,88 @@
+"""
+backend/test_autotune.py
+
+Unit tests for the host autotuner and its use by the thread budget.
+"""
+from __future__ import annotations
+
+import json
+
+import pytest
+import torch
+
+import autotune
+import chord_custom
+from thread_budget import ThreadBudget
+
+
+def test_thread_candidates():
+    assert autotune.thread_candidates(1) == [1]
+    assert autotune.thread_candidates(6) == [1, 2, 4, 6]
+    assert autotune.thread_candidates(8) == [1, 2, 4, 8]
+
+
+def test_profile_roundtrip_and_host_check(tmp_path):
+    path = tmp_path / "profile.json"
+    profile = {"version": autotune.PROFILE_VERSION, "host": autotune.host_fingerprint(), "templates": {"threads": 2}}
+    autotune.save_profile(profile, path)
+    assert autotune.load_profile(path) == profile
+
+    other_host = dict(profile, host={**profile["host"], "cores": profile["host"]["cores"] + 64})
+    path.write_text(json.dumps(other_host))
+    assert autotune.load_profile(path) is None
+    assert autotune.load_profile(tmp_path / "missing.json") is None
+
+
+def test_template_stage_writes_a_profile(tmp_path):
+    path = tmp_path / "profile.json"
+    profile = autotune.run_autotune(quick=True, path=path, stages=("templates",))
+    assert profile["templates"]["threads"] in autotune.thread_candidates(profile["host"]["cores"])
+    assert autotune.load_profile(path) == profile
+
+
+def test_onnx_stage_tunes_session_options(tmp_path, monkeypatch):
+    ort = pytest.importorskip("onnxruntime")
+    pytest.importorskip("onnx")  # needed by the exporter
+    from ml.chord_vocab import NUM_CLASSES
+    from ml.model import ChordCRNN
+
+    model_path = tmp_path / "chord_model.onnx"
+    torch.onnx.export(
+        ChordCRNN(num_classes=NUM_CLASSES).eval(), torch.randn(1, 1, 216, 50), str(model_path),
+        input_names=["log_cqt"], output_names=["logits"],
+        dynamic_axes={"log_cqt": {0: "batch", 3: "n_frames"}, "logits": {0: "batch", 1: "n_frames"}},
+        opset_version=14, dynamo=False,
+    )
+    monkeypatch.setattr(chord_custom, "USE_QUANTIZED_MODEL", False)
+    monkeypatch.setattr(chord_custom, "CHORD_MODEL_PATH", model_path)
+
+    result = autotune.tune_onnx(seconds=3.0, repeats=1, max_threads=2)
+    assert result["model"] == "chord_model.onnx"
+    assert result["graph_optimization_level"] in ("ORT_ENABLE_BASIC", "ORT_ENABLE_EXTENDED", "ORT_ENABLE_ALL")
+    assert hasattr(ort.ExecutionMode, result["execution_mode"])
+
+
+def test_profile_caps_the_thread_budget(monkeypatch):
+    ort = pytest.importorskip("onnxruntime")
+    import thread_budget
+
+    profile = {
+        "demucs": {"threads": 2},
+        "templates": {"threads": 1},
+        "onnx": {"intra_op_num_threads": 3, "inter_op_num_threads": 1,
+                 "graph_optimization_level": "ORT_ENABLE_BASIC", "execution_mode": "ORT_SEQUENTIAL"},
+    }
+    budget = ThreadBudget(total=16, light_concurrency=2, profile=profile)
+    assert budget.onnx_threads() == 3  # the fair share (8) is capped by the tuned optimum
+
+    original = torch.get_num_threads()
+    try:
+        with budget.lease("heavy"):
+            assert torch.get_num_threads() == 2
+    finally:
+        torch.set_num_threads(original)
+
+    monkeypatch.setattr(thread_budget, "_THREAD_BUDGET", budget)
+    opts = thread_budget.onnx_session_options()
+    assert opts.intra_op_num_threads == 3
+    assert opts.graph_optimization_level == ort.GraphOptimizationLevel.ORT_ENABLE_BASIC
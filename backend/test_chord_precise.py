@@ -0,0 +1,57 @@
+"""
+backend/test_chord_precise.py
+
+Unit tests for precise mode's batched ensemble scoring.
+"""
+from __future__ import annotations
+
+import numpy as np
+
+import chord_precise as cp
+
+
+def _reference_ensemble_score(vec: np.ndarray) -> np.ndarray:
+    """The per-template loop that `_ensemble_scores` replaced."""
+    v_norm = vec / np.linalg.norm(vec)
+    cosine = cp.CHORD_TEMPLATES @ v_norm
+    v_centered = vec - vec.mean()
+    v_std = v_centered.std()
+    pearson = np.zeros(cp.N_CHORDS, dtype=np.float32)
+    for i, tpl in enumerate(cp.CHORD_TEMPLATES):
+        t_centered = tpl - tpl.mean()
+        t_std = t_centered.std()
+        if v_std > 1e-9 and t_std >= 1e-9:
+            pearson[i] = float(np.dot(v_centered, t_centered) / (v_std * t_std + 1e-9))
+    pearson = np.clip(pearson, -1.0, 1.0)
+    euclidean = 1.0 / (1.0 + np.linalg.norm(cp.CHORD_TEMPLATES - v_norm[None, :], axis=1))
+    return (0.50 * cosine + 0.35 * pearson + 0.15 * euclidean).astype(np.float32)
+
+
+def test_batched_scores_match_per_segment_loop():
+    rng = np.random.default_rng(0)
+    vecs = rng.random((64, 12), dtype=np.float32)
+    vecs[0] = 1.0  # flat chroma: Pearson term is zero
+    batched = cp._ensemble_scores(vecs)
+    expected = np.stack([_reference_ensemble_score(v) for v in vecs])
+    np.testing.assert_allclose(batched, expected, atol=1e-5)
+
+
+def test_repeated_bias_indices_compound():
+    mult = cp._bias_multipliers({"diatonic": [1], "secondary": [2, 2], "borrowed": [1]})
+    np.testing.assert_allclose(mult[[0, 1, 2]], [1.0, 1.45 * 1.10, 1.20 * 1.20], rtol=1e-6)
+
+
+def test_segment_detection_finds_triad_and_slash_bass():
+    chroma = np.zeros((12, 40), dtype=np.float32)
+    chroma[[0, 4, 7], :20] = 1.0          # C major
+    chroma[[9, 0, 4], 20:] = 1.0          # A minor
+    bass = np.zeros((12, 40), dtype=np.float32)
+    bass[0, :20] = 1.0                    # C in the bass under both chords
+    bass[0, 20:] = 1.0
+
+    segs = cp._detect_segment_chords(
+        chroma, bass, np.array([0, 20, 40]), np.array([20, 40, 45]), 22050, 512,
+        cp._get_bias_indices("C", "major"),
+    )
+    assert [s["chord"] for s in segs] == ["C", "Amin/C", "N.C."]
+    assert segs[0]["bass"] == "C"
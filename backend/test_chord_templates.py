@@ -0,0 +1,52 @@
+"""
+backend/test_chord_templates.py
+
+Unit tests for the batched frame-to-template scoring kernel.
+"""
+from __future__ import annotations
+
+import numpy as np
+
+from ml.chord_templates import score_chroma_frames
+from ml.chord_vocab import LABEL_TO_IDX, build_templates
+
+NC = LABEL_TO_IDX["N.C."]
+
+
+def _reference_scores(chroma, templates, min_norm, silent, nc_silent):
+    """The per-frame loop the kernel replaced."""
+    sims = np.zeros((len(chroma), len(templates)), dtype=np.float32)
+    for t in range(len(chroma)):
+        norm = float(np.linalg.norm(chroma[t]))
+        if silent[t] or norm < min_norm:
+            sims[t, NC] = nc_silent
+        else:
+            sims[t] = templates @ (chroma[t] / (norm + 1e-8))
+            sims[t, NC] = -1.0
+    return sims
+
+
+def test_kernel_matches_per_frame_loop():
+    rng = np.random.default_rng(0)
+    chroma = rng.random((500, 12), dtype=np.float32)
+    chroma /= np.linalg.norm(chroma, axis=1, keepdims=True)
+    chroma[::7] *= 0.1                  # weak frames → norm gate
+    silent = np.zeros(500, dtype=bool)
+    silent[100:150] = True              # RMS gate
+    templates = build_templates(with_penalties=True)
+
+    sims, norms = score_chroma_frames(
+        chroma, templates, NC, min_norm=0.18, silent=silent, nc_silent_score=2.0
+    )
+    expected = _reference_scores(chroma, templates, 0.18, silent, 2.0)
+
+    assert sims.dtype == np.float32 and sims.shape == expected.shape
+    np.testing.assert_allclose(sims, expected, atol=1e-5)
+    np.testing.assert_allclose(norms, np.linalg.norm(chroma, axis=1), rtol=1e-6)
+    np.testing.assert_array_equal(sims.argmax(axis=1), expected.argmax(axis=1))
+
+
+def test_all_silent_input_is_no_chord():
+    sims, _ = score_chroma_frames(np.zeros((10, 12)), build_templates(), NC, min_norm=0.15)
+    assert (sims.argmax(axis=1) == NC).all()
+    assert np.count_nonzero(sims) == 10
@@ -0,0 +1,107 @@
+"""
+backend/test_inference_batcher.py
+
+Unit tests for cross-request CRNN batching.
+"""
+from __future__ import annotations
+
+import threading
+
+import numpy as np
+import pytest
+
+from inference_batcher import PAD_VALUE, InferenceBatcher, plan_batches
+
+
+class _FakeSession:
+    """Per-frame 'logits' = [mean over bins, frame index]; records batch shapes."""
+
+    def __init__(self):
+        self.shapes = []
+        self.lock = threading.Lock()
+
+    def run(self, output_names, feeds):
+        x = feeds["log_cqt"]
+        with self.lock:
+            self.shapes.append(x.shape)
+        b, _, _, t = x.shape
+        mean = x[:, 0].mean(axis=1)  # (B, T)
+        idx = np.broadcast_to(np.arange(t, dtype=np.float32), (b, t))
+        return [np.stack([mean, idx], axis=-1)]
+
+
+def _input(n_frames: int, value: float) -> np.ndarray:
+    return np.full((216, n_frames), value, dtype=np.float32)
+
+
+def _infer_concurrently(batcher, inputs):
+    results = [None] * len(inputs)
+    barrier = threading.Barrier(len(inputs))
+
+    def worker(i):
+        barrier.wait()
+        results[i] = batcher.infer(inputs[i])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(inputs))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_plan_batches_bounds_padding_waste_and_size():
+    assert plan_batches([100, 98, 95], max_size=8, max_padding_waste=0.1) == [[2, 1, 0]]
+    # 40 next to 100 would waste 30% of the batch
+    assert plan_batches([100, 40, 95], max_size=8, max_padding_waste=0.1) == [[1], [2, 0]]
+    assert plan_batches([10] * 5, max_size=2, max_padding_waste=0.5) == [[0, 1], [2, 3], [4]]
+    assert plan_batches([], max_size=4, max_padding_waste=0.1) == []
+
+
+def test_concurrent_requests_share_one_run():
+    sess = _FakeSession()
+    batcher = InferenceBatcher(sess, window_ms=200, max_size=3, max_padding_waste=0.2)
+    inputs = [_input(100, 0.1), _input(90, 0.2), _input(95, 0.3)]
+    results = _infer_concurrently(batcher, inputs)
+
+    assert sess.shapes == [(3, 1, 216, 100)]
+    for x, logits in zip(inputs, results):
+        assert logits.shape == (x.shape[1], 2)  # cropped back to the caller's length
+        assert np.allclose(logits[:, 0], x[0, 0])
+        assert np.array_equal(logits[:, 1], np.arange(x.shape[1]))
+    stats = batcher.stats()
+    assert stats["batches"] == 1 and stats["avgBatchSize"] == 3.0
+    assert stats["paddingWaste"] == pytest.approx(1 - 285 / 300, abs=1e-4)
+
+
+def test_mismatched_lengths_are_bucketed_separately():
+    sess = _FakeSession()
+    batcher = InferenceBatcher(sess, window_ms=200, max_size=4, max_padding_waste=0.1)
+    results = _infer_concurrently(batcher, [_input(1000, 0.5), _input(50, 0.5), _input(980, 0.5), _input(55, 0.5)])
+    assert sorted(sess.shapes) == [(2, 1, 216, 55), (2, 1, 216, 1000)]
+    assert [r.shape[0] for r in results] == [1000, 50, 980, 55]
+
+
+def test_padding_uses_silence():
+    seen = []
+
+    class Recorder(_FakeSession):
+        def run(self, output_names, feeds):
+            seen.append(feeds["log_cqt"].copy())
+            return super().run(output_names, feeds)
+
+    batcher = InferenceBatcher(Recorder(), window_ms=200, max_size=2, max_padding_waste=0.5)
+    _infer_concurrently(batcher, [_input(10, 0.7), _input(8, 0.7)])
+    (x,) = seen
+    short = 0 if np.all(x[0, 0, :, 8:] == PAD_VALUE) else 1
+    assert np.all(x[short, 0, :, 8:] == PAD_VALUE) and np.all(x[short, 0, :, :8] == 0.7)
+
+
+def test_session_errors_reach_every_caller():
+    class Broken:
+        def run(self, output_names, feeds):
+            raise RuntimeError("ort failure")
+
+    batcher = InferenceBatcher(Broken(), window_ms=0)
+    with pytest.raises(RuntimeError, match="ort failure"):
+        batcher.infer(_input(10, 0.0))
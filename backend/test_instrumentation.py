@@ -0,0 +1,116 @@
+"""
+backend/test_instrumentation.py
+
+Unit tests for the metrics registry, stage timing and /api/metrics.
+"""
+from __future__ import annotations
+
+import time
+
+import numpy as np
+import pytest
+import soundfile as sf
+from ml.instrumentation import (
+    REGISTRY,
+    STAGE_SECONDS,
+    MetricFamily,
+    Registry,
+    analysis_mode,
+    capture,
+    stage,
+)
+
+
+def _stage_total(name: str, mode: str) -> float:
+    return STAGE_SECONDS.total(stage=name, mode=mode)
+
+
+def test_histogram_renders_cumulative_buckets():
+    reg = Registry()
+    hist = reg.histogram("t_seconds", "Test.", ("mode",), buckets=(0.1, 1.0))
+    for v in (0.05, 0.5, 0.5, 3.0):
+        hist.observe(v, mode='a"b')
+    text = reg.render()
+    assert "# TYPE t_seconds histogram" in text
+    assert 't_seconds_bucket{mode="a\\"b",le="0.1"} 1' in text
+    assert 't_seconds_bucket{mode="a\\"b",le="1"} 3' in text
+    assert 't_seconds_bucket{mode="a\\"b",le="+Inf"} 4' in text
+    assert 't_seconds_sum{mode="a\\"b"} 4.05' in text
+    assert 't_seconds_count{mode="a\\"b"} 4' in text
+
+
+def test_counters_gauges_and_collectors():
+    reg = Registry()
+    reg.counter("t_total", "Test.", ("kind",)).inc(2, kind="x")
+    reg.gauge("t_level", "Test.").set(7)
+    reg.add_collector(lambda: [MetricFamily("t_files", "gauge", "Test.").add(3, cache="stem").add(None)])
+    reg.add_collector(lambda: 1 / 0)  # a broken collector does not break the scrape
+    text = reg.render()
+    assert 't_total{kind="x"} 2' in text
+    assert "t_level 7" in text
+    assert 't_files{cache="stem"} 3' in text
+    with pytest.raises(ValueError):
+        reg.counter("t_total", "Test.", ("kind",)).inc(kind="x", extra="y")
+
+
+def test_nested_stages_record_self_time():
+    with analysis_mode("t-nested"), stage("outer"):
+        time.sleep(0.02)
+        with stage("inner"):
+            time.sleep(0.05)
+    assert _stage_total("inner", "t-nested") >= 0.05
+    assert 0.015 <= _stage_total("outer", "t-nested") < 0.05
+
+
+def test_only_the_outermost_mode_counts_as_a_run():
+    runs = REGISTRY.get("guitariz_analysis_duration_seconds")
+    with analysis_mode("t-outer"), analysis_mode("t-inner"), stage("work"):
+        pass
+    assert STAGE_SECONDS.count(stage="work", mode="t-inner") == 1
+    assert runs.count(mode="t-outer", outcome="ok") == 1
+    assert runs.count(mode="t-inner", outcome="ok") == 0
+
+    from job_control import JobCancelled
+    with pytest.raises(JobCancelled), analysis_mode("t-cancel"):
+        raise JobCancelled("gone")
+    assert runs.count(mode="t-cancel", outcome="cancelled") == 1
+
+
+def test_captured_observations_replay_into_another_registry():
+    with capture() as observations, analysis_mode("t-capture"), stage("cqt"):
+        pass
+    assert ("guitariz_stage_duration_seconds", {"stage": "cqt", "mode": "t-capture"}) in [
+        (name, labels) for name, labels, _ in observations
+    ]
+    before = STAGE_SECONDS.count(stage="cqt", mode="t-capture")
+    REGISTRY.replay(observations)
+    assert STAGE_SECONDS.count(stage="cqt", mode="t-capture") == before + 1
+
+
+def test_balanced_engine_reports_its_stages(tmp_path):
+    from analysis import analyze_file
+
+    sr = 44100
+    t = np.arange(4 * sr) / sr
+    mono = sum(np.sin(2 * np.pi * f * t) for f in (261.63, 329.63, 392.00)) * 0.15
+    path = tmp_path / "c_major.wav"
+    sf.write(path, np.stack([mono, mono], axis=1).astype(np.float32), sr)
+
+    before = {s: STAGE_SECONDS.count(stage=s, mode="balanced") for s in ("decode", "resample", "key", "tempo")}
+    analyze_file(path)
+    for s in ("decode", "resample", "cqt", "hpss", "key", "tempo", "chords", "viterbi"):
+        assert STAGE_SECONDS.count(stage=s, mode="balanced") >= before.get(s, 0) + 1, s
+
+
+def test_metrics_endpoint_serves_prometheus_text():
+    from fastapi.testclient import TestClient
+
+    from main import app
+
+    response = TestClient(app).get("/api/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    assert "# TYPE guitariz_stage_duration_seconds histogram" in text
+    assert 'guitariz_scheduler_workers{pool="heavy"}' in text
+    assert "guitariz_separated_files_bytes 0" in text
@@ -0,0 +1,128 @@
+"""
+backend/test_job_control.py
+
+Unit tests for cancellation tokens, progress scaling and engine cancellation.
+"""
+from __future__ import annotations
+
+import numpy as np
+import pytest
+import soundfile as sf
+import torch
+
+from job_control import CancellationToken, JobCancelled, check_cancelled, scale_progress
+
+
+def test_token_cancels_once_and_runs_callbacks():
+    token = CancellationToken()
+    calls = []
+    token.on_cancel(lambda: calls.append("early"))
+    check_cancelled(token)
+    check_cancelled(None)
+
+    token.cancel("client disconnected")
+    token.cancel("again")
+    token.on_cancel(lambda: calls.append("late"))
+
+    assert calls == ["early", "late"]
+    assert token.cancelled and token.reason == "client disconnected"
+    with pytest.raises(JobCancelled, match="client disconnected"):
+        token.raise_if_cancelled()
+
+
+def test_scale_progress_maps_into_the_callers_range():
+    events = []
+    scaled = scale_progress(lambda *e: events.append(e), 10, 35, stage=1)
+    for pct in (0, 50, 50, 100, 140):
+        scaled(7, "Separating", pct)
+    assert events == [(1, "Separating", 10), (1, "Separating", 22), (1, "Separating", 35)]
+    assert scale_progress(None, 0, 50) is None
+
+
+# ── Demucs chunk callback ───────────────────────────────────────────────────
+
+class _TinySeparator(torch.nn.Module):
+    """Stand-in for a Demucs model: 1 s segments, two sources."""
+
+    samplerate = 8000
+    segment = 1.0
+    audio_channels = 2
+    sources = ["vocals", "other"]
+
+    def forward(self, mix):
+        return torch.stack([mix * 0.5, mix * 0.5], dim=1)
+
+
+@pytest.fixture
+def separator(tmp_path):
+    from analysis import DemucsSeparator
+
+    sep = DemucsSeparator.__new__(DemucsSeparator)  # skip loading pretrained weights
+    sep.model = _TinySeparator()
+    sep.samplerate = sep.model.samplerate
+    path = tmp_path / "mix.wav"
+    sf.write(path, (0.1 * np.random.default_rng(0).standard_normal((8000 * 5, 2))).astype(np.float32), 8000)
+    return sep, path
+
+
+def test_demucs_reports_progress_per_chunk(separator):
+    sep, path = separator
+    events = []
+    stems = sep.separate_audio_file(path, overlap=0.0, progress_cb=lambda *e: events.append(e))
+
+    assert set(stems) == {"vocals", "other"}
+    assert [pct for _, _, pct in events] == [20, 40, 60, 80, 100]
+    assert events[-1][:2] == (1, "Separating stems via Demucs (5/5 chunks)...")
+
+
+def test_demucs_stops_between_chunks_when_cancelled(separator):
+    sep, path = separator
+    token = CancellationToken()
+    events = []
+
+    def progress(stage, msg, pct):
+        events.append(pct)
+        if pct >= 40:
+            token.cancel("client disconnected")
+
+    with pytest.raises(JobCancelled):
+        sep.separate_audio_file(path, overlap=0.0, progress_cb=progress, cancel_token=token)
+    assert events == [20, 40]
+
+
+def test_demucs_progress_does_not_need_apply_model_callback(separator, monkeypatch):
+    import demucs.apply
+
+    real_apply_model = demucs.apply.apply_model
+
+    calls = []
+
+    # demucs 4.0.1 (the pinned version) has no `callback` parameter; newer
+    # versions pass their own to the recursive calls
+    def apply_model(model, mix, **kwargs):
+        if not calls and "callback" in kwargs:
+            raise TypeError("apply_model() got an unexpected keyword argument 'callback'")
+        calls.append(model)
+        return real_apply_model(model, mix, **kwargs)
+
+    monkeypatch.setattr(demucs.apply, "apply_model", apply_model)
+    sep, path = separator
+    events = []
+    sep.separate_audio_file(path, overlap=0.0, progress_cb=lambda *e: events.append(e), cancel_token=CancellationToken())
+    assert [pct for _, _, pct in events] == [20, 40, 60, 80, 100]
+    assert not sep.model._forward_hooks and not sep.model._forward_pre_hooks
+
+
+def test_job_cancelled_passes_through_the_separation_fallback(separator, monkeypatch):
+    import analysis
+
+    sep, path = separator
+    monkeypatch.setattr(analysis, "_get_separator", lambda: sep)
+    monkeypatch.setattr(analysis, "get_stem_cache", lambda: None)
+    token = CancellationToken()
+    token.cancel("client disconnected")
+
+    # separate_audio_full turns failures into None (raw-mix fallback) but not a cancellation
+    with pytest.raises(JobCancelled):
+        analysis.separate_audio_full(path, cancel_token=token)
+    assert analysis.separate_audio_full(path) is not None
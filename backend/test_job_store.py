@@ -0,0 +1,104 @@
+"""
+backend/test_job_store.py
+
+Unit tests for the SQLite job store and the /api/jobs endpoints.
+"""
+from __future__ import annotations
+
+import json
+import threading
+import time
+
+import numpy as np
+import soundfile as sf
+from fastapi.testclient import TestClient
+
+import main
+from job_store import JobStore
+
+
+def test_job_lifecycle_and_event_log(tmp_path):
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    job_id = store.create("precise", False, "song.mp3", cost=120.0)
+    assert store.get(job_id)["status"] == "queued"
+    assert store.get(job_id)["etaSeconds"] == 120.0
+
+    store.mark_running(job_id)
+    store.add_event(job_id, {"type": "progress", "stage": 1, "message": "Separating", "percent": 10})
+    store.add_event(job_id, {"type": "progress", "stage": 2, "message": "Features", "percent": 35})
+    job = store.get(job_id)
+    assert (job["status"], job["stage"], job["percent"]) == ("running", 2, 35)
+    assert job["etaSeconds"] is not None
+    assert [seq for seq, _ in store.events(job_id)] == [1, 2]
+    assert store.events(job_id, after=1)[0][1]["message"] == "Features"
+
+    store.finish(job_id, {"chords": [], "key": "C"})
+    assert store.get(job_id)["status"] == "done"
+    assert store.result(job_id) == {"chords": [], "key": "C"}
+
+
+def test_state_survives_reopen_and_interrupted_jobs_fail(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+    store = JobStore(path)
+    done = store.create("fast", False)
+    store.finish(done, {"chords": []})
+    running = store.create("precise", True)
+    store.mark_running(running)
+
+    reopened = JobStore(path)
+    assert reopened.recover_interrupted() == 1
+    assert reopened.get(done)["status"] == "done"
+    assert reopened.result(done) == {"chords": []}
+    assert reopened.get(running)["status"] == "failed"
+
+
+def test_expire_drops_old_finished_jobs(tmp_path):
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    old = store.create("fast", False)
+    store.add_event(old, {"type": "progress", "stage": 1, "message": "", "percent": 50})
+    store.finish(old, {})
+    pending = store.create("fast", False)
+    assert store.expire(ttl_seconds=-1) == 1
+    assert store.get(old) is None and store.events(old) == []
+    assert store.get(pending)["status"] == "queued"
+
+
+def test_jobs_api_submit_poll_stream_result(tmp_path, monkeypatch):
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    monkeypatch.setattr(main, "job_store", store)
+    monkeypatch.setattr(main, "result_cache", None)
+    release = threading.Event()
+
+    def fake_analysis(path, mode, separate_vocals, progress_cb=None):
+        progress_cb(1, "Separating guitar & piano stems via Demucs...", 10)
+        release.wait(5)
+        progress_cb(5, "Refining...", 88)
+        return {"tempo": 100, "key": "G", "chords": [{"start": 0.0, "end": 2.0, "chord": "G"}]}
+
+    monkeypatch.setattr(main, "_run_analysis", fake_analysis)
+    audio = tmp_path / "song.wav"
+    sf.write(audio, np.zeros(8000, dtype=np.float32), 8000)
+
+    client = TestClient(main.app)
+    with open(audio, "rb") as f:
+        resp = client.post("/api/jobs", files={"file": ("song.wav", f)}, data={"mode": "precise"})
+    assert resp.status_code == 202
+    job_id = resp.json()["id"]
+
+    deadline = time.time() + 5
+    while client.get(f"/api/jobs/{job_id}").json()["stage"] != 1 and time.time() < deadline:
+        time.sleep(0.01)
+    assert client.get(f"/api/jobs/{job_id}").json()["status"] == "running"
+    assert client.get(f"/api/jobs/{job_id}/result").status_code == 202
+
+    release.set()
+    lines = [json.loads(line) for line in client.get(f"/api/jobs/{job_id}/events").text.splitlines()]
+    assert [line["type"] for line in lines] == ["progress", "progress", "metadata", "chords"]
+    assert [line["seq"] for line in lines[:2]] == [1, 2]
+    assert lines[2]["key"] == "G"
+
+    resumed = client.get(f"/api/jobs/{job_id}/events", params={"after": 1}).text.splitlines()
+    assert json.loads(resumed[0])["seq"] == 2
+
+    assert client.get(f"/api/jobs/{job_id}/result").json()["key"] == "G"
+    assert client.get("/api/jobs/unknown").status_code == 404
@@ -0,0 +1,98 @@
+"""
+backend/test_model_manager.py
+
+Unit tests for the shared, thread-safe model manager.
+"""
+from __future__ import annotations
+
+import threading
+import time
+
+import numpy as np
+import soundfile as sf
+import torch
+
+import analysis
+import chord_precise
+from model_manager import ModelManager
+
+
+def test_concurrent_first_use_loads_once():
+    manager = ModelManager()
+    loads = []
+
+    def loader():
+        loads.append(1)
+        time.sleep(0.05)
+        return torch.nn.Linear(4, 4)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(manager.get("m", loader))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(loads) == 1
+    assert all(r is results[0] for r in results)
+    stats = manager.stats()["loaded"]["m"]
+    assert stats["hits"] == 7
+    assert stats["paramBytes"] == (16 + 4) * 4
+    assert stats["loadSeconds"] >= 0.05
+
+
+def test_failed_load_is_retried():
+    manager = ModelManager()
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("download failed")
+        return object()
+
+    try:
+        manager.get("m", flaky)
+    except RuntimeError:
+        pass
+    assert not manager.is_loaded("m")
+    assert manager.get("m", flaky) is not None
+    assert len(calls) == 2
+
+
+class _FakeSeparator:
+    samplerate = 8000
+    sources = ["vocals", "drums", "bass", "guitar", "piano", "other"]
+
+    def __init__(self):
+        self.calls = 0
+
+    def separate_audio_file(self, path, overlap=0.1):
+        self.calls += 1
+        return {name: torch.full((2, self.samplerate), 0.01) for name in self.sources}
+
+
+def test_precise_mode_uses_the_shared_six_stem_separator(tmp_path, monkeypatch):
+    audio = tmp_path / "song.wav"
+    sf.write(audio, np.zeros(8000, dtype=np.float32), 8000)
+
+    fake = _FakeSeparator()
+    manager = ModelManager()
+    monkeypatch.setattr(analysis, "get_model_manager", lambda: manager)
+    monkeypatch.setattr(analysis, "get_stem_cache", lambda: None)
+    monkeypatch.setattr(analysis, "DemucsSeparator", lambda name: fake)
+    monkeypatch.setattr(chord_precise, "load_or_separate_stems", analysis.load_or_separate_stems)
+
+    for _ in range(2):
+        harmonic = chord_precise._precise_separate_stems(audio)
+        assert harmonic.size > 0
+
+    assert fake.calls == 2
+    assert manager.stats()["loaded"]["htdemucs_6s"]["hits"] == 1
+    assert analysis._get_separator_6stem() is fake
+
+
+def test_main_reports_the_manager_analysis_loads_into():
+    import main
+
+    assert main.get_model_manager() is analysis.get_model_manager()
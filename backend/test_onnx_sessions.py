@@ -0,0 +1,72 @@
+"""
+backend/test_onnx_sessions.py
+
+Unit tests for the pooled ONNX Runtime sessions.
+"""
+from __future__ import annotations
+
+import threading
+
+import numpy as np
+import pytest
+
+ort = pytest.importorskip("onnxruntime")
+
+from onnxruntime import datasets  # noqa: E402
+
+from onnx_sessions import OnnxSessionPool  # noqa: E402
+
+MODEL = datasets.get_example("sigmoid.onnx")
+
+
+def _sigmoid_input(value: float = 0.0) -> dict:
+    return {"x": np.full((3, 4, 5), value, dtype=np.float32)}
+
+
+@pytest.mark.parametrize("model_format", ["ort", "onnx"])
+def test_pool_matches_a_plain_session(tmp_path, model_format):
+    pool = OnnxSessionPool(MODEL, size=2, cache_dir=tmp_path, model_format=model_format).start()
+    feeds = {"x": np.random.default_rng(0).standard_normal((3, 4, 5)).astype(np.float32)}
+    expected = ort.InferenceSession(MODEL, providers=["CPUExecutionProvider"]).run(None, feeds)[0]
+
+    np.testing.assert_allclose(pool.run(None, feeds)[0], expected, rtol=1e-6)
+    assert pool.optimized_path.suffix == f".{model_format}" and pool.optimized_path.exists()
+    assert [i.name for i in pool.get_inputs()] == ["x"]
+
+    stats = pool.stats()
+    assert stats["sessions"] == 2 and stats["idle"] == 2
+    assert stats["firstInferenceMs"] is not None and stats["steadyStateMs"] is not None
+    assert stats["runs"] == 1 and stats["cached"] is False
+
+
+def test_optimized_model_is_reused_from_disk(tmp_path):
+    first = OnnxSessionPool(MODEL, size=1, cache_dir=tmp_path).start()
+    second = OnnxSessionPool(MODEL, size=1, cache_dir=tmp_path).start()
+    assert second.optimized_path == first.optimized_path
+    assert second.cache_hit and second.optimize_seconds == 0.0
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_a_busy_session_does_not_block_the_others(tmp_path):
+    pool = OnnxSessionPool(MODEL, size=2, cache_dir=tmp_path).start()
+    busy = pool._idle.get()  # an in-flight request holds one session
+    assert np.allclose(pool.run(None, _sigmoid_input(2.0))[0], 1 / (1 + np.exp(-2.0)))
+    assert pool.stats()["waits"] == 0
+
+    other = pool._idle.get()  # now every session is busy: the next run waits
+    done = threading.Event()
+    threading.Thread(target=lambda: (pool.run(None, _sigmoid_input()), done.set())).start()
+    assert not done.wait(0.1)
+    pool._idle.put(busy)
+    assert done.wait(5)
+    pool._idle.put(other)
+    assert pool.stats()["waits"] == 1 and pool.stats()["idle"] == 2
+
+
+def test_main_preloads_the_pool_the_fast_engine_uses():
+    import sys
+
+    import chord_fast
+    import main
+
+    assert main._chord_custom() is sys.modules[chord_fast.detect_chords_custom.__module__]
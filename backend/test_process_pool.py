@@ -0,0 +1,145 @@
+"""
+backend/test_process_pool.py
+
+Unit tests for the fork-based analysis worker pool.
+"""
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from ml.analysis_context import AnalysisContext
+from process_pool import AnalysisProcessPool
+
+
+def _describe_source(source, mode, separate_vocals, progress_cb=None):
+    """Pool target: reports what the worker received."""
+    if progress_cb is not None:
+        for pct in (10, 50, 90):
+            progress_cb(1, f"step {pct}", pct)
+    if isinstance(source, AnalysisContext):
+        return {
+            "pid": os.getpid(),
+            "kind": "context",
+            "shape": source.audio.shape,
+            "sum": float(source.audio.sum()),
+            "name": source.file_path.name,
+            "mode": mode,
+        }
+    return {"pid": os.getpid(), "kind": "path", "path": str(source), "mode": mode}
+
+
+def _wait_for_cancel(source, mode, separate_vocals, progress_cb=None, cancel_token=None):
+    """Pool target: reports progress, then spins until its token is cancelled."""
+    import time
+
+    progress_cb(1, "started", 0)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        cancel_token.raise_if_cancelled()
+        time.sleep(0.01)
+    return {"cancelled": False}
+
+
+def _die(source, mode, separate_vocals, progress_cb=None):
+    """Pool target: the worker process dies mid-job."""
+    progress_cb(1, "started", 0)
+    os._exit(1)
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = AnalysisProcessPool(processes=2, torch_threads=1)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.fixture
+def stereo_wav(tmp_path) -> Path:
+    t = np.arange(22050) / 22050
+    y = np.stack([np.sin(2 * np.pi * 220 * t), 0.5 * np.sin(2 * np.pi * 330 * t)], axis=1) * 0.3
+    path = tmp_path / "song.wav"
+    sf.write(path, y.astype(np.float32), 22050)
+    return path
+
+
+def test_decoded_audio_is_shared_with_the_worker(pool, stereo_wav):
+    out = pool.run(_describe_source, stereo_wav, "balanced", False)
+    expected = AnalysisContext(stereo_wav, keep_channels=True).audio
+
+    assert out["pid"] != os.getpid()
+    assert out["kind"] == "context" and out["name"] == "song.wav"
+    assert out["shape"] == expected.shape
+    assert out["sum"] == pytest.approx(float(expected.sum()), rel=1e-5)
+    assert pool.stats()["sharedAudioBytesTotal"] >= expected.astype(np.float32).nbytes
+
+    mono = pool.run(_describe_source, stereo_wav, "fast", False)
+    assert mono["shape"] == (expected.shape[1],)
+
+
+def test_file_jobs_get_the_path(pool, stereo_wav):
+    out = pool.run(_describe_source, stereo_wav, "precise", False)
+    assert out == {"pid": out["pid"], "kind": "path", "path": str(stereo_wav), "mode": "precise"}
+    vocal = pool.run(_describe_source, stereo_wav, "balanced", True, shared_audio=False)
+    assert vocal["kind"] == "path"
+
+
+def test_progress_events_arrive_before_run_returns(pool, stereo_wav):
+    events = []
+    pool.run(_describe_source, stereo_wav, "precise", False, progress_cb=lambda *e: events.append(e))
+    assert events == [(1, "step 10", 10), (1, "step 50", 50), (1, "step 90", 90)]
+
+
+def test_shared_blocks_are_released(pool, stereo_wav, monkeypatch):
+    import process_pool
+
+    created = []
+    real_decode = process_pool._decode_shared
+
+    def tracking_decode(path, mode):
+        shm, source = real_decode(path, mode)
+        created.append(shm.name)
+        return shm, source
+
+    monkeypatch.setattr(process_pool, "_decode_shared", tracking_decode)
+    pool.run(_describe_source, stereo_wav, "fast", False)
+    assert created
+    with pytest.raises(FileNotFoundError):
+        process_pool.shared_memory.SharedMemory(name=created[0])
+
+
+def test_cancel_token_reaches_the_worker(pool, stereo_wav):
+    import threading
+
+    from process_pool import CancellationToken
+    from scheduler import JobCancelled  # the class the backend modules raise
+
+    token = CancellationToken()
+    started = threading.Event()
+    with pytest.raises(JobCancelled):
+        threading.Timer(0.2, token.cancel).start()
+        pool.run(
+            _wait_for_cancel, stereo_wav, "precise", False,
+            progress_cb=lambda *e: started.set(), cancel_token=token,
+        )
+    assert started.is_set()
+    # The pool keeps serving jobs afterwards
+    assert pool.run(_describe_source, stereo_wav, "precise", False)["kind"] == "path"
+
+
+def test_a_dead_worker_fails_the_job_without_waiting_for_progress(stereo_wav):
+    import time
+    from concurrent.futures.process import BrokenProcessPool
+
+    broken = AnalysisProcessPool(processes=1, torch_threads=1)
+    try:
+        t0 = time.monotonic()
+        with pytest.raises(BrokenProcessPool):
+            broken.run(_die, stereo_wav, "precise", False, progress_cb=lambda *e: None)
+        assert time.monotonic() - t0 < 3.0
+    finally:
+        broken.shutdown()
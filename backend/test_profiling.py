@@ -0,0 +1,142 @@
+"""
+backend/test_profiling.py
+
+Unit tests for on-demand request profiling and the admin profile endpoints.
+"""
+from __future__ import annotations
+
+import json
+import pstats
+import threading
+import time
+
+import numpy as np
+import soundfile as sf
+
+from scheduler import JobScheduler
+
+# The profiling module the scheduler reads the current session from
+try:
+    from backend.profiling import Profiler, current_session
+except (ImportError, ModuleNotFoundError):
+    from profiling import Profiler, current_session
+
+
+def _hot_loop(seconds: float = 0.1) -> int:
+    n, end = 0, time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        n += 1
+    return n
+
+
+def _in_thread(fn) -> None:
+    t = threading.Thread(target=fn)
+    t.start()
+    t.join()
+
+
+def test_sampled_profile_writes_collapsed_stacks(tmp_path):
+    profiler = Profiler(admin_token="t", directory=tmp_path, interval=0.001)
+    with profiler.session("POST /api/analyze", "sample") as session:
+        def job():
+            with session.capture():
+                _hot_loop()
+        _in_thread(job)
+    stacks = (tmp_path / f"{session.id}.collapsed").read_text().splitlines()
+    assert stacks and all(line.rsplit(" ", 1)[1].isdigit() for line in stacks)
+    assert any("_hot_loop (test_profiling.py:" in line for line in stacks)
+    meta = json.loads((tmp_path / f"{session.id}.json").read_text())
+    assert meta["mode"] == "sample" and meta["jobs"] == 1 and meta["samples"] > 0
+    assert profiler.list()[0]["id"] == session.id
+
+
+def test_cprofile_profile_loads_with_pstats(tmp_path):
+    profiler = Profiler(admin_token="t", directory=tmp_path)
+    with profiler.session("POST /api/analyze", "cprofile") as session:
+        def job():
+            with session.capture():
+                _hot_loop(0.01)
+        _in_thread(job)
+    stats = pstats.Stats(str(tmp_path / f"{session.id}.pstats"))
+    assert any(func == "_hot_loop" for _, _, func in stats.stats)
+
+
+def test_requests_opt_in_by_admin_header_or_sample_rate():
+    profiler = Profiler(admin_token="secret", sample_rate=0.0)
+    assert profiler.choose_mode("cprofile", "secret") == "cprofile"
+    assert profiler.choose_mode("bogus", "secret") == "sample"
+    assert profiler.choose_mode("cprofile", "wrong") is None
+    assert profiler.choose_mode(None, None) is None
+
+    sampled = Profiler(admin_token="", sample_rate=1.0, default_mode="cprofile")
+    assert sampled.enabled
+    assert sampled.choose_mode("sample", "anything") == "cprofile"
+    assert not Profiler(admin_token="", sample_rate=0.0).enabled
+
+
+def test_profiles_are_pruned_and_paths_checked(tmp_path):
+    profiler = Profiler(admin_token="t", directory=tmp_path, max_files=2)
+    ids = []
+    for _ in range(3):
+        with profiler.session("POST /api/jobs", "cprofile") as session, session.capture():
+            pass
+        ids.append(session.id)
+        time.sleep(0.01)
+    assert {m["id"] for m in profiler.list()} == set(ids[1:])
+    assert profiler.path(f"{ids[-1]}.pstats") is not None
+    assert profiler.path(f"{ids[0]}.pstats") is None
+    assert profiler.path("../etc/passwd") is None
+
+
+def test_jobs_queued_by_a_profiled_request_are_captured(tmp_path):
+    profiler = Profiler(admin_token="t", directory=tmp_path)
+    sched = JobScheduler(heavy_workers=1, light_workers=1)
+    gate = threading.Event()
+    sched.submit(gate.wait, cost=0.0, heavy=False)
+    with profiler.session("POST /api/jobs", "cprofile") as session:
+        future = sched.submit(lambda: current_session() is session and _hot_loop(0.01) > 0, cost=1.0, heavy=False)
+    # The request is over (202) before its job starts: the job writes the profile
+    assert not (tmp_path / f"{session.id}.pstats").exists()
+    gate.set()
+    assert future.result(timeout=5) is True
+    sched.shutdown()
+    assert (tmp_path / f"{session.id}.pstats").exists()
+    assert current_session() is None
+
+
+def test_admin_endpoints_profile_a_request(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    monkeypatch.setattr(main.profiler, "admin_token", "secret")
+    monkeypatch.setattr(main.profiler, "directory", tmp_path)
+    client = TestClient(main.app)
+
+    sr = 22050
+    audio = np.random.default_rng().normal(0, 0.1, 3 * sr).astype(np.float32)  # unique → no cache hit
+    path = tmp_path / "noise.wav"
+    sf.write(path, audio, sr)
+    with open(path, "rb") as f:
+        response = client.post(
+            "/api/analyze", files={"file": ("noise.wav", f, "audio/wav")}, data={"mode": "balanced"},
+            headers={"X-Profile": "cprofile", "X-Admin-Token": "secret"},
+        )
+    assert response.status_code == 200
+    profile_id = response.headers["x-profile-id"]
+
+    assert client.get("/api/admin/profiles").status_code == 403
+    listed = client.get("/api/admin/profiles", headers={"X-Admin-Token": "secret"}).json()["profiles"]
+    assert listed[0]["id"] == profile_id and listed[0]["label"] == "POST /api/analyze"
+    download = client.get(f"/api/admin/profiles/{profile_id}.pstats", headers={"X-Admin-Token": "secret"})
+    assert download.status_code == 200
+    stats_path = tmp_path / "downloaded.pstats"
+    stats_path.write_bytes(download.content)
+    assert any(func == "analyze_file" for _, _, func in pstats.Stats(str(stats_path)).stats)
+
+    with open(path, "rb") as f:
+        unprofiled = client.post("/api/analyze", files={"file": ("noise.wav", f, "audio/wav")}, data={"mode": "balanced"})
+    assert "x-profile-id" not in unprofiled.headers
+
+    monkeypatch.setattr(main.profiler, "admin_token", "")
+    assert client.get("/api/admin/profiles", headers={"X-Admin-Token": ""}).status_code == 404
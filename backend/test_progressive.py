@@ -0,0 +1,126 @@
+"""
+backend/test_progressive.py
+
+Unit tests for progressive (block-by-block) stream analysis.
+"""
+from __future__ import annotations
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+import progressive
+from analysis import analyze_file
+from ml.chord_vocab import LABEL_TO_IDX, NUM_CLASSES
+from progressive import ProgressiveAnalyzer, SegmentStream, iter_audio_blocks
+
+CHORDS = [(261.63, 329.63, 392.00), (220.00, 261.63, 329.63), (174.61, 220.00, 261.63), (196.00, 246.94, 293.66)]
+
+
+@pytest.fixture(scope="module")
+def progression(tmp_path_factory):
+    """16 s of C–Am–F–G (2 s each), stereo at 44.1 kHz."""
+    sr = 44100
+    t = np.arange(2 * sr) / sr
+    mono = np.concatenate([
+        sum(np.sin(2 * np.pi * f * t) for f in CHORDS[i % 4]) for i in range(8)
+    ]) * 0.15
+    path = tmp_path_factory.mktemp("audio") / "progression.wav"
+    sf.write(path, np.stack([mono, 0.8 * mono], axis=1).astype(np.float32), sr)
+    return path
+
+
+def _segments(stream: SegmentStream, labels: list[int]) -> list[tuple[int, int, int]]:
+    out = []
+    for i, label in enumerate(labels):
+        out += stream.push(i, label, 1.0)
+    out += stream.flush()
+    return [(s.label, s.start, s.end) for s in out]
+
+
+def test_segment_stream_absorbs_short_runs():
+    labels = [1] * 5 + [2] * 2 + [1] * 5 + [3] * 6
+    assert _segments(SegmentStream(min_frames=3), labels) == [(1, 0, 12), (3, 12, 18)]
+
+
+def test_segment_stream_holds_only_the_last_long_segment():
+    stream = SegmentStream(min_frames=2)
+    emitted = []
+    for i, label in enumerate([1] * 4 + [2] * 4 + [3]):
+        emitted += stream.push(i, label, 1.0)
+    # Segment 1 is final once segment 2 closed; 2 may still absorb the short 3
+    assert [(s.label, s.start, s.end) for s in emitted] == [(1, 0, 4)]
+
+
+def test_blocks_concatenate_to_a_whole_file_decode(progression):
+    import librosa
+
+    blocks = list(iter_audio_blocks(progression, block_sec=3.0, keep_channels=True))
+    assert len(blocks) > 4 and all(b.shape[0] == 2 for b in blocks)
+    whole, _ = librosa.load(str(progression), sr=progressive.SR, mono=False)
+    streamed = np.concatenate(blocks, axis=1)
+    assert abs(streamed.shape[1] - whole.shape[1]) <= 1
+    n = min(streamed.shape[1], whole.shape[1])
+    assert np.max(np.abs(streamed[:, :n] - whole[:, :n])) < 1e-3
+
+
+def test_balanced_stream_matches_the_one_shot_engine(progression):
+    events = []
+    result = ProgressiveAnalyzer(progression, "balanced", block_sec=3.0, provisional_sec=6.0).run(events.append)
+
+    kinds = [e["type"] for e in events]
+    first_chords = kinds.index("chords")
+    # Chords and provisional metadata arrive before the analysis ends
+    assert first_chords < len(kinds) - 2
+    assert any(e["type"] == "metadata" and e["provisional"] for e in events)
+    assert events[-1]["type"] == "metadata" and not events[-1]["provisional"]
+
+    # Streamed ranges advance through the track without gaps
+    chord_events = [e for e in events if e["type"] == "chords"]
+    for prev, nxt in zip(chord_events, chord_events[1:]):
+        assert nxt["start"] <= prev["end"] + 1e-6
+    assert chord_events[-1]["end"] == pytest.approx(result["chords"][-1]["end"], abs=1e-3)
+
+    offline = analyze_file(progression)
+    assert [c["chord"] for c in result["chords"]] == [c["chord"] for c in offline["chords"]]
+    assert (result["key"], result["scale"]) == (offline["key"], offline["scale"])
+
+
+def test_fast_stream_runs_the_crnn_with_look_ahead(progression, monkeypatch):
+    a_min = LABEL_TO_IDX["A:min"]
+
+    class FakeCrnn:
+        def __init__(self):
+            self.calls = []
+
+        def run(self, output_names, feeds):
+            x = feeds["log_cqt"]
+            self.calls.append(x.shape[-1])
+            logits = np.zeros((1, x.shape[-1], NUM_CLASSES), dtype=np.float32)
+            logits[..., a_min] = 10.0
+            return [logits]
+
+    fake = FakeCrnn()
+    monkeypatch.setattr(progressive, "_get_onnx_session", lambda: fake)
+    result = ProgressiveAnalyzer(progression, "fast", block_sec=4.0).run(lambda e: None)
+
+    assert len(fake.calls) > 1  # one inference per block, not one for the track
+    assert [c["chord"] for c in result["chords"]] == ["Amin"]
+    assert result["chords"][-1]["end"] == pytest.approx(16.0, abs=0.2)
+
+
+def test_cancelled_token_stops_the_stream_at_the_next_block(progression):
+    from progressive import CancellationToken
+    from scheduler import JobCancelled  # the class the backend modules raise
+
+    token = CancellationToken()
+    events = []
+
+    def emit(event):
+        events.append(event)
+        token.cancel("client disconnected")
+
+    analyzer = ProgressiveAnalyzer(progression, "balanced", block_sec=2.0, cancel_token=token)
+    with pytest.raises(JobCancelled):
+        analyzer.run(emit)
+    assert len(events) == 1  # nothing after the block in which the client left
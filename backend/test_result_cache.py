@@ -0,0 +1,125 @@
+"""
+backend/test_result_cache.py
+
+Unit tests for the content-addressed server-side result cache.
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import tempfile
+from pathlib import Path
+
+from result_cache import ResultCache, copy_and_hash, hash_file, make_key
+
+RESULT = {
+    "tempo": 120.0, "meter": 4, "key": "C", "scale": "major",
+    "chords": [{"start": 0.0, "end": 2.0, "chord": "C", "confidence": 0.9}],
+    "simpleChords": [{"start": 0.0, "end": 2.0, "chord": "C", "confidence": 0.9}],
+}
+
+
+def test_copy_and_hash_matches_file_hash(tmp_path):
+    data = b"RIFF" + bytes(range(256)) * 5000
+    dst = tmp_path / "upload.bin"
+    with open(dst, "wb") as f:
+        digest = copy_and_hash(io.BytesIO(data), f)
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert hash_file(dst) == digest
+    assert dst.read_bytes() == data
+
+
+def test_key_depends_on_every_parameter():
+    base = make_key("abc", "fast", False, "1.0/fast")
+    assert base != make_key("abd", "fast", False, "1.0/fast")
+    assert base != make_key("abc", "balanced", False, "1.0/fast")
+    assert base != make_key("abc", "fast", True, "1.0/fast")
+    assert base != make_key("abc", "fast", False, "1.1/fast")
+
+
+def test_roundtrip_memory_then_disk(tmp_path):
+    cache = ResultCache(tmp_path, max_bytes=10_000_000, memory_entries=4)
+    assert cache.get("k1") is None
+
+    cache.put("k1", {**RESULT, "instrumentalPath": "/tmp/x.wav"})
+    result, instrumental = cache.get("k1")
+    assert result == RESULT
+    assert instrumental is None
+
+    # Returned results are private copies
+    result["chords"].clear()
+    assert cache.get("k1")[0] == RESULT
+
+    # A fresh instance (e.g. after a restart) serves the entry from disk
+    reloaded = ResultCache(tmp_path, max_bytes=10_000_000, memory_entries=4)
+    assert reloaded.get("k1")[0] == RESULT
+    stats = reloaded.stats()
+    assert stats["hits"] == 1 and stats["memoryHits"] == 0 and stats["entries"] == 1
+
+
+def test_instrumental_is_stored_alongside_result(tmp_path):
+    wav = tmp_path / "instr.wav"
+    wav.write_bytes(b"\x00" * 1000)
+    cache = ResultCache(tmp_path / "cache", max_bytes=10_000_000)
+    cache.put("k", RESULT, instrumental_path=wav)
+    _, instrumental = cache.get("k")
+    assert instrumental is not None and instrumental.read_bytes() == wav.read_bytes()
+
+
+def test_lru_eviction_respects_byte_budget(tmp_path):
+    wav = tmp_path / "instr.wav"
+    wav.write_bytes(b"\x00" * 4000)
+    cache = ResultCache(tmp_path / "cache", max_bytes=10_000, memory_entries=1)
+
+    cache.put("a", RESULT, instrumental_path=wav)
+    cache.put("b", RESULT, instrumental_path=wav)
+    cache.get("a")  # touch "a" so "b" becomes least recently used
+    cache.put("c", RESULT, instrumental_path=wav)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["bytes"] <= 10_000
+
+
+def test_failed_vocal_separation_is_not_cached(tmp_path, monkeypatch):
+    import main
+
+    cache = ResultCache(tmp_path / "cache", max_bytes=10_000_000)
+    monkeypatch.setattr(main, "result_cache", cache)
+    monkeypatch.setattr(main, "FAST_ENGINE_AVAILABLE", True)
+    monkeypatch.setattr(main, "separate_audio_full", lambda *args, **kwargs: None)
+    monkeypatch.setattr(main, "analyze_file_fast", lambda *args, **kwargs: dict(RESULT))
+    monkeypatch.setattr(main, "analyze_file", lambda *args, **kwargs: dict(RESULT))
+
+    for mode in ("fast", "balanced"):
+        main._store_result(mode, main._run_engine(tmp_path / "song.wav", mode, separate_vocals=True))
+        assert cache.get(mode) is None
+
+    result = main._run_engine(tmp_path / "song.wav", "balanced", separate_vocals=False)
+    main._store_result("plain", result)
+    assert cache.get("plain")[0] == RESULT
+
+
+def test_instrumental_evicted_before_the_copy_is_a_miss(tmp_path, monkeypatch):
+    import main
+
+    wav = tmp_path / "instr.wav"
+    wav.write_bytes(b"\x00" * 1000)
+    cache = ResultCache(tmp_path / "cache", max_bytes=10_000_000)
+    cache.put("k", RESULT, instrumental_path=wav)
+    get = cache.get
+
+    def get_then_evict(key):
+        hit = get(key)
+        hit[1].unlink()  # another request's put() evicts the entry right now
+        return hit
+
+    monkeypatch.setattr(cache, "get", get_then_evict)
+    monkeypatch.setattr(main, "result_cache", cache)
+    temp_dir = Path(tempfile.gettempdir())
+    leftovers = set(temp_dir.glob("*_instrumental.wav"))
+    assert main._cached_result("k") is None
+    assert set(temp_dir.glob("*_instrumental.wav")) == leftovers
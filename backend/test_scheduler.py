@@ -0,0 +1,138 @@
+"""
+backend/test_scheduler.py
+
+Unit tests for the cost-aware job scheduler.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from scheduler import JobScheduler, estimate_cost, is_heavy
+
+
+def _blocked_scheduler(**kwargs) -> tuple[JobScheduler, threading.Event]:
+    """A scheduler whose single light worker is busy until the event is set."""
+    sched = JobScheduler(heavy_workers=1, light_workers=1, **kwargs)
+    gate = threading.Event()
+    sched.submit(gate.wait, cost=0.0, heavy=False)
+    return sched, gate
+
+
+def test_shortest_expected_job_runs_first():
+    sched, gate = _blocked_scheduler(aging_rate=0.0)
+    order = []
+    futures = [
+        sched.submit(order.append, name, cost=cost, heavy=False)
+        for name, cost in [("long", 300.0), ("short", 5.0), ("medium", 40.0)]
+    ]
+    gate.set()
+    for f in futures:
+        f.result(timeout=5)
+    assert order == ["short", "medium", "long"]
+    sched.shutdown()
+
+
+def test_aging_lets_a_waiting_long_job_overtake():
+    sched, gate = _blocked_scheduler(aging_rate=1000.0)
+    order = []
+    first = sched.submit(order.append, "long", cost=10.0, heavy=False)
+    time.sleep(0.05)  # 50 ms of waiting is worth 50 s of cost at this rate
+    second = sched.submit(order.append, "short", cost=1.0, heavy=False)
+    gate.set()
+    first.result(timeout=5)
+    second.result(timeout=5)
+    assert order == ["long", "short"]
+    sched.shutdown()
+
+
+def test_heavy_jobs_do_not_block_light_pool():
+    sched = JobScheduler(heavy_workers=1, light_workers=1)
+    started, gate = threading.Event(), threading.Event()
+    heavy = sched.submit(lambda: (started.set(), gate.wait()), cost=500.0, heavy=True)
+    assert started.wait(5)
+    assert sched.submit(lambda: "light", cost=1.0, heavy=False).result(timeout=5) == "light"
+    assert sched.stats()["heavy"]["running"] == 1
+    gate.set()
+    heavy.result(timeout=5)
+    sched.shutdown()
+
+
+def test_cancelled_queued_job_never_runs():
+    sched, gate = _blocked_scheduler()
+    ran = []
+    future = sched.submit(ran.append, 1, cost=1.0, heavy=False)
+    assert future.cancel()
+    gate.set()
+    sched.submit(lambda: None, cost=1.0, heavy=False).result(timeout=5)
+    assert ran == []
+    assert sched.stats()["light"]["cancelled"] == 1
+    sched.shutdown()
+
+
+def test_run_awaits_without_holding_the_loop_and_propagates_errors():
+    sched = JobScheduler(heavy_workers=1, light_workers=2)
+
+    def boom():
+        raise ValueError("bad audio")
+
+    async def main():
+        slow = sched.run(time.sleep, 0.1, cost=1.0, heavy=True)
+        fast = sched.run(lambda: 42, cost=1.0, heavy=False)
+        assert await fast == 42  # answered while the heavy job is still running
+        await slow
+        with pytest.raises(ValueError, match="bad audio"):
+            await sched.run(boom, cost=1.0, heavy=False)
+
+    asyncio.run(main())
+    assert sched.stats()["light"]["failed"] == 1
+    sched.shutdown()
+
+
+def test_cost_model():
+    assert estimate_cost(100.0, "fast") < estimate_cost(100.0, "balanced") < estimate_cost(100.0, "precise")
+    assert estimate_cost(100.0, "balanced", separate_vocals=True) > estimate_cost(100.0, "precise")
+    assert estimate_cost(None, "fast") == estimate_cost(180.0, "fast")
+    assert is_heavy("precise", False) and is_heavy("fast", True) and not is_heavy("balanced", False)
+
+
+def test_running_job_cancelled_by_its_token_frees_the_worker():
+    from scheduler import JobCancelled  # the class the backend modules raise
+
+    sched = JobScheduler(heavy_workers=1, light_workers=1)
+    started, stop = threading.Event(), threading.Event()
+
+    def long_job():
+        started.set()
+        stop.wait(5)
+        raise JobCancelled("client disconnected")
+
+    future = sched.submit(long_job, cost=100.0, heavy=True)
+    assert started.wait(5)
+    stop.set()
+    with pytest.raises(JobCancelled):
+        future.result(timeout=5)
+    assert sched.submit(lambda: "next", cost=1.0, heavy=True).result(timeout=5) == "next"
+    stats = sched.stats()["heavy"]
+    assert stats["cancelled"] == 1 and stats["failed"] == 0
+    sched.shutdown()
+
+
+def test_expected_wait_follows_the_queue_order():
+    sched, gate = _blocked_scheduler(aging_rate=0.0)
+    assert sched.expected_wait(10.0, heavy=True) == 0.0  # idle pool
+    while sched.stats()["light"]["running"] == 0:
+        time.sleep(0.01)
+    for cost in (100.0, 200.0):
+        sched.submit(gate.wait, cost=cost, heavy=False)
+    assert sched.queued(heavy=False) == 2
+    # The blocker has cost 0: a short job waits for nothing queued,
+    # a long one for everything shorter than itself
+    assert sched.expected_wait(50.0, heavy=False) == 0.0
+    assert sched.expected_wait(150.0, heavy=False) == pytest.approx(100.0)
+    assert sched.expected_wait(500.0, heavy=False) == pytest.approx(300.0)
+    gate.set()
+    sched.shutdown()
@@ -0,0 +1,69 @@
+"""
+backend/test_segments.py
+
+Unit tests for the struct-of-arrays segment engine (ml/segments.py).
+"""
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from ml.segments import SegmentArrays, coalesce_runs, merge_short_segments, segments_from_path
+
+
+def _segs(*rows):
+    return SegmentArrays.from_tuples(list(rows))
+
+
+def test_segments_from_path_run_length_encodes():
+    probs = np.full((6, 3), 0.1, dtype=np.float32)
+    probs[:3, 0] = [0.9, 0.8, 0.7]
+    probs[3:, 2] = 0.6
+    segs = segments_from_path(np.array([0, 0, 0, 2, 2, 2]), probs, 2.0, ["A", "B", "C"])
+    assert [(s, e, c) for s, e, c, _ in segs.to_tuples()] == [(0.0, 1.5, "A"), (1.5, 3.0, "C")]
+    np.testing.assert_allclose(segs.conf, [0.8, 0.6], rtol=1e-6)
+
+
+def test_coalesce_runs_weighted_and_max():
+    segs = _segs((0.0, 1.0, "C", 0.9), (1.0, 4.0, "C", 0.5), (4.0, 5.0, "G", 0.7))
+    weighted = coalesce_runs(segs).to_tuples()
+    assert weighted[0][:3] == (0.0, 4.0, "C")
+    assert weighted[0][3] == pytest.approx((0.9 * 1 + 0.5 * 3) / 4)
+    assert coalesce_runs(segs, conf_mode="max").to_tuples()[0][3] == pytest.approx(0.9)
+    assert len(weighted) == 2
+
+
+def test_short_segment_goes_to_more_confident_neighbor():
+    segs = _segs((0.0, 1.0, "C", 0.6), (1.0, 1.1, "D", 0.3), (1.1, 2.0, "G", 0.9))
+    out = merge_short_segments(segs, min_dur=0.3).to_tuples()
+    assert [(s, e, c) for s, e, c, _ in out] == [(0.0, 1.0, "C"), (1.0, 2.0, "G")]
+
+
+def test_flicker_run_collapses_in_one_pass():
+    # C, then an alternating D/E flicker of ten 50 ms segments, then C again
+    rows = [(0.0, 1.0, "C", 0.9)]
+    t = 1.0
+    for i in range(10):
+        rows.append((t, t + 0.05, "D" if i % 2 else "E", 0.2))
+        t += 0.05
+    rows.append((t, t + 1.0, "C", 0.8))
+    out = merge_short_segments(_segs(*rows), min_dur=0.3).to_tuples()
+    assert len(out) == 1
+    assert out[0][:3] == (0.0, pytest.approx(2.5), "C")
+
+
+def test_confident_short_segment_survives_when_confidence_aware():
+    segs = _segs((0.0, 1.0, "C", 0.9), (1.0, 1.2, "D", 0.95), (1.2, 2.0, "G", 0.9))
+    kept = merge_short_segments(segs, min_dur=0.3, hard_min_dur=0.12, conf_threshold=0.55)
+    assert [c for _, _, c, _ in kept.to_tuples()] == ["C", "D", "G"]
+    dropped = merge_short_segments(segs, min_dur=0.3)
+    assert [c for _, _, c, _ in dropped.to_tuples()] == ["C", "G"]
+
+
+def test_left_preference_keeps_source_of_label():
+    segs = _segs((0.0, 0.05, "D", 0.9), (0.05, 1.0, "C", 0.5), (1.0, 1.05, "E", 0.1), (1.05, 2.0, "G", 0.9))
+    out = merge_short_segments(segs, min_dur=0.3, prefer="left", absorb_conf="keep")
+    assert [c for _, _, c, _ in out.to_tuples()] == ["C", "G"]
+    assert out.start[0] == 0.0 and out.end[0] == 1.05
+    assert out.conf[0] == 0.5
+    assert out.src.tolist() == [1, 3]
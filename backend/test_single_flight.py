@@ -0,0 +1,106 @@
+"""
+backend/test_single_flight.py
+
+Unit tests for single-flight coalescing of identical requests.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def _counting_start(calls: list, gate: asyncio.Event):
+    async def start(flight):
+        calls.append(flight.key)
+        threading.Thread(target=flight.progress_cb, args=(1, "Separating", 10)).start()
+        await gate.wait()
+        return {"chords": [{"chord": "C"}]}
+    return start
+
+
+def test_identical_requests_share_one_computation():
+    registry = SingleFlight(enabled=True)
+    calls = []
+
+    async def main():
+        gate = asyncio.Event()
+        start = _counting_start(calls, gate)
+        async with registry.attach("k", start) as (first, leader):
+            await asyncio.sleep(0.05)  # the progress event has been published
+            async with registry.attach("k", start) as (second, follower_leads):
+                assert second is first and leader and not follower_leads
+                late = second.listen()
+                assert late.get_nowait()["message"] == "Separating"  # replayed
+                gate.set()
+                await first.task
+                a, b = first.result(), second.result()
+        return a, b
+
+    a, b = asyncio.run(main())
+    assert calls == ["k"]
+    assert a == b and a is not b  # every client gets its own copy
+    assert registry.stats()["joined"] == 1 and registry.stats()["inFlight"] == 0
+
+
+def test_only_the_last_client_leaving_cancels_the_work():
+    registry = SingleFlight(enabled=True)
+
+    async def main():
+        gate = asyncio.Event()
+        first, _ = registry.join("k", _counting_start([], gate))
+        second, _ = registry.join("k", _counting_start([], gate))
+        registry.leave(first)
+        await asyncio.sleep(0)
+        assert not first.cancel_token.cancelled and not first.task.done()
+        registry.leave(second)
+        with pytest.raises(asyncio.CancelledError):
+            await first.task
+        assert first.cancel_token.cancelled
+
+        # The next identical request starts a fresh computation
+        third, leader = registry.join("k", _counting_start([], asyncio.Event()))
+        assert leader and third is not first
+        registry.leave(third)
+
+    asyncio.run(main())
+    assert registry.stats()["abandoned"] == 2
+
+
+def test_finished_or_failed_flights_are_not_reused():
+    registry = SingleFlight(enabled=True)
+    calls = []
+
+    async def fail(flight):
+        calls.append(1)
+        raise ValueError("bad audio")
+
+    async def main():
+        for _ in range(2):
+            async with registry.attach("k", fail) as (flight, leader):
+                assert leader
+                await asyncio.wait({flight.task})
+                with pytest.raises(ValueError, match="bad audio"):
+                    flight.result()
+
+    asyncio.run(main())
+    assert len(calls) == 2
+
+
+def test_disabled_registry_gives_every_request_its_own_flight():
+    registry = SingleFlight(enabled=False)
+    calls = []
+
+    async def main():
+        gate = asyncio.Event()
+        gate.set()
+        async with registry.attach("k", _counting_start(calls, gate)) as (a, _):
+            async with registry.attach("k", _counting_start(calls, gate)) as (b, leader):
+                assert leader and a is not b
+                await asyncio.gather(a.task, b.task)
+
+    asyncio.run(main())
+    assert calls == ["k", "k"]
@@ -0,0 +1,92 @@
+"""
+backend/test_stem_cache.py
+
+Unit tests for the persistent Demucs stem cache and its use by analysis.py.
+"""
+from __future__ import annotations
+
+import numpy as np
+import soundfile as sf
+import torch
+
+import analysis
+from stem_cache import StemCache
+
+
+class _FakeSeparator:
+    """Stands in for DemucsSeparator; counts inference calls."""
+
+    samplerate = 8000
+    sources = ["vocals", "drums", "bass", "guitar", "piano", "other"]
+
+    def __init__(self):
+        self.calls = 0
+
+    def separate_audio_file(self, path, overlap=0.1):
+        self.calls += 1
+        n = self.samplerate
+        return {name: torch.full((2, n), 0.01 * (i + 1)) for i, name in enumerate(self.sources)}
+
+
+def test_put_then_load_roundtrip(tmp_path):
+    cache = StemCache(tmp_path, max_bytes=10_000_000)
+    stems = {"vocals": np.linspace(-1, 1, 100, dtype=np.float32), "other": np.zeros(100, np.float32)}
+    assert cache.load("abc", "htdemucs") is None
+
+    cache.put("abc", "htdemucs", stems, 44100)
+    loaded, sr = cache.load("abc", "htdemucs")
+    assert sr == 44100
+    np.testing.assert_array_equal(loaded["vocals"], stems["vocals"])
+    assert cache.load("abc", "htdemucs_6s") is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_separations_reuse_a_cached_six_stem_run(tmp_path, monkeypatch):
+    audio = tmp_path / "song.wav"
+    sf.write(audio, np.zeros(8000, dtype=np.float32), 8000)
+
+    fake = _FakeSeparator()
+    cache = StemCache(tmp_path / "stems", max_bytes=10_000_000)
+    monkeypatch.setattr(analysis, "get_stem_cache", lambda: cache)
+    monkeypatch.setattr(analysis, "_get_separator_6stem", lambda: fake)
+    monkeypatch.setattr(analysis, "_get_separator", lambda: fake)
+
+    six = analysis.separate_audio_stems(audio)
+    assert set(six) == set(_FakeSeparator.sources)
+    assert fake.calls == 1
+    assert cache.stats()["entries"] == 1
+
+    # /api/separate (4-stem) and the vocal filter can answer from the 6-stem run
+    full = analysis.separate_audio_full(audio)
+    assert set(full) == {"vocals", "instrumental"}
+    instrumental, _ = sf.read(full["instrumental"])
+    np.testing.assert_allclose(instrumental, 0.02 + 0.03 + 0.04 + 0.05 + 0.06, atol=1e-4)
+    assert fake.calls == 1
+
+
+def test_low_overlap_stems_never_serve_a_higher_overlap_request(tmp_path, monkeypatch):
+    audio = tmp_path / "song.wav"
+    sf.write(audio, np.zeros(8000, dtype=np.float32), 8000)
+
+    fake = _FakeSeparator()
+    cache = StemCache(tmp_path / "stems", max_bytes=10_000_000)
+    monkeypatch.setattr(analysis, "get_stem_cache", lambda: cache)
+    monkeypatch.setattr(analysis, "_get_separator_6stem", lambda: fake)
+
+    # Precise mode separates with overlap 0 …
+    analysis.load_or_separate_stems(audio, "htdemucs_6s", overlap=0.0)
+    assert fake.calls == 1
+    # … which a 6-stem /api/separate download (overlap 0.1) must not reuse
+    analysis.separate_audio_stems(audio)
+    assert fake.calls == 2
+    # The overlap-0.1 run replaced the entry and now serves both
+    analysis.separate_audio_stems(audio)
+    analysis.load_or_separate_stems(audio, "htdemucs_6s", overlap=0.0)
+    assert fake.calls == 2
+    assert cache.stats()["entries"] == 1
+
+
+def test_main_reports_the_cache_analysis_uses():
+    import main
+
+    assert main.stem_cache is analysis.get_stem_cache()
@@ -0,0 +1,67 @@
+"""
+backend/test_thread_budget.py
+
+Unit tests for the process-wide CPU thread budget.
+"""
+from __future__ import annotations
+
+
+import pytest
+import torch
+
+from scheduler import JobScheduler
+from thread_budget import ThreadBudget
+
+
+def test_allowances_share_the_budget_by_weight():
+    budget = ThreadBudget(total=8, heavy_weight=2.0, light_concurrency=3)
+    assert budget.allowance("light", heavy=0, light=0) == 8
+    assert budget.allowance("light", heavy=0, light=2) == 4
+    assert budget.allowance("heavy", heavy=1, light=2) == 4
+    assert budget.allowance("light", heavy=1, light=2) == 2
+    assert budget.allowance("light", heavy=1, light=20) == 1  # never below one thread
+    assert budget.onnx_threads() == 2
+
+
+def test_leases_resize_torch_threads_with_load():
+    original = torch.get_num_threads()
+    budget = ThreadBudget(total=8, heavy_weight=2.0)
+    try:
+        with budget.lease("heavy") as heavy:
+            assert heavy == 8 and torch.get_num_threads() == 8
+            with budget.lease("light") as light:
+                assert light == 2
+                # torch only runs heavy work: it follows the heavy allowance
+                assert torch.get_num_threads() == int(8 * 2 / 3)
+            assert torch.get_num_threads() == 8
+        stats = budget.stats()
+        assert stats["activeJobs"] == {"heavy": 0, "light": 0}
+        assert stats["leases"] == 2
+        assert 0.0 <= stats["cpuUtilization"]
+    finally:
+        torch.set_num_threads(original)
+
+
+def test_scheduler_jobs_run_under_a_lease():
+    budget = ThreadBudget(total=4)
+    sched = JobScheduler(heavy_workers=1, light_workers=1, budget=budget)
+    seen = sched.submit(lambda: budget.stats()["activeJobs"], cost=1.0, heavy=True).result(timeout=5)
+    assert seen == {"heavy": 1, "light": 0}
+    assert budget.stats()["activeJobs"] == {"heavy": 0, "light": 0}
+    sched.shutdown()
+
+
+def test_onnx_session_options_follow_the_budget(monkeypatch):
+    ort = pytest.importorskip("onnxruntime")
+    import thread_budget
+
+    monkeypatch.setattr(thread_budget, "_THREAD_BUDGET", ThreadBudget(total=6, light_concurrency=3))
+    opts = thread_budget.onnx_session_options()
+    assert isinstance(opts, ort.SessionOptions)
+    assert (opts.intra_op_num_threads, opts.inter_op_num_threads) == (2, 1)
+
+
+def test_main_tunes_the_budget_the_scheduler_leases_from():
+    import main
+
+    assert main.get_thread_budget() is main.scheduler._pools["heavy"].budget
@@ -0,0 +1,151 @@
+"""
+backend/test_tracing.py
+
+Unit tests for per-request tracing spans and their OTLP JSON export.
+"""
+from __future__ import annotations
+
+import json
+
+import pytest
+from ml import tracing
+from ml.instrumentation import analysis_mode, stage
+from ml.tracing import InMemoryExporter, JsonLinesExporter, span
+
+
+@pytest.fixture
+def spans():
+    exporter = InMemoryExporter()
+    previous = tracing.set_exporter(exporter)
+    yield exporter
+    tracing.set_exporter(previous)
+
+
+def test_spans_nest_and_record_errors(spans):
+    with span("outer", video_id="abc") as outer:
+        with span("inner"):
+            pass
+        with pytest.raises(RuntimeError), span("failing"):
+            raise RuntimeError("blocked")
+    inner, failing = spans.by_name("inner")[0], spans.by_name("failing")[0]
+    assert outer.parent_id is None
+    assert inner.trace_id == failing.trace_id == outer.trace_id
+    assert inner.parent_id == failing.parent_id == outer.span_id
+    assert outer.attributes == {"video_id": "abc"}
+    assert failing.status == tracing.STATUS_ERROR and failing.status_message == "blocked"
+    assert failing.attributes["exception.type"] == "RuntimeError"
+    assert inner.end_ns >= inner.start_ns
+
+
+def test_disabled_tracing_records_nothing():
+    previous = tracing.set_exporter(None)
+    try:
+        with span("ignored") as sp:
+            sp.set_attribute("k", 1)
+        assert sp is tracing.NOOP_SPAN
+        assert tracing.current_traceparent() is None
+    finally:
+        tracing.set_exporter(previous)
+
+
+def test_stages_are_spans_under_the_engine_run(spans):
+    with analysis_mode("t-trace"), stage("cqt"):
+        pass
+    run, cqt = spans.by_name("analysis.t-trace")[0], spans.by_name("stage.cqt")[0]
+    assert cqt.parent_id == run.span_id
+    assert cqt.attributes["mode"] == "t-trace"
+
+
+def test_json_lines_export_is_otlp_and_rotates(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    exporter = JsonLinesExporter(path, max_bytes=2000)
+    previous = tracing.set_exporter(exporter)
+    try:
+        with span("youtube.attempt", method="cobalt", attempt=2, ok=False, wait=0.5):
+            pass
+    finally:
+        tracing.set_exporter(previous)
+
+    request = json.loads(path.read_text().splitlines()[0])
+    resource = request["resourceSpans"][0]
+    assert resource["resource"]["attributes"][0] == {"key": "service.name", "value": {"stringValue": "guitariz"}}
+    exported = resource["scopeSpans"][0]["spans"][0]
+    assert exported["name"] == "youtube.attempt"
+    assert len(exported["traceId"]) == 32 and len(exported["spanId"]) == 16
+    assert "parentSpanId" not in exported
+    assert int(exported["endTimeUnixNano"]) >= int(exported["startTimeUnixNano"])
+    assert exported["attributes"] == [
+        {"key": "method", "value": {"stringValue": "cobalt"}},
+        {"key": "attempt", "value": {"intValue": "2"}},
+        {"key": "ok", "value": {"boolValue": False}},
+        {"key": "wait", "value": {"doubleValue": 0.5}},
+    ]
+
+    for _ in range(10):
+        exporter.export([tracing.Span("filler")])
+    assert path.with_name("spans.jsonl.1").exists()
+    assert path.stat().st_size <= 2000
+
+
+def test_traceparent_round_trip_and_worker_collection(spans):
+    assert tracing.parse_traceparent("garbage") is None
+    assert tracing.parse_traceparent("00-" + "0" * 32 + "-" + "1" * 16 + "-01") is None
+
+    with span("request") as request:
+        header = tracing.current_traceparent()
+    assert tracing.parse_traceparent(header) == (request.trace_id, request.span_id)
+
+    # What an analysis worker process does with the parent's traceparent
+    with tracing.collect(header) as collected, stage("decode"):
+        pass
+    assert [s.name for s in collected] == ["stage.decode"]
+    assert collected[0].trace_id == request.trace_id
+    assert collected[0].parent_id == request.span_id
+    assert not spans.by_name("stage.decode")  # left for the parent to export
+
+
+def test_scheduler_jobs_run_under_the_submitting_span(spans):
+    from scheduler import JobScheduler
+
+    sched = JobScheduler(heavy_workers=1, light_workers=1)
+    with span("request") as request:
+        sched.submit(lambda: tracing.current_span().set_attribute("ran", True), cost=1.0, heavy=True).result(5)
+    sched.shutdown()
+    job = spans.by_name("scheduler.job")[0]
+    assert job.parent_id == request.span_id
+    assert job.attributes["pool"] == "heavy"
+    assert job.attributes["ran"] is True
+    assert "queue_wait_seconds" in job.attributes
+
+
+def test_failed_separation_marks_its_span(spans, monkeypatch, tmp_path):
+    import analysis
+
+    def boom(*args, **kwargs):
+        raise RuntimeError("demucs unavailable")
+
+    monkeypatch.setattr(analysis, "load_or_separate_stems", boom)
+    assert analysis.separate_audio_full(tmp_path / "missing.wav") is None
+    failed = spans.by_name("demucs.separate_full")[0]
+    assert failed.status == tracing.STATUS_ERROR
+    assert failed.status_message == "demucs unavailable"
+
+
+def test_api_responses_carry_the_trace_id(spans):
+    from fastapi.testclient import TestClient
+
+    from main import app
+
+    client = TestClient(app)
+    parent_trace = "4bf92f3577b34da6a3ce929d0e0e4736"
+    response = client.get(
+        "/api/jobs/does-not-exist", headers={"traceparent": f"00-{parent_trace}-00f067aa0ba902b7-01"},
+    )
+    assert response.headers["x-trace-id"] == parent_trace
+    assert response.headers["traceparent"].startswith(f"00-{parent_trace}-")
+    root = spans.by_name("GET /api/jobs/does-not-exist")[0]
+    assert root.parent_id == "00f067aa0ba902b7"
+    assert root.kind == tracing.KIND_SERVER
+    assert root.attributes["http.status_code"] == response.status_code
+
+    assert "x-trace-id" not in client.get("/api/metrics").headers
@@ -9,7 +9,7 @@ import numpy as np
 import pytest
 
 from ml.chord_vocab import LABEL_TO_IDX, LABELS
-from ml.viterbi import smooth_chord_sequence
+from ml.viterbi import OnlineViterbi, _transition_logs, smooth_chord_sequence, viterbi_paths
 
 
 def test_viterbi_simple_progression():
@@ -97,3 +97,158 @@ def test_viterbi_transition_resistance():
     
     assert len(segments) == 1
     assert segments[0].chord == "C:maj"
+
+
+# ── Kernel equivalence ──────────────────────────────────────────────────────
+
+from ml import viterbi as viterbi_mod  # noqa: E402
+
+
+def _reference_path(frame_probs, self_prob_seq):
+    """The original per-frame O(n_classes) recursion + backtrace."""
+    n_frames, n_classes = frame_probs.shape
+    log_probs = np.log(frame_probs + 1e-12)
+    viterbi_matrix = np.zeros((n_frames, n_classes))
+    backpointer = np.zeros((n_frames, n_classes), dtype=int)
+    viterbi_matrix[0] = np.full(n_classes, np.log(1.0 / n_classes)) + log_probs[0]
+    for t in range(1, n_frames):
+        p = min(max(float(self_prob_seq[t - 1]), 1e-6), 1.0 - 1e-6)
+        q = (1.0 - p) / max(n_classes - 1, 1)
+        log_p, log_q = np.log(p), np.log(q + 1e-12)
+        prev = viterbi_matrix[t - 1]
+        best_idx = int(np.argmax(prev))
+        prev_copy = prev.copy()
+        prev_copy[best_idx] = -np.inf
+        second_idx = int(np.argmax(prev_copy))
+        other_val = np.full(n_classes, prev[best_idx] + log_q)
+        other_idx = np.full(n_classes, best_idx, dtype=int)
+        other_val[best_idx] = prev_copy[second_idx] + log_q
+        other_idx[best_idx] = second_idx
+        self_val = prev + log_p
+        stay_better = self_val >= other_val
+        viterbi_matrix[t] = np.where(stay_better, self_val, other_val) + log_probs[t]
+        backpointer[t] = np.where(stay_better, np.arange(n_classes), other_idx)
+    path = np.zeros(n_frames, dtype=int)
+    path[-1] = np.argmax(viterbi_matrix[-1])
+    for t in range(n_frames - 2, -1, -1):
+        path[t] = backpointer[t + 1, path[t + 1]]
+    return path
+
+
+def _reference_self_probs(frame_probs, p, floor=None, sensitivity=1.0):
+    """The original step 1: static or novelty-relaxed self-transition sequence."""
+    n_frames = len(frame_probs)
+    if floor is None or n_frames < 2:
+        return np.full(max(n_frames - 1, 0), p)
+    a, b = frame_probs[:-1], frame_probs[1:]
+    cos = np.clip(np.sum(a * b, axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1) + 1e-12), -1.0, 1.0)
+    novelty = 1.0 - cos
+    if novelty.size >= 3:
+        novelty = np.convolve(novelty, np.ones(3) / 3, mode="same")
+    strength = np.clip(novelty / (0.35 / sensitivity), 0.0, 1.0)
+    return p - (p - floor) * strength
+
+
+def _noisy_progression(n_frames, seed, n_classes=len(LABELS)):
+    """Blocky chord sequence with jitter and occasional single-frame flicker."""
+    rng = np.random.default_rng(seed)
+    probs = rng.random((n_frames, n_classes)).astype(np.float32) * 0.2
+    t = 0
+    while t < n_frames:
+        length = int(rng.integers(1, 25))
+        probs[t:t + length, rng.integers(n_classes)] += rng.uniform(0.3, 3.0)
+        t += length
+    return probs / probs.sum(axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("use_numba", [False, True])
+@pytest.mark.parametrize("adaptive", [False, True])
+def test_kernel_paths_match_reference(use_numba, adaptive):
+    if use_numba and viterbi_mod.numba is None:
+        pytest.skip("numba not installed")
+    probs_list = [_noisy_progression(n, seed) for seed, n in enumerate((1, 2, 300, 1000))]
+    log_probs, log_ps, log_qs, expected = [], [], [], []
+    for probs in probs_list:
+        lp, log_p, log_q = viterbi_mod._observation_and_transition_logs(
+            probs, 0.95, 0.72 if adaptive else None, 1.15
+        )
+        log_probs.append(lp)
+        log_ps.append(log_p)
+        log_qs.append(log_q)
+        seq = _reference_self_probs(probs, 0.95, 0.72 if adaptive else None, 1.15)
+        expected.append(_reference_path(probs, seq))
+
+    paths = viterbi_mod.viterbi_paths(log_probs, log_ps, log_qs, use_numba=use_numba)
+    for path, ref in zip(paths, expected):
+        np.testing.assert_array_equal(path, ref)
+
+
+@pytest.mark.parametrize("kwargs", [
+    {},
+    {"min_self_transition_prob": 0.72, "change_sensitivity": 1.15, "hard_min_duration_ms": 110.0},
+    {"min_self_transition_prob": 0.76, "tempo_bpm": 140.0},
+])
+def test_numba_numpy_and_batch_outputs_are_identical(monkeypatch, kwargs):
+    probs_list = [_noisy_progression(n, 10 + n) for n in (5, 400, 1500)]
+
+    monkeypatch.setattr(viterbi_mod, "VITERBI_USE_NUMBA", False)
+    numpy_out = [smooth_chord_sequence(p, 43.07, **kwargs) for p in probs_list]
+    batch_out = viterbi_mod.smooth_chord_sequence_batch(probs_list, 43.07, **kwargs)
+    assert batch_out == numpy_out
+
+    if viterbi_mod.numba is not None:
+        monkeypatch.setattr(viterbi_mod, "VITERBI_USE_NUMBA", True)
+        assert [smooth_chord_sequence(p, 43.07, **kwargs) for p in probs_list] == numpy_out
+
+
+def test_backpointers_are_compact():
+    assert viterbi_mod._backpointer_dtype(len(LABELS)) == np.uint8
+    assert viterbi_mod._backpointer_dtype(300) == np.uint16
+
+
+def test_online_viterbi_matches_offline_prefix_decoding():
+    """The fixed-lag decision for frame t-lag equals the offline path over frames 0..t."""
+    rng = np.random.default_rng(3)
+    n_frames, n_classes, lag = 30, 8, 3
+    probs = rng.dirichlet(np.ones(n_classes) * 0.3, size=n_frames)
+    p = 0.8
+    log_p, log_q = _transition_logs(np.full(n_frames - 1, p), n_classes)
+
+    online = OnlineViterbi(n_classes, self_transition_prob=p, lag=lag)
+    for t in range(n_frames):
+        state = online.push(probs[t])
+        lp = np.log(probs[: t + 1] + 1e-12)
+        (path,) = viterbi_paths([lp], [log_p[:t]], [log_q[:t]], use_numba=False)
+        assert state == path[max(t - lag, 0)]
+    assert online.frames == n_frames
+
+
+def test_online_viterbi_lag_suppresses_single_frame_flicker():
+    n_classes = len(LABELS)
+    c_maj, a_min = LABEL_TO_IDX["C:maj"], LABEL_TO_IDX["A:min"]
+    probs = np.full((12, n_classes), 0.01)
+    probs[:, c_maj] = 0.6
+    probs[5, c_maj], probs[5, a_min] = 0.01, 0.6   # one-frame glitch
+    probs /= probs.sum(axis=1, keepdims=True)
+
+    causal = OnlineViterbi(n_classes, self_transition_prob=0.3, lag=0)
+    lagged = OnlineViterbi(n_classes, self_transition_prob=0.3, lag=1)
+    causal_out = [causal.push(f) for f in probs]
+    lagged_out = [lagged.push(f) for f in probs]
+
+    assert a_min in causal_out
+    assert set(lagged_out) == {c_maj}
+
+
+def test_online_viterbi_tail_completes_the_offline_path():
+    rng = np.random.default_rng(4)
+    n_frames, n_classes, lag = 25, 6, 4
+    probs = rng.dirichlet(np.ones(n_classes) * 0.3, size=n_frames)
+    log_p, log_q = _transition_logs(np.full(n_frames - 1, 0.8), n_classes)
+    (offline,) = viterbi_paths([np.log(probs + 1e-12)], [log_p], [log_q], use_numba=False)
+
+    online = OnlineViterbi(n_classes, self_transition_prob=0.8, lag=lag)
+    decided = [online.push(f) for f in probs][lag:]
+    tail = online.tail()
+    assert len(tail) == lag + 1 and tail[0] == decided[-1]
+    assert np.array_equal(np.concatenate([decided, tail[1:]]), offline)
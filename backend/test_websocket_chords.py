@@ -0,0 +1,135 @@
+"""
+backend/test_websocket_chords.py
+
+Unit tests for live WebSocket chord detection.
+"""
+from __future__ import annotations
+
+import json
+import struct
+
+import numpy as np
+from fastapi import FastAPI, WebSocket
+from fastapi.testclient import TestClient
+
+import websocket_chords
+from websocket_chords import LiveChordSession, _pitch_class_profile
+
+SR = 44100
+
+
+def _chord_pcm(freqs, n=4096, amp=0.2) -> bytes:
+    t = np.arange(n) / SR
+    y = sum(np.sin(2 * np.pi * f * t) for f in freqs) * amp
+    return y.astype("<f4").tobytes()
+
+
+def _reference_pitch_classes(pcm: bytes) -> np.ndarray:
+    """The original struct.unpack + per-bin loop."""
+    n = len(pcm) // 4
+    samples = np.array(struct.unpack(f"<{n}f", pcm), dtype=np.float32)
+    fft_size = min(4096, n)
+    spectrum = np.abs(np.fft.rfft(samples[:fft_size] * np.hanning(fft_size)))
+    freqs = np.fft.rfftfreq(fft_size, 1.0 / SR)
+    pcs = np.zeros(12, dtype=np.float32)
+    for i in range(1, len(spectrum) - 1):
+        if 65.0 <= freqs[i] <= 2000.0 and spectrum[i] > spectrum[i - 1] and spectrum[i] > spectrum[i + 1]:
+            pcs[int(round(69 + 12 * np.log2(freqs[i] / 440.0))) % 12] += spectrum[i]
+    return pcs
+
+
+def test_pitch_class_profile_matches_reference():
+    pcm = _chord_pcm([220.0, 261.63, 329.63])  # A minor
+    frame = np.frombuffer(pcm, dtype="<f4")
+    np.testing.assert_allclose(_pitch_class_profile(frame, SR), _reference_pitch_classes(pcm), rtol=1e-4)
+
+
+def _progression(chords, chunks_per_chord=8, chunk=4096, amp=0.2) -> np.ndarray:
+    """A phase-continuous stream that switches chord every `chunks_per_chord` chunks."""
+    n = chunk * chunks_per_chord
+    t = np.arange(n * len(chords)) / SR
+    y = np.zeros_like(t)
+    for i, freqs in enumerate(chords):
+        sl = slice(i * n, (i + 1) * n)
+        y[sl] = sum(np.sin(2 * np.pi * f * t[sl]) for f in freqs) * amp
+    return y.astype("<f4")
+
+
+C_MAJOR = [261.63, 329.63, 392.0]
+A_MINOR = [220.0, 261.63, 329.63]
+
+
+def test_session_smooths_a_continuous_stream():
+    session = LiveChordSession(hop=2048, lag=2)
+    stream = _progression([C_MAJOR, A_MINOR])
+
+    labels = []
+    for i in range(0, len(stream), 4096):
+        session.write(stream[i:i + 4096].tobytes())
+        result = session.analyze_pending()
+        labels.append(result["chord"])
+        assert result["latencyMs"] == session.latency_ms
+
+    # One label change, decided `lag` hops after the audio changed
+    assert labels[:8] == ["C"] * 8
+    assert labels[-4:] == ["Am"] * 4
+    assert sum(a != b for a, b in zip(labels, labels[1:])) == 1
+    assert session.hops_analyzed == len(stream) // 2048 - 1
+    assert session.latency_ms == round((4096 / 2 + 2 * 2048) / SR * 1000, 1)
+
+
+def test_warm_up_reports_the_frame_the_label_was_decided_for():
+    session = LiveChordSession(hop=4096, lag=3)
+    stream = _progression([C_MAJOR, A_MINOR], chunks_per_chord=1)
+    session.write(stream[:4096].tobytes())
+    first = session.analyze_pending()
+    session.write(stream[4096:].tobytes())
+    second = session.analyze_pending()
+    # Still warming up: the label is decided for the first frame, so the
+    # pitch classes reported with it are the first frame's too
+    assert first["chord"] == "C"
+    assert second["pitchClasses"] == first["pitchClasses"]
+
+
+def test_session_buffers_partial_frames_and_stays_bounded():
+    session = LiveChordSession(hop=1024, max_pending_hops=4)
+    stream = _progression([C_MAJOR], chunks_per_chord=16)
+
+    session.write(stream[:1000].tobytes())
+    assert session.analyze_pending() is None  # less than one window so far
+
+    # A client far ahead of the analysis: only the newest hops are analyzed
+    session.write(stream[1000:].tobytes())
+    assert session.analyze_pending()["chord"] == "C"
+    assert session.hops_analyzed == 4
+    assert session.hops_skipped == (len(stream) - 4096) // 1024 + 1 - 4
+    assert session._ring.nbytes == (4096 + 4 * 1024) * 4
+
+
+def test_session_query_parameters_are_clamped():
+    session = LiveChordSession.from_query({"hop": "10", "lag": "1000"})
+    assert (session.hop, session.lag) == (256, 32)
+    session = LiveChordSession.from_query({"hop": "2048", "latencyMs": "200"})
+    assert session.lag == int((0.2 * SR - 4096 / 2) / 2048)
+    assert session.latency_ms <= 200
+    assert LiveChordSession.from_query({"latencyMs": "10"}).lag == 0
+    assert LiveChordSession.from_query({"hop": "abc"}).hop == websocket_chords.LIVE_HOP
+
+
+def test_endpoint_streams_smoothed_results():
+    app = FastAPI()
+
+    @app.websocket("/ws")
+    async def live(websocket: WebSocket):
+        await websocket_chords.websocket_chord_endpoint(websocket)
+
+    stream = _progression([C_MAJOR, A_MINOR])
+    with TestClient(app) as client, client.websocket_connect("/ws?hop=4096&lag=0") as ws:
+        ws.send_bytes(stream[:4096].tobytes())
+        first = json.loads(ws.receive_text())
+        assert first["chord"] == "C"
+        assert first["latencyMs"] == round(2048 / SR * 1000, 1)
+        for i in range(len(stream) - 4 * 4096, len(stream), 4096):
+            ws.send_bytes(stream[i:i + 4096].tobytes())
+            chord = json.loads(ws.receive_text())["chord"]
+        assert chord == "Am"
@@ -0,0 +1,59 @@
+"""
+backend/test_windowing.py
+
+Unit tests for overlapped windowed inference (ml/windowing.py).
+"""
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from ml.windowing import plan_windows, windowed_logits
+
+
+@pytest.mark.parametrize("n_frames", [1, 99, 100, 101, 250, 1000, 1037])
+def test_keep_ranges_tile_the_track(n_frames):
+    plan = plan_windows(n_frames, window=100, overlap=20)
+    kept = np.concatenate([np.arange(ks, ke) for _, _, ks, ke in plan])
+    assert np.array_equal(kept, np.arange(n_frames))
+    for start, end, ks, ke in plan:
+        assert 0 <= start <= ks < ke <= end <= n_frames
+        assert end - start == min(100, n_frames)
+
+
+def test_kept_frames_have_context_on_both_sides():
+    n_frames, window, overlap = 1037, 100, 20
+    for start, end, ks, ke in plan_windows(n_frames, window, overlap):
+        if start > 0:
+            assert ks - start >= overlap // 2
+        if end < n_frames:
+            assert end - ke >= overlap // 2
+
+
+def test_frame_local_model_matches_full_track():
+    rng = np.random.default_rng(0)
+    features = rng.standard_normal((16, 777)).astype(np.float32)
+    weights = rng.standard_normal((16, 5)).astype(np.float32)
+    calls = []
+
+    def run_batch(batch):
+        calls.append(batch.shape)
+        return np.einsum("bcft,fk->btk", batch, weights)
+
+    full = features.T @ weights
+    out = windowed_logits(run_batch, features, window=128, overlap=32, batch_size=3)
+    np.testing.assert_allclose(out, full, rtol=1e-5, atol=1e-5)
+    # Memory bound: never more than batch_size windows of `window` frames per call
+    assert all(b <= 3 and t == 128 for b, _, _, t in calls)
+    assert sum(b for b, _, _, _ in calls) == len(plan_windows(777, 128, 32))
+
+
+def test_short_tracks_run_in_one_window():
+    calls = []
+
+    def run_batch(batch):
+        calls.append(batch.shape)
+        return np.zeros((batch.shape[0], batch.shape[3], 2), dtype=np.float32)
+
+    out = windowed_logits(run_batch, np.zeros((8, 40), dtype=np.float32), window=128, overlap=32, batch_size=4)
+    assert out.shape == (40, 2) and calls == [(1, 1, 8, 40)]
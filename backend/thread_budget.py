@@ -0,0 +1,217 @@
+"""
+backend/thread_budget.py
+
+Process-wide CPU thread budget shared by torch, ONNX Runtime and BLAS.
+
+Each library used to size its own thread pool: torch was pinned to
+min(cpu_count, 4) at import, every ONNX session took one intra-op thread per
+core, and BLAS (via NumPy / SciPy) took its own default. With three chord
+jobs and a Demucs run in flight that is several times more runnable threads
+than cores, and tail latency suffers accordingly.
+
+The budget divides THREAD_BUDGET_TOTAL (default: the cores this process may
+run on) between the jobs currently running. The scheduler takes a lease for
+every job; on each start / finish the allowances are recomputed and applied:
+
+  - torch intra-op threads → the heavy (Demucs) job's allowance, since torch
+    only does heavy work here; the light share when no heavy job runs.
+  - BLAS threads (threadpoolctl, if installed) → the light-job allowance.
+  - ONNX Runtime sessions → `onnx_session_options()`: intra-op threads sized
+    for the configured number of concurrent light jobs, no spin-waiting.
+
+torch and BLAS limits are process-wide, so a lease's allowance is a fair
+share rather than a hard per-thread cap. Heavy jobs weigh
+THREAD_BUDGET_HEAVY_WEIGHT (default 2) light jobs.
+
+When an autotune profile exists for this host (autotune.py), its measured
+optima cap the shares — more threads than the fastest setting only adds
+contention — and its ONNX graph optimization level / execution mode are used
+for new sessions.
+
+`stats()` reports the current allowances and the process CPU utilization
+since the previous call, for /api/health.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+try:
+    from threadpoolctl import ThreadpoolController
+except ImportError:  # optional: BLAS keeps its own default
+    ThreadpoolController = None
+
+try:
+    from backend.autotune import load_profile
+except (ImportError, ModuleNotFoundError):
+    from autotune import load_profile
+
+
+def _available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        return os.cpu_count() or 1
+
+
+THREAD_BUDGET_TOTAL = int(os.environ.get("THREAD_BUDGET_TOTAL", "0")) or _available_cores()
+THREAD_BUDGET_HEAVY_WEIGHT = float(os.environ.get("THREAD_BUDGET_HEAVY_WEIGHT", "2.0"))
+THREAD_BUDGET_LIGHT_CONCURRENCY = int(os.environ.get("SCHEDULER_LIGHT_WORKERS", "3"))
+
+
+class ThreadBudget:
+    """Fair-share thread allowances for the jobs running in this process."""
+
+    def __init__(
+        self,
+        total: int = THREAD_BUDGET_TOTAL,
+        heavy_weight: float = THREAD_BUDGET_HEAVY_WEIGHT,
+        light_concurrency: int = THREAD_BUDGET_LIGHT_CONCURRENCY,
+        profile: dict | None = None,
+    ):
+        self.total = max(int(total), 1)
+        self.heavy_weight = heavy_weight
+        self.light_concurrency = max(int(light_concurrency), 1)
+        self.profile: dict | None = None
+        self._caps: dict[str, int] = {}
+        self.set_profile(profile)
+
+        self._lock = threading.Lock()
+        self._active = {"heavy": 0, "light": 0}
+        self._applied: dict[str, int | None] = {"torch": None, "blas": None}
+        self._blas = ThreadpoolController() if ThreadpoolController is not None else None
+
+        self.leases = 0
+        self._cpu_mark = (time.monotonic(), _process_cpu_seconds())
+
+    # ── Allowances ──────────────────────────────────────────────────────────
+
+    def allowance(self, kind: str, heavy: int | None = None, light: int | None = None) -> int:
+        """Threads for one `kind` job given the running job counts (default: current)."""
+        heavy = self._active["heavy"] if heavy is None else heavy
+        light = self._active["light"] if light is None else light
+        weight = self.heavy_weight if kind == "heavy" else 1.0
+        total_weight = heavy * self.heavy_weight + light
+        if total_weight <= 0:
+            return self.total
+        return max(1, int(self.total * weight / total_weight))
+
+    @contextmanager
+    def lease(self, kind: str) -> Iterator[int]:
+        """Count a running `kind` ("heavy" / "light") job; yields its allowance."""
+        with self._lock:
+            self._active[kind] += 1
+            self.leases += 1
+            allowance = self.allowance(kind)
+            self._apply_locked()
+        try:
+            yield allowance
+        finally:
+            with self._lock:
+                self._active[kind] -= 1
+                self._apply_locked()
+
+    def set_profile(self, profile: dict | None) -> None:
+        """Use an autotune profile's optima as caps (None clears them)."""
+        self.profile = profile
+        caps = {}
+        for name, stage, key in (("torch", "demucs", "threads"), ("blas", "templates", "threads"),
+                                 ("onnx", "onnx", "intra_op_num_threads")):
+            value = ((profile or {}).get(stage) or {}).get(key)
+            if value:
+                caps[name] = int(value)
+        self._caps = caps
+
+    def _cap(self, name: str, threads: int) -> int:
+        return max(1, min(threads, self._caps.get(name, threads)))
+
+    def apply(self) -> None:
+        """Apply the allowances for the current load (e.g. at worker start)."""
+        with self._lock:
+            self._apply_locked()
+
+    def _apply_locked(self) -> None:
+        light = self.allowance("light", light=max(self._active["light"], 1))
+        torch_threads = self._cap("torch", self.allowance("heavy") if self._active["heavy"] else light)
+        light = self._cap("blas", light)
+        if torch_threads != self._applied["torch"]:
+            try:
+                import torch
+                torch.set_num_threads(torch_threads)
+                self._applied["torch"] = torch_threads
+            except ImportError:
+                pass
+        if self._blas is not None and light != self._applied["blas"]:
+            self._blas.limit(limits=light, user_api="blas")
+            self._applied["blas"] = light
+
+    def onnx_threads(self) -> int:
+        """Intra-op threads for one ONNX session (one per concurrent light job)."""
+        return self._cap("onnx", max(1, self.total // self.light_concurrency))
+
+    # ── Reporting ───────────────────────────────────────────────────────────
+
+    def stats(self) -> dict:
+        now, cpu = time.monotonic(), _process_cpu_seconds()
+        with self._lock:
+            then, cpu_then = self._cpu_mark
+            self._cpu_mark = (now, cpu)
+            wall = now - then
+            return {
+                "totalThreads": self.total,
+                "activeJobs": dict(self._active),
+                "torchThreads": self._applied["torch"],
+                "blasThreads": self._applied["blas"],
+                "onnxThreads": self.onnx_threads(),
+                "leases": self.leases,
+                "autotuned": self.profile is not None,
+                # Share of the budget's cores busy in this process since the last call
+                "cpuUtilization": round((cpu - cpu_then) / (wall * self.total), 3) if wall > 0 else 0.0,
+            }
+
+
+def _process_cpu_seconds() -> float:
+    t = os.times()
+    return t.user + t.system
+
+
+_THREAD_BUDGET: ThreadBudget | None = None
+_THREAD_BUDGET_LOCK = threading.Lock()
+
+
+def get_thread_budget() -> ThreadBudget:
+    """The process-wide thread budget."""
+    global _THREAD_BUDGET
+    with _THREAD_BUDGET_LOCK:
+        if _THREAD_BUDGET is None:
+            _THREAD_BUDGET = ThreadBudget(profile=load_profile())
+        return _THREAD_BUDGET
+
+
+def configure_thread_budget(total: int, light_concurrency: int = 1) -> ThreadBudget:
+    """Replace the process-wide budget (pool workers own a slice of the machine)."""
+    global _THREAD_BUDGET
+    with _THREAD_BUDGET_LOCK:
+        _THREAD_BUDGET = ThreadBudget(total=total, light_concurrency=light_concurrency, profile=load_profile())
+        return _THREAD_BUDGET
+
+
+def onnx_session_options():
+    """ONNX Runtime SessionOptions sized by the thread budget."""
+    import onnxruntime as ort
+
+    budget = get_thread_budget()
+    tuned = (budget.profile or {}).get("onnx") or {}
+    opts = ort.SessionOptions()
+    opts.intra_op_num_threads = budget.onnx_threads()
+    opts.inter_op_num_threads = int(tuned.get("inter_op_num_threads", 1))
+    opts.execution_mode = getattr(ort.ExecutionMode, tuned.get("execution_mode", "ORT_SEQUENTIAL"))
+    opts.graph_optimization_level = getattr(
+        ort.GraphOptimizationLevel, tuned.get("graph_optimization_level", "ORT_ENABLE_ALL")
+    )
+    # Idle intra-op threads would otherwise spin and steal cores from other jobs
+    opts.add_session_config_entry("session.intra_op.allow_spinning", "0")
+    return opts
@@ -7,115 +7,244 @@ The client sends raw PCM audio chunks over the WebSocket, and the server
 responds with the detected chord label + confidence for each chunk.
 
 Uses the DSP template-matching approach (no ONNX model needed) for low latency.
+
+Each connection gets a LiveChordSession: incoming PCM goes into a bounded
+ring buffer that is analyzed in overlapping windows at a configurable hop,
+and labels are stabilized by a fixed-lag online Viterbi (ml.viterbi). The
+configured latency is reported back with every result.
+
+Detection never runs on the event loop: analysis is handed to a small,
+process-wide thread pool (LIVE_CHORD_WORKERS, default 2) so live sessions
+cannot stall HTTP traffic on the same worker. Each connection has at most one
+analysis in flight; if it falls behind, the oldest hops are skipped so a slow
+client gets fresh results instead of a growing backlog of stale audio.
 """
 from __future__ import annotations
 
+import asyncio
 import json
-import struct
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 import numpy as np
 from fastapi import WebSocket, WebSocketDisconnect
 
 from ml.chord_vocab import LABELS, LABEL_TO_IDX, build_templates
-from ml.features import SR, N_CHROMA
+from ml.instrumentation import REGISTRY
+from ml.viterbi import OnlineViterbi
+
+LIVE_CHORD_WORKERS = int(os.environ.get("LIVE_CHORD_WORKERS", "2"))
+
+_LIVE_EXECUTOR = ThreadPoolExecutor(max_workers=LIVE_CHORD_WORKERS, thread_name_prefix="live-chords")
+_TEMPLATES = build_templates()
+
+WS_FRAME_SECONDS = REGISTRY.histogram(
+    "guitariz_websocket_frame_seconds",
+    "Time from receiving live audio to sending the chord result for it.",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
 
 
-def _detect_chord_from_pcm(
-    pcm_data: bytes,
-    sample_rate: int = 44100,
-    templates: np.ndarray | None = None,
-) -> dict:
+@lru_cache(maxsize=16)
+def _spectral_tables(fft_size: int, sample_rate: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
     """
-    Detect a single chord from a raw PCM audio chunk.
+    Per (fft_size, sample_rate): Hann window, the interior FFT bins inside the
+    65–2000 Hz chord range, and each such bin's pitch class.
+    """
+    window = np.hanning(fft_size)
+    freqs = np.fft.rfftfreq(fft_size, 1.0 / sample_rate)
+    bins = np.arange(1, len(freqs) - 1)
+    bins = bins[(freqs[bins] >= 65.0) & (freqs[bins] <= 2000.0)]
+    midi = 69 + 12 * np.log2(freqs[bins] / 440.0)
+    pcs = np.round(midi).astype(np.int64) % 12
+    return window, bins, pcs
+
 
-    Args:
-        pcm_data: Raw PCM bytes (float32, mono)
-        sample_rate: Sample rate of the incoming audio
-        templates: Pre-computed chord templates (109, 12)
+def _pitch_class_profile(frame: np.ndarray, sample_rate: int) -> np.ndarray:
+    """Pitch class histogram (12,) from local spectral maxima of one Hann-windowed frame."""
+    window, bins, pcs = _spectral_tables(len(frame), sample_rate)
+    spectrum = np.abs(np.fft.rfft(frame * window))
+    mags = spectrum[bins]
+    is_peak = (mags > spectrum[bins - 1]) & (mags > spectrum[bins + 1])
+    return np.bincount(pcs[is_peak], weights=mags[is_peak], minlength=12).astype(np.float32)
 
-    Returns:
-        dict with 'chord', 'confidence', 'pitchClasses'
+
+def _display_label(label: str) -> str:
+    """Clean label: "C:maj" → "C", "A:min" → "Am"."""
+    if ":" not in label:
+        return label
+    root, qual = label.split(":", 1)
+    if qual == "maj":
+        return root
+    if qual == "min":
+        return f"{root}m"
+    return f"{root}{qual}"
+
+
+# ── Streaming sessions ─────────────────────────────────────────────────────
+
+LIVE_WINDOW = int(os.environ.get("LIVE_CHORD_WINDOW", "4096"))      # samples per analysis frame
+LIVE_HOP = int(os.environ.get("LIVE_CHORD_HOP", "2048"))            # samples between frames
+LIVE_LAG = int(os.environ.get("LIVE_CHORD_LAG", "3"))               # smoothing delay, in hops
+LIVE_MAX_PENDING_HOPS = int(os.environ.get("LIVE_CHORD_MAX_PENDING_HOPS", "8"))
+
+
+class LiveChordSession:
     """
-    if templates is None:
-        templates = build_templates()
+    Per-connection streaming state for live chord detection.
 
-    # Decode PCM float32 samples
-    n_samples = len(pcm_data) // 4
-    if n_samples < 512:
-        return {"chord": "N.C.", "confidence": 0.0, "pitchClasses": [0] * 12}
+    Incoming PCM of any frame size is appended to a fixed-size ring buffer.
+    Every `hop` samples, the last `window` samples are analyzed (so frames
+    overlap and no audio is discarded); each analysis frame's pitch-class
+    profile is scored against the chord templates and fed to a fixed-lag
+    `OnlineViterbi`, which stabilizes labels at the cost of `lag` hops of
+    delay. If analysis falls behind by more than `max_pending_hops`, the
+    oldest hops are skipped, so memory stays at
+    window + max_pending_hops * hop samples regardless of client behaviour.
 
-    samples = np.array(struct.unpack(f"<{n_samples}f", pcm_data[:n_samples * 4]), dtype=np.float32)
+    `write()` is called from the event loop; `analyze_pending()` runs in the
+    live-chord executor. One analysis per session is in flight at a time.
+    """
 
-    # Quick RMS energy check
-    rms = np.sqrt(np.mean(samples ** 2))
-    if rms < 0.01:
-        return {"chord": "N.C.", "confidence": 0.0, "pitchClasses": [0] * 12}
+    def __init__(
+        self,
+        sample_rate: int = 44100,
+        window: int = LIVE_WINDOW,
+        hop: int = LIVE_HOP,
+        lag: int = LIVE_LAG,
+        max_pending_hops: int = LIVE_MAX_PENDING_HOPS,
+        self_transition_prob: float = 0.9,
+        temperature: float = 0.2,
+    ):
+        self.sample_rate = sample_rate
+        self.window = window
+        self.hop = hop
+        self.lag = lag
+        self.max_pending_hops = max(max_pending_hops, 1)
+        self.temperature = temperature
 
-    # Compute chroma using simple FFT-based approach for low latency
-    fft_size = min(4096, len(samples))
-    if fft_size < 512:
-        return {"chord": "N.C.", "confidence": 0.0, "pitchClasses": [0] * 12}
+        self._capacity = window + self.max_pending_hops * hop
+        self._ring = np.zeros(self._capacity, dtype=np.float32)
+        self._written = 0                 # total samples received
+        self._next_end = window           # absolute end sample of the next analysis frame
+        self._lock = threading.Lock()
 
-    # Apply Hann window
-    window = np.hanning(fft_size)
-    windowed = samples[:fft_size] * window
+        self._viterbi = OnlineViterbi(len(LABELS), self_transition_prob=self_transition_prob, lag=lag)
+        # (confidence score row, pitch classes) of the last lag+1 frames, to
+        # report the frame the smoothed label was decided for
+        self._recent: deque[tuple[np.ndarray | None, np.ndarray]] = deque(maxlen=lag + 1)
+        self.hops_analyzed = 0
+        self.hops_skipped = 0
 
-    # FFT
-    spectrum = np.abs(np.fft.rfft(windowed))
-    freqs = np.fft.rfftfreq(fft_size, 1.0 / sample_rate)
+    @classmethod
+    def from_query(cls, params) -> LiveChordSession:
+        """
+        Build a session from WebSocket query parameters:
+          sr, window, hop (samples), lag (hops) or latencyMs (target label delay,
+          as reported in `latency_ms`).
+        """
+        sample_rate = _int_param(params, "sr", 44100, 8000, 96000)
+        window = _int_param(params, "window", LIVE_WINDOW, 512, 16384)
+        hop = _int_param(params, "hop", LIVE_HOP, 256, window)
+        lag = _int_param(params, "lag", LIVE_LAG, 0, 32)
+        if "latencyMs" in params:
+            latency_ms = _int_param(params, "latencyMs", 0, 0, 5000)
+            # latency_ms counts half a window before the smoothing lag
+            smoothing = latency_ms / 1000.0 * sample_rate - window / 2
+            lag = min(max(int(smoothing / hop), 0), 32)
+        return cls(sample_rate=sample_rate, window=window, hop=hop, lag=lag)
+
+    @property
+    def latency_ms(self) -> float:
+        """Label delay behind the newest analyzed audio (half a window + smoothing lag)."""
+        return round((self.window / 2 + self.lag * self.hop) / self.sample_rate * 1000.0, 1)
+
+    def write(self, pcm_data: bytes) -> None:
+        samples = np.frombuffer(pcm_data, dtype="<f4", count=len(pcm_data) // 4)
+        if len(samples) > self._capacity:
+            skipped = len(samples) - self._capacity
+            samples = samples[-self._capacity:]
+        else:
+            skipped = 0
+        with self._lock:
+            self._written += skipped
+            start = self._written % self._capacity
+            first = min(len(samples), self._capacity - start)
+            self._ring[start:start + first] = samples[:first]
+            self._ring[:len(samples) - first] = samples[first:]
+            self._written += len(samples)
+
+    def _take_pending_frames(self) -> list[np.ndarray]:
+        with self._lock:
+            pending = (self._written - self._next_end) // self.hop + 1 if self._written >= self._next_end else 0
+            if pending > self.max_pending_hops:
+                skip = pending - self.max_pending_hops
+                self._next_end += skip * self.hop
+                self.hops_skipped += skip
+                pending = self.max_pending_hops
+            frames = []
+            for _ in range(pending):
+                idx = np.arange(self._next_end - self.window, self._next_end) % self._capacity
+                frames.append(self._ring[idx])
+                self._next_end += self.hop
+            return frames
+
+    def analyze_pending(self) -> dict | None:
+        """Analyze every complete hop received so far; returns the newest smoothed result."""
+        frames = self._take_pending_frames()
+        if not frames:
+            return None
+
+        nc_idx = LABEL_TO_IDX["N.C."]
+        state = nc_idx
+        for frame in frames:
+            pitch_classes = _pitch_class_profile(frame, self.sample_rate)
+            rms = float(np.sqrt(np.mean(frame ** 2)))
+            pc_sum = float(pitch_classes.sum())
+
+            sims = np.zeros(len(LABELS), dtype=np.float32)
+            if rms < 0.01 or pc_sum < 0.01:
+                scores = None
+                sims[nc_idx] = 1.0
+            else:
+                # Template scores, used for the reported confidence
+                scores = _TEMPLATES @ (pitch_classes / (pc_sum + 1e-8))
+                scores[nc_idx] = -1.0
+                # Cosine similarity drives the HMM observation probabilities
+                sims = scores * (pc_sum / (float(np.linalg.norm(pitch_classes)) + 1e-8))
+                sims[nc_idx] = -1.0
 
-    # Build pitch class histogram from spectral peaks
-    pitch_classes = np.zeros(12, dtype=np.float32)
-    min_freq, max_freq = 65.0, 2000.0
-
-    for i in range(1, len(spectrum) - 1):
-        freq = freqs[i]
-        mag = spectrum[i]
-        if freq < min_freq or freq > max_freq:
-            continue
-        if mag > spectrum[i - 1] and mag > spectrum[i + 1]:
-            # Peak detected — map to pitch class
-            if freq > 0:
-                midi = 69 + 12 * np.log2(freq / 440.0)
-                pc = int(round(midi)) % 12
-                pitch_classes[pc] += mag
-
-    # Normalize
-    pc_sum = pitch_classes.sum()
-    if pc_sum < 0.01:
-        return {"chord": "N.C.", "confidence": 0.0, "pitchClasses": pitch_classes.tolist()}
-
-    pc_norm = pitch_classes / (pc_sum + 1e-8)
-
-    # Template matching via cosine similarity
-    scores = templates @ pc_norm
-    nc_idx = LABEL_TO_IDX["N.C."]
-    scores[nc_idx] = -1.0  # Suppress N.C. for non-silent
-
-    best_idx = int(np.argmax(scores))
-    best_score = float(scores[best_idx])
-
-    # Map similarity [-1, 1] → confidence [0, 1]
-    confidence = float(np.clip((best_score + 1.0) / 2.0, 0, 1))
-
-    # Clean label: "C:maj" → "C", "A:min" → "Am"
-    label = LABELS[best_idx]
-    if ":" in label:
-        root, qual = label.split(":", 1)
-        if qual == "maj":
-            chord = root
-        elif qual == "min":
-            chord = f"{root}m"
+            e = np.exp((sims - sims.max()) / self.temperature)
+            state = self._viterbi.push(e / e.sum())
+            self._recent.append((scores, pitch_classes))
+            self.hops_analyzed += 1
+
+        # The smoothed label belongs to the oldest buffered frame: `lag` hops
+        # back, or the first frame while the smoother is still warming up
+        scores, pitch_classes = self._recent[0]
+        if state == nc_idx or scores is None:
+            confidence = 0.0
         else:
-            chord = f"{root}{qual}"
-    else:
-        chord = label
+            confidence = float(np.clip((float(scores[state]) + 1.0) / 2.0, 0, 1))
+
+        return {
+            "chord": _display_label(LABELS[state]),
+            "confidence": round(confidence, 3),
+            "pitchClasses": pitch_classes.tolist(),
+            "latencyMs": self.latency_ms,
+        }
 
-    return {
-        "chord": chord,
-        "confidence": round(confidence, 3),
-        "pitchClasses": pitch_classes.tolist(),
-    }
+
+def _int_param(params, name: str, default: int, lo: int, hi: int) -> int:
+    try:
+        value = int(float(params.get(name, default)))
+    except (TypeError, ValueError):
+        value = default
+    return min(max(value, lo), hi)
 
 
 async def websocket_chord_endpoint(websocket: WebSocket):
@@ -123,24 +252,68 @@ async def websocket_chord_endpoint(websocket: WebSocket):
     WebSocket handler for real-time chord detection.
 
     Protocol:
-      - Client sends binary PCM frames (float32, mono, 44100 Hz)
-      - Server responds with JSON: {"chord": "Am", "confidence": 0.85, "pitchClasses": [...]}
+      - Query parameters (all optional): sr, window, hop, lag | latencyMs
+        (see LiveChordSession.from_query)
+      - Client sends binary PCM frames (float32, mono, 44100 Hz) of any size
+      - Server responds with JSON:
+        {"chord": "Am", "confidence": 0.85, "pitchClasses": [...], "latencyMs": 116.1}
+        for the newest smoothed frame whenever analysis catches up with the
+        audio received so far.
     """
     await websocket.accept()
-    print("[WS] Client connected for live chord detection")
+    session = LiveChordSession.from_query(websocket.query_params)
+    print(
+        f"[WS] Client connected for live chord detection "
+        f"(hop={session.hop}, lag={session.lag}, latency≈{session.latency_ms}ms)"
+    )
 
-    templates = build_templates()
+    loop = asyncio.get_running_loop()
+    frame_ready = asyncio.Event()
+    closed = asyncio.Event()
+    pending_since: float | None = None  # arrival of the oldest unanswered audio
 
+    async def receive_frames() -> None:
+        nonlocal pending_since
+        try:
+            while True:
+                session.write(await websocket.receive_bytes())
+                if pending_since is None:
+                    pending_since = time.perf_counter()
+                frame_ready.set()
+        finally:
+            closed.set()
+            frame_ready.set()
+
+    receiver = asyncio.create_task(receive_frames())
     try:
         while True:
-            data = await websocket.receive_bytes()
-            result = _detect_chord_from_pcm(data, sample_rate=44100, templates=templates)
-            await websocket.send_text(json.dumps(result))
+            await frame_ready.wait()
+            frame_ready.clear()
+            if closed.is_set():
+                break
+            received_at, pending_since = pending_since, None
+            result = await loop.run_in_executor(_LIVE_EXECUTOR, session.analyze_pending)
+            if result is not None:
+                await websocket.send_text(json.dumps(result))
+                if received_at is not None:
+                    WS_FRAME_SECONDS.observe(time.perf_counter() - received_at)
     except WebSocketDisconnect:
-        print("[WS] Client disconnected")
+        pass
     except Exception as e:
         print(f"[WS] Error: {e}")
         try:
             await websocket.close()
         except Exception:
             pass
+    finally:
+        receiver.cancel()
+        try:
+            await receiver
+        except (asyncio.CancelledError, WebSocketDisconnect):
+            pass
+        except Exception as e:
+            print(f"[WS] Error: {e}")
+        print(
+            f"[WS] Client disconnected ({session.hops_analyzed} hops analyzed, "
+            f"{session.hops_skipped} stale hops skipped)"
+        )
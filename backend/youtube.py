@@ -2,6 +2,11 @@
 YouTube audio extraction utilities using yt-dlp.
 
 Handles downloading audio from YouTube URLs for chord analysis.
+
+Each download method extract_audio tries (yt-dlp, pytubefix, then every
+Invidious / Piped / Cobalt instance) runs in its own "youtube.attempt"
+tracing span (ml/tracing.py), so a slow request's trace shows where the
+time went.
 """
 
 import os
@@ -14,6 +19,8 @@ from collections import defaultdict
 import threading
 import subprocess
 
+from ml.tracing import STATUS_ERROR, STATUS_OK, current_span, span
+
 # Rate limiting: track requests per IP
 _rate_limit_lock = threading.Lock()
 _request_counts: Dict[str, list] = defaultdict(list)  # IP -> list of timestamps
@@ -132,6 +139,7 @@ def _setup_ydl_opts(base_opts: Dict[str, Any]) -> Dict[str, Any]:
     return opts
 
 
+@span("youtube.video_info")
 def get_video_info(url: str) -> Dict[str, Any]:
     """
     Get video metadata without downloading.
@@ -181,6 +189,7 @@ def get_video_info(url: str) -> Dict[str, Any]:
             raise RuntimeError(f"Failed to get video info step: {str(e)}")
 
 
+@span("youtube.extract_audio")
 def extract_audio(url: str, output_dir: Optional[Path] = None) -> Dict[str, Any]:
     """
     Download audio from YouTube URL.
@@ -200,6 +209,7 @@ def extract_audio(url: str, output_dir: Optional[Path] = None) -> Dict[str, Any]
     video_id = extract_video_id(url)
     if not video_id:
         raise ValueError("Invalid YouTube URL")
+    current_span().set_attribute("video_id", video_id)
 
     # Check duration limit (7 minutes)
     try:
@@ -226,6 +236,7 @@ def extract_audio(url: str, output_dir: Optional[Path] = None) -> Dict[str, Any]
     # Check if already downloaded (cache)
     if output_path.exists():
         # Get info without downloading again
+        current_span().set_attribute("cached", True)
         info = get_video_info(url)
         return {
             'audio_path': str(output_path),
@@ -274,69 +285,71 @@ def extract_audio(url: str, output_dir: Optional[Path] = None) -> Dict[str, Any]
         ydl_opts['ffmpeg_location'] = ffmpeg_path
     
     try:
-        # Try yt-dlp first
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
+        with span("youtube.attempt", method="yt-dlp"):
+            # Try yt-dlp first
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                ydl.download([url])
         
-        # Verify file exists
-        if not output_path.exists():
-            raise RuntimeError("yt-dlp failed to create file")
+            # Verify file exists
+            if not output_path.exists():
+                raise RuntimeError("yt-dlp failed to create file")
             
-        print(f"[YouTube] Audio extracted with yt-dlp: {output_path}")
+            print(f"[YouTube] Audio extracted with yt-dlp: {output_path}")
 
     except Exception as e_yt:
         print(f"[YouTube] yt-dlp failed: {e_yt}. Trying pytubefix fallback...")
         try:
-            from pytubefix import YouTube
+            with span("youtube.attempt", method="pytubefix"):
+                from pytubefix import YouTube
             
-            # Pass PO Token to pytubefix if available
-            po_token = os.environ.get("YOUTUBE_PO_TOKEN")
-            visitor_data = os.environ.get("YOUTUBE_VISITOR_DATA")
+                # Pass PO Token to pytubefix if available
+                po_token = os.environ.get("YOUTUBE_PO_TOKEN")
+                visitor_data = os.environ.get("YOUTUBE_VISITOR_DATA")
             
-            # Prepare kwargs
-            yt_kwargs = {}
-            # Attempt to init YouTube object
-            try:
-                if po_token and visitor_data:
-                    print("[YouTube] Passing PO Token to pytubefix...")
-                    yt_kwargs['use_po_token'] = True
-                    yt_kwargs['po_token'] = po_token
-                    yt_kwargs['visitor_data'] = visitor_data
-                    yt = YouTube(url, **yt_kwargs)
-                else:
-                    yt_kwargs['use_po_token'] = True # Try auto-generation
-                    yt = YouTube(url, **yt_kwargs)
-            except TypeError as te:
-                print(f"[YouTube] ⚠️ pytubefix init failed with args: {te}. Retrying with defaults...")
-                yt = YouTube(url, use_po_token=True)
+                # Prepare kwargs
+                yt_kwargs = {}
+                # Attempt to init YouTube object
+                try:
+                    if po_token and visitor_data:
+                        print("[YouTube] Passing PO Token to pytubefix...")
+                        yt_kwargs['use_po_token'] = True
+                        yt_kwargs['po_token'] = po_token
+                        yt_kwargs['visitor_data'] = visitor_data
+                        yt = YouTube(url, **yt_kwargs)
+                    else:
+                        yt_kwargs['use_po_token'] = True # Try auto-generation
+                        yt = YouTube(url, **yt_kwargs)
+                except TypeError as te:
+                    print(f"[YouTube] ⚠️ pytubefix init failed with args: {te}. Retrying with defaults...")
+                    yt = YouTube(url, use_po_token=True)
             
-            # If cookies are available, use them for pytubefix too?
-            # pytubefix doesn't easily accept a cookiefile path in constructor?
-            # It uses 'use_oauth' or 'po_token'.
-            # But we can try 'use_oauth=False, allow_oauth_cache=False' default.
+                # If cookies are available, use them for pytubefix too?
+                # pytubefix doesn't easily accept a cookiefile path in constructor?
+                # It uses 'use_oauth' or 'po_token'.
+                # But we can try 'use_oauth=False, allow_oauth_cache=False' default.
             
-            # Filter for audio only
-            stream = yt.streams.get_audio_only()
-            if not stream:
-                stream = yt.streams.get_highest_resolution()
+                # Filter for audio only
+                stream = yt.streams.get_audio_only()
+                if not stream:
+                    stream = yt.streams.get_highest_resolution()
                 
-            if not stream:
-                raise RuntimeError("No stream found via pytubefix")
+                if not stream:
+                    raise RuntimeError("No stream found via pytubefix")
 
-            # Pytubefix output handling
-            downloaded_path = stream.download(output_path=str(output_dir), filename=f"{video_id}.mp4") 
+                # Pytubefix output handling
+                downloaded_path = stream.download(output_path=str(output_dir), filename=f"{video_id}.mp4") 
             
-            # Convert to mp3
-            print(f"[YouTube] Converting pytubefix output {downloaded_path} to {output_path}...")
-            subprocess.run([
-                'ffmpeg', '-y', '-i', downloaded_path, 
-                '-vn', '-acodec', 'libmp3lame', '-q:a', '2', 
-                str(output_path)
-            ], check=True, capture_output=True)
+                # Convert to mp3
+                print(f"[YouTube] Converting pytubefix output {downloaded_path} to {output_path}...")
+                subprocess.run([
+                    'ffmpeg', '-y', '-i', downloaded_path, 
+                    '-vn', '-acodec', 'libmp3lame', '-q:a', '2', 
+                    str(output_path)
+                ], check=True, capture_output=True)
             
-            # Cleanup raw extraction
-            Path(downloaded_path).unlink(missing_ok=True)
-            print(f"[YouTube] Audio extracted with pytubefix: {output_path}")
+                # Cleanup raw extraction
+                Path(downloaded_path).unlink(missing_ok=True)
+                print(f"[YouTube] Audio extracted with pytubefix: {output_path}")
 
         except Exception as e_py:
             print(f"[YouTube] pytubefix also failed: {e_py}")
@@ -370,43 +383,48 @@ def extract_audio(url: str, output_dir: Optional[Path] = None) -> Dict[str, Any]
             
             # --- Invidious Loop ---
             for instance in invidious_instances:
-                try:
-                    # m4a audio itag=140
-                    download_url = f"{instance}/latest_version?id={video_id}&itag=140"
-                    print(f"[YouTube] Trying {instance}...")
+                with span("youtube.attempt", method="invidious", instance=instance) as sp:
+                    # An attempt counts as failed until its download succeeds
+                    sp.set_status(STATUS_ERROR, "no usable audio")
+                    try:
+                        # m4a audio itag=140
+                        download_url = f"{instance}/latest_version?id={video_id}&itag=140"
+                        print(f"[YouTube] Trying {instance}...")
                     
-                    with requests.get(download_url, stream=True, timeout=15) as r:
-                         if r.status_code == 200:
-                             content_type = r.headers.get('Content-Type', '')
-                             if 'text/html' in content_type:
-                                 print(f"[YouTube] {instance} returned HTML. Skipping.")
-                                 continue
+                        with requests.get(download_url, stream=True, timeout=15) as r:
+                             if r.status_code == 200:
+                                 content_type = r.headers.get('Content-Type', '')
+                                 if 'text/html' in content_type:
+                                     print(f"[YouTube] {instance} returned HTML. Skipping.")
+                                     continue
                              
-                             temp_audio = output_dir / f"{video_id}.m4a"
-                             file_size = 0
-                             with open(temp_audio, 'wb') as f:
-                                 for chunk in r.iter_content(chunk_size=8192):
-                                     f.write(chunk)
-                                     file_size += len(chunk)
+                                 temp_audio = output_dir / f"{video_id}.m4a"
+                                 file_size = 0
+                                 with open(temp_audio, 'wb') as f:
+                                     for chunk in r.iter_content(chunk_size=8192):
+                                         f.write(chunk)
+                                         file_size += len(chunk)
                              
-                             if file_size < 10000:
-                                 print(f"[YouTube] {instance} too small ({file_size}b). Skipping.")
-                                 temp_audio.unlink(missing_ok=True)
-                                 continue
-
-                             print(f"[YouTube] Converting Invidious output {temp_audio} to {output_path}...")
-                             subprocess.run([
-                                 'ffmpeg', '-y', '-i', str(temp_audio), 
-                                 '-vn', '-acodec', 'libmp3lame', '-q:a', '2', 
-                                 str(output_path)
-                             ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                                 if file_size < 10000:
+                                     print(f"[YouTube] {instance} too small ({file_size}b). Skipping.")
+                                     temp_audio.unlink(missing_ok=True)
+                                     continue
+
+                                 print(f"[YouTube] Converting Invidious output {temp_audio} to {output_path}...")
+                                 subprocess.run([
+                                     'ffmpeg', '-y', '-i', str(temp_audio), 
+                                     '-vn', '-acodec', 'libmp3lame', '-q:a', '2', 
+                                     str(output_path)
+                                 ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
                              
-                             temp_audio.unlink(missing_ok=True)
-                             print(f"[YouTube] Audio extracted via Invidious: {output_path}")
-                             success = True
-                             break
-                except Exception:
-                    print(f"[YouTube] {instance} failed")
+                                 temp_audio.unlink(missing_ok=True)
+                                 print(f"[YouTube] Audio extracted via Invidious: {output_path}")
+                                 success = True
+                                 sp.set_status(STATUS_OK)
+                                 break
+                    except Exception:
+                        print(f"[YouTube] {instance} failed")
+                        sp.set_status(STATUS_ERROR, "request failed")
 
             # --- Piped Fallback (If Invidious fails) ---
             if not success:
@@ -421,46 +439,51 @@ def extract_audio(url: str, output_dir: Optional[Path] = None) -> Dict[str, Any]
                  ]
                  
                  for api_base in piped_instances:
-                     try:
-                         print(f"[YouTube] Trying Piped API: {api_base}...")
-                         # Get video streams
-                         resp = requests.get(f"{api_base}/streams/{video_id}", timeout=10)
-                         if resp.status_code != 200:
-                             print(f"[YouTube] Piped {api_base} returned {resp.status_code}")
-                             continue
+                     with span("youtube.attempt", method="piped", instance=api_base) as sp:
+                         # An attempt counts as failed until its download succeeds
+                         sp.set_status(STATUS_ERROR, "no usable audio")
+                         try:
+                             print(f"[YouTube] Trying Piped API: {api_base}...")
+                             # Get video streams
+                             resp = requests.get(f"{api_base}/streams/{video_id}", timeout=10)
+                             if resp.status_code != 200:
+                                 print(f"[YouTube] Piped {api_base} returned {resp.status_code}")
+                                 continue
                          
-                         data = resp.json()
-                         audio_streams = data.get('audioStreams', [])
-                         # Find m4a stream
-                         target_stream = next((s for s in audio_streams if s.get('format') == 'M4A'), None)
-                         if not target_stream and audio_streams:
-                             target_stream = audio_streams[0] # Fallback to any
+                             data = resp.json()
+                             audio_streams = data.get('audioStreams', [])
+                             # Find m4a stream
+                             target_stream = next((s for s in audio_streams if s.get('format') == 'M4A'), None)
+                             if not target_stream and audio_streams:
+                                 target_stream = audio_streams[0] # Fallback to any
                              
-                         if target_stream:
-                             stream_url = target_stream['url']
-                             print("[YouTube] Downloading from Piped stream...")
+                             if target_stream:
+                                 stream_url = target_stream['url']
+                                 print("[YouTube] Downloading from Piped stream...")
                              
-                             # Download the stream
-                             with requests.get(stream_url, stream=True, timeout=20) as r_stream:
-                                 if r_stream.status_code == 200:
-                                     temp_audio = output_dir / f"{video_id}_piped.m4a"
-                                     with open(temp_audio, 'wb') as f:
-                                         for chunk in r_stream.iter_content(chunk_size=8192):
-                                             f.write(chunk)
+                                 # Download the stream
+                                 with requests.get(stream_url, stream=True, timeout=20) as r_stream:
+                                     if r_stream.status_code == 200:
+                                         temp_audio = output_dir / f"{video_id}_piped.m4a"
+                                         with open(temp_audio, 'wb') as f:
+                                             for chunk in r_stream.iter_content(chunk_size=8192):
+                                                 f.write(chunk)
                                      
-                                     # Convert
-                                     print("[YouTube] Converting Piped output...")
-                                     subprocess.run([
-                                        'ffmpeg', '-y', '-i', str(temp_audio), 
-                                        '-vn', '-acodec', 'libmp3lame', '-q:a', '2', 
-                                        str(output_path)
-                                     ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                                         # Convert
+                                         print("[YouTube] Converting Piped output...")
+                                         subprocess.run([
+                                            'ffmpeg', '-y', '-i', str(temp_audio), 
+                                            '-vn', '-acodec', 'libmp3lame', '-q:a', '2', 
+                                            str(output_path)
+                                         ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
                                      
-                                     temp_audio.unlink(missing_ok=True)
-                                     success = True
-                                     break
-                     except Exception as e_piped:
-                         print(f"[YouTube] Piped {api_base} failed: {e_piped}")
+                                         temp_audio.unlink(missing_ok=True)
+                                         success = True
+                                         sp.set_status(STATUS_OK)
+                                         break
+                         except Exception as e_piped:
+                             print(f"[YouTube] Piped {api_base} failed: {e_piped}")
+                             sp.set_status(STATUS_ERROR, str(e_piped))
 
             # --- Cobalt Fallback (The Professional Downloader) ---
             if not success:
@@ -474,76 +497,81 @@ def extract_audio(url: str, output_dir: Optional[Path] = None) -> Dict[str, Any]
                  ]
                  
                  for api_base in cobalt_instances:
-                     try:
-                         print(f"[YouTube] Trying Cobalt API: {api_base}...")
-                         headers = {
-                             "Accept": "application/json",
-                             "Content-Type": "application/json",
-                             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-                         }
+                     with span("youtube.attempt", method="cobalt", instance=api_base) as sp:
+                         # An attempt counts as failed until its download succeeds
+                         sp.set_status(STATUS_ERROR, "no usable audio")
+                         try:
+                             print(f"[YouTube] Trying Cobalt API: {api_base}...")
+                             headers = {
+                                 "Accept": "application/json",
+                                 "Content-Type": "application/json",
+                                 "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+                             }
                          
-                         # Try v10 payload first (POST /)
-                         payload_v10 = {
-                             "url": f"https://www.youtube.com/watch?v={video_id}",
-                             "downloadMode": "audio",
-                             "audioFormat": "mp3"
-                         }
+                             # Try v10 payload first (POST /)
+                             payload_v10 = {
+                                 "url": f"https://www.youtube.com/watch?v={video_id}",
+                                 "downloadMode": "audio",
+                                 "audioFormat": "mp3"
+                             }
                          
-                         try:
-                             resp = requests.post(f"{api_base}/", json=payload_v10, headers=headers, timeout=15)
-                             if resp.status_code == 200:
+                             try:
+                                 resp = requests.post(f"{api_base}/", json=payload_v10, headers=headers, timeout=15)
+                                 if resp.status_code == 200:
+                                     data = resp.json()
+                                     download_url = data.get('url')
+                                     if download_url:
+                                         # Success with v10
+                                         pass 
+                                     else:
+                                         # Try v7 payload (POST /api/json)
+                                         raise ValueError("v10 failed")
+                                 else:
+                                     raise ValueError(f"v10 returned {resp.status_code}")
+                             except Exception:
+                                 # Fallback to v7 style
+                                 payload_v7 = {
+                                     "url": f"https://www.youtube.com/watch?v={video_id}",
+                                     "isAudioOnly": True,
+                                     "aFormat": "mp3"
+                                 }
+                                 resp = requests.post(f"{api_base}/api/json", json=payload_v7, headers=headers, timeout=15)
+                                 if resp.status_code != 200:
+                                     print(f"[YouTube] Cobalt {api_base} returned {resp.status_code}: {resp.text}")
+                                     continue
                                  data = resp.json()
                                  download_url = data.get('url')
-                                 if download_url:
-                                     # Success with v10
-                                     pass 
-                                 else:
-                                     # Try v7 payload (POST /api/json)
-                                     raise ValueError("v10 failed")
-                             else:
-                                 raise ValueError(f"v10 returned {resp.status_code}")
-                         except Exception:
-                             # Fallback to v7 style
-                             payload_v7 = {
-                                 "url": f"https://www.youtube.com/watch?v={video_id}",
-                                 "isAudioOnly": True,
-                                 "aFormat": "mp3"
-                             }
-                             resp = requests.post(f"{api_base}/api/json", json=payload_v7, headers=headers, timeout=15)
-                             if resp.status_code != 200:
-                                 print(f"[YouTube] Cobalt {api_base} returned {resp.status_code}: {resp.text}")
-                                 continue
-                             data = resp.json()
-                             download_url = data.get('url')
-
-                         if download_url:
-                             print("[YouTube] Downloading from Cobalt stream...")
-                             with requests.get(download_url, stream=True, timeout=30) as r_stream:
-                                 if r_stream.status_code == 200:
-                                     temp_audio = output_dir / f"{video_id}_cobalt.mp3"
-                                     with open(temp_audio, 'wb') as f:
-                                         for chunk in r_stream.iter_content(chunk_size=8192):
-                                             f.write(chunk)
+
+                             if download_url:
+                                 print("[YouTube] Downloading from Cobalt stream...")
+                                 with requests.get(download_url, stream=True, timeout=30) as r_stream:
+                                     if r_stream.status_code == 200:
+                                         temp_audio = output_dir / f"{video_id}_cobalt.mp3"
+                                         with open(temp_audio, 'wb') as f:
+                                             for chunk in r_stream.iter_content(chunk_size=8192):
+                                                 f.write(chunk)
                                      
-                                     if temp_audio.stat().st_size < 10000:
-                                          print("[YouTube] Cobalt download too small.")
-                                          temp_audio.unlink(missing_ok=True)
-                                          continue
-
-                                     subprocess.run([
-                                        'ffmpeg', '-y', '-i', str(temp_audio), 
-                                        '-vn', '-acodec', 'libmp3lame', '-q:a', '2', 
-                                        str(output_path)
-                                     ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                                         if temp_audio.stat().st_size < 10000:
+                                              print("[YouTube] Cobalt download too small.")
+                                              temp_audio.unlink(missing_ok=True)
+                                              continue
+
+                                         subprocess.run([
+                                            'ffmpeg', '-y', '-i', str(temp_audio), 
+                                            '-vn', '-acodec', 'libmp3lame', '-q:a', '2', 
+                                            str(output_path)
+                                         ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
                                      
-                                     temp_audio.unlink(missing_ok=True)
-                                     success = True
-                                     break
-                         else:
-                             print(f"[YouTube] Cobalt response missing url: {data}")
+                                         temp_audio.unlink(missing_ok=True)
+                                         success = True
+                                         sp.set_status(STATUS_OK)
+                                         break
+                             else:
+                                 print(f"[YouTube] Cobalt response missing url: {data}")
                              
-                     except Exception as e_cobalt:
-                         print(f"[YouTube] Cobalt {api_base} failed: {e_cobalt}")
+                         except Exception as e_cobalt:
+                             print(f"[YouTube] Cobalt {api_base} failed: {e_cobalt}")
+                             sp.set_status(STATUS_ERROR, str(e_cobalt))
 
             if not success:
                 raise RuntimeError("All methods failed (yt-dlp, pytubefix, Invidious/Piped/Cobalt). Running in Datacenter? IP is heavily blocked.")
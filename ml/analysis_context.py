@@ -0,0 +1,167 @@
+"""
+ml/analysis_context.py
+
+Per-request "decode once, compute once" feature cache.
+
+A single analysis request runs several detectors over the same file — chords,
+key and tempo in fast mode; key, tempo and template chords in balanced mode.
+Before this module each detector called `load_audio` on its own, so an MP3
+was decoded and resampled three times, and the fast path computed the same
+full-range CQT twice (once for the CRNN input, once for key chroma).
+
+`AnalysisContext` decodes the file lazily on first use and memoizes every
+derived feature (waveform, CQT magnitude, chroma, CNN input, harmonic
+component, onset envelope, RMS). Detectors accept either a path or a context;
+passing a context lets them share all of that work.
+
+A context is meant to live for one request. Accessors are guarded by a
+per-instance lock so it is safe to hand the same context to helper threads.
+"""
+from __future__ import annotations
+
+import threading
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import librosa
+import numpy as np
+
+from .features import (
+    HOP_LENGTH,
+    SR,
+    chroma_from_cqt,
+    cnn_input_from_cqt,
+    cqt_magnitude,
+)
+from .instrumentation import stage
+
+
+class AnalysisContext:
+    """
+    Lazily decoded audio plus memoized features for one analysis request.
+
+    Args:
+        file_path: Audio file to analyze. May be None when the context is
+            built from an in-memory waveform via `from_waveform`.
+        sr: Analysis sample rate (all features are computed at this rate).
+        keep_channels: Decode with channels preserved. Set this when a
+            consumer needs the stereo image (balanced-mode vocal attenuation);
+            the mono waveform is then derived from the same decode instead of
+            reading the file a second time.
+    """
+
+    def __init__(
+        self,
+        file_path: str | Path | None,
+        sr: int = SR,
+        keep_channels: bool = False,
+    ):
+        self.file_path = Path(file_path) if file_path is not None else None
+        self.sr = sr
+        self.keep_channels = keep_channels
+        self._lock = threading.RLock()
+        self._memo: dict[str, Any] = {}
+
+    @classmethod
+    def from_waveform(cls, y: np.ndarray, sr: int = SR) -> AnalysisContext:
+        """Build a context around audio that is already decoded at `sr`."""
+        ctx = cls(None, sr=sr, keep_channels=y.ndim == 2)
+        ctx._memo["audio"] = np.asarray(y, dtype=np.float32)
+        return ctx
+
+    def _get(self, key: str, compute: Callable[[], Any]) -> Any:
+        with self._lock:
+            if key not in self._memo:
+                self._memo[key] = compute()
+            return self._memo[key]
+
+    def _decode(self) -> np.ndarray:
+        if self.file_path is None:
+            raise ValueError("AnalysisContext has no file_path and no waveform")
+        # librosa.load(sr=self.sr) in two timed steps: same samples
+        with stage("decode"):
+            y, native_sr = librosa.load(str(self.file_path), sr=None, mono=not self.keep_channels)
+        if native_sr != self.sr:
+            with stage("resample"):
+                y = librosa.resample(y, orig_sr=native_sr, target_sr=self.sr)
+        return y
+
+    # ── Decoded audio ───────────────────────────────────────────────────────
+
+    @property
+    def audio(self) -> np.ndarray:
+        """Decoded audio as loaded: (n_samples,) or (n_channels, n_samples)."""
+        return self._get("audio", self._decode)
+
+    @property
+    def waveform(self) -> np.ndarray:
+        """Mono waveform at `sr`, shape (n_samples,)."""
+        def compute() -> np.ndarray:
+            y = self.audio
+            return librosa.to_mono(y) if y.ndim == 2 else y
+        return self._get("waveform", compute)
+
+    @property
+    def duration(self) -> float:
+        """Audio duration in seconds."""
+        return len(self.waveform) / float(self.sr)
+
+    # ── Derived features ────────────────────────────────────────────────────
+
+    @property
+    def cqt(self) -> np.ndarray:
+        """Full-range CQT magnitude of the mono waveform, shape (216, n_frames)."""
+        return self._get("cqt", lambda: cqt_magnitude(self.waveform, self.sr))
+
+    @property
+    def chroma(self) -> np.ndarray:
+        """Unit-max CQT chroma, shape (n_frames, 12)."""
+        return self._get("chroma", lambda: chroma_from_cqt(self.cqt, self.sr))
+
+    @property
+    def cnn_input(self) -> np.ndarray:
+        """Log-CQT CRNN input, shape (216, n_frames)."""
+        return self._get("cnn_input", lambda: cnn_input_from_cqt(self.cqt))
+
+    @property
+    def harmonic(self) -> np.ndarray:
+        """HPSS harmonic component of the mono waveform."""
+        def compute() -> np.ndarray:
+            with stage("hpss"):
+                return librosa.effects.harmonic(self.waveform)
+        return self._get("harmonic", compute)
+
+    @property
+    def harmonic_chroma(self) -> np.ndarray:
+        """Unit-max CQT chroma of the harmonic component, shape (n_frames, 12)."""
+        return self._get(
+            "harmonic_chroma",
+            lambda: chroma_from_cqt(cqt_magnitude(self.harmonic, self.sr), self.sr),
+        )
+
+    @property
+    def onset_envelope(self) -> np.ndarray:
+        """Median-aggregated onset strength (≤8 kHz) used by tempo estimation."""
+        return self._get(
+            "onset_envelope",
+            lambda: librosa.onset.onset_strength(
+                y=self.waveform, sr=self.sr, hop_length=HOP_LENGTH,
+                aggregate=np.median,
+                fmax=8000,
+            ),
+        )
+
+    @property
+    def rms(self) -> np.ndarray:
+        """Frame RMS energy of the mono waveform, shape (n_frames,)."""
+        return self._get(
+            "rms", lambda: librosa.feature.rms(y=self.waveform, hop_length=HOP_LENGTH)[0]
+        )
+
+
+def as_context(source: str | Path | AnalysisContext, **kwargs) -> AnalysisContext:
+    """Return `source` unchanged if it is already a context, else wrap the path in a new one."""
+    if isinstance(source, AnalysisContext):
+        return source
+    return AnalysisContext(source, **kwargs)
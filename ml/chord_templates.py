@@ -24,14 +24,16 @@ import numpy as np
 import scipy.signal
 import librosa
 
-from .chord_vocab import LABELS, LABEL_TO_IDX, NUM_CLASSES, build_templates
+from .analysis_context import AnalysisContext, as_context
+from .chord_vocab import LABELS, LABEL_TO_IDX, build_templates
 from .features import SR, HOP_LENGTH
+from .instrumentation import stage
+from .segments import SegmentArrays, coalesce_runs
 from .viterbi import smooth_chord_sequence
 
 
 def _suppress_center_vocals_and_isolate_harmonics(
-    file_path: str | Path,
-    sr: int = SR,
+    ctx: AnalysisContext,
     max_duration: float = 360.0,
 ) -> tuple[np.ndarray, np.ndarray, int]:
     """
@@ -41,10 +43,16 @@ def _suppress_center_vocals_and_isolate_harmonics(
       - Computes RMS energy envelope for silence gating.
       - Applies HPSS to isolate sustained harmonic instruments.
 
+    The stereo image is only available when `ctx` was built with
+    keep_channels=True; otherwise the mono path is taken.
+
     Returns: (y_harmonic, rms_envelope, sr)
     """
-    # 1. Load stereo audio (mono=False) to allow stereo phase processing
-    y_raw, _ = librosa.load(str(file_path), sr=sr, mono=False, duration=max_duration)
+    sr = ctx.sr
+    max_samples = int(max_duration * sr)
+
+    # 1. Use the context's channel-preserving decode for stereo phase processing
+    y_raw = ctx.audio[..., :max_samples]
 
     if y_raw.ndim == 2 and y_raw.shape[0] >= 2:
         # Stereo audio: Lead vocals are panned center in >95% of mixed tracks.
@@ -70,11 +78,13 @@ def _suppress_center_vocals_and_isolate_harmonics(
         y_proc = y_raw if y_raw.ndim == 1 else y_raw[0]
         mono = y_proc
 
-    # 2. Compute RMS envelope on mono for accurate silence detection
-    rms = librosa.feature.rms(y=mono, hop_length=HOP_LENGTH)[0]
+    # 2. RMS envelope on mono for accurate silence detection (shared with the
+    #    context; truncated to the capped duration)
+    rms = ctx.rms[: 1 + len(mono) // HOP_LENGTH]
 
     # 3. HPSS Harmonic Isolation: Extracts stationary harmonic content (chords)
-    y_harmonic = librosa.effects.harmonic(y_proc, margin=2.5)
+    with stage("hpss"):
+        y_harmonic = librosa.effects.harmonic(y_proc, margin=2.5)
 
     return y_harmonic, rms, sr
 
@@ -110,35 +120,58 @@ def get_diatonic_chords(key_str: str | None) -> set[str]:
         return set()
 
 
-def detect_chords_template(
-    file_path: str | Path,
-    use_vocal_suppression: bool = True,
-    detected_key: str | None = None,
-    min_duration_ms: float = 400.0,
-    self_transition_prob: float = 0.96,
-    tempo_bpm: float | None = None,
-) -> list[tuple[float, float, str, float]]:
+def score_chroma_frames(
+    chroma: np.ndarray,
+    templates: np.ndarray,
+    nc_idx: int,
+    min_norm: float,
+    silent: np.ndarray | None = None,
+    nc_silent_score: float = 1.0,
+    nc_active_score: float = -1.0,
+) -> tuple[np.ndarray, np.ndarray]:
     """
-    DSP chord recognition pipeline for Balanced Mode.
+    Batched cosine scoring of every chroma frame against every chord template.
+
+    Replaces the per-frame `templates @ (v / |v|)` loop with one float32
+    matrix multiply over the whole track, scaled in place by the frame norms.
+
+    Frames whose chroma norm is below `min_norm` — or flagged in the optional
+    boolean `silent` mask (e.g. RMS gating) — score 0 for every chord and
+    `nc_silent_score` for N.C.; active frames score `nc_active_score` for N.C.
+
+    Args:
+        chroma:    (n_frames, 12) chroma matrix.
+        templates: (n_classes, 12) chord templates.
 
     Returns:
-        List of (start_sec, end_sec, chord_label, confidence) tuples.
+        (sims, norms): (n_frames, n_classes) float32 scores and the
+        (n_frames,) float32 chroma norms, reusable for confidence estimates.
     """
-    # 1. Preprocess with vocal attenuation + harmonic isolation + RMS energy
-    if use_vocal_suppression:
-        y_harm, rms, sr = _suppress_center_vocals_and_isolate_harmonics(file_path, sr=SR)
-    else:
-        y_harm, sr = librosa.load(str(file_path), sr=SR, mono=True, duration=360.0)
-        rms = librosa.feature.rms(y=y_harm, hop_length=HOP_LENGTH)[0]
+    chroma = np.asarray(chroma, dtype=np.float32)
+    templates = np.asarray(templates, dtype=np.float32)
 
-    # 2. Tuning estimation (corrects for tracks tuned slightly sharp or flat, e.g. 432Hz or Eb)
-    try:
-        tuning = float(librosa.estimate_tuning(y=y_harm, sr=sr))
-    except Exception:
-        tuning = 0.0
+    norms = np.sqrt(np.einsum("ij,ij->i", chroma, chroma))
+    inactive = norms < min_norm
+    if silent is not None:
+        inactive |= silent[: len(norms)]
 
-    # 3. Band-limited CQT Chroma (C2 ~65.4Hz up to ~1050Hz)
-    # Focuses strictly on chord fundamentals (bass root + triad voicings)
+    sims = chroma @ templates.T
+    sims /= (norms + np.float32(1e-8))[:, None]
+    sims[inactive] = 0.0
+    sims[:, nc_idx] = np.where(inactive, nc_silent_score, nc_active_score)
+    return sims, norms
+
+
+@stage("cqt")
+def template_chroma(y_harm: np.ndarray, sr: int, tuning: float = 0.0) -> np.ndarray:
+    """
+    Balanced-mode chroma: band-limited CQT (C2 to C6) folded to 12 bins,
+    log-compressed and unit-norm per frame. Shape (n_frames, 12).
+
+    Focuses strictly on chord fundamentals (bass root + triad voicings).
+    Every step is frame-local, so blocks of a longer signal (with a little
+    context) give the same frames as the whole signal.
+    """
     fmin = librosa.note_to_hz("C2")  # 65.4 Hz
     n_octaves = 4                    # C2 to C6
     bins_per_octave = 36             # 3 bins/semitone for sharp note definition
@@ -166,55 +199,98 @@ def detect_chords_template(
     # Logarithmic compression to balance loud vs quiet notes in chord voicing
     chroma = np.log1p(15.0 * chroma)
     chroma = chroma / (np.linalg.norm(chroma, axis=0, keepdims=True) + 1e-8)
-    chroma = chroma.T  # (n_frames, 12)
+    return chroma.T  # (n_frames, 12)
 
-    n_frames = len(chroma)
-    frame_rate = sr / HOP_LENGTH
 
-    # 4. Reference chord templates (109 classes) with clashing note penalties
+def template_frame_probs(
+    chroma: np.ndarray,
+    silent: np.ndarray,
+    diatonic_indices: list[int],
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Balanced-mode frame scoring: penalized template similarity, silence and
+    weak-chroma frames → dominant N.C., a gentle diatonic key prior and a
+    sharp softmax. Returns (sims, probs), both (n_frames, n_classes).
+    """
+    # Reference chord templates (109 classes) with clashing note penalties
     templates = build_templates(with_penalties=True)  # (109, 12)
     nc_idx = LABEL_TO_IDX["N.C."]
 
+    sims, _ = score_chroma_frames(
+        chroma,
+        templates,
+        nc_idx,
+        min_norm=0.18,
+        silent=silent,
+        nc_silent_score=2.0,
+    )
+
+    # Gentle diatonic key prior (+0.10 boost to in-key chords)
+    if diatonic_indices:
+        sims[:, diatonic_indices] += 0.10
+
+    # Softmax temperature scaling
+    tau = 0.16  # Sharp peak distribution
+    e = np.exp(sims / tau)
+    probs = e / e.sum(axis=-1, keepdims=True)
+    return sims, probs
+
+
+@stage("chords")
+def detect_chords_template(
+    file_path: str | Path | AnalysisContext,
+    use_vocal_suppression: bool = True,
+    detected_key: str | None = None,
+    min_duration_ms: float = 400.0,
+    self_transition_prob: float = 0.96,
+    tempo_bpm: float | None = None,
+) -> list[tuple[float, float, str, float]]:
+    """
+    DSP chord recognition pipeline for Balanced Mode.
+
+    `file_path` may be a shared AnalysisContext; build it with
+    keep_channels=True so the vocal attenuation can use the stereo image.
+
+    Returns:
+        List of (start_sec, end_sec, chord_label, confidence) tuples.
+    """
+    ctx = as_context(file_path, sr=SR, keep_channels=use_vocal_suppression)
+
+    # 1. Preprocess with vocal attenuation + harmonic isolation + RMS energy
+    if use_vocal_suppression:
+        y_harm, rms, sr = _suppress_center_vocals_and_isolate_harmonics(ctx)
+    else:
+        sr = ctx.sr
+        y_harm = ctx.waveform[: int(360.0 * sr)]
+        rms = ctx.rms[: 1 + len(y_harm) // HOP_LENGTH]
+
+    # 2. Tuning estimation (corrects for tracks tuned slightly sharp or flat, e.g. 432Hz or Eb)
+    try:
+        tuning = float(librosa.estimate_tuning(y=y_harm, sr=sr))
+    except Exception:
+        tuning = 0.0
+
+    # 3. Band-limited CQT Chroma (C2 ~65.4Hz up to ~1050Hz)
+    chroma = template_chroma(y_harm, sr, tuning)
+
+    n_frames = len(chroma)
+    frame_rate = sr / HOP_LENGTH
+
+    # 4-7. Gated, key-biased template scores → per-frame probabilities
+    nc_idx = LABEL_TO_IDX["N.C."]
     diatonic_chords = get_diatonic_chords(detected_key) if detected_key else set()
     diatonic_indices = [LABEL_TO_IDX[c] for c in diatonic_chords if c in LABEL_TO_IDX]
 
-    # 5. Silence & Energy Gating
     # Align RMS frames to chroma frames
     if len(rms) < n_frames:
         rms = np.pad(rms, (0, n_frames - len(rms)), mode="edge")
     else:
         rms = rms[:n_frames]
-
     max_rms = float(np.max(rms)) if len(rms) > 0 else 1.0
     # Dynamic silence threshold: -38dB from peak, or below absolute 0.008
     silence_threshold = max(0.008, max_rms * 0.025)
 
-    # Compute similarity and posterior probability per frame
-    sims = np.zeros((n_frames, NUM_CLASSES), dtype=np.float32)
-
-    for t in range(n_frames):
-        vec = chroma[t]
-        vec_norm = float(np.linalg.norm(vec))
-        frame_rms = float(rms[t])
-
-        # Strict silence check: no chords during quiet parts or silence
-        if frame_rms < silence_threshold or vec_norm < 0.18:
-            sims[t, nc_idx] = 2.0  # Dominant N.C.
-        else:
-            v = vec / (vec_norm + 1e-8)
-            scores = templates @ v
-            sims[t] = scores
-            # Suppress N.C. for active musical frames
-            sims[t, nc_idx] = -1.0
-
-    # 6. Apply gentle diatonic key prior (+0.10 boost to in-key chords)
-    if diatonic_indices:
-        sims[:, diatonic_indices] += 0.10
-
-    # 7. Softmax temperature scaling
-    tau = 0.16  # Sharp peak distribution
-    e = np.exp(sims / tau)
-    probs = e / e.sum(axis=-1, keepdims=True)
+    sims, probs = template_frame_probs(chroma, rms < silence_threshold, diatonic_indices)
 
     # 8. Ergodic HMM Viterbi Sequence Decoding
     smoothed = smooth_chord_sequence(
@@ -251,15 +327,4 @@ def detect_chords_template(
                 results.append((seg.start, seg.end, seg.chord, mean_conf))
 
     # 9. Final segment compaction (merge consecutive identical chords)
-    final_results: list[tuple[float, float, str, float]] = []
-    for start, end, chord, conf in results:
-        if final_results and final_results[-1][2] == chord:
-            prev_start, prev_end, _, prev_conf = final_results[-1]
-            p_dur = prev_end - prev_start
-            c_dur = end - start
-            new_conf = (prev_conf * p_dur + conf * c_dur) / (p_dur + c_dur)
-            final_results[-1] = (prev_start, end, chord, float(new_conf))
-        else:
-            final_results.append((start, end, chord, conf))
-
-    return final_results
+    return coalesce_runs(SegmentArrays.from_tuples(results)).to_tuples()
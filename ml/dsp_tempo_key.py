@@ -16,10 +16,14 @@ Both run in <1s for a 4-minute song and add zero licensing risk.
 """
 from __future__ import annotations
 
+from pathlib import Path
+
 import numpy as np
 import librosa
 
-from .features import SR, HOP_LENGTH, load_audio, extract_cqt_chroma
+from .analysis_context import AnalysisContext, as_context
+from .features import HOP_LENGTH
+from .instrumentation import stage
 
 NOTE_NAMES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
 
@@ -29,19 +33,21 @@ KK_MAJOR = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66,
 KK_MINOR = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
 
 
-def detect_tempo_dsp(file_path: str) -> float:
+@stage("tempo")
+def detect_tempo_dsp(file_path: str | Path | AnalysisContext) -> float:
     """
     Estimate BPM using onset-strength autocorrelation with median filtering
     and log-normal tempo prior to prevent octave doubling on slow ballads (e.g. 70 BPM).
 
+    Accepts a path or a shared AnalysisContext (reuses its decoded audio).
     Returns rounded BPM as a float (e.g. 70.0).
     """
-    y, sr = load_audio(file_path)
-    onset_env = librosa.onset.onset_strength(
-        y=y, sr=sr, hop_length=HOP_LENGTH,
-        aggregate=np.median,
-        fmax=8000
-    )
+    ctx = as_context(file_path)
+    return tempo_from_onset_envelope(ctx.onset_envelope, ctx.sr)
+
+
+def tempo_from_onset_envelope(onset_env: np.ndarray, sr: int) -> float:
+    """Tempo estimate (rounded BPM) from a precomputed onset-strength envelope."""
     try:
         import scipy.stats
         prior = scipy.stats.lognorm(s=0.65, scale=115)
@@ -65,14 +71,19 @@ def detect_tempo_dsp(file_path: str) -> float:
     return round(bpm, 1)
 
 
-def detect_key_dsp(file_path: str) -> str:
+@stage("key")
+def detect_key_dsp(file_path: str | Path | AnalysisContext) -> str:
     """
     Estimate musical key using the Krumhansl-Schmuckler algorithm.
 
+    Accepts a path or a shared AnalysisContext (reuses its CQT chroma).
     Returns a string like "C major" or "A minor".
     """
-    y, sr = load_audio(file_path)
-    chroma = extract_cqt_chroma(y, sr)  # (n_frames, 12)
+    return key_from_chroma(as_context(file_path).chroma)
+
+
+def key_from_chroma(chroma: np.ndarray) -> str:
+    """Krumhansl-Schmuckler key estimate from a (n_frames, 12) chroma matrix."""
     agg = chroma.mean(axis=0)
     agg = agg / (agg.sum() + 1e-8)
 
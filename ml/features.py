@@ -16,6 +16,8 @@ from __future__ import annotations
 import numpy as np
 import librosa
 
+from .instrumentation import stage
+
 # ── Global constants ────────────────────────────────────────────────────────
 SR = 22050                  # Standard analysis sample rate
 HOP_LENGTH = 2048           # ~93ms per frame at 22050 Hz — good speed/resolution tradeoff
@@ -36,14 +38,17 @@ def load_audio(
     return y, sr
 
 
-def extract_cqt_chroma(y: np.ndarray, sr: int = SR) -> np.ndarray:
+@stage("cqt")
+def cqt_magnitude(y: np.ndarray, sr: int = SR) -> np.ndarray:
     """
-    CQT-based chroma — much more robust to non-piano timbres (distorted guitar,
-    vocals, etc.) than STFT chroma.
+    Full-range CQT magnitude (C1 upward, 6 octaves at 36 bins/octave).
 
-    Returns: array of shape (n_frames, 12), values in [0, 1].
+    This is the single spectral representation behind both the chroma
+    features and the CNN input, so callers that need both can compute it once.
+
+    Returns: array of shape (n_bins=216, n_frames).
     """
-    cqt = np.abs(
+    return np.abs(
         librosa.cqt(
             y,
             sr=sr,
@@ -53,6 +58,10 @@ def extract_cqt_chroma(y: np.ndarray, sr: int = SR) -> np.ndarray:
             bins_per_octave=BINS_PER_OCTAVE,
         )
     )
+
+
+def chroma_from_cqt(cqt: np.ndarray, sr: int = SR) -> np.ndarray:
+    """Fold a `cqt_magnitude` spectrogram into per-frame unit-max chroma, shape (n_frames, 12)."""
     chroma = librosa.feature.chroma_cqt(
         C=cqt,
         sr=sr,
@@ -65,6 +74,24 @@ def extract_cqt_chroma(y: np.ndarray, sr: int = SR) -> np.ndarray:
     return chroma.T.astype(np.float32)  # (n_frames, 12)
 
 
+def cnn_input_from_cqt(cqt: np.ndarray) -> np.ndarray:
+    """Log-scale a `cqt_magnitude` spectrogram into the CNN input range, shape (n_bins, n_frames)."""
+    log_cqt = librosa.amplitude_to_db(cqt, ref=np.max)
+    # Scale to roughly [-1, 1] for neural network input
+    log_cqt = (log_cqt + 40.0) / 40.0
+    return log_cqt.astype(np.float32)  # (n_bins, n_frames)
+
+
+def extract_cqt_chroma(y: np.ndarray, sr: int = SR) -> np.ndarray:
+    """
+    CQT-based chroma — much more robust to non-piano timbres (distorted guitar,
+    vocals, etc.) than STFT chroma.
+
+    Returns: array of shape (n_frames, 12), values in [0, 1].
+    """
+    return chroma_from_cqt(cqt_magnitude(y, sr), sr)
+
+
 def frame_times(n_frames: int, sr: int = SR, hop_length: int = HOP_LENGTH) -> np.ndarray:
     """Convert frame indices to timestamps in seconds."""
     return librosa.frames_to_time(np.arange(n_frames), sr=sr, hop_length=hop_length)
@@ -79,17 +106,4 @@ def extract_cnn_input(y: np.ndarray, sr: int = SR) -> np.ndarray:
 
     Returns: array of shape (n_bins=216, n_frames), log-scaled to roughly [-1, 1].
     """
-    cqt = np.abs(
-        librosa.cqt(
-            y,
-            sr=sr,
-            hop_length=HOP_LENGTH,
-            fmin=FMIN,
-            n_bins=N_OCTAVES * BINS_PER_OCTAVE,
-            bins_per_octave=BINS_PER_OCTAVE,
-        )
-    )
-    log_cqt = librosa.amplitude_to_db(cqt, ref=np.max)
-    # Scale to roughly [-1, 1] for neural network input
-    log_cqt = (log_cqt + 40.0) / 40.0
-    return log_cqt.astype(np.float32)  # (n_bins, n_frames)
+    return cnn_input_from_cqt(cqt_magnitude(y, sr))
@@ -0,0 +1,350 @@
+"""
+ml/instrumentation.py
+
+Process-wide metrics in the Prometheus text exposition format, plus
+per-stage latency timing for the analysis pipelines.
+
+No client library: counters, gauges and histograms are small thread-safe
+dicts keyed by label values, rendered by `REGISTRY.render()` for the
+backend's /api/metrics endpoint. Subsystems that already keep their own
+counters (caches, scheduler, model manager, ...) are exported through
+collectors — callables run at scrape time that return `MetricFamily`s.
+
+Stage timing:
+
+    with analysis_mode("balanced"):     # engine entry point
+        with stage("cqt"):
+            ...
+
+records `guitariz_stage_duration_seconds{stage="cqt", mode="balanced"}`.
+Stages nest, and each records its *self* time — a "key" stage that first
+computes the shared CQT reports the CQT under "cqt", not twice — so the
+stages of one run add up to its total. The mode is a context variable set
+at the engine entry points; stages outside any engine report mode="other".
+
+Every stage and engine run is also a tracing span (tracing.py): "stage.cqt"
+inside "analysis.balanced", under the request's trace when tracing is on.
+
+Observations made in an analysis worker process (backend/process_pool.py)
+are captured with `capture()` and replayed into the parent's registry.
+
+Commercially clean: standard library only.
+"""
+from __future__ import annotations
+
+import bisect
+import contextvars
+import math
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from .tracing import span
+
+# Pipeline stages run from milliseconds (key, Viterbi) to minutes (Demucs)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+LabelValues = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+@dataclass
+class MetricFamily:
+    """One metric as returned by a collector: samples are (labels, value)."""
+
+    name: str
+    kind: str  # "counter" | "gauge"
+    help: str
+    samples: list[tuple[dict[str, str], float]] = field(default_factory=list)
+
+    def add(self, value: float | None, **labels) -> MetricFamily:
+        if value is not None:
+            self.samples.append(({k: str(v) for k, v in labels.items()}, float(value)))
+        return self
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in self.samples:
+            lines.append(f"{self.name}{_format_labels(labels, labels.values())} {_format_value(value)}")
+        return lines
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values → [per-bucket counts (+Inf last), sum]
+        self._series: dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+        _record_capture(self.name, labels, value)
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Observe the wall time of the `with` block."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return sum(series[0]) if series else 0
+
+    def total(self, **labels) -> float:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return series[1] if series else 0.0
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted((k, (list(s[0]), s[1])) for k, s in self._series.items())
+        lines = self._header()
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, n in zip((*self.buckets, math.inf), counts):
+                cumulative += n
+                labels = _format_labels((*self.labelnames, "le"), (*key, _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Named metrics plus scrape-time collectors."""
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._collectors: list[Callable[[], Iterable[MetricFamily]]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # Re-imported module (backend.X vs X): share the first instance
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(
+        self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def get(self, name: str) -> _Metric | None:
+        return self._metrics.get(name)
+
+    def add_collector(self, collector: Callable[[], Iterable[MetricFamily]]) -> None:
+        with self._lock:
+            self._collectors.append(collector)
+
+    def replay(self, observations: Iterable[tuple[str, dict, float]]) -> None:
+        """Re-record histogram observations captured in another process."""
+        for name, labels, value in observations:
+            metric = self._metrics.get(name)
+            if isinstance(metric, Histogram):
+                metric.observe(value, **labels)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines: list[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in collectors:
+            try:
+                for family in collector():
+                    lines.extend(family.render())
+            except Exception as e:
+                print(f"[Metrics] Collector failed: {e}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "guitariz_stage_duration_seconds",
+    "Self time of one analysis pipeline stage.",
+    ("stage", "mode"),
+)
+ANALYSIS_SECONDS = REGISTRY.histogram(
+    "guitariz_analysis_duration_seconds",
+    "Wall time of one engine run, by mode and outcome.",
+    ("mode", "outcome"),
+)
+
+
+# ── Stage timing ────────────────────────────────────────────────────────────
+
+class _Frame:
+    __slots__ = ("children",)
+
+    def __init__(self):
+        self.children = 0.0
+
+
+_mode: contextvars.ContextVar[str | None] = contextvars.ContextVar("guitariz_mode", default=None)
+_stack: contextvars.ContextVar[tuple[_Frame, ...]] = contextvars.ContextVar("guitariz_stages", default=())
+_capture: contextvars.ContextVar[list | None] = contextvars.ContextVar("guitariz_capture", default=None)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Record the self time of the `with` block as pipeline stage `name`."""
+    frame = _Frame()
+    stack = _stack.get()
+    token = _stack.set((*stack, frame))
+    t0 = time.perf_counter()
+    try:
+        with span(f"stage.{name}", mode=current_mode()):
+            yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        _stack.reset(token)
+        if stack:
+            stack[-1].children += elapsed
+        STAGE_SECONDS.observe(max(elapsed - frame.children, 0.0), stage=name, mode=current_mode())
+
+
+@contextmanager
+def analysis_mode(mode: str) -> Iterator[None]:
+    """
+    Label the stages inside the block with `mode` and record the run's wall
+    time. Nested blocks (an engine called by another) relabel their stages
+    but only the outermost one counts as a run.
+    """
+    outermost = _mode.get() is None
+    token = _mode.set(mode)
+    t0 = time.perf_counter()
+    outcome = "error"
+    try:
+        with span(f"analysis.{mode}", mode=mode):
+            yield
+        outcome = "ok"
+    except BaseException as e:
+        # backend/job_control.JobCancelled (ml/ does not import the backend)
+        if type(e).__name__ == "JobCancelled":
+            outcome = "cancelled"
+        raise
+    finally:
+        _mode.reset(token)
+        if outermost:
+            ANALYSIS_SECONDS.observe(time.perf_counter() - t0, mode=mode, outcome=outcome)
+
+
+def current_mode() -> str:
+    return _mode.get() or "other"
+
+
+def _record_capture(name: str, labels: dict, value: float) -> None:
+    captured = _capture.get()
+    if captured is not None:
+        captured.append((name, dict(labels), value))
+
+
+@contextmanager
+def capture() -> Iterator[list[tuple[str, dict, float]]]:
+    """Collect the histogram observations made in the block (for `Registry.replay`)."""
+    observations: list[tuple[str, dict, float]] = []
+    token = _capture.set(observations)
+    try:
+        yield observations
+    finally:
+        _capture.reset(token)
@@ -0,0 +1,259 @@
+"""
+ml/segments.py
+
+Struct-of-arrays chord segment engine shared by every post-processing step.
+
+A track's segments live in parallel NumPy arrays (start, end, label index,
+confidence) instead of per-segment dataclasses / dicts / tuples. All merging
+happens on these arrays; callers convert to `ChordSegment` objects, tuples or
+response dicts only at the API edge.
+
+Shared by:
+  - ml/viterbi.py          (frame path → segments, minimum-duration merge)
+  - ml/chord_templates.py  (final compaction)
+  - backend/chord_custom.py   (low-confidence → N.C. + compaction)
+  - backend/chord_precise.py  (precise-mode smoothing)
+
+Operations:
+  - segments_from_path():   run-length encode a frame-level label path.
+  - coalesce_runs():        merge consecutive identical labels (vectorized).
+  - merge_short_segments(): single left-to-right pass that absorbs short
+    (and, optionally, low-confidence) segments into a neighbor. A stack of
+    committed segments replaces the old fixed number of re-merge passes: a
+    segment that grows by absorbing its left neighbor is re-examined
+    immediately, and equal neighbors are coalesced as they are pushed, so one
+    pass reaches the fixed point.
+
+Commercially clean: pure NumPy (BSD).
+"""
+from __future__ import annotations
+
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class SegmentArrays:
+    """Parallel arrays describing n chord segments."""
+    start: np.ndarray   # (n,) float64 seconds
+    end: np.ndarray     # (n,) float64 seconds
+    label: np.ndarray   # (n,) int64 index into `labels`
+    conf: np.ndarray    # (n,) float64
+    labels: Sequence[str]
+    # Index of the input segment each segment carries its label from (lets
+    # callers re-attach per-segment extras such as precise mode's bass note)
+    src: np.ndarray | None = None
+
+    def __post_init__(self):
+        if self.src is None:
+            self.src = np.arange(len(self.start), dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    @classmethod
+    def from_records(
+        cls,
+        starts: Sequence[float],
+        ends: Sequence[float],
+        chords: Sequence[str],
+        confs: Sequence[float],
+    ) -> SegmentArrays:
+        """Build from parallel Python sequences with string labels."""
+        vocab: dict[str, int] = {}
+        label = np.fromiter((vocab.setdefault(c, len(vocab)) for c in chords), dtype=np.int64, count=len(chords))
+        return cls(
+            start=np.asarray(starts, dtype=np.float64),
+            end=np.asarray(ends, dtype=np.float64),
+            label=label,
+            conf=np.asarray(confs, dtype=np.float64),
+            labels=list(vocab),
+        )
+
+    @classmethod
+    def from_tuples(cls, segments: Sequence[tuple[float, float, str, float]]) -> SegmentArrays:
+        if not segments:
+            return cls.from_records([], [], [], [])
+        starts, ends, chords, confs = zip(*segments)
+        return cls.from_records(starts, ends, chords, confs)
+
+    def chord(self, i: int) -> str:
+        return self.labels[self.label[i]]
+
+    def to_tuples(self) -> list[tuple[float, float, str, float]]:
+        return [
+            (float(s), float(e), self.labels[lab], float(c))
+            for s, e, lab, c in zip(self.start, self.end, self.label, self.conf)
+        ]
+
+
+def segments_from_path(
+    path: np.ndarray,
+    frame_probs: np.ndarray,
+    frame_rate: float,
+    labels: Sequence[str],
+) -> SegmentArrays:
+    """
+    Run-length encode a frame-level label path. Each segment's confidence is
+    the mean probability of its label over its frames.
+    """
+    path = np.asarray(path, dtype=np.int64)
+    n_frames = len(path)
+    if n_frames == 0:
+        return SegmentArrays(np.empty(0), np.empty(0), np.empty(0, np.int64), np.empty(0), labels)
+
+    starts = np.flatnonzero(np.r_[True, path[1:] != path[:-1]])
+    ends = np.r_[starts[1:], n_frames]
+    label_probs = frame_probs[np.arange(n_frames), path].astype(np.float64)
+    conf = np.add.reduceat(label_probs, starts) / (ends - starts)
+
+    return SegmentArrays(
+        start=starts / frame_rate,
+        end=ends / frame_rate,
+        label=path[starts],
+        conf=conf,
+        labels=labels,
+    )
+
+
+def _combine_conf(a: float, a_dur: float, b: float, b_dur: float, mode: str) -> float:
+    if mode == "max":
+        return max(a, b)
+    if mode == "keep":
+        return a
+    total = a_dur + b_dur
+    return (a * a_dur + b * b_dur) / total if total > 0 else a
+
+
+def coalesce_runs(segs: SegmentArrays, conf_mode: str = "weighted") -> SegmentArrays:
+    """
+    Merge consecutive segments with the same label.
+
+    conf_mode: "weighted" (duration-weighted mean) or "max".
+    """
+    n = len(segs)
+    if n <= 1:
+        return segs
+
+    first = np.flatnonzero(np.r_[True, segs.label[1:] != segs.label[:-1]])
+    if len(first) == n:
+        return segs
+    last = np.r_[first[1:], n] - 1
+
+    if conf_mode == "max":
+        conf = np.maximum.reduceat(segs.conf, first)
+    else:
+        dur = segs.end - segs.start
+        total = np.add.reduceat(dur, first)
+        weighted = np.add.reduceat(segs.conf * dur, first)
+        conf = np.divide(weighted, total, out=segs.conf[first].copy(), where=total > 0)
+
+    return SegmentArrays(
+        start=segs.start[first],
+        end=segs.end[last],
+        label=segs.label[first],
+        conf=conf,
+        labels=segs.labels,
+        src=segs.src[first],
+    )
+
+
+def merge_short_segments(
+    segs: SegmentArrays,
+    min_dur: float,
+    hard_min_dur: float | None = None,
+    conf_threshold: float | None = None,
+    prefer: str = "confidence",
+    absorb_conf: str = "weighted",
+    coalesce_conf: str = "weighted",
+) -> SegmentArrays:
+    """
+    Absorb short segments into a neighbor in a single linear pass.
+
+    A segment is merged away when it is shorter than `hard_min_dur`, or
+    shorter than `min_dur` and — if `conf_threshold` is given — less
+    confident than it. With `conf_threshold=None` the rule is purely
+    duration-based.
+
+    prefer:        "confidence" absorbs into whichever neighbor is more
+                   confident (left on ties); "left" always prefers the left.
+    absorb_conf:   how the absorbing neighbor's confidence is updated:
+                   "weighted" (duration-weighted mean) or "keep".
+    coalesce_conf: how equal neighbors are combined when they meet:
+                   "weighted" or "max".
+    """
+    n = len(segs)
+    if n <= 1:
+        return segs
+
+    hard = min(hard_min_dur, min_dur) if hard_min_dur is not None else min_dur
+    in_start, in_end, in_label, in_conf, in_src = (
+        segs.start.tolist(), segs.end.tolist(), segs.label.tolist(), segs.conf.tolist(), segs.src.tolist()
+    )
+
+    # Output stack (committed segments), preallocated
+    o_start = [0.0] * n
+    o_end = [0.0] * n
+    o_label = [0] * n
+    o_conf = [0.0] * n
+    o_src = [0] * n
+    k = 0
+
+    # The segment under examination (its start/conf change when it absorbs a
+    # short left-hand segment merged "to the right")
+    i = 0
+    c_start, c_end, c_label, c_conf, c_src = in_start[0], in_end[0], in_label[0], in_conf[0], in_src[0]
+    while True:
+        dur = c_end - c_start
+        short = dur < hard or (
+            dur < min_dur and (conf_threshold is None or c_conf < conf_threshold)
+        )
+        has_left = k > 0
+        has_right = i + 1 < n
+
+        if short and (has_left or has_right):
+            if has_left and has_right:
+                into_left = prefer == "left" or o_conf[k - 1] >= in_conf[i + 1]
+            else:
+                into_left = has_left
+
+            if into_left:
+                top = k - 1
+                o_conf[top] = _combine_conf(o_conf[top], o_end[top] - o_start[top], c_conf, dur, absorb_conf)
+                o_end[top] = c_end
+                if not has_right:
+                    break
+                i += 1
+                c_start, c_end, c_label, c_conf, c_src = in_start[i], in_end[i], in_label[i], in_conf[i], in_src[i]
+            else:
+                i += 1
+                r_dur = in_end[i] - in_start[i]
+                c_conf = _combine_conf(in_conf[i], r_dur, c_conf, dur, absorb_conf)
+                c_end, c_label, c_src = in_end[i], in_label[i], in_src[i]
+                # c_start stays: the right neighbor now begins where the short segment did
+            continue
+
+        # Commit, coalescing with an equal left neighbor
+        if has_left and o_label[k - 1] == c_label:
+            top = k - 1
+            o_conf[top] = _combine_conf(o_conf[top], o_end[top] - o_start[top], c_conf, dur, coalesce_conf)
+            o_end[top] = c_end
+        else:
+            o_start[k], o_end[k], o_label[k], o_conf[k], o_src[k] = c_start, c_end, c_label, c_conf, c_src
+            k += 1
+
+        if not has_right:
+            break
+        i += 1
+        c_start, c_end, c_label, c_conf, c_src = in_start[i], in_end[i], in_label[i], in_conf[i], in_src[i]
+
+    return SegmentArrays(
+        start=np.asarray(o_start[:k], dtype=np.float64),
+        end=np.asarray(o_end[:k], dtype=np.float64),
+        label=np.asarray(o_label[:k], dtype=np.int64),
+        conf=np.asarray(o_conf[:k], dtype=np.float64),
+        labels=segs.labels,
+        src=np.asarray(o_src[:k], dtype=np.int64),
+    )
@@ -0,0 +1,341 @@
+"""
+ml/tracing.py
+
+Lightweight per-request tracing: spans for the pipeline stages, the
+engines, Demucs and the YouTube download fallbacks, exported as
+OTLP-compatible JSON.
+
+Aggregate metrics (instrumentation.py) say *that* p99 got worse; a trace
+says why one request was slow — e.g. a YouTube download that fell through
+yt-dlp → pytubefix → eleven Invidious instances → Piped → Cobalt.
+
+    with span("youtube.yt_dlp", url=url) as sp:
+        ...
+        sp.set_attribute("bytes", size)
+
+opens a child of the current span (a context variable) or, outside any
+span, the root of a new trace. A span that exits with an exception gets
+status ERROR and the exception type / message. `instrumentation.stage()`
+and `analysis_mode()` open spans too, so every timed stage shows up.
+
+Finished spans go to the process-wide exporter. With TRACING_ENABLED=true
+the default is `JsonLinesExporter(TRACE_EXPORT_PATH)`: one OTLP
+ExportTraceServiceRequest (the OTLP/JSON file-exporter format) per line,
+ready for an OpenTelemetry collector's `otlpjson` file receiver. Any object
+with `export(spans)` can be plugged in with `set_exporter`. With no
+exporter `span()` yields a shared no-op span and records nothing.
+
+Spans made in an analysis worker process (backend/process_pool.py) are
+collected with `collect(parent)` under the parent's trace and exported by
+the parent, like the stage metrics.
+
+Commercially clean: standard library only.
+"""
+from __future__ import annotations
+
+import contextvars
+import json
+import os
+import tempfile
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Protocol
+
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "false").lower() == "true"
+TRACE_EXPORT_PATH = Path(
+    os.environ.get("TRACE_EXPORT_PATH", Path(tempfile.gettempdir()) / "guitariz_traces.jsonl")
+)
+TRACE_EXPORT_MAX_BYTES = int(os.environ.get("TRACE_EXPORT_MAX_BYTES", str(64 * 1024 * 1024)))
+
+SERVICE_NAME = "guitariz"
+
+# OTLP Status.code
+STATUS_UNSET, STATUS_OK, STATUS_ERROR = 0, 1, 2
+# OTLP Span.kind
+KIND_INTERNAL, KIND_SERVER = 1, 2
+
+
+def _new_id(n_bytes: int) -> str:
+    return os.urandom(n_bytes).hex()
+
+
+class Span:
+    """One timed operation. Ids are lowercase hex, as in W3C traceparent."""
+
+    __slots__ = (
+        "name", "trace_id", "span_id", "parent_id", "kind",
+        "start_ns", "end_ns", "attributes", "status", "status_message",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: str | None = None,
+        parent_id: str | None = None,
+        kind: int = KIND_INTERNAL,
+        attributes: dict[str, Any] | None = None,
+    ):
+        self.name = name
+        self.trace_id = trace_id or _new_id(16)
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = dict(attributes or {})
+        self.status = STATUS_UNSET
+        self.status_message = ""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_status(self, code: int, message: str = "") -> None:
+        self.status = code
+        self.status_message = message
+
+    @property
+    def duration(self) -> float:
+        """Seconds, once the span has ended."""
+        return (self.end_ns - self.start_ns) / 1e9
+
+    @property
+    def traceparent(self) -> str:
+        """W3C `traceparent` header value naming this span as the parent."""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_otlp(self) -> dict:
+        out = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": self.status},
+        }
+        if self.parent_id:
+            out["parentSpanId"] = self.parent_id
+        if self.status_message:
+            out["status"]["message"] = self.status_message
+        return out
+
+
+class _NoopSpan:
+    """Yielded by `span()` while tracing is off, so callers never branch."""
+
+    trace_id = span_id = parent_id = None
+    traceparent = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_status(self, code: int, message: str = "") -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _otlp_attribute(key: str, value: Any) -> dict:
+    # OTLP JSON encodes int64 as a string
+    if isinstance(value, bool):
+        v = {"boolValue": value}
+    elif isinstance(value, int):
+        v = {"intValue": str(value)}
+    elif isinstance(value, float):
+        v = {"doubleValue": value}
+    else:
+        v = {"stringValue": str(value)}
+    return {"key": key, "value": v}
+
+
+def to_otlp_request(spans: Iterable[Span]) -> dict:
+    """An OTLP ExportTraceServiceRequest holding `spans`."""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+            "scopeSpans": [{
+                "scope": {"name": SERVICE_NAME},
+                "spans": [s.to_otlp() for s in spans],
+            }],
+        }],
+    }
+
+
+# ── Exporters ───────────────────────────────────────────────────────────────
+
+class SpanExporter(Protocol):
+    def export(self, spans: list[Span]) -> None: ...
+
+
+class JsonLinesExporter:
+    """Appends each batch of finished spans as one OTLP/JSON line to `path`;
+    past `max_bytes` the file is rotated to `<path>.1`."""
+
+    def __init__(self, path: str | Path = TRACE_EXPORT_PATH, max_bytes: int = TRACE_EXPORT_MAX_BYTES):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def export(self, spans: list[Span]) -> None:
+        line = json.dumps(to_otlp_request(spans), separators=(",", ":")) + "\n"
+        with self._lock:
+            try:
+                if self.path.exists() and self.path.stat().st_size + len(line) > self.max_bytes:
+                    self.path.replace(self.path.with_name(self.path.name + ".1"))
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError as e:
+                print(f"[Tracing] Export to {self.path} failed: {e}")
+
+
+class InMemoryExporter:
+    """Keeps finished spans in a list (tests, debugging)."""
+
+    def __init__(self):
+        self.spans: list[Span] = []
+        self._lock = threading.Lock()
+
+    def export(self, spans: list[Span]) -> None:
+        with self._lock:
+            self.spans.extend(spans)
+
+    def by_name(self, name: str) -> list[Span]:
+        with self._lock:
+            return [s for s in self.spans if s.name == name]
+
+
+_exporter: SpanExporter | None = None
+_exporter_lock = threading.Lock()
+
+
+def set_exporter(exporter: SpanExporter | None) -> SpanExporter | None:
+    """Install the process-wide exporter (None turns tracing off). Returns the previous one."""
+    global _exporter
+    with _exporter_lock:
+        previous, _exporter = _exporter, exporter
+    return previous
+
+
+def get_exporter() -> SpanExporter | None:
+    return _exporter
+
+
+def export(spans: list[Span]) -> None:
+    """Hand finished spans (e.g. collected in a worker process) to the exporter."""
+    exporter = _exporter
+    if exporter is None or not spans:
+        return
+    try:
+        exporter.export(spans)
+    except Exception as e:
+        print(f"[Tracing] Exporter failed: {e}")
+
+
+if TRACING_ENABLED:
+    set_exporter(JsonLinesExporter())
+
+
+# ── Spans ───────────────────────────────────────────────────────────────────
+
+_current: contextvars.ContextVar[Span | None] = contextvars.ContextVar("guitariz_span", default=None)
+_collect: contextvars.ContextVar[list | None] = contextvars.ContextVar("guitariz_span_collect", default=None)
+
+
+def enabled() -> bool:
+    return _exporter is not None or _collect.get() is not None
+
+
+def current_span() -> Span | _NoopSpan:
+    """The innermost open span, or the no-op span."""
+    return _current.get() or NOOP_SPAN
+
+
+def current_traceparent() -> str | None:
+    """`traceparent` of the innermost open span, for handing to another process."""
+    sp = _current.get()
+    return sp.traceparent if sp is not None else None
+
+
+def parse_traceparent(header: str | None) -> tuple[str, str] | None:
+    """(trace_id, parent_span_id) from a W3C `traceparent` header, if valid."""
+    if not header:
+        return None
+    parts = header.strip().lower().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    trace_id, span_id = parts[1], parts[2]
+    try:
+        int(trace_id, 16), int(span_id, 16)
+    except ValueError:
+        return None
+    if trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return trace_id, span_id
+
+
+@contextmanager
+def span(
+    name: str,
+    parent: tuple[str, str] | None = None,
+    kind: int = KIND_INTERNAL,
+    **attributes: Any,
+) -> Iterator[Span | _NoopSpan]:
+    """
+    Time the `with` block as span `name`, a child of the current span — or
+    of `parent` (trace_id, span_id) from an incoming `traceparent`, or the
+    root of a new trace.
+    """
+    if not enabled():
+        yield NOOP_SPAN
+        return
+    if parent is None:
+        enclosing = _current.get()
+        parent = (enclosing.trace_id, enclosing.span_id) if enclosing is not None else None
+    sp = Span(name, *(parent or (None, None)), kind=kind, attributes=attributes)
+    token = _current.set(sp)
+    try:
+        yield sp
+    except BaseException as e:
+        # backend/job_control.JobCancelled (ml/ does not import the backend)
+        if type(e).__name__ == "JobCancelled":
+            sp.set_attribute("cancelled", True)
+        sp.set_attribute("exception.type", type(e).__name__)
+        sp.set_status(STATUS_ERROR, str(e)[:500])
+        raise
+    finally:
+        _current.reset(token)
+        sp.end_ns = time.time_ns()
+        collected = _collect.get()
+        if collected is not None:
+            collected.append(sp)
+        else:
+            export([sp])
+
+
+@contextmanager
+def collect(traceparent: str | None) -> Iterator[list[Span]]:
+    """
+    Record the spans made in the block under the remote parent
+    `traceparent` and return them instead of exporting (worker processes).
+    With no parent the block is not traced.
+    """
+    spans: list[Span] = []
+    parent = parse_traceparent(traceparent)
+    if parent is None:
+        yield spans
+        return
+    remote = Span("", trace_id=parent[0])
+    remote.span_id = parent[1]
+    collect_token = _collect.set(spans)
+    span_token = _current.set(remote)
+    try:
+        yield spans
+    finally:
+        _current.reset(span_token)
+        _collect.reset(collect_token)
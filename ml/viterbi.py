@@ -11,7 +11,8 @@ by modelling chord transitions as a hidden Markov model:
     - Observation probabilities → per-frame softmax from the classifier
 
 After decoding, a minimum-duration constraint (300ms) merges any remaining
-short segments into their most confident neighbor.
+short segments into their most confident neighbor (single pass over
+struct-of-arrays storage, see ml/segments.py).
 
 --- Adaptive mode (opt-in via `min_self_transition_prob`) --------------------
 A single fixed self-transition probability makes a hard trade-off: sticky
@@ -36,16 +37,43 @@ Both additions are fully backward compatible: if `min_self_transition_prob`
 is left as None (the default), behavior is byte-for-byte identical to the
 original static implementation.
 
+--- Kernel -------------------------------------------------------------------
+The forward recursion + backtrace runs in a Numba-compiled kernel when numba
+is importable (it ships with librosa) and VITERBI_USE_NUMBA is not "false";
+otherwise a NumPy kernel with preallocated row buffers is used. Both keep
+only two DP rows resident, store backpointers as uint8 (uint16 above 256
+classes) and produce exactly the same path as the original frame loop — the
+DP rows stay float64 and every add/compare happens in the original order.
+`smooth_chord_sequence_batch` decodes several probability matrices in one
+call (stacked across the batch in the NumPy kernel).
+
+--- Online mode --------------------------------------------------------------
+`OnlineViterbi` runs the same recursion one frame at a time for streaming
+input (live microphone sessions) and emits fixed-lag decisions: the label of
+frame t - lag, backtraced from the best state at frame t. Memory is bounded
+by `lag` backpointer rows.
+
 Commercially clean: implemented from scratch using NumPy (BSD).
 """
 
 from __future__ import annotations
 
+import os
+from collections import deque
 from dataclasses import dataclass
 
 import numpy as np
 
 from .chord_vocab import LABELS
+from .instrumentation import stage
+from .segments import SegmentArrays, merge_short_segments, segments_from_path
+
+try:
+    import numba
+except ImportError:  # optional accelerator; the NumPy kernel is always available
+    numba = None
+
+VITERBI_USE_NUMBA = os.environ.get("VITERBI_USE_NUMBA", "true").lower() == "true"
 
 
 @dataclass
@@ -73,6 +101,319 @@ def _smooth_1d(x: np.ndarray, window: int = 3) -> np.ndarray:
     return np.convolve(x, kernel, mode="same")
 
 
+def _backpointer_dtype(n_classes: int) -> type:
+    return np.uint8 if n_classes <= 256 else np.uint16
+
+
+def _transition_logs(self_prob_seq: np.ndarray, n_classes: int) -> tuple[np.ndarray, np.ndarray]:
+    """Per-transition log self / log off-diagonal probabilities (float64)."""
+    p = np.minimum(np.maximum(np.asarray(self_prob_seq, dtype=np.float64), 1e-6), 1.0 - 1e-6)
+    q = (1.0 - p) / max(n_classes - 1, 1)
+    return np.log(p), np.log(q + 1e-12)
+
+
+def _backtrace_numpy(backpointer: np.ndarray, end_state: int, length: int) -> np.ndarray:
+    """
+    Follow backpointers from `end_state` at frame `length - 1`.
+
+    Instead of one step per frame, jumps a whole segment at a time: while the
+    path stays in state s, bp[t, s] == s, so the next state change is the last
+    frame (searched backwards in blocks) where the column differs from s.
+    """
+    path = np.empty(length, dtype=np.int64)
+    t, state = length - 1, int(end_state)
+    block = 256
+    while t > 0:
+        found = -1
+        hi = t
+        while hi > 0:
+            lo = max(1, hi - block + 1)
+            changes = np.flatnonzero(backpointer[lo:hi + 1, state] != state)
+            if changes.size:
+                found = lo + int(changes[-1])
+                break
+            hi = lo - 1
+        if found < 0:
+            break
+        path[found:t + 1] = state
+        state = int(backpointer[found, state])
+        t = found - 1
+    path[:t + 1] = state
+    return path
+
+
+def _viterbi_path_numpy(log_probs: np.ndarray, log_p: np.ndarray, log_q: np.ndarray) -> np.ndarray:
+    """Single-sequence NumPy kernel: two rolling float64 rows, no per-frame allocations."""
+    n_frames, n_classes = log_probs.shape
+    bp_dtype = _backpointer_dtype(n_classes)
+    backpointer = np.zeros((n_frames, n_classes), dtype=bp_dtype)
+    states = np.arange(n_classes, dtype=bp_dtype)
+
+    prev = np.full(n_classes, np.log(1.0 / n_classes)) + log_probs[0]
+    cur = np.empty_like(prev)
+    self_val = np.empty_like(prev)
+    other_val = np.empty_like(prev)
+    stay = np.empty(n_classes, dtype=bool)
+
+    for t in range(1, n_frames):
+        best_idx = int(np.argmax(prev))
+        best_val = prev[best_idx]
+        prev[best_idx] = -np.inf
+        second_idx = int(np.argmax(prev))
+        second_val = prev[second_idx]
+        prev[best_idx] = best_val
+
+        log_q_t = log_q[t - 1]
+        other_val.fill(best_val + log_q_t)
+        other_val[best_idx] = second_val + log_q_t
+        np.add(prev, log_p[t - 1], out=self_val)   # candidate: stay in state j
+
+        # max() picks the same value np.where(self >= other, self, other) would
+        np.greater_equal(self_val, other_val, out=stay)
+        np.maximum(self_val, other_val, out=cur)
+        cur += log_probs[t]
+
+        bp_t = backpointer[t]
+        bp_t.fill(best_idx)
+        bp_t[best_idx] = second_idx
+        np.copyto(bp_t, states, where=stay)
+
+        prev, cur = cur, prev
+
+    return _backtrace_numpy(backpointer, int(np.argmax(prev)), n_frames)
+
+
+def _viterbi_paths_numpy(
+    log_probs: list[np.ndarray],
+    log_ps: list[np.ndarray],
+    log_qs: list[np.ndarray],
+) -> list[np.ndarray]:
+    """
+    Batched NumPy kernel: one O(n_classes) recursion step for every sequence
+    at once. Shorter sequences are zero-padded; the recursion is causal, so
+    padding never affects their paths.
+    """
+    if len(log_probs) == 1:
+        return [_viterbi_path_numpy(log_probs[0], log_ps[0], log_qs[0])]
+
+    lengths = [len(lp) for lp in log_probs]
+    n_batch, n_max, n_classes = len(log_probs), max(lengths), log_probs[0].shape[1]
+    dtype = np.result_type(*[lp.dtype for lp in log_probs])
+
+    obs = np.zeros((n_batch, n_max, n_classes), dtype=dtype)
+    log_p = np.zeros((n_batch, max(n_max - 1, 0)))
+    log_q = np.zeros_like(log_p)
+    for b, n in enumerate(lengths):
+        obs[b, :n] = log_probs[b]
+        log_p[b, :n - 1] = log_ps[b]
+        log_q[b, :n - 1] = log_qs[b]
+
+    bp_dtype = _backpointer_dtype(n_classes)
+    backpointer = np.zeros((n_batch, n_max, n_classes), dtype=bp_dtype)
+    states = np.arange(n_classes, dtype=bp_dtype)
+    rows = np.arange(n_batch)
+
+    prev = np.full(n_classes, np.log(1.0 / n_classes)) + obs[:, 0]   # (B, C) float64
+    cur = np.empty_like(prev)
+    self_val = np.empty_like(prev)
+    other_val = np.empty_like(prev)
+    stay = np.empty(prev.shape, dtype=bool)
+    end_states = np.zeros(n_batch, dtype=np.int64)
+    ends_at = np.asarray(lengths) - 1
+
+    done = ends_at == 0
+    end_states[done] = np.argmax(prev[done], axis=1)
+
+    for t in range(1, n_max):
+        best_idx = np.argmax(prev, axis=1)
+        best_val = prev[rows, best_idx]
+        prev[rows, best_idx] = -np.inf
+        second_idx = np.argmax(prev, axis=1)
+        second_val = prev[rows, second_idx]
+        prev[rows, best_idx] = best_val
+
+        lq = log_q[:, t - 1]
+        other_val[:] = (best_val + lq)[:, None]
+        other_val[rows, best_idx] = second_val + lq
+        np.add(prev, log_p[:, t - 1, None], out=self_val)
+
+        np.greater_equal(self_val, other_val, out=stay)
+        np.maximum(self_val, other_val, out=cur)
+        cur += obs[:, t]
+
+        bp_t = backpointer[:, t]
+        bp_t[:] = best_idx[:, None]
+        bp_t[rows, best_idx] = second_idx
+        np.copyto(bp_t, states, where=stay)
+
+        done = ends_at == t
+        if done.any():
+            end_states[done] = np.argmax(cur[done], axis=1)
+        prev, cur = cur, prev
+
+    return [
+        _backtrace_numpy(backpointer[b], end_states[b], lengths[b])
+        for b in range(n_batch)
+    ]
+
+
+if numba is not None:
+    @numba.njit(cache=True, nogil=True)
+    def _viterbi_path_numba(log_probs, log_init, log_p, log_q, backpointer):  # pragma: no cover - compiled
+        n_frames, n_classes = log_probs.shape
+        prev = np.empty(n_classes)
+        cur = np.empty(n_classes)
+        for j in range(n_classes):
+            prev[j] = log_init + log_probs[0, j]
+
+        for t in range(1, n_frames):
+            # First-occurrence argmax, then argmax with the best masked to -inf
+            best_idx = 0
+            best_val = prev[0]
+            for j in range(1, n_classes):
+                if prev[j] > best_val:
+                    best_idx = j
+                    best_val = prev[j]
+            second_idx = 0
+            second_val = -np.inf if best_idx == 0 else prev[0]
+            for j in range(1, n_classes):
+                v = -np.inf if j == best_idx else prev[j]
+                if v > second_val:
+                    second_idx = j
+                    second_val = v
+
+            lp = log_p[t - 1]
+            other = best_val + log_q[t - 1]
+            other_best = second_val + log_q[t - 1]
+            for j in range(n_classes):
+                self_val = prev[j] + lp
+                if j == best_idx:
+                    other_val = other_best
+                    other_idx = second_idx
+                else:
+                    other_val = other
+                    other_idx = best_idx
+                if self_val >= other_val:
+                    cur[j] = self_val + log_probs[t, j]
+                    backpointer[t, j] = j
+                else:
+                    cur[j] = other_val + log_probs[t, j]
+                    backpointer[t, j] = other_idx
+            prev, cur = cur, prev
+
+        path = np.empty(n_frames, dtype=np.int64)
+        end = 0
+        for j in range(1, n_classes):
+            if prev[j] > prev[end]:
+                end = j
+        path[n_frames - 1] = end
+        for t in range(n_frames - 2, -1, -1):
+            path[t] = backpointer[t + 1, path[t + 1]]
+        return path
+
+
+def _use_numba() -> bool:
+    return numba is not None and VITERBI_USE_NUMBA
+
+
+def viterbi_paths(
+    log_probs: list[np.ndarray],
+    log_ps: list[np.ndarray],
+    log_qs: list[np.ndarray],
+    use_numba: bool | None = None,
+) -> list[np.ndarray]:
+    """
+    Most likely state path for each (n_frames, n_classes) log-observation
+    matrix under the (p on diagonal, uniform q off-diagonal) transition
+    model, with per-transition log p / log q sequences of length n_frames-1
+    and a uniform initial distribution.
+    """
+    if not log_probs:
+        return []
+    if use_numba is None:
+        use_numba = _use_numba()
+    if use_numba and numba is not None:
+        paths = []
+        for lp, log_p, log_q in zip(log_probs, log_ps, log_qs):
+            n_classes = lp.shape[1]
+            bp = np.empty(lp.shape, dtype=_backpointer_dtype(n_classes))
+            log_init = float(np.log(1.0 / n_classes))
+            paths.append(_viterbi_path_numba(np.ascontiguousarray(lp), log_init, log_p, log_q, bp))
+        return paths
+    return _viterbi_paths_numpy(log_probs, log_ps, log_qs)
+
+
+class OnlineViterbi:
+    """
+    Fixed-lag streaming decoder for the ergodic chord HMM.
+
+    Same transition model as `smooth_chord_sequence` (static mode): stay with
+    probability p, switch to any other class with uniform probability.
+    `push()` consumes one frame of class probabilities and returns the label
+    index decided for the frame `lag` steps back (or the oldest frame seen,
+    while fewer than `lag` frames have arrived). lag=0 is a causal filter.
+    """
+
+    def __init__(self, n_classes: int, self_transition_prob: float = 0.95, lag: int = 2):
+        self.n_classes = n_classes
+        self.lag = max(int(lag), 0)
+        log_p, log_q = _transition_logs(np.array([self_transition_prob]), n_classes)
+        self.log_p, self.log_q = float(log_p[0]), float(log_q[0])
+        self._states = np.arange(n_classes, dtype=_backpointer_dtype(n_classes))
+        self.reset()
+
+    def reset(self) -> None:
+        self._delta: np.ndarray | None = None
+        self._backpointers: deque[np.ndarray] = deque(maxlen=self.lag)
+        self.frames = 0
+
+    def push(self, frame_probs: np.ndarray) -> int:
+        log_obs = np.log(np.asarray(frame_probs, dtype=np.float64) + 1e-12)
+        if self._delta is None:
+            self._delta = np.log(1.0 / self.n_classes) + log_obs
+        else:
+            prev = self._delta
+            best_idx = int(np.argmax(prev))
+            best_val = prev[best_idx]
+            prev[best_idx] = -np.inf
+            second_idx = int(np.argmax(prev))
+            second_val = prev[second_idx]
+            prev[best_idx] = best_val
+
+            self_val = prev + self.log_p
+            other_val = np.full(self.n_classes, best_val + self.log_q)
+            other_val[best_idx] = second_val + self.log_q
+            stay = self_val >= other_val
+
+            bp = np.full(self.n_classes, best_idx, dtype=self._states.dtype)
+            bp[best_idx] = second_idx
+            np.copyto(bp, self._states, where=stay)
+            if self.lag:
+                self._backpointers.append(bp)
+
+            delta = np.maximum(self_val, other_val) + log_obs
+            self._delta = delta - delta.max()  # keep the running scores bounded
+        self.frames += 1
+
+        state = int(np.argmax(self._delta))
+        for bp in reversed(self._backpointers):
+            state = int(bp[state])
+        return state
+
+    def tail(self) -> np.ndarray:
+        """
+        Best path over the most recent frames still within the lag (up to
+        lag + 1 of them, oldest first), for finishing a stream without
+        waiting for frames that will never arrive.
+        """
+        if self._delta is None:
+            return np.zeros(0, dtype=np.int64)
+        path = [int(np.argmax(self._delta))]
+        for bp in reversed(self._backpointers):
+            path.append(int(bp[path[-1]]))
+        return np.array(path[::-1], dtype=np.int64)
+
+
 def smooth_chord_sequence(
     frame_probs: np.ndarray,
     frame_rate: float,
@@ -123,12 +464,41 @@ def smooth_chord_sequence(
     Returns:
         List of ChordSegment objects, time-aligned and smoothed.
     """
-    n_frames, n_classes = frame_probs.shape
-    if n_frames == 0:
-        return []
-
+    return smooth_chord_sequence_batch(
+        [frame_probs],
+        frame_rate,
+        min_duration_ms,
+        self_transition_prob,
+        min_self_transition_prob=min_self_transition_prob,
+        change_sensitivity=change_sensitivity,
+        hard_min_duration_ms=hard_min_duration_ms,
+        min_duration_confidence_threshold=min_duration_confidence_threshold,
+        tempo_bpm=tempo_bpm,
+        beat_subdivision=beat_subdivision,
+    )[0]
+
+
+@stage("viterbi")
+def smooth_chord_sequence_batch(
+    frame_probs_list: list[np.ndarray],
+    frame_rate: float,
+    min_duration_ms: float = 300.0,
+    self_transition_prob: float = 0.95,
+    *,
+    min_self_transition_prob: float | None = None,
+    change_sensitivity: float = 1.0,
+    hard_min_duration_ms: float = 120.0,
+    min_duration_confidence_threshold: float = 0.55,
+    tempo_bpm: float | None = None,
+    beat_subdivision: float = 1.0,
+) -> list[list[ChordSegment]]:
+    """
+    `smooth_chord_sequence` for several (n_frames_i, n_classes) probability
+    matrices sharing one frame rate and parameter set (e.g. the windows of a
+    long track, or queued requests). The Viterbi recursions run in one kernel
+    call; results are identical to decoding each matrix separately.
+    """
     adaptive = min_self_transition_prob is not None
-    floor_prob = min_self_transition_prob if adaptive else self_transition_prob
 
     # Optional tempo-aware duration floor (only ever tightens the constraint,
     # never loosens it beyond what the caller asked for).
@@ -137,6 +507,64 @@ def smooth_chord_sequence(
         adaptive_floor_ms = max(beat_ms * beat_subdivision, hard_min_duration_ms)
         min_duration_ms = min(min_duration_ms, adaptive_floor_ms)
 
+    decodable = [i for i, fp in enumerate(frame_probs_list) if fp.shape[0] > 0]
+    log_probs, log_ps, log_qs = [], [], []
+    for i in decodable:
+        lp, log_p, log_q = _observation_and_transition_logs(
+            frame_probs_list[i],
+            self_transition_prob,
+            min_self_transition_prob,
+            change_sensitivity,
+        )
+        log_probs.append(lp)
+        log_ps.append(log_p)
+        log_qs.append(log_q)
+
+    # ── 3. O(n_classes) time-(in)homogeneous Viterbi ─────────────────────────
+    paths = dict(zip(decodable, viterbi_paths(log_probs, log_ps, log_qs)))
+
+    results: list[list[ChordSegment]] = []
+    for i, frame_probs in enumerate(frame_probs_list):
+        if i not in paths:
+            results.append([])
+            continue
+        # ── 4. Collapse frame-level path into segments ───────────────────────
+        segments = segments_from_path(paths[i], frame_probs, frame_rate, LABELS)
+
+        # ── 5. Enforce minimum duration by merging short segments ───────────
+        # Adaptive: confidence-aware (always merge below the hard floor, keep
+        # confident short segments). Static: purely duration-based.
+        segments = merge_short_segments(
+            segments,
+            min_dur=min_duration_ms / 1000.0,
+            hard_min_dur=min(hard_min_duration_ms, min_duration_ms) / 1000.0,
+            conf_threshold=min_duration_confidence_threshold if adaptive else None,
+            prefer="confidence",
+        )
+        results.append(_to_chord_segments(segments))
+    return results
+
+
+def _to_chord_segments(segments: SegmentArrays) -> list[ChordSegment]:
+    return [
+        ChordSegment(start=start, end=end, chord=LABELS[label], confidence=conf)
+        for start, end, label, conf in zip(
+            segments.start.tolist(), segments.end.tolist(), segments.label.tolist(), segments.conf.tolist()
+        )
+    ]
+
+
+def _observation_and_transition_logs(
+    frame_probs: np.ndarray,
+    self_transition_prob: float,
+    min_self_transition_prob: float | None,
+    change_sensitivity: float,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Steps 1–2: log observation matrix plus per-transition log p / log q."""
+    n_frames, n_classes = frame_probs.shape
+    adaptive = min_self_transition_prob is not None
+    floor_prob = min_self_transition_prob if adaptive else self_transition_prob
+
     # ── 1. Per-transition self-transition probability sequence ──────────────
     if adaptive and n_frames > 1:
         novelty = _row_cosine_distance(frame_probs[:-1], frame_probs[1:])  # len n_frames-1
@@ -149,178 +577,5 @@ def smooth_chord_sequence(
 
     # ── 2. Observation probabilities (log-space) ────────────────────────────
     log_probs = np.log(frame_probs + 1e-12)
-    log_init = np.full(n_classes, np.log(1.0 / n_classes))
-
-    # ── 3. O(n_classes) time-(in)homogeneous Viterbi ─────────────────────────
-    viterbi_matrix = np.zeros((n_frames, n_classes))
-    backpointer = np.zeros((n_frames, n_classes), dtype=int)
-    viterbi_matrix[0] = log_init + log_probs[0]
-
-    for t in range(1, n_frames):
-        p = float(self_prob_seq[t - 1])
-        p = min(max(p, 1e-6), 1.0 - 1e-6)
-        q = (1.0 - p) / max(n_classes - 1, 1)
-        log_p = np.log(p)
-        log_q = np.log(q + 1e-12)
-
-        prev = viterbi_matrix[t - 1]
-        best_idx = int(np.argmax(prev))
-        best_val = prev[best_idx]
-        if n_classes > 1:
-            prev_copy = prev.copy()
-            prev_copy[best_idx] = -np.inf
-            second_idx = int(np.argmax(prev_copy))
-            second_val = prev_copy[second_idx]
-        else:
-            second_idx, second_val = best_idx, -np.inf
-
-        other_val = np.full(n_classes, best_val + log_q)
-        other_idx = np.full(n_classes, best_idx, dtype=int)
-        other_val[best_idx] = second_val + log_q
-        other_idx[best_idx] = second_idx
-
-        self_val = prev + log_p  # candidate: stay in state j
-
-        stay_better = self_val >= other_val
-        viterbi_matrix[t] = np.where(stay_better, self_val, other_val) + log_probs[t]
-        backpointer[t] = np.where(stay_better, np.arange(n_classes), other_idx)
-
-    # Backtrace optimal path
-    best_path = np.zeros(n_frames, dtype=int)
-    best_path[-1] = np.argmax(viterbi_matrix[-1])
-    for t in range(n_frames - 2, -1, -1):
-        best_path[t] = backpointer[t + 1, best_path[t + 1]]
-
-    # ── 4. Collapse frame-level path into segments ───────────────────────────
-    segments: list[ChordSegment] = []
-    seg_start_idx = 0
-    seg_label_idx = best_path[0]
-    for t in range(1, n_frames):
-        if best_path[t] != seg_label_idx:
-            t_start = seg_start_idx / frame_rate
-            t_end = t / frame_rate
-            seg_probs = frame_probs[seg_start_idx:t, seg_label_idx]
-            confidence = float(np.mean(seg_probs))
-            segments.append(ChordSegment(
-                start=t_start,
-                end=t_end,
-                chord=LABELS[seg_label_idx],
-                confidence=confidence,
-            ))
-            seg_start_idx = t
-            seg_label_idx = best_path[t]
-    t_start = seg_start_idx / frame_rate
-    t_end = n_frames / frame_rate
-    seg_probs = frame_probs[seg_start_idx:n_frames, seg_label_idx]
-    confidence = float(np.mean(seg_probs))
-    segments.append(ChordSegment(
-        start=t_start,
-        end=t_end,
-        chord=LABELS[seg_label_idx],
-        confidence=confidence,
-    ))
-
-    # ── 5. Enforce minimum duration by merging short segments ───────────────
-    min_dur = min_duration_ms / 1000.0
-    hard_min_dur = min(hard_min_duration_ms, min_duration_ms) / 1000.0
-
-    if len(segments) <= 1:
-        return segments
-
-    curr_list = list(segments)
-    max_passes = 6
-    while max_passes > 0 and len(curr_list) > 1:
-        max_passes -= 1
-        changed = False
-        new_list: list[ChordSegment] = []
-        skip_next = False
-        for idx in range(len(curr_list)):
-            if skip_next:
-                skip_next = False
-                continue
-            seg = curr_list[idx]
-            dur = seg.end - seg.start
-
-            if adaptive:
-                must_merge = dur < hard_min_dur
-                may_merge = (
-                    not must_merge
-                    and dur < min_dur
-                    and seg.confidence < min_duration_confidence_threshold
-                )
-                do_merge = (must_merge or may_merge) and len(curr_list) > 1
-            else:
-                # Original behavior: purely duration-based, unconditional.
-                do_merge = dur < min_dur and len(curr_list) > 1
-
-            if do_merge:
-                changed = True
-                if new_list and idx < len(curr_list) - 1:
-                    left = new_list[-1]
-                    right = curr_list[idx + 1]
-                    if left.confidence >= right.confidence:
-                        l_dur = left.end - left.start
-                        new_conf = (left.confidence * l_dur + seg.confidence * dur) / (l_dur + dur)
-                        new_list[-1] = ChordSegment(
-                            start=left.start,
-                            end=seg.end,
-                            chord=left.chord,
-                            confidence=float(new_conf),
-                        )
-                    else:
-                        r_dur = right.end - right.start
-                        new_conf = (right.confidence * r_dur + seg.confidence * dur) / (r_dur + dur)
-                        new_list.append(ChordSegment(
-                            start=seg.start,
-                            end=right.end,
-                            chord=right.chord,
-                            confidence=float(new_conf),
-                        ))
-                        skip_next = True
-                elif new_list:
-                    left = new_list[-1]
-                    l_dur = left.end - left.start
-                    new_conf = (left.confidence * l_dur + seg.confidence * dur) / (l_dur + dur)
-                    new_list[-1] = ChordSegment(
-                        start=left.start,
-                        end=seg.end,
-                        chord=left.chord,
-                        confidence=float(new_conf),
-                    )
-                elif idx < len(curr_list) - 1:
-                    right = curr_list[idx + 1]
-                    r_dur = right.end - right.start
-                    new_conf = (right.confidence * r_dur + seg.confidence * dur) / (r_dur + dur)
-                    new_list.append(ChordSegment(
-                        start=seg.start,
-                        end=right.end,
-                        chord=right.chord,
-                        confidence=float(new_conf),
-                    ))
-                    skip_next = True
-                else:
-                    new_list.append(seg)
-            else:
-                new_list.append(seg)
-
-        merged: list[ChordSegment] = []
-        for s in new_list:
-            if merged and merged[-1].chord == s.chord:
-                p_seg = merged[-1]
-                p_dur = p_seg.end - p_seg.start
-                s_dur = s.end - s.start
-                comb_conf = (p_seg.confidence * p_dur + s.confidence * s_dur) / (p_dur + s_dur)
-                merged[-1] = ChordSegment(
-                    start=p_seg.start,
-                    end=s.end,
-                    chord=p_seg.chord,
-                    confidence=float(comb_conf),
-                )
-            else:
-                merged.append(s)
-        curr_list = merged
-
-        if not changed:
-            break
-
-    return curr_list
+    log_p, log_q = _transition_logs(self_prob_seq, n_classes)
+    return log_probs, log_p, log_q
@@ -13,6 +13,8 @@ interface ChordResult {
   chord: string;
   confidence: number;
   pitchClasses: number[];
+  /** Smoothing delay of the server-side streaming session, in ms */
+  latencyMs?: number;
 }
 
 export function useChordWebSocket() {